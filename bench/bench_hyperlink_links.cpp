@@ -0,0 +1,131 @@
+/**
+ * \file bench_hyperlink_links.cpp
+ *
+ * Benchmarks adding links to one big fasttrips::Hyperlink link set, like a hub stop with many trips, against the
+ * std::map of links plus std::multimap of costs the flat link array replaced (reproduced here for comparison).
+ *
+ * For each link set size, the links are added once with random times and costs, then replaced a few times
+ * each in random order, so most of the work is finding the existing link and moving it in the time window order.
+ * The time window is wide enough that nothing is pruned.
+ */
+#include "pathfinder.h"
+
+#include <sys/time.h>
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <map>
+#include <sstream>
+#include <vector>
+
+namespace {
+
+    double now_usec()
+    {
+        struct timeval tv;
+        gettimeofday(&tv, NULL);
+        return tv.tv_sec*1000000.0 + tv.tv_usec;
+    }
+
+    const double DISPERSION = 0.5;
+
+    /// The links to add: each trip's link is added once and then replaced, in random order
+    void makeLinks(int num_trips, int replacements, std::vector<fasttrips::StopState>& links)
+    {
+        srand(42);
+        links.clear();
+        for (int add_num = 0; add_num < num_trips*(1 + replacements); ++add_num) {
+            int trip_id = (add_num < num_trips) ? add_num : (rand() % num_trips);
+            fasttrips::StopState ss;
+            ss.deparr_time_   = 300.0 + (rand() % 3000)/100.0;
+            ss.deparr_mode_   = fasttrips::MODE_TRANSIT;
+            ss.trip_id_       = trip_id;
+            ss.stop_succpred_ = 7;
+            ss.seq_           = 3;
+            ss.seq_succpred_  = 4;
+            ss.cost_          = 10.0 + (rand() % 2000)/100.0;
+            links.push_back(ss);
+        }
+    }
+
+    /// Adds the links to a fasttrips::Hyperlink.  Returns the final sum of exponentiated costs.
+    double addNew(const std::vector<fasttrips::StopState>& links, const fasttrips::PathSpecification& path_spec,
+                  const fasttrips::PathFinder& pf, fasttrips::NodeArena* arena)
+    {
+        std::ostringstream trace;
+        fasttrips::Hyperlink hyperlink(arena);
+        hyperlink.reset(1, path_spec.outbound_);
+        bool rejected;
+        for (size_t link_num = 0; link_num < links.size(); ++link_num) {
+            hyperlink.addLink<false>(links[link_num], NULL, rejected, trace, path_spec, pf);
+        }
+        return hyperlink.getLinkSet(true).sum_exp_cost_;
+    }
+
+    /// The add/replace part of the std::map version of Hyperlink::addLink, without the window
+    double addOld(const std::vector<fasttrips::StopState>& links)
+    {
+        typedef std::map<fasttrips::StopStateKey, fasttrips::StopState> StopStateMap;
+        typedef std::multimap<double, fasttrips::StopStateKey>           CostToStopState;
+        StopStateMap    stop_state_map;
+        CostToStopState cost_map;
+        double          sum_exp_cost = 0;
+        for (size_t link_num = 0; link_num < links.size(); ++link_num) {
+            const fasttrips::StopState& ss = links[link_num];
+            const fasttrips::StopStateKey ssk = { ss.deparr_mode_, ss.trip_id_, ss.stop_succpred_, ss.seq_, ss.seq_succpred_ };
+            std::pair<StopStateMap::iterator, bool> result = stop_state_map.insert(std::make_pair(ssk, ss));
+            if (!result.second) {
+                // replace: take the old cost out of the cost map
+                const fasttrips::StopState& old_ss = result.first->second;
+                std::pair<CostToStopState::iterator, CostToStopState::iterator> range = cost_map.equal_range(old_ss.cost_);
+                for (CostToStopState::iterator it = range.first; it != range.second; ++it) {
+                    if (it->second == ssk) { cost_map.erase(it); break; }
+                }
+                sum_exp_cost -= exp(-1.0*DISPERSION*old_ss.cost_);
+                result.first->second = ss;
+            }
+            cost_map.insert(std::make_pair(ss.cost_, ssk));
+            sum_exp_cost += exp(-1.0*DISPERSION*ss.cost_);
+        }
+        return sum_exp_cost;
+    }
+}
+
+int main(int argc, char** argv)
+{
+    fasttrips::Hyperlink::TIME_WINDOW_      = 1000.0;
+    fasttrips::Hyperlink::STOCH_DISPERSION_ = DISPERSION;
+
+    fasttrips::PathSpecification path_spec;
+    path_spec.hyperpath_ = true;
+    path_spec.outbound_  = true;
+    path_spec.trace_     = false;
+    fasttrips::PathFinder pf;
+    fasttrips::NodeArena  arena;
+
+    const int replacements = 3;
+    printf("%-10s %10s %14s %14s\n", "links", "adds", "flat_ns/add", "map_ns/add");
+
+    const int trip_counts[] = { 8, 32, 128, 512, 2048, 8192 };
+    for (size_t t=0; t<sizeof(trip_counts)/sizeof(trip_counts[0]); ++t) {
+        std::vector<fasttrips::StopState> links;
+        makeLinks(trip_counts[t], replacements, links);
+        int repeats = std::max(1, 400000/static_cast<int>(links.size()));
+
+        double new_sum = 0, old_sum = 0;
+        double start = now_usec();
+        for (int r = 0; r < repeats; ++r) { new_sum = addNew(links, path_spec, pf, &arena); }
+        double new_ns = (now_usec() - start)*1000.0/(repeats*links.size());
+
+        start = now_usec();
+        for (int r = 0; r < repeats; ++r) { old_sum = addOld(links); }
+        double old_ns = (now_usec() - start)*1000.0/(repeats*links.size());
+
+        if (fabs(new_sum - old_sum) > 1e-9*fabs(old_sum)) {
+            fprintf(stderr, "Mismatch for %d links: %g vs %g\n", trip_counts[t], new_sum, old_sum);
+            return 1;
+        }
+        printf("%-10d %10lu %14.1f %14.1f\n", trip_counts[t], (unsigned long)links.size(), new_ns, old_ns);
+    }
+    return 0;
+}
@@ -0,0 +1,243 @@
+/**
+ * \file bench_label_stop_queue.cpp
+ *
+ * Benchmarks fasttrips::LabelStopQueue against the lazy-deletion queue it replaced
+ * (a std::priority_queue plus a std::map of valid labels, reproduced here for comparison).
+ *
+ * Two workloads:
+ * - A replay of push/pop sequences recorded from hyperpath labeling on the test network
+ *   (data/label_stop_queue_ops.txt, or the file given as the first argument).  Each request starts
+ *   with a "#" line, followed by "+ stop_id is_trip label" for each push and "-" for each pop.
+ * - A synthetic labeling-like mix for larger networks: each pop pushes a few neighboring stops
+ *   with labels that keep improving, so stops are re-queued many times before they're popped.
+ */
+#include "pathfinder.h"
+
+#include <sys/time.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <fstream>
+#include <map>
+#include <queue>
+#include <string>
+#include <vector>
+
+namespace {
+
+    double now_usec()
+    {
+        struct timeval tv;
+        gettimeofday(&tv, NULL);
+        return tv.tv_sec*1000000.0 + tv.tv_usec;
+    }
+
+    /// The priority_queue + map version LabelStopQueue replaced, without the tracing
+    class LazyLabelStopQueue {
+    public:
+        LazyLabelStopQueue() : valid_count_(0) {}
+
+        void push(const fasttrips::LabelStop& pushed) {
+            // it predates the lower bounds, so it's ordered by label
+            fasttrips::LabelStop val = pushed;
+            val.priority_ = val.label_;
+            std::pair<int,bool> full_stop_id = std::make_pair(val.stop_id_, val.is_trip_);
+            std::map< std::pair<int, bool>, LabelCount>::iterator it = labelstop_map_.find(full_stop_id);
+            if (it == labelstop_map_.end()) {
+                queue_.push(val);
+                LabelCount lc = { val.label_, true, 1 };
+                labelstop_map_[full_stop_id] = lc;
+                valid_count_++;
+            } else if (!it->second.valid_) {
+                queue_.push(val);
+                it->second.label_  = val.label_;
+                it->second.valid_  = true;
+                it->second.count_ += 1;
+                valid_count_++;
+            } else if (val.label_ < it->second.label_) {
+                queue_.push(val);
+                it->second.label_  = val.label_;
+                it->second.count_ += 1;
+            }
+        }
+
+        fasttrips::LabelStop pop_top() {
+            while (true) {
+                fasttrips::LabelStop ls = queue_.top();
+                queue_.pop();
+                LabelCount& lc = labelstop_map_[std::make_pair(ls.stop_id_, ls.is_trip_)];
+                lc.count_ -= 1;
+                if (!lc.valid_ || lc.label_ != ls.label_) { continue; }
+                lc.valid_ = false;
+                valid_count_ -= 1;
+                return ls;
+            }
+        }
+
+        bool empty() const { return valid_count_ == 0; }
+
+    private:
+        typedef struct {
+            double label_;
+            bool   valid_;
+            int    count_;
+        } LabelCount;
+
+        std::priority_queue<fasttrips::LabelStop, std::vector<fasttrips::LabelStop>, struct fasttrips::LabelStopCompare> queue_;
+        std::map< std::pair<int, bool>, LabelCount> labelstop_map_;
+        int valid_count_;
+    };
+
+    /// Adapts the two queues to the same interface
+    struct NewQueue {
+        fasttrips::LabelStopQueue           queue_;
+        std::map<int, std::string>          stop_num_to_str_;
+        std::ofstream                       trace_file_;
+
+        void reset()                                { queue_.clear(); }
+        void push(const fasttrips::LabelStop& ls)   { queue_.push(ls); }
+        fasttrips::LabelStop pop()                  { return queue_.pop_top(stop_num_to_str_, false, trace_file_); }
+        bool empty() const                          { return queue_.empty(); }
+    };
+
+    struct OldQueue {
+        LazyLabelStopQueue                  queue_;
+
+        void reset()                                { queue_ = LazyLabelStopQueue(); }
+        void push(const fasttrips::LabelStop& ls)   { queue_.push(ls); }
+        fasttrips::LabelStop pop()                  { return queue_.pop_top(); }
+        bool empty() const                          { return queue_.empty(); }
+    };
+
+    /// One recorded queue operation.  stop_id_ of -1 means a new request; is_pop_ means pop.
+    typedef struct {
+        bool                 is_pop_;
+        fasttrips::LabelStop label_stop_;
+    } QueueOp;
+
+    bool readOps(const char* filename, std::vector<QueueOp>& ops)
+    {
+        FILE* file = fopen(filename, "r");
+        if (file == NULL) { return false; }
+        char line[256];
+        while (fgets(line, sizeof(line), file) != NULL) {
+            QueueOp op = { false, { 0, -1, false } };
+            if (line[0] == '-') {
+                op.is_pop_ = true;
+            } else if (line[0] == '+') {
+                int stop_id, is_trip;
+                double label;
+                if (sscanf(line+1, "%d %d %lf", &stop_id, &is_trip, &label) != 3) { continue; }
+                op.label_stop_.stop_id_ = stop_id;
+                op.label_stop_.is_trip_ = (is_trip != 0);
+                op.label_stop_.label_   = label;
+            } else if (line[0] != '#') {
+                continue;
+            }
+            ops.push_back(op);
+        }
+        fclose(file);
+        return true;
+    }
+
+    /// Replays the recorded operations repeats times.  Returns nanoseconds per operation.
+    template <class Queue>
+    double replay(const std::vector<QueueOp>& ops, int repeats, size_t& checksum)
+    {
+        Queue queue;
+        double start = now_usec();
+        for (int r=0; r<repeats; ++r) {
+            for (size_t i=0; i<ops.size(); ++i) {
+                const QueueOp& op = ops[i];
+                if (op.is_pop_) {
+                    checksum += queue.pop().stop_id_;
+                } else if (op.label_stop_.stop_id_ < 0) {
+                    queue.reset();
+                } else {
+                    queue.push(op.label_stop_);
+                }
+            }
+        }
+        return (now_usec() - start)*1000.0/(static_cast<double>(ops.size())*repeats);
+    }
+
+    /**
+     * Labels num_stops stops, each linked to `degree` pseudo-random neighbors.  Each pop pushes its
+     * neighbors with the popped label plus a link cost, and a pop can re-queue an already-popped stop
+     * (as hyperpath labeling does when a hyperlink changes).  Returns nanoseconds per operation.
+     */
+    template <class Queue>
+    double synthetic(int num_stops, int degree, size_t& checksum, size_t& num_ops)
+    {
+        Queue queue;
+        std::vector<double> best(2*num_stops, 1.0e30);
+        unsigned int seed = 12345;
+        num_ops = 0;
+
+        double start = now_usec();
+        fasttrips::LabelStop first = { 0.0, 1, false };
+        queue.push(first);
+        num_ops++;
+        int pops = 0;
+        while (!queue.empty() && pops < 20*num_stops) {
+            fasttrips::LabelStop ls = queue.pop();
+            checksum += ls.stop_id_;
+            num_ops++; pops++;
+            for (int d=0; d<degree; ++d) {
+                seed = seed*1103515245 + 12345;
+                int    stop_id = 1 + static_cast<int>((ls.stop_id_*31 + d*7919 + (seed>>16)%5) % num_stops);
+                bool   is_trip = !ls.is_trip_;
+                double label   = ls.label_ + 1.0 + ((seed>>8)%1000)/100.0;
+                // hyperpath labels combine links, so a later link can still lower the label a bit
+                double& b = best[2*(stop_id-1) + (is_trip ? 1 : 0)];
+                if (label < b) { b = label; } else { label = b - 0.001; b = label; }
+                fasttrips::LabelStop next = { label, stop_id, is_trip };
+                queue.push(next);
+                num_ops++;
+            }
+        }
+        return (now_usec() - start)*1000.0/num_ops;
+    }
+}
+
+int main(int argc, char** argv)
+{
+    const char* filename = (argc > 1) ? argv[1] : "data/label_stop_queue_ops.txt";
+    std::vector<QueueOp> ops;
+    if (!readOps(filename, ops)) {
+        fprintf(stderr, "Couldn't read %s\n", filename);
+        return 1;
+    }
+
+    printf("%-28s %10s %14s %14s\n", "workload", "ops", "heap_ns/op", "lazy_ns/op");
+
+    size_t new_sum = 0, old_sum = 0;
+    int    repeats = 2000;
+    double new_ns  = replay<NewQueue>(ops, repeats, new_sum);
+    double old_ns  = replay<OldQueue>(ops, repeats, old_sum);
+    if (new_sum != old_sum) {
+        fprintf(stderr, "Mismatch replaying %s: %lu vs %lu\n", filename, (unsigned long)new_sum, (unsigned long)old_sum);
+        return 1;
+    }
+    printf("%-28s %10lu %14.1f %14.1f\n", "replay", (unsigned long)ops.size(), new_ns, old_ns);
+
+    const int stop_counts[] = { 1000, 10000, 100000 };
+    const int degrees[]     = { 4, 16 };
+    for (size_t s=0; s<sizeof(stop_counts)/sizeof(stop_counts[0]); ++s) {
+        for (size_t d=0; d<sizeof(degrees)/sizeof(degrees[0]); ++d) {
+            size_t new_ops = 0, old_ops = 0;
+            new_sum = old_sum = 0;
+            new_ns = synthetic<NewQueue>(stop_counts[s], degrees[d], new_sum, new_ops);
+            old_ns = synthetic<OldQueue>(stop_counts[s], degrees[d], old_sum, old_ops);
+            if ((new_sum != old_sum) || (new_ops != old_ops)) {
+                fprintf(stderr, "Mismatch for %d stops, degree %d: %lu vs %lu\n",
+                        stop_counts[s], degrees[d], (unsigned long)new_sum, (unsigned long)old_sum);
+                return 1;
+            }
+            char name[64];
+            sprintf(name, "synthetic %d stops x %d", stop_counts[s], degrees[d]);
+            printf("%-28s %10lu %14.1f %14.1f\n", name, (unsigned long)new_ops, new_ns, old_ns);
+        }
+    }
+    return 0;
+}
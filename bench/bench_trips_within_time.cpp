@@ -0,0 +1,118 @@
+/**
+ * \file bench_trips_within_time.cpp
+ *
+ * Benchmarks fasttrips::PathFinder::getTripsWithinTime() on a synthetic hub stop.
+ *
+ * The binary-searched lookup should scale with the number of trips in the time window,
+ * while the old linear scan (reproduced here for comparison) scales with the number of
+ * stop times at the stop over the whole day.
+ */
+#include "pathfinder.h"
+
+#include <sys/time.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <vector>
+
+namespace {
+
+    double now_usec()
+    {
+        struct timeval tv;
+        gettimeofday(&tv, NULL);
+        return tv.tv_sec*1000000.0 + tv.tv_usec;
+    }
+
+    /// Exposes the protected methods we want to time.
+    class BenchPathFinder : public fasttrips::PathFinder {
+    public:
+        /// One stop visited by num_trips trips, one stop time each, evenly spread over the day
+        void setupHubStop(int num_trips)
+        {
+            std::vector<int>    stoptime_index(3*num_trips);
+            std::vector<double> stoptime_times(3*num_trips);
+            for (int i=0; i<num_trips; ++i) {
+                // shuffle trip ids vs time so the input isn't already time ordered
+                double arrive = (24*60.0*((i*7919) % num_trips))/num_trips;
+                stoptime_index[3*i  ] = i+1;     // trip id
+                stoptime_index[3*i+1] = 1;       // sequence
+                stoptime_index[3*i+2] = 1;       // stop id
+                stoptime_times[3*i  ] = arrive;  // arrive time
+                stoptime_times[3*i+1] = arrive;  // depart time
+                stoptime_times[3*i+2] = 0;       // overcap
+            }
+            setupStopTimes(&stoptime_index[0], &stoptime_times[0], num_trips);
+            // keep the unsorted stop times (in trip order) for the linear scan
+            unsorted_ = trip_stop_times_;
+        }
+
+        size_t binarySearch(bool outbound, double timepoint) const
+        {
+            fasttrips::TripStopTimeRange range = getTripsWithinTime(1, outbound, timepoint);
+            size_t count = 0;
+            for (const fasttrips::TripStopTime* it = range.first; it != range.second; ++it) { count += it->trip_id_; }
+            return count;
+        }
+
+        /// The scan-and-copy version getTripsWithinTime() replaced
+        size_t linearScan(bool outbound, double timepoint) const
+        {
+            std::vector<fasttrips::TripStopTime> return_trips;
+            for (std::vector<fasttrips::TripStopTime>::const_iterator it  = unsorted_.begin();
+                                                                    it != unsorted_.end();   ++it) {
+                if (outbound && (it->arrive_time_ <= timepoint) && (it->arrive_time_ > timepoint-fasttrips::Hyperlink::TIME_WINDOW_)) {
+                    return_trips.push_back(*it);
+                } else if (!outbound && (it->depart_time_ >= timepoint) && (it->depart_time_ < timepoint+fasttrips::Hyperlink::TIME_WINDOW_)) {
+                    return_trips.push_back(*it);
+                }
+            }
+            size_t count = 0;
+            for (size_t i=0; i<return_trips.size(); ++i) { count += return_trips[i].trip_id_; }
+            return count;
+        }
+
+    private:
+        std::vector<fasttrips::TripStopTime> unsorted_;
+    };
+
+    /// Returns nanoseconds per call
+    double timeCalls(const BenchPathFinder& pf, bool binary, int calls, size_t& checksum)
+    {
+        double start = now_usec();
+        for (int c=0; c<calls; ++c) {
+            double timepoint = 5*60.0 + (c % 997)*(18*60.0/997);
+            bool   outbound  = (c % 2 == 0);
+            checksum += binary ? pf.binarySearch(outbound, timepoint) : pf.linearScan(outbound, timepoint);
+        }
+        return (now_usec() - start)*1000.0/calls;
+    }
+}
+
+int main(int argc, char** argv)
+{
+    const int    trip_counts[]   = { 250, 1000, 4000, 16000 };
+    const double time_windows[]  = { 5.0, 15.0, 30.0, 60.0 };
+    const int    calls           = 20000;
+
+    printf("%10s %10s %12s %14s %14s\n", "stoptimes", "window", "avg_in_win", "binary_ns", "linear_ns");
+    for (size_t t=0; t<sizeof(trip_counts)/sizeof(trip_counts[0]); ++t) {
+        BenchPathFinder pf;
+        pf.setupHubStop(trip_counts[t]);
+
+        for (size_t w=0; w<sizeof(time_windows)/sizeof(time_windows[0]); ++w) {
+            fasttrips::Hyperlink::TIME_WINDOW_ = time_windows[w];
+
+            size_t binary_sum = 0, linear_sum = 0;
+            double binary_ns = timeCalls(pf, true,  calls, binary_sum);
+            double linear_ns = timeCalls(pf, false, calls, linear_sum);
+            if (binary_sum != linear_sum) {
+                fprintf(stderr, "Mismatch for %d stoptimes, window %.0f: %lu vs %lu\n",
+                        trip_counts[t], time_windows[w], (unsigned long)binary_sum, (unsigned long)linear_sum);
+                return 1;
+            }
+            printf("%10d %10.0f %12.1f %14.1f %14.1f\n", trip_counts[t], time_windows[w],
+                   trip_counts[t]*time_windows[w]/(24*60.0), binary_ns, linear_ns);
+        }
+    }
+    return 0;
+}
@@ -17,7 +17,7 @@ import collections,datetime,math,multiprocessing,os,random,sys,traceback
 import numpy,pandas
 import _fasttrips
 
-from .Error       import ConfigurationError
+from .Error       import ConfigurationError, UnexpectedError
 from .Logger      import FastTripsLogger, setupLogging
 from .Passenger   import Passenger
 from .PathSet     import PathSet
@@ -117,8 +117,57 @@ class Assignment:
 
     #: Route choice configuration: How many stochastic paths will we generate
     #: (not necessarily unique) to define a path choice set?  Int.
+    #: This is the most; see :py:attr:`Assignment.STOCH_PATHSET_STALL_DRAWS` and
+    #: :py:attr:`Assignment.STOCH_PATHSET_UNSEEN_PROBABILITY` for stopping sooner.
     STOCH_PATHSET_SIZE              = None
 
+    #: Route choice configuration: Stop generating stochastic paths for a path choice set
+    #: once this many in a row found no new path.  Set to 0 to always generate
+    #: :py:attr:`Assignment.STOCH_PATHSET_SIZE` paths.  Int.
+    STOCH_PATHSET_STALL_DRAWS       = None
+
+    #: Route choice configuration: Stop generating stochastic paths for a path choice set once the
+    #: estimated probability that the next one is a new path is less than this.  The estimate
+    #: (Good-Turing) is the share of the paths generated so far that were only generated once, and it's
+    #: only used after at least 1/this many paths.  Set to 0 to always generate :py:attr:`Assignment.STOCH_PATHSET_SIZE` paths.  Float.
+    STOCH_PATHSET_UNSEEN_PROBABILITY = None
+
+    #: Route choice configuration: Label once for a group of trips that differ only in their end TAZ
+    #: (origin for outbound, destination for inbound): the same start TAZ, preferred time, user class,
+    #: purpose and demand modes.  Each trip's paths are then enumerated from that shared labeling.
+    #: This only applies to path finding in this process (e.g. not via :py:mod:`multiprocessing`).  Boolean.
+    SHARE_LABELING                  = None
+
+    #: Route choice configuration: Width of the preferred time buckets for shared labeling and the label cache,
+    #: in minutes.  If positive and either is on, each trip's preferred time is moved to the edge of its bucket
+    #: for path finding, so that trips in the same bucket can share a labeling (see :py:attr:`Assignment.SHARE_LABELING`
+    #: and :py:attr:`Assignment.LABEL_CACHE_MEGABYTES`).  Preferred
+    #: arrival times move earlier and preferred departure times move later, by less than the bucket width.
+    #: This changes the path finding results for every trip, whether or not it shares a labeling: its paths are
+    #: found for the moved preferred time, so its pathset can differ from the one for its own preferred time.
+    #: The path costs computed in python still use each trip's own preferred time.  Set to 0 to share only
+    #: between trips with exactly the same preferred time, which leaves the results as they are.  Float.
+    LABELING_TIME_BUCKET            = None
+
+    #: Route choice configuration: Memory budget for the C++ extension's cache of recent labelings, in megabytes.
+    #: A request with the same start TAZ (destination for outbound, origin for inbound), preferred time (bucketed
+    #: by :py:attr:`Assignment.LABELING_TIME_BUCKET`), user class, purpose and demand modes as a cached labeling
+    #: skips labeling and only connects its end TAZ to it.  Cached labelings don't stop early for the end TAZ, so
+    #: a miss labels more of the network than it would without the cache.  Each cached labeling includes per-stop
+    #: arrays, so this should allow for at least a few multiples of the network size.  The least recently used labelings are dropped to stay within
+    #: the budget, and the cache is emptied whenever the supply or bump wait changes.  Without a positive
+    #: :py:attr:`Assignment.LABELING_TIME_BUCKET`, only exactly matching preferred times hit, so a warning is logged.  Set to 0 to disable.  Float.
+    LABEL_CACHE_MEGABYTES           = None
+
+    #: Route choice configuration: Weight on a lower bound on the rest of each path (from the shortest ride,
+    #: transfer and access/egress times in the supply) when ordering stops for labeling, as in A* search.
+    #: Labeling then heads towards the other end of the trip and stops sooner.  Only stochastic path finding
+    #: uses it: deterministic labeling depends on the order stops are labeled in, so it would change the
+    #: deterministic paths.  For stochastic path finding the bound is converted
+    #: with the smallest time weight, and weights below 1.0 trade less pruning for hyperpaths closer to
+    #: those found without the bound.  Set to 0 to disable.  Float.
+    LABEL_LOWER_BOUND_WEIGHT        = None
+
     #: Route choice configuration: Use vehicle capacity constraints. Boolean.
     CAPACITY_CONSTRAINT             = None
 
@@ -144,6 +193,24 @@ class Assignment:
     #: Set to positive integer greater than 1 to set a fixed number of processes
     NUMBER_OF_PROCESSES             = None
 
+    #: Number of threads to use for path finding
+    #: The threads run within the C++ extension in this process and share one copy of the network supply.
+    #: Set to 1 to not use threads (then :py:attr:`Assignment.NUMBER_OF_PROCESSES` applies)
+    #: Set to less than 1 to use the result of :py:func:`multiprocessing.cpu_count`
+    #: Set to positive integer greater than 1 to set a fixed number of threads; this overrides
+    #: :py:attr:`Assignment.NUMBER_OF_PROCESSES`
+    NUMBER_OF_THREADS               = None
+
+    #: When using :py:attr:`Assignment.NUMBER_OF_PROCESSES` worker processes on a platform with :py:func:`os.fork`,
+    #: initialize the C++ extension once in this process and fork the workers afterwards, so they share
+    #: the network supply copy-on-write rather than each reading the configuration and building their own.
+    #: Boolean, off by default.  Where fork isn't available (Windows), workers always initialize their own extension.
+    FORK_WORKERS                    = None
+
+    #: When path finding within this process (e.g. not via :py:mod:`multiprocessing`), this
+    #: many paths are sent to the C++ extension at a time.  See :py:meth:`Assignment.find_trip_based_pathsets`.
+    FIND_PATHSETS_BATCH_SIZE        = 1000
+
     #: Extra time so passengers don't get bumped (?). A :py:class:`datetime.timedelta` instance.
     BUMP_BUFFER                     = None
 
@@ -251,9 +318,14 @@ class Assignment:
                       'debug_num_trips'                 :-1,
                       'prepend_route_id_to_trip_id'     :'False',
                       'number_of_processes'             :0,
+                      'number_of_threads'               :1,
+                      'fork_workers'                    :'False',
                       'bump_buffer'                     :5,
                       'bump_one_at_a_time'              :'False',
                       # pathfinding
+                      'label_cache_megabytes'           :0,
+                      'label_lower_bound_weight'        :0.0,
+                      'labeling_time_bucket'            :0.0,
                       'max_num_paths'                   :-1,
                       'min_path_probability'            :0.005,
                       'min_transfer_penalty'            :1.0,
@@ -261,9 +333,12 @@ class Assignment:
                       'overlap_split_transit'           :'False',
                       'overlap_variable'                :'count',
                       'pathfinding_type'                :Assignment.PATHFINDING_TYPE_STOCHASTIC,
+                      'share_labeling'                  :'False',
                       'stochastic_dispersion'           :1.0,
                       'stochastic_max_stop_process_count':-1,
                       'stochastic_pathset_size'         :1000,
+                      'stochastic_pathset_stall_draws'  :0,
+                      'stochastic_pathset_unseen_probability':0.0,
                       'time_window'                     :30,
                       'user_class_function'             :'generic_user_class'
                      })
@@ -294,11 +369,16 @@ class Assignment:
         Assignment.DEBUG_NUM_TRIPS               = parser.getint    ('fasttrips','debug_num_trips')
         Assignment.PREPEND_ROUTE_ID_TO_TRIP_ID   = parser.getboolean('fasttrips','prepend_route_id_to_trip_id')
         Assignment.NUMBER_OF_PROCESSES           = parser.getint    ('fasttrips','number_of_processes')
+        Assignment.NUMBER_OF_THREADS             = parser.getint    ('fasttrips','number_of_threads')
+        Assignment.FORK_WORKERS                  = parser.getboolean('fasttrips','fork_workers')
         Assignment.BUMP_BUFFER = datetime.timedelta(
                                          minutes = parser.getfloat  ('fasttrips','bump_buffer'))
         Assignment.BUMP_ONE_AT_A_TIME            = parser.getboolean('fasttrips','bump_one_at_a_time')
 
         # pathfinding
+        Assignment.LABEL_CACHE_MEGABYTES         = parser.getfloat  ('pathfinding','label_cache_megabytes')
+        Assignment.LABEL_LOWER_BOUND_WEIGHT      = parser.getfloat  ('pathfinding','label_lower_bound_weight')
+        Assignment.LABELING_TIME_BUCKET          = parser.getfloat  ('pathfinding','labeling_time_bucket')
         Assignment.MAX_NUM_PATHS                 = parser.getint    ('pathfinding','max_num_paths')
         Assignment.MIN_PATH_PROBABILITY          = parser.getfloat  ('pathfinding','min_path_probability')
         PathSet.MIN_TRANSFER_PENALTY             = parser.getfloat  ('pathfinding','min_transfer_penalty')
@@ -309,9 +389,12 @@ class Assignment:
         assert(Assignment.PATHFINDING_TYPE in [Assignment.PATHFINDING_TYPE_STOCHASTIC, \
                                                Assignment.PATHFINDING_TYPE_DETERMINISTIC, \
                                                Assignment.PATHFINDING_TYPE_READ_FILE])
+        Assignment.SHARE_LABELING                = parser.getboolean('pathfinding','share_labeling')
         Assignment.STOCH_DISPERSION              = parser.getfloat  ('pathfinding','stochastic_dispersion')
         Assignment.STOCH_MAX_STOP_PROCESS_COUNT  = parser.getint    ('pathfinding','stochastic_max_stop_process_count')
         Assignment.STOCH_PATHSET_SIZE            = parser.getint    ('pathfinding','stochastic_pathset_size')
+        Assignment.STOCH_PATHSET_STALL_DRAWS     = parser.getint    ('pathfinding','stochastic_pathset_stall_draws')
+        Assignment.STOCH_PATHSET_UNSEEN_PROBABILITY = parser.getfloat('pathfinding','stochastic_pathset_unseen_probability')
         Assignment.TIME_WINDOW = datetime.timedelta(
                                          minutes = parser.getfloat  ('pathfinding','time_window'))
         PathSet.USER_CLASS_FUNCTION              = parser.get       ('pathfinding','user_class_function')
@@ -324,6 +407,10 @@ class Assignment:
             msg = "User class function [%s] not defined.  Please check your function file [%s]" % (PathSet.USER_CLASS_FUNCTION, func_file)
             FastTripsLogger.fatal(msg)
             raise ConfigurationError(func_file, msg)
+        if Assignment.LABEL_CACHE_MEGABYTES > 0 and Assignment.LABELING_TIME_BUCKET <= 0:
+            FastTripsLogger.warn("pathfinding.label_cache_megabytes is set but pathfinding.labeling_time_bucket is 0, so only trips with " +
+                                 "exactly the same preferred time can use a cached labeling, and every other trip labels the whole network " +
+                                 "for the cache.  Set labeling_time_bucket too, or set label_cache_megabytes to 0.")
 
         weights_file = os.path.join(Assignment.INPUT_DEMAND_DIR, PathSet.WEIGHTS_FILE)
         if not os.path.exists(weights_file):
@@ -358,11 +445,16 @@ class Assignment:
         parser.set('fasttrips','debug_num_trips',               '%d' % Assignment.DEBUG_NUM_TRIPS)
         parser.set('fasttrips','prepend_route_id_to_trip_id',   'True' if Assignment.PREPEND_ROUTE_ID_TO_TRIP_ID else 'False')
         parser.set('fasttrips','number_of_processes',           '%d' % Assignment.NUMBER_OF_PROCESSES)
+        parser.set('fasttrips','number_of_threads',             '%d' % Assignment.NUMBER_OF_THREADS)
+        parser.set('fasttrips','fork_workers',                  'True' if Assignment.FORK_WORKERS else 'False')
         parser.set('fasttrips','bump_buffer',                   '%f' % (Assignment.BUMP_BUFFER.total_seconds()/60.0))
         parser.set('fasttrips','bump_one_at_a_time',            'True' if Assignment.BUMP_ONE_AT_A_TIME else 'False')
 
         #pathfinding
         parser.add_section('pathfinding')
+        parser.set('pathfinding','label_cache_megabytes',       '%f' % Assignment.LABEL_CACHE_MEGABYTES)
+        parser.set('pathfinding','label_lower_bound_weight',    '%f' % Assignment.LABEL_LOWER_BOUND_WEIGHT)
+        parser.set('pathfinding','labeling_time_bucket',        '%f' % Assignment.LABELING_TIME_BUCKET)
         parser.set('pathfinding','max_num_paths',               '%d' % Assignment.MAX_NUM_PATHS)
         parser.set('pathfinding','min_path_probability',        '%f' % Assignment.MIN_PATH_PROBABILITY)
         parser.set('pathfinding','min_transfer_penalty',        '%f' % PathSet.MIN_TRANSFER_PENALTY)
@@ -370,9 +462,12 @@ class Assignment:
         parser.set('pathfinding','overlap_split_transit',       'True' if PathSet.OVERLAP_SPLIT_TRANSIT else 'False')
         parser.set('pathfinding','overlap_variable',            '%s' % PathSet.OVERLAP_VARIABLE)
         parser.set('pathfinding','pathfinding_type',            Assignment.PATHFINDING_TYPE)
+        parser.set('pathfinding','share_labeling',              'True' if Assignment.SHARE_LABELING else 'False')
         parser.set('pathfinding','stochastic_dispersion',       '%f' % Assignment.STOCH_DISPERSION)
         parser.set('pathfinding','stochastic_max_stop_process_count', '%d' % Assignment.STOCH_MAX_STOP_PROCESS_COUNT)
         parser.set('pathfinding','stochastic_pathset_size',     '%d' % Assignment.STOCH_PATHSET_SIZE)
+        parser.set('pathfinding','stochastic_pathset_stall_draws', '%d' % Assignment.STOCH_PATHSET_STALL_DRAWS)
+        parser.set('pathfinding','stochastic_pathset_unseen_probability', '%f' % Assignment.STOCH_PATHSET_UNSEEN_PROBABILITY)
         parser.set('pathfinding','time_window',                 '%f' % (Assignment.TIME_WINDOW.total_seconds()/60.0))
         parser.set('pathfinding','user_class_function',         '%s' % PathSet.USER_CLASS_FUNCTION)
 
@@ -381,12 +476,33 @@ class Assignment:
         output_file.close()
 
     @staticmethod
-    def initialize_fasttrips_extension(process_number, output_dir, stop_times_df):
+    def network_for_extension(FT):
+        """
+        Returns the network tables for :py:meth:`Assignment.initialize_fasttrips_extension`: the trip, stop, route and
+        supply mode ID strings, the path weights, and the access/egress, transfer and trip attributes.
+
+        These are numpy arrays (and lists of strings), so they're cheap to pass to worker processes.
+        """
+        return (FT.trips.trip_ids_for_extension(),
+                FT.stops.stop_ids_for_extension(),
+                FT.routes.route_ids_for_extension(),
+                FT.routes.modes_for_extension(),
+                PathSet.weights_for_extension(),
+                FT.tazs.access_egress_for_extension(),
+                FT.transfers.transfers_for_extension(),
+                FT.trips.trips_for_extension())
+
+    @staticmethod
+    def initialize_fasttrips_extension(process_number, output_dir, stop_times_df, network):
         """
         Initialize the C++ fasttrips extension by passing it the network supply.
+
+        *network* is from :py:meth:`Assignment.network_for_extension`.
         """
         FastTripsLogger.debug("Initializing fasttrips extension for process number %d" % process_number)
 
+        _fasttrips.initialize_network(process_number, *network)
+
         # this may not be set yet if it is iter1
         overcap_col = Trip.SIM_COL_VEH_OVERCAP
         if Assignment.MSA_RESULTS:
@@ -410,10 +526,14 @@ class Assignment:
         _fasttrips.initialize_parameters(Assignment.TIME_WINDOW.total_seconds()/60.0,
                                          Assignment.BUMP_BUFFER.total_seconds()/60.0,
                                          Assignment.STOCH_PATHSET_SIZE,
+                                         Assignment.STOCH_PATHSET_STALL_DRAWS,
+                                         Assignment.STOCH_PATHSET_UNSEEN_PROBABILITY,
                                          Assignment.STOCH_DISPERSION,
                                          Assignment.STOCH_MAX_STOP_PROCESS_COUNT,
                                          Assignment.MAX_NUM_PATHS,
-                                         Assignment.MIN_PATH_PROBABILITY)
+                                         Assignment.MIN_PATH_PROBABILITY,
+                                         Assignment.LABEL_CACHE_MEGABYTES,
+                                         Assignment.LABEL_LOWER_BOUND_WEIGHT)
 
     @staticmethod
     def set_fasttrips_bump_wait(bump_wait_df):
@@ -684,10 +804,40 @@ class Assignment:
         if num_processes > est_paths_to_find*3:
             num_processes = int(est_paths_to_find/3)
 
+        num_threads         = Assignment.NUMBER_OF_THREADS
+        if  Assignment.NUMBER_OF_THREADS < 1:
+            num_threads     = multiprocessing.cpu_count()
+        if num_threads > est_paths_to_find*3:
+            num_threads = int(est_paths_to_find/3)
+        # threads replace the processes
+        if num_threads > 1:
+            num_processes = 1
+
+        if num_threads < 1:
+            num_threads = 1
+
+        # in this process, paths are found in batches
+        batch_pathsets      = []
+
+        # the network tables for the extension, for this process or the workers
+        network             = Assignment.network_for_extension(FT)
+
+        # forked workers inherit the extension initialized here
+        fork_workers        = num_processes > 1 and Assignment.FORK_WORKERS and hasattr(os, "fork")
+
         # this is probalby time consuming... put in a try block
         try:
             # Setup multiprocessing processes
             if num_processes > 1:
+                if fork_workers:
+                    Assignment.initialize_fasttrips_extension(0, output_dir, veh_trips_df, network)
+                    if iteration > 1:
+                        Assignment.set_fasttrips_bump_wait(Assignment.bump_wait_df)
+                    FastTripsLogger.info("Forking worker processes sharing the initialized network supply")
+                    worker_args = (None, None, None)
+                else:
+                    worker_args = (Assignment.bump_wait_df, veh_trips_df, network)
+
                 todo_queue      = multiprocessing.Queue()
                 done_queue      = multiprocessing.Queue()
                 for process_idx in range(1, 1+num_processes):
@@ -697,19 +847,29 @@ class Assignment:
                             args=(iteration, process_idx, Assignment.INPUT_NETWORK_DIR, Assignment.INPUT_DEMAND_DIR,
                                   Assignment.OUTPUT_DIR, todo_queue, done_queue,
                                   Assignment.PATHFINDING_TYPE==Assignment.PATHFINDING_TYPE_STOCHASTIC,
-                                  Assignment.bump_wait_df, veh_trips_df)),
+                                  fork_workers) + worker_args),
                         "alive":True,
                         "done":False
                     }
                     process_dict[process_idx]["process"].start()
             else:
-                Assignment.initialize_fasttrips_extension(0, output_dir, veh_trips_df)
+                Assignment.initialize_fasttrips_extension(0, output_dir, veh_trips_df, network)
+                if iteration > 1:
+                    Assignment.set_fasttrips_bump_wait(Assignment.bump_wait_df)
+                if num_threads > 1:
+                    FastTripsLogger.info("Finding paths with %d threads" % num_threads)
 
             # process tasks or send tasks to workers for processing
             num_paths_found_prev  = 0
             num_paths_found_now   = 0
-            path_cols             = list(FT.passengers.pathfind_trip_list_df.columns.values)
-            for path_tuple in FT.passengers.pathfind_trip_list_df.itertuples(index=False):
+            num_paths_requested   = 0  # pathsets sent to be found
+            num_paths_returned    = 0  # pathsets that came back, found or not
+            pathfind_trip_list_df = FT.passengers.pathfind_trip_list_df
+            # put trips that can share labeling into the same batches, and reuse cached labelings while they're recent.
+            # They're batched once they've all been collected, so the outputs stay in trip list order.
+            shared_batches        = (Assignment.SHARE_LABELING or Assignment.LABEL_CACHE_MEGABYTES > 0) and num_processes == 1
+            path_cols             = list(pathfind_trip_list_df.columns.values)
+            for path_tuple in pathfind_trip_list_df.itertuples(index=False):
                 path_dict         = dict(zip(path_cols, path_tuple))
                 trip_list_id      = path_dict[Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM]
                 person_id         = path_dict[Passenger.TRIP_LIST_COLUMN_PERSON_ID]
@@ -731,30 +891,36 @@ class Assignment:
                 #    num_paths_found_prev += 1
                 #    continue
 
+                num_paths_requested += 1
                 if num_processes > 1:
                     todo_queue.put( trip_pathset )
                 else:
                     if trace_person:
                         FastTripsLogger.debug("Tracing assignment of person_id %s" % str(person_id))
 
+                    batch_pathsets.append(trip_pathset)
+                    if shared_batches: continue
+                    if len(batch_pathsets) < Assignment.FIND_PATHSETS_BATCH_SIZE: continue
+
                     # do the work
-                    (pathdict, perf_dict) = \
-                        Assignment.find_trip_based_pathset(iteration, trip_pathset,
-                                                        Assignment.PATHFINDING_TYPE==Assignment.PATHFINDING_TYPE_STOCHASTIC,
-                                                        trace=trace_person)
-                    trip_pathset.pathdict = pathdict
-                    FT.performance.add_info(iteration, person_id, trip_list_id, perf_dict)
-
-                    if trip_pathset.path_found():
-                        num_paths_found_now += 1
-
-                    if num_paths_found_now % info_freq == 0:
-                        time_elapsed = datetime.datetime.now() - start_time
-                        FastTripsLogger.info(" %6d / %6d passenger paths found.  Time elapsed: %2dh:%2dm:%2ds" % (
-                                             num_paths_found_now, est_paths_to_find,
-                                             int( time_elapsed.total_seconds() / 3600),
-                                             int( (time_elapsed.total_seconds() % 3600) / 60),
-                                             time_elapsed.total_seconds() % 60))
+                    num_paths_found_now += Assignment.find_pathset_batch(FT, iteration, batch_pathsets, num_threads)
+                    num_paths_returned  += len(batch_pathsets)
+                    batch_pathsets       = []
+
+                    time_elapsed = datetime.datetime.now() - start_time
+                    FastTripsLogger.info(" %6d / %6d passenger paths found.  Time elapsed: %2dh:%2dm:%2ds" % (
+                                         num_paths_found_now, est_paths_to_find,
+                                         int( time_elapsed.total_seconds() / 3600),
+                                         int( (time_elapsed.total_seconds() % 3600) / 60),
+                                         time_elapsed.total_seconds() % 60))
+
+            # the last batch, or all of them if they're batched for shared labeling
+            if shared_batches and len(batch_pathsets) > 0:
+                num_paths_found_now += Assignment.find_pathset_batches_for_shared_labeling(FT, iteration, batch_pathsets, num_threads)
+                num_paths_returned  += len(batch_pathsets)
+            elif len(batch_pathsets) > 0:
+                num_paths_found_now += Assignment.find_pathset_batch(FT, iteration, batch_pathsets, num_threads)
+                num_paths_returned  += len(batch_pathsets)
 
             # multiprocessing follow-up
             if num_processes > 1:
@@ -763,55 +929,69 @@ class Assignment:
                     todo_queue.put('DONE')
 
                 # get results
-                done_procs = 0  # where done means not alive
+                done_procs = 0  # where done means it sent DONE, or it exited without sending it
                 while done_procs < len(process_dict):
 
+                    results = []
                     try:
-                        result     = done_queue.get(True, 30)
-                        worker_num = result[0]
-
-                        # FastTripsLogger.debug("Received %s" % str(result))
-                        if result[1] == "DONE":
-                            FastTripsLogger.debug("Received done from process %d" % worker_num)
-                            process_dict[worker_num]["done"] = True
-                        elif result[1] == "STARTING":
-                            process_dict[worker_num]["working_on"] = (result[2],result[3])
-                        elif result[1] == "COMPLETED":
-                            trip_list_id    = result[2]
-                            pathset         = FT.passengers.get_pathset(trip_list_id)
-                            pathset.pathdict= result[3]
-                            perf_dict       = result[4]
-                            person_id       = FT.passengers.get_person_id(trip_list_id)
-
-                            FT.performance.add_info(iteration, person_id, trip_list_id, perf_dict)
-
-                            if pathset.path_found():
-                                num_paths_found_now += 1
-
-                            if num_paths_found_now % info_freq == 0:
-                                time_elapsed = datetime.datetime.now() - start_time
-                                FastTripsLogger.info(" %6d / %6d passenger paths found.  Time elapsed: %2dh:%2dm:%2ds" % (
-                                                     num_paths_found_now, est_paths_to_find,
-                                                     int( time_elapsed.total_seconds() / 3600),
-                                                     int( (time_elapsed.total_seconds() % 3600) / 60),
-                                                     time_elapsed.total_seconds() % 60))
-
-                            del process_dict[worker_num]["working_on"]
-                        else:
-                            print "Unexpected done queue contents: " + str(result)
-
+                        results.append(done_queue.get(True, 30))
                     except Queue.Empty:
                         # This is normal
                         pass
-                    except:
-                        FastTripsLogger.error("Caught exception: %s" % str(sys.exc_info()))
-                        pass
 
-                    # check if any processes are not alive
-                    for process_idx in process_dict.keys():
-                        if process_dict[process_idx]["alive"] and not process_dict[process_idx]["process"].is_alive():
-                            FastTripsLogger.debug("Process %d is not alive" % process_idx)
-                            process_dict[process_idx]["alive"] = False
+                    # a process that has exited may have left results in the queue, so read those before deciding it crashed
+                    exited = [process_idx for process_idx in process_dict.keys()
+                              if process_dict[process_idx]["alive"] and not process_dict[process_idx]["process"].is_alive()]
+                    if len(exited) > 0:
+                        try:
+                            while True:
+                                results.append(done_queue.get_nowait())
+                        except Queue.Empty:
+                            pass
+
+                    for result in results:
+                        try:
+                            worker_num = result[0]
+                            # FastTripsLogger.debug("Received %s" % str(result))
+                            if result[1] == "DONE":
+                                FastTripsLogger.debug("Received done from process %d" % worker_num)
+                                process_dict[worker_num]["done"] = True
+                                done_procs += 1
+                            elif result[1] == "STARTING":
+                                process_dict[worker_num]["working_on"] = (result[2],result[3])
+                            elif result[1] == "COMPLETED":
+                                num_paths_returned += 1
+                                trip_list_id    = result[2]
+                                pathset         = FT.passengers.get_pathset(trip_list_id)
+                                pathset.set_paths(*result[3])
+                                perf_dict       = result[4]
+                                person_id       = FT.passengers.get_person_id(trip_list_id)
+
+                                FT.performance.add_info(iteration, person_id, trip_list_id, perf_dict)
+
+                                if pathset.path_found():
+                                    num_paths_found_now += 1
+
+                                if num_paths_found_now % info_freq == 0:
+                                    time_elapsed = datetime.datetime.now() - start_time
+                                    FastTripsLogger.info(" %6d / %6d passenger paths found.  Time elapsed: %2dh:%2dm:%2ds" % (
+                                                         num_paths_found_now, est_paths_to_find,
+                                                         int( time_elapsed.total_seconds() / 3600),
+                                                         int( (time_elapsed.total_seconds() % 3600) / 60),
+                                                         time_elapsed.total_seconds() % 60))
+
+                                del process_dict[worker_num]["working_on"]
+                            else:
+                                print "Unexpected done queue contents: " + str(result)
+
+                        except:
+                            FastTripsLogger.error("Caught exception: %s" % str(sys.exc_info()))
+                            pass
+
+                    for process_idx in exited:
+                        FastTripsLogger.debug("Process %d is not alive" % process_idx)
+                        process_dict[process_idx]["alive"] = False
+                        if not process_dict[process_idx]["done"]:
                             done_procs += 1
 
                 # join up my processes
@@ -827,6 +1007,12 @@ class Assignment:
                         else:
                             FastTripsLogger.info("Process %d appears to have crashed; see ft_debug_worker%02d.log" % (process_idx, process_idx))
 
+            # every pathset sent to be found should have come back, whether or not a path was found
+            if num_paths_returned != num_paths_requested:
+                msg = "Requested %d pathsets but got %d back (%d with paths)" % (num_paths_requested, num_paths_returned, num_paths_found_now)
+                FastTripsLogger.fatal(msg)
+                raise UnexpectedError(msg)
+
         except (KeyboardInterrupt, SystemExit):
             exc_type, exc_value, exc_tb = sys.exc_info()
             FastTripsLogger.error("Exception caught: %s" % str(exc_type))
@@ -862,10 +1048,10 @@ class Assignment:
         Will do so either backwards (destination to origin) if :py:attr:`PathSet.direction` is :py:attr:`PathSet.DIR_OUTBOUND`
         or forwards (origin to destination) if :py:attr:`PathSet.direction` is :py:attr:`PathSet.DIR_INBOUND`.
 
-        Returns (pathdict,
+        Returns ((link_ints, link_doubles, path_costs),
                  performance_dict)
 
-        Where pathdict maps {pathnum:{PATH_KEY_COST:cost, PATH_KEY_PROBABILITY:probability, PATH_KEY_STATES:[state list]}}
+        Where link_ints, link_doubles and path_costs are the arrays to pass to :py:meth:`PathSet.set_paths`
 
         Where performance_dict includes:
                  number of label iterations,
@@ -884,75 +1070,29 @@ class Assignment:
         :type  trace:     boolean
 
         """
+        # cached labelings are shared within a preferred time bucket
+        pref_time = float(pathset.pref_time_min)
+        if Assignment.LABEL_CACHE_MEGABYTES > 0:
+            pref_time = float(Assignment.labeling_pref_time(pref_time, pathset.outbound()))
+
         # FastTripsLogger.debug("C++ extension start")
         # send it to the C++ extension
         (ret_ints, ret_doubles, path_costs, process_num,
          label_iterations, num_labeled_stops, max_label_process_count,
          ms_labeling, ms_enumerating,
-         bytes_workingset, bytes_privateusage) = \
+         bytes_workingset, bytes_privateusage,
+         label_cache_hits, label_cache_misses, label_cache_evictions,
+         link_allocations, link_heap_allocations,
+         bytes_peak_workingset, ms_cpu,
+         label_queue_pushes, label_queue_pops, trips_scanned, links_accepted, links_rejected,
+         pathset_draws) = \
             _fasttrips.find_pathset(iteration, pathset.person_id_num, pathset.trip_list_id_num, hyperpath,
                                  pathset.user_class, pathset.purpose, pathset.access_mode, pathset.transit_mode, pathset.egress_mode,
                                  pathset.o_taz_num, pathset.d_taz_num,
-                                 1 if pathset.outbound() else 0, float(pathset.pref_time_min),
+                                 1 if pathset.outbound() else 0, pref_time,
                                  1 if trace else 0)
         # FastTripsLogger.debug("C++ extension complete")
         # FastTripsLogger.debug("Finished finding path for person %s trip list id num %d" % (pathset.person_id, pathset.trip_list_id_num))
-        pathdict = {}
-        row_num  = 0
-
-        for path_num in range(path_costs.shape[0]):
-
-            pathdict[path_num] = {}
-            pathdict[path_num][PathSet.PATH_KEY_COST       ] = path_costs[path_num, 0]
-            pathdict[path_num][PathSet.PATH_KEY_PROBABILITY] = path_costs[path_num, 1]
-            # List of (stop_id, stop_state)
-            pathdict[path_num][PathSet.PATH_KEY_STATES     ] = []
-
-            # print "path_num %d" % path_num
-
-            # while we have unprocessed rows and the row is still relevant for this path_num
-            while (row_num < ret_ints.shape[0]) and (ret_ints[row_num, 0] == path_num):
-                # print row_num
-
-                mode = ret_ints[row_num,2]
-                # todo
-                if mode == -100:
-                    mode = PathSet.STATE_MODE_ACCESS
-                elif mode == -101:
-                    mode = PathSet.STATE_MODE_EGRESS
-                elif mode == -102:
-                    mode = PathSet.STATE_MODE_TRANSFER
-                elif mode == -103:
-                    mode = Passenger.MODE_GENERIC_TRANSIT_NUM
-
-                if hyperpath:
-                    pathdict[path_num][PathSet.PATH_KEY_STATES].append( (ret_ints[row_num, 1], [
-                        ret_doubles[row_num,0],                                                          # label,
-                        Util.SIMULATION_DAY_START + datetime.timedelta(minutes=ret_doubles[row_num,1]),  # departure/arrival time
-                        mode,                                                                            # departure/arrival mode
-                        ret_ints[row_num,3],                                                             # trip id
-                        ret_ints[row_num,4],                                                             # successor/predecessor
-                        ret_ints[row_num,5],                                                             # sequence
-                        ret_ints[row_num,6],                                                             # sequence succ/pred
-                        datetime.timedelta(minutes=ret_doubles[row_num,2]),                              # link time
-                        ret_doubles[row_num,3],                                                          # cost
-                        Util.SIMULATION_DAY_START + datetime.timedelta(minutes=ret_doubles[row_num,4])   # arrival/departure time
-                    ] ) )
-                else:
-                    pathdict[path_num][PathSet.PATH_KEY_STATES].append( (ret_ints[row_num, 1], [
-                        datetime.timedelta(minutes=ret_doubles[row_num,0]),                              # label,
-                        Util.SIMULATION_DAY_START + datetime.timedelta(minutes=ret_doubles[row_num,1]),  # departure/arrival time
-                        mode,                                                                            # departure/arrival mode
-                        ret_ints[row_num,3],                                                             # trip id
-                        ret_ints[row_num,4],                                                             # successor/predecessor
-                        ret_ints[row_num,5],                                                             # sequence
-                        ret_ints[row_num,6],                                                             # sequence succ/pred
-                        datetime.timedelta(minutes=ret_doubles[row_num,2]),                              # link time
-                        datetime.timedelta(minutes=ret_doubles[row_num,3]),                              # cost
-                        Util.SIMULATION_DAY_START + datetime.timedelta(minutes=ret_doubles[row_num,4])   # arrival/departure time
-                    ] ) )
-                row_num += 1
-
         perf_dict = { \
             Performance.PERFORMANCE_COLUMN_PROCESS_NUM           : process_num,
             Performance.PERFORMANCE_COLUMN_LABEL_ITERATIONS      : label_iterations,
@@ -962,9 +1102,193 @@ class Assignment:
             Performance.PERFORMANCE_COLUMN_TIME_ENUMERATING_MS   : ms_enumerating,
             Performance.PERFORMANCE_COLUMN_TRACED                : trace,
             Performance.PERFORMANCE_COLUMN_WORKING_SET_BYTES     : bytes_workingset,
-            Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES   : bytes_privateusage
+            Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES   : bytes_privateusage,
+            Performance.PERFORMANCE_COLUMN_LABEL_CACHE_HITS      : label_cache_hits,
+            Performance.PERFORMANCE_COLUMN_LABEL_CACHE_MISSES    : label_cache_misses,
+            Performance.PERFORMANCE_COLUMN_LABEL_CACHE_EVICTIONS : label_cache_evictions,
+            Performance.PERFORMANCE_COLUMN_LINK_ALLOCATIONS      : link_allocations,
+            Performance.PERFORMANCE_COLUMN_LINK_HEAP_ALLOCATIONS : link_heap_allocations,
+            Performance.PERFORMANCE_COLUMN_PEAK_WORKING_SET_BYTES: bytes_peak_workingset,
+            Performance.PERFORMANCE_COLUMN_TIME_CPU_MS           : ms_cpu,
+            Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_PUSHES    : label_queue_pushes,
+            Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_POPS      : label_queue_pops,
+            Performance.PERFORMANCE_COLUMN_TRIPS_SCANNED         : trips_scanned,
+            Performance.PERFORMANCE_COLUMN_LINKS_ACCEPTED        : links_accepted,
+            Performance.PERFORMANCE_COLUMN_LINKS_REJECTED        : links_rejected,
+            Performance.PERFORMANCE_COLUMN_PATHSET_DRAWS         : pathset_draws
         }
-        return (pathdict, perf_dict)
+        return ((ret_ints, ret_doubles, path_costs), perf_dict)
+
+    @staticmethod
+    def find_trip_based_pathsets(iteration, pathsets, hyperpath, num_threads=1, share_labeling=False):
+        """
+        Perform trip-based path set search for a batch of :py:class:`PathSet` instances with a single call to the
+        C++ extension, which loops over them (on *num_threads* threads) without going back to python in between.
+        If *share_labeling*, pathsets in the batch that can share a labeling (see :py:attr:`Assignment.SHARE_LABELING`)
+        are labeled once.
+
+        Returns a list of ((link_ints, link_doubles, path_costs), performance_dict), one for each pathset.
+        The arrays are slices of the arrays returned for the whole batch.
+        See :py:meth:`Assignment.find_trip_based_pathset` for details.
+
+        :param iteration:   The pathfinding iteration we're on
+        :type  iteration:   int
+        :param pathsets:    the paths to fill in
+        :type  pathsets:    list of :py:class:`PathSet` instances
+        :param hyperpath:   pass True to use a stochastic hyperpath-finding algorithm, otherwise a deterministic shortest path
+                            search algorithm will be use.
+        :type  hyperpath:   boolean
+        :param num_threads: number of threads for the C++ extension to use
+        :type  num_threads: int
+        :param share_labeling: label once for pathsets that differ only in their end TAZ, with preferred times
+                               bucketed by :py:attr:`Assignment.LABELING_TIME_BUCKET`
+        :type  share_labeling: boolean
+        """
+        # the extension takes the user class, purpose and demand modes as codes into this list of strings
+        string_nums = {}
+        def string_codes(strings):
+            return numpy.array([string_nums.setdefault(string, len(string_nums)) for string in strings], dtype='int32')
+
+        traced = [ (pathset.person_id in Assignment.TRACE_PERSON_IDS) for pathset in pathsets ]
+
+        outbound  = numpy.array([pathset.outbound()      for pathset in pathsets], dtype='int32')
+        pref_time = numpy.array([pathset.pref_time_min   for pathset in pathsets], dtype='float64')
+        if share_labeling or Assignment.LABEL_CACHE_MEGABYTES > 0:
+            pref_time = Assignment.labeling_pref_time(pref_time, outbound)
+
+        (ret_ints, ret_doubles, path_costs, link_offsets, path_offsets, perf, process_num) = \
+            _fasttrips.find_pathsets(iteration, 1 if hyperpath else 0, num_threads, 1 if share_labeling else 0,
+                                     numpy.array([pathset.person_id_num        for pathset in pathsets], dtype='int32'),
+                                     numpy.array([pathset.trip_list_id_num     for pathset in pathsets], dtype='int32'),
+                                     numpy.array([pathset.o_taz_num            for pathset in pathsets], dtype='int32'),
+                                     numpy.array([pathset.d_taz_num            for pathset in pathsets], dtype='int32'),
+                                     outbound,
+                                     pref_time,
+                                     numpy.array(traced,                                                 dtype='int32'),
+                                     string_codes([pathset.user_class          for pathset in pathsets]),
+                                     string_codes([pathset.purpose             for pathset in pathsets]),
+                                     string_codes([pathset.access_mode         for pathset in pathsets]),
+                                     string_codes([pathset.transit_mode        for pathset in pathsets]),
+                                     string_codes([pathset.egress_mode         for pathset in pathsets]),
+                                     sorted(string_nums, key=string_nums.get))
+
+        results = []
+        for pathset_num in range(len(pathsets)):
+            links = slice(link_offsets[pathset_num], link_offsets[pathset_num+1])
+            paths = slice(path_offsets[pathset_num], path_offsets[pathset_num+1])
+            perf_dict = { \
+                Performance.PERFORMANCE_COLUMN_PROCESS_NUM           : process_num,
+                Performance.PERFORMANCE_COLUMN_LABEL_ITERATIONS      : perf[pathset_num, 0],
+                Performance.PERFORMANCE_COLUMN_NUM_LABELED_STOPS     : perf[pathset_num, 1],
+                Performance.PERFORMANCE_COLUMN_MAX_STOP_PROCESS_COUNT: perf[pathset_num, 2],
+                Performance.PERFORMANCE_COLUMN_TIME_LABELING_MS      : perf[pathset_num, 3],
+                Performance.PERFORMANCE_COLUMN_TIME_ENUMERATING_MS   : perf[pathset_num, 4],
+                Performance.PERFORMANCE_COLUMN_TRACED                : traced[pathset_num],
+                Performance.PERFORMANCE_COLUMN_WORKING_SET_BYTES     : perf[pathset_num, 5],
+                Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES   : perf[pathset_num, 6],
+                Performance.PERFORMANCE_COLUMN_LABEL_CACHE_HITS      : perf[pathset_num, 7],
+                Performance.PERFORMANCE_COLUMN_LABEL_CACHE_MISSES    : perf[pathset_num, 8],
+                Performance.PERFORMANCE_COLUMN_LABEL_CACHE_EVICTIONS : perf[pathset_num, 9],
+                Performance.PERFORMANCE_COLUMN_LINK_ALLOCATIONS      : perf[pathset_num, 10],
+                Performance.PERFORMANCE_COLUMN_LINK_HEAP_ALLOCATIONS : perf[pathset_num, 11],
+                Performance.PERFORMANCE_COLUMN_PEAK_WORKING_SET_BYTES: perf[pathset_num, 12],
+                Performance.PERFORMANCE_COLUMN_TIME_CPU_MS           : perf[pathset_num, 13],
+                Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_PUSHES    : perf[pathset_num, 14],
+                Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_POPS      : perf[pathset_num, 15],
+                Performance.PERFORMANCE_COLUMN_TRIPS_SCANNED         : perf[pathset_num, 16],
+                Performance.PERFORMANCE_COLUMN_LINKS_ACCEPTED        : perf[pathset_num, 17],
+                Performance.PERFORMANCE_COLUMN_LINKS_REJECTED        : perf[pathset_num, 18],
+                Performance.PERFORMANCE_COLUMN_PATHSET_DRAWS         : perf[pathset_num, 19]
+            }
+            results.append( ((ret_ints[links], ret_doubles[links], path_costs[paths]), perf_dict) )
+        return results
+
+    @staticmethod
+    def labeling_pref_time(pref_time, outbound):
+        """
+        Returns the preferred times to find paths with for the given preferred times (minutes after midnight) and
+        outbound flags, both numpy arrays or both scalars.  If :py:attr:`Assignment.LABELING_TIME_BUCKET` is positive, preferred
+        arrival times (outbound) are rounded down and preferred departure times rounded up to a multiple of it.
+        Both labeling and path enumeration use the rounded time, so this changes the pathsets found.
+        """
+        if Assignment.LABELING_TIME_BUCKET <= 0:
+            return pref_time
+        buckets = pref_time/Assignment.LABELING_TIME_BUCKET
+        return numpy.where(outbound, numpy.floor(buckets), numpy.ceil(buckets))*Assignment.LABELING_TIME_BUCKET
+
+    @staticmethod
+    def shared_labeling_order(pathsets):
+        """
+        Returns the order in which to find the given list of :py:class:`PathSet` instances so that pathsets which can share
+        a labeling (see :py:attr:`Assignment.SHARE_LABELING`) are next to each other: by direction, start TAZ (destination
+        for outbound, origin for inbound) and preferred time, bucketed as in :py:meth:`Assignment.labeling_pref_time`.
+        """
+        outbound      = numpy.array([pathset.outbound() for pathset in pathsets], dtype=bool)
+        start_taz_num = numpy.array([(pathset.d_taz_num if pathset.outbound() else pathset.o_taz_num) for pathset in pathsets])
+        pref_time     = numpy.array([pathset.pref_time_min for pathset in pathsets], dtype='float64')
+        pref_time     = Assignment.labeling_pref_time(pref_time, outbound)
+        # lexsort is stable, so otherwise the order is unchanged
+        return numpy.lexsort((pref_time, start_taz_num, outbound))
+
+    @staticmethod
+    def find_pathset_batch(FT, iteration, pathsets, num_threads):
+        """
+        Finds the pathsets for the given list of :py:class:`PathSet` instances using :py:meth:`Assignment.find_trip_based_pathsets`,
+        sets their paths and records the performance information.
+
+        Returns the number of pathsets for which a path was found.
+        """
+        results = Assignment.find_trip_based_pathsets(iteration, pathsets,
+                                                      Assignment.PATHFINDING_TYPE==Assignment.PATHFINDING_TYPE_STOCHASTIC,
+                                                      num_threads, Assignment.SHARE_LABELING)
+        return Assignment.set_pathset_results(FT, iteration, pathsets, results)
+
+    @staticmethod
+    def find_pathset_batches_for_shared_labeling(FT, iteration, pathsets, num_threads):
+        """
+        Like :py:meth:`Assignment.find_pathset_batch`, but for all of the pathsets to find in this process, batched
+        in :py:meth:`Assignment.shared_labeling_order` so that pathsets which can share a labeling are in the same batch
+        and cached labelings are reused while they're recent.  The paths and performance information are still set in
+        the order given, so the outputs stay in trip list order.
+
+        Returns the number of pathsets for which a path was found.
+        """
+        order      = Assignment.shared_labeling_order(pathsets)
+        results    = [None]*len(pathsets)
+        start_time = datetime.datetime.now()
+        for batch_start in range(0, len(order), Assignment.FIND_PATHSETS_BATCH_SIZE):
+            batch_nums    = order[batch_start:batch_start+Assignment.FIND_PATHSETS_BATCH_SIZE]
+            batch_results = Assignment.find_trip_based_pathsets(iteration, [pathsets[pathset_num] for pathset_num in batch_nums],
+                                                                Assignment.PATHFINDING_TYPE==Assignment.PATHFINDING_TYPE_STOCHASTIC,
+                                                                num_threads, Assignment.SHARE_LABELING)
+            for (pathset_num, result) in zip(batch_nums, batch_results):
+                results[pathset_num] = result
+
+            time_elapsed = datetime.datetime.now() - start_time
+            FastTripsLogger.info(" %6d / %6d passenger paths searched.  Time elapsed: %2dh:%2dm:%2ds" % (
+                                 batch_start + len(batch_nums), len(pathsets),
+                                 int( time_elapsed.total_seconds() / 3600),
+                                 int( (time_elapsed.total_seconds() % 3600) / 60),
+                                 time_elapsed.total_seconds() % 60))
+
+        return Assignment.set_pathset_results(FT, iteration, pathsets, results)
+
+    @staticmethod
+    def set_pathset_results(FT, iteration, pathsets, results):
+        """
+        Sets the paths for the given list of :py:class:`PathSet` instances from the results of
+        :py:meth:`Assignment.find_trip_based_pathsets` and records the performance information, in order.
+
+        Returns the number of pathsets for which a path was found.
+        """
+        num_paths_found = 0
+        for (pathset, (path_arrays, perf_dict)) in zip(pathsets, results):
+            pathset.set_paths(*path_arrays)
+            FT.performance.add_info(iteration, pathset.person_id, pathset.trip_list_id_num, perf_dict)
+
+            if pathset.path_found():
+                num_paths_found += 1
+        return num_paths_found
 
     @staticmethod
     def find_passenger_vehicle_times(pathset_links_df, veh_trips_df):
@@ -1694,11 +2018,16 @@ class Assignment:
 
 
 def find_trip_based_paths_process_worker(iteration, worker_num, input_network_dir, input_demand_dir,
-                                         output_dir, todo_pathset_queue, done_queue, hyperpath, bump_wait_df, stop_times_df):
+                                         output_dir, todo_pathset_queue, done_queue, hyperpath, forked,
+                                         bump_wait_df, stop_times_df, network):
     """
     Process worker function.  Processes all the paths in queue.
 
     todo_queue has (passenger_id, path object)
+
+    If *forked*, this process was forked after the parent initialized the C++ extension (see
+    :py:attr:`Assignment.FORK_WORKERS`), so the configuration and the network supply are inherited
+    and *bump_wait_df*, *stop_times_df* and *network* are unused.
     """
     worker_str = "_worker%02d" % worker_num
 
@@ -1709,19 +2038,24 @@ def find_trip_based_paths_process_worker(iteration, worker_num, input_network_di
                  append           = True if iteration > 1 else False)
     FastTripsLogger.info("Iteration %d Worker %2d starting" % (iteration, worker_num))
 
-    # the child process doesn't have these set to read them
-    Assignment.read_configuration(override_input_network_dir=output_dir,
-                                  override_input_demand_dir=input_demand_dir,
-                                  config_file=Assignment.CONFIGURATION_OUTPUT_FILE)
+    if forked:
+        # the extension was initialized by the parent; it just needs to know who we are
+        _fasttrips.set_process_number(worker_num)
+    else:
+        # the child process doesn't have these set to read them
+        Assignment.read_configuration(override_input_network_dir=output_dir,
+                                      override_input_demand_dir=input_demand_dir,
+                                      config_file=Assignment.CONFIGURATION_OUTPUT_FILE)
 
-    # this passes those read parameters and the stop times to the C++ extension
-    Assignment.initialize_fasttrips_extension(worker_num, output_dir, stop_times_df)
+        # this passes those read parameters, the network and the stop times to the C++ extension
+        Assignment.initialize_fasttrips_extension(worker_num, output_dir, stop_times_df, network)
 
-    # the extension has it now, so we're done
-    stop_times_df = None
+        # the extension has it now, so we're done
+        stop_times_df = None
+        network       = None
 
-    if iteration > 1:
-        Assignment.set_fasttrips_bump_wait(bump_wait_df)
+        if iteration > 1:
+            Assignment.set_fasttrips_bump_wait(bump_wait_df)
 
     while True:
         # go through my queue -- check if we're done
@@ -1744,8 +2078,8 @@ def find_trip_based_paths_process_worker(iteration, worker_num, input_network_di
             trace_person = True
 
         try:
-            (pathdict, perf_dict) = Assignment.find_trip_based_pathset(iteration, pathset, hyperpath, trace=trace_person)
-            done_queue.put( (worker_num, "COMPLETED", pathset.trip_list_id_num, pathdict, perf_dict) )
+            (path_arrays, perf_dict) = Assignment.find_trip_based_pathset(iteration, pathset, hyperpath, trace=trace_person)
+            done_queue.put( (worker_num, "COMPLETED", pathset.trip_list_id_num, path_arrays, perf_dict) )
         except:
             FastTripsLogger.exception("Exception")
             # call it a day
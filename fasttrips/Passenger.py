@@ -339,7 +339,7 @@ class Passenger:
         FastTripsLogger.debug("Demand mode types by class & purpose: \n%s" % str(self.modes_df))
 
         # Make sure we have all the weights required for these user_class/mode combinations
-        self.trip_list_df = PathSet.verify_weight_config(self.modes_df, output_dir, routes, capacity_constraint, self.trip_list_df)
+        self.trip_list_df = PathSet.verify_weight_config(self.modes_df, routes, capacity_constraint, self.trip_list_df)
 
         FastTripsLogger.info("Have %d person trips" % len(self.trip_list_df))
         FastTripsLogger.debug("Final trip_list_df\n"+str(self.trip_list_df.index.dtype)+"\n"+str(self.trip_list_df.dtypes))
@@ -511,133 +511,77 @@ class Passenger:
 
         """
         from .PathSet import PathSet
-        pathlist = []
-        linklist = []
-
-        trip_list_id_nums = self.pathfind_trip_list_df[Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM].tolist()
-
-        for trip_list_id,pathset in self.id_to_pathset.iteritems():
-            # only process if we just did pathfinding for this person trip
-            if trip_list_id not in trip_list_id_nums: continue
-
-            if not pathset.goes_somewhere():   continue
-            if not pathset.path_found():       continue
-
-            for pathnum in range(pathset.num_paths()):
-                # OUTBOUND passengers have states like this:
-                #    stop:          label    departure   dep_mode  successor linktime
-                # orig_taz                                 Access    b stop1
-                #  b stop1                                  trip1    a stop2
-                #  a stop2                               Transfer    b stop3
-                #  b stop3                                  trip2    a stop4
-                #  a stop4                                 Egress   dest_taz
-                #
-                #  stop:         label  dep_time    dep_mode   successor  seq  suc       linktime             cost  arr_time
-                #   460:  0:20:49.4000  17:41:10      Access        3514   -1   -1   0:03:08.4000     0:03:08.4000  17:44:18
-                #  3514:  0:17:41.0000  17:44:18     5131292        4313   30   40   0:06:40.0000     0:12:21.8000  17:50:59
-                #  4313:  0:05:19.2000  17:50:59    Transfer        5728   -1   -1   0:00:19.2000     0:00:19.2000  17:51:18
-                #  5728:  0:04:60.0000  17:57:00     5154302        5726   16   17   0:07:33.8000     0:03:02.4000  17:58:51
-                #  5726:  0:01:57.6000  17:58:51      Egress         231   -1   -1   0:01:57.6000     0:01:57.6000  18:00:49
-
-                # INBOUND passengers have states like this
-                #   stop:          label      arrival   arr_mode predecessor linktime
-                # dest_taz                                 Egress    a stop4
-                #  a stop4                                  trip2    b stop3
-                #  b stop3                               Transfer    a stop2
-                #  a stop2                                  trip1    b stop1
-                #  b stop1                                 Access   orig_taz
-                #
-                #  stop:         label  arr_time    arr_mode predecessor  seq pred       linktime             cost  dep_time
-                #    15:  0:36:38.4000  17:30:38      Egress        3772   -1   -1   0:02:38.4000     0:02:38.4000  17:28:00
-                #  3772:  0:34:00.0000  17:28:00     5123368        6516   22   14   0:24:17.2000     0:24:17.2000  17:05:50
-                #  6516:  0:09:42.8000  17:03:42    Transfer        4766   -1   -1   0:00:16.8000     0:00:16.8000  17:03:25
-                #  4766:  0:09:26.0000  17:03:25     5138749        5671    7    3   0:05:30.0000     0:05:33.2000  16:57:55
-                #  5671:  0:03:52.8000  16:57:55      Access         943   -1   -1   0:03:52.8000     0:03:52.8000  16:54:03
-                prev_linkmode = None
-                prev_state_id = None
-
-                state_list = pathset.pathdict[pathnum][PathSet.PATH_KEY_STATES]
-                if not pathset.outbound(): state_list = list(reversed(state_list))
-
-                pathlist.append([\
-                    pathset.person_id,
-                    pathset.person_trip_id,
-                    trip_list_id,
-                    pathset.direction,
-                    pathset.mode,
-                    iteration,
-                    pathnum,
-                    pathset.pathdict[pathnum][PathSet.PATH_KEY_COST],
-                    pathset.pathdict[pathnum][PathSet.PATH_KEY_PROBABILITY]
-                ])
-
-                link_num   = 0
-                for (state_id, state) in state_list:
-
-                    linkmode        = state[PathSet.STATE_IDX_DEPARRMODE]
-                    mode_num        = None
-                    trip_id         = None
-                    waittime        = None
-
-                    if linkmode in [PathSet.STATE_MODE_ACCESS, PathSet.STATE_MODE_TRANSFER, PathSet.STATE_MODE_EGRESS]:
-                        mode_num    = state[PathSet.STATE_IDX_TRIP]
-                    else:
-                        # trip mode_num will need to be joined
-                        trip_id     = state[PathSet.STATE_IDX_TRIP]
-                        linkmode    = PathSet.STATE_MODE_TRIP
-
-                    if pathset.outbound():
-                        a_id_num    = state_id
-                        b_id_num    = state[PathSet.STATE_IDX_SUCCPRED]
-                        a_seq       = state[PathSet.STATE_IDX_SEQ]
-                        b_seq       = state[PathSet.STATE_IDX_SEQ_SUCCPRED]
-                        b_time      = state[PathSet.STATE_IDX_ARRDEP]
-                        a_time      = b_time - state[PathSet.STATE_IDX_LINKTIME]
-                        trip_time   = state[PathSet.STATE_IDX_ARRDEP] - state[PathSet.STATE_IDX_DEPARR]
-                    else:
-                        a_id_num    = state[PathSet.STATE_IDX_SUCCPRED]
-                        b_id_num    = state_id
-                        a_seq       = state[PathSet.STATE_IDX_SEQ_SUCCPRED]
-                        b_seq       = state[PathSet.STATE_IDX_SEQ]
-                        b_time      = state[PathSet.STATE_IDX_DEPARR]
-                        a_time      = b_time - state[PathSet.STATE_IDX_LINKTIME]
-                        trip_time   = state[PathSet.STATE_IDX_DEPARR] - state[PathSet.STATE_IDX_ARRDEP]
-
-                    # trips: linktime includes wait
-                    if linkmode == PathSet.STATE_MODE_TRIP:
-                        waittime    = state[PathSet.STATE_IDX_LINKTIME] - trip_time
-
-                    # two trips in a row -- this shouldn't happen
-                    if linkmode == PathSet.STATE_MODE_TRIP and prev_linkmode == PathSet.STATE_MODE_TRIP:
-                        FastTripsLogger.warn("Two trip links in a row... this shouldn't happen.  trip_list_id is %s\npathnum is %d\nstatelist (%d): %s\n" % (str(trip_list_id), pathnum, len(state_list), str(state_list)))
-                        sys.exit()
-
-                    linklist.append([\
-                        pathset.person_id,
-                        pathset.person_trip_id,
-                        trip_list_id,
-                        iteration,
-                        pathnum,
-                        linkmode,
-                        mode_num,
-                        trip_id,
-                        a_id_num,
-                        b_id_num,
-                        a_seq,
-                        b_seq,
-                        a_time,
-                        b_time,
-                        state[PathSet.STATE_IDX_LINKTIME],
-                        waittime,
-                        link_num ])
-
-                    prev_linkmode = linkmode
-                    prev_state_id = state_id
-                    link_num     += 1
-
-        FastTripsLogger.debug("setup_passenger_pathsets(): pathlist and linklist constructed")
-
-        pathset_paths_df = pandas.DataFrame(pathlist, columns=[\
+
+        trip_list_id_nums = set(self.pathfind_trip_list_df[Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM].tolist())
+
+        # only process if we just did pathfinding for this person trip, and found something
+        pathsets = [ (trip_list_id, pathset) for (trip_list_id, pathset) in self.id_to_pathset.iteritems()
+                     if (trip_list_id in trip_list_id_nums) and pathset.goes_somewhere() and pathset.path_found() ]
+
+        # OUTBOUND passengers have states like this:
+        #    stop:          label    departure   dep_mode  successor linktime
+        # orig_taz                                 Access    b stop1
+        #  b stop1                                  trip1    a stop2
+        #  a stop2                               Transfer    b stop3
+        #  b stop3                                  trip2    a stop4
+        #  a stop4                                 Egress   dest_taz
+        #
+        #  stop:         label  dep_time    dep_mode   successor  seq  suc       linktime             cost  arr_time
+        #   460:  0:20:49.4000  17:41:10      Access        3514   -1   -1   0:03:08.4000     0:03:08.4000  17:44:18
+        #  3514:  0:17:41.0000  17:44:18     5131292        4313   30   40   0:06:40.0000     0:12:21.8000  17:50:59
+        #  4313:  0:05:19.2000  17:50:59    Transfer        5728   -1   -1   0:00:19.2000     0:00:19.2000  17:51:18
+        #  5728:  0:04:60.0000  17:57:00     5154302        5726   16   17   0:07:33.8000     0:03:02.4000  17:58:51
+        #  5726:  0:01:57.6000  17:58:51      Egress         231   -1   -1   0:01:57.6000     0:01:57.6000  18:00:49
+
+        # INBOUND passengers have states like this
+        #   stop:          label      arrival   arr_mode predecessor linktime
+        # dest_taz                                 Egress    a stop4
+        #  a stop4                                  trip2    b stop3
+        #  b stop3                               Transfer    a stop2
+        #  a stop2                                  trip1    b stop1
+        #  b stop1                                 Access   orig_taz
+        #
+        #  stop:         label  arr_time    arr_mode predecessor  seq pred       linktime             cost  dep_time
+        #    15:  0:36:38.4000  17:30:38      Egress        3772   -1   -1   0:02:38.4000     0:02:38.4000  17:28:00
+        #  3772:  0:34:00.0000  17:28:00     5123368        6516   22   14   0:24:17.2000     0:24:17.2000  17:05:50
+        #  6516:  0:09:42.8000  17:03:42    Transfer        4766   -1   -1   0:00:16.8000     0:00:16.8000  17:03:25
+        #  4766:  0:09:26.0000  17:03:25     5138749        5671    7    3   0:05:30.0000     0:05:33.2000  16:57:55
+        #  5671:  0:03:52.8000  16:57:55      Access         943   -1   -1   0:03:52.8000     0:03:52.8000  16:54:03
+        #
+        # The extension returns them as rows of link_ints and link_doubles (see PathSet.LINK_INT_* and PathSet.LINK_DOUBLE_*),
+        # which we stack for all the pathsets and turn into columns without going through the rows in python.
+        def stack(arrays, num_cols, dtype):
+            if len(arrays) == 0: return numpy.empty((0,num_cols), dtype=dtype)
+            return numpy.concatenate(arrays)
+
+        def minutes_to_timedelta(minutes):
+            # to the microsecond, like datetime.timedelta
+            return numpy.round(minutes*60.0*1000000.0).astype(numpy.int64).astype('timedelta64[us]')
+
+        path_costs   = stack([pathset.path_costs   for (trip_list_id, pathset) in pathsets], 2, numpy.float64)
+        link_ints    = stack([pathset.link_ints    for (trip_list_id, pathset) in pathsets], 7, numpy.int32).astype(numpy.int64)
+        link_doubles = stack([pathset.link_doubles for (trip_list_id, pathset) in pathsets], 5, numpy.float64)
+
+        # pathset attributes, indexed by pathset
+        num_paths    = numpy.array([pathset.num_paths()        for (trip_list_id, pathset) in pathsets], dtype=numpy.int64)
+        num_links    = numpy.array([pathset.link_ints.shape[0] for (trip_list_id, pathset) in pathsets], dtype=numpy.int64)
+        outbound     = numpy.array([pathset.outbound()         for (trip_list_id, pathset) in pathsets], dtype=bool)
+        first_path   = numpy.cumsum(num_paths) - num_paths
+
+        # path attributes
+        path_pathset = numpy.repeat(numpy.arange(len(pathsets)), num_paths)
+
+        pathset_paths_df = pandas.DataFrame({
+            Passenger.TRIP_LIST_COLUMN_PERSON_ID         : numpy.array([pathset.person_id      for (trip_list_id, pathset) in pathsets], dtype=object)[path_pathset],
+            Passenger.TRIP_LIST_COLUMN_PERSON_TRIP_ID    : numpy.array([pathset.person_trip_id for (trip_list_id, pathset) in pathsets], dtype=object)[path_pathset],
+            Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM  : numpy.array([trip_list_id           for (trip_list_id, pathset) in pathsets], dtype=numpy.int64)[path_pathset],
+            'pathdir'                                    : numpy.array([pathset.direction      for (trip_list_id, pathset) in pathsets], dtype=numpy.int64)[path_pathset],
+            'pathmode'                                   : numpy.array([pathset.mode           for (trip_list_id, pathset) in pathsets], dtype=object)[path_pathset],
+            Passenger.PF_COL_PF_ITERATION                : numpy.repeat(iteration, len(path_pathset)),
+            Passenger.PF_COL_PATH_NUM                    : numpy.arange(len(path_pathset)) - first_path[path_pathset],
+            PathSet.PATH_KEY_COST                        : path_costs[:,PathSet.PATH_COL_COST],
+            PathSet.PATH_KEY_PROBABILITY                 : path_costs[:,PathSet.PATH_COL_PROBABILITY]
+            }, columns=[
             Passenger.TRIP_LIST_COLUMN_PERSON_ID,
             Passenger.TRIP_LIST_COLUMN_PERSON_TRIP_ID,
             Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM,
@@ -648,7 +592,77 @@ class Passenger:
             PathSet.PATH_KEY_COST,
             PathSet.PATH_KEY_PROBABILITY ])
 
-        pathset_links_df = pandas.DataFrame(linklist, columns=[\
+        # link attributes; link_path is the row in pathset_paths_df
+        link_pathset   = numpy.repeat(numpy.arange(len(pathsets)), num_links)
+        link_path      = first_path[link_pathset] + link_ints[:,PathSet.LINK_INT_PATH_NUM]
+        # (older numpy doesn't take minlength=0)
+        links_per_path = numpy.bincount(link_path, minlength=max(len(path_pathset),1))[:len(path_pathset)]
+        link_pos       = numpy.arange(len(link_path)) - (numpy.cumsum(links_per_path) - links_per_path)[link_path]
+        # inbound paths come destination first, so reverse those
+        link_num       = numpy.where(outbound[link_pathset], link_pos, links_per_path[link_path] - 1 - link_pos)
+
+        order          = numpy.lexsort((link_num, link_path))
+        link_ints      = link_ints[order]
+        link_doubles   = link_doubles[order]
+        link_path      = link_path[order]
+        link_num       = link_num[order]
+        link_outbound  = outbound[link_pathset[order]]
+
+        deparr_mode    = link_ints[:,PathSet.LINK_INT_DEPARRMODE]
+        linkmode       = numpy.empty(len(link_path), dtype=object)
+        linkmode[:]    = PathSet.STATE_MODE_TRIP
+        linkmode[deparr_mode == PathSet.MODE_CODE_ACCESS  ] = PathSet.STATE_MODE_ACCESS
+        linkmode[deparr_mode == PathSet.MODE_CODE_EGRESS  ] = PathSet.STATE_MODE_EGRESS
+        linkmode[deparr_mode == PathSet.MODE_CODE_TRANSFER] = PathSet.STATE_MODE_TRANSFER
+        is_trip        = (linkmode == PathSet.STATE_MODE_TRIP)
+
+        # two trips in a row -- this shouldn't happen
+        two_trips      = is_trip[1:] & is_trip[:-1] & (link_path[1:] == link_path[:-1])
+        if two_trips.any():
+            bad_path   = pathset_paths_df.iloc[link_path[1:][two_trips][0]]
+            FastTripsLogger.warn("Two trip links in a row... this shouldn't happen.  trip_list_id is %s\npathnum is %d\nlinkmodes: %s\n" % \
+                                 (str(bad_path[Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM]), bad_path[Passenger.PF_COL_PATH_NUM],
+                                  str(linkmode[link_path == link_path[1:][two_trips][0]].tolist())))
+            sys.exit()
+
+        # trips: trip mode_num will need to be joined
+        trip_or_mode   = link_ints[:,PathSet.LINK_INT_TRIP].astype(numpy.float64)
+        mode_num       = numpy.where(is_trip, numpy.nan, trip_or_mode)
+        trip_id_num    = numpy.where(is_trip, trip_or_mode, numpy.nan)
+
+        stop_id        = link_ints[:,PathSet.LINK_INT_STOP]
+        succpred       = link_ints[:,PathSet.LINK_INT_SUCCPRED]
+        seq            = link_ints[:,PathSet.LINK_INT_SEQ]
+        seq_succpred   = link_ints[:,PathSet.LINK_INT_SEQ_SUCCPRED]
+
+        day_start      = numpy.datetime64(Util.SIMULATION_DAY_START)
+        deparr_time    = day_start + minutes_to_timedelta(link_doubles[:,PathSet.LINK_DOUBLE_DEPARR])
+        arrdep_time    = day_start + minutes_to_timedelta(link_doubles[:,PathSet.LINK_DOUBLE_ARRDEP])
+        linktime       = minutes_to_timedelta(link_doubles[:,PathSet.LINK_DOUBLE_LINKTIME])
+        b_time         = numpy.where(link_outbound, arrdep_time, deparr_time)
+        trip_time      = numpy.where(link_outbound, arrdep_time - deparr_time, deparr_time - arrdep_time)
+        # trips: linktime includes wait
+        waittime       = numpy.where(is_trip, linktime - trip_time, numpy.timedelta64('NaT'))
+
+        pathset_links_df = pandas.DataFrame({
+            Passenger.TRIP_LIST_COLUMN_PERSON_ID         : pathset_paths_df[Passenger.TRIP_LIST_COLUMN_PERSON_ID       ].values[link_path],
+            Passenger.TRIP_LIST_COLUMN_PERSON_TRIP_ID    : pathset_paths_df[Passenger.TRIP_LIST_COLUMN_PERSON_TRIP_ID  ].values[link_path],
+            Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM  : pathset_paths_df[Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM].values[link_path],
+            Passenger.PF_COL_PF_ITERATION                : pathset_paths_df[Passenger.PF_COL_PF_ITERATION              ].values[link_path],
+            Passenger.PF_COL_PATH_NUM                    : pathset_paths_df[Passenger.PF_COL_PATH_NUM                  ].values[link_path],
+            Passenger.PF_COL_LINK_MODE                   : linkmode,
+            Route.ROUTES_COLUMN_MODE_NUM                 : mode_num,
+            Trip.TRIPS_COLUMN_TRIP_ID_NUM                : trip_id_num,
+            'A_id_num'                                   : numpy.where(link_outbound, stop_id,      succpred),
+            'B_id_num'                                   : numpy.where(link_outbound, succpred,     stop_id),
+            'A_seq'                                      : numpy.where(link_outbound, seq,          seq_succpred),
+            'B_seq'                                      : numpy.where(link_outbound, seq_succpred, seq),
+            Passenger.PF_COL_PAX_A_TIME                  : (b_time - linktime).astype('datetime64[ns]'),
+            Passenger.PF_COL_PAX_B_TIME                  : b_time.astype('datetime64[ns]'),
+            Passenger.PF_COL_LINK_TIME                   : linktime.astype('timedelta64[ns]'),
+            Passenger.PF_COL_WAIT_TIME                   : waittime.astype('timedelta64[ns]'),
+            Passenger.PF_COL_LINK_NUM                    : link_num
+            }, columns=[
             Passenger.TRIP_LIST_COLUMN_PERSON_ID,
             Passenger.TRIP_LIST_COLUMN_PERSON_TRIP_ID,
             Passenger.TRIP_LIST_COLUMN_TRIP_LIST_ID_NUM,
@@ -94,26 +94,37 @@ class PathSet:
     #: Weights column: Supply Mode number
     WEIGHTS_COLUMN_SUPPLY_MODE_NUM  = "supply_mode_num"
 
-    #: File with weights for c++
-    OUTPUT_WEIGHTS_FILE             = "ft_intermediate_weights.txt"
-
     DIR_OUTBOUND    = 1  #: Trips outbound from home have preferred arrival times
     DIR_INBOUND     = 2  #: Trips inbound to home have preferred departure times
 
     PATH_KEY_COST           = "pf_cost"
     PATH_KEY_PROBABILITY    = "pf_probability"
-    PATH_KEY_STATES         = "states"
-
-    STATE_IDX_LABEL         = 0  #: :py:class:`datetime.timedelta` instance
-    STATE_IDX_DEPARR        = 1  #: :py:class:`datetime.datetime` instance. Departure if outbound/backwards, arrival if inbound/forwards.
-    STATE_IDX_DEPARRMODE    = 2  #: mode id
-    STATE_IDX_TRIP          = 3  #: trip id
-    STATE_IDX_SUCCPRED      = 4  #: stop identifier or TAZ identifier
-    STATE_IDX_SEQ           = 5  #: sequence (for trip)
-    STATE_IDX_SEQ_SUCCPRED  = 6  #: sequence for successor/predecessor
-    STATE_IDX_LINKTIME      = 7  #: :py:class:`datetime.timedelta` instance
-    STATE_IDX_COST          = 8  #: cost float, for hyperpath/stochastic assignment
-    STATE_IDX_ARRDEP        = 9  #: :py:class:`datetime.datetime` instance. Arrival if outbound/backwards, departure if inbound/forwards.
+
+    # columns of :py:attr:`PathSet.link_ints`, one row per path link, as returned by the C++ extension
+    LINK_INT_PATH_NUM       = 0  #: path number within the pathset
+    LINK_INT_STOP           = 1  #: stop identifier or TAZ identifier
+    LINK_INT_DEPARRMODE     = 2  #: mode code, one of the PathSet.MODE_CODE_*
+    LINK_INT_TRIP           = 3  #: trip id for trip links, mode id otherwise
+    LINK_INT_SUCCPRED       = 4  #: stop identifier or TAZ identifier
+    LINK_INT_SEQ            = 5  #: sequence (for trip)
+    LINK_INT_SEQ_SUCCPRED   = 6  #: sequence for successor/predecessor
+
+    # columns of :py:attr:`PathSet.link_doubles`; times are in minutes after midnight and durations in minutes
+    LINK_DOUBLE_LABEL       = 0  #: label
+    LINK_DOUBLE_DEPARR      = 1  #: Departure if outbound/backwards, arrival if inbound/forwards.
+    LINK_DOUBLE_LINKTIME    = 2  #: link time
+    LINK_DOUBLE_COST        = 3  #: cost, for hyperpath/stochastic assignment
+    LINK_DOUBLE_ARRDEP      = 4  #: Arrival if outbound/backwards, departure if inbound/forwards.
+
+    # columns of :py:attr:`PathSet.path_costs`, one row per path
+    PATH_COL_COST           = 0  #: path cost
+    PATH_COL_PROBABILITY    = 1  #: path probability
+
+    # :py:attr:`PathSet.LINK_INT_DEPARRMODE` codes for access, egress, transfer and (generic) transit links
+    MODE_CODE_ACCESS          = -100
+    MODE_CODE_EGRESS          = -101
+    MODE_CODE_TRANSFER        = -102
+    MODE_CODE_GENERIC_TRANSIT = -103
 
     # these are also the demand_mode_type values
     STATE_MODE_ACCESS   = "access"
@@ -145,8 +156,8 @@ class PathSet:
         else:
             raise Exception("Don't understand trip_list %s: %s" % (Passenger.TRIP_LIST_COLUMN_TIME_TARGET, str(trip_list_dict)))
 
-        #: Dict of path-num -> { cost:, probability:, states: [List of (stop_id, stop_state)]}
-        self.pathdict = {}
+        #: The paths found, as the arrays returned by the C++ extension.  See :py:meth:`PathSet.set_paths`.
+        self.reset()
 
     def goes_somewhere(self):
         """
@@ -158,19 +169,37 @@ class PathSet:
         """
         Was a a transit path found from the origin to the destination with the constraints?
         """
-        return len(self.pathdict) > 0
+        return self.path_costs.shape[0] > 0
 
     def num_paths(self):
         """
         Number of paths in the PathSet
         """
-        return len(self.pathdict)
+        return self.path_costs.shape[0]
+
+    def set_paths(self, link_ints, link_doubles, path_costs):
+        """
+        Sets the paths found from the arrays returned by the C++ extension for this pathset.
+        They're kept as they are; :py:meth:`Passenger.setup_passenger_pathsets` turns them into dataframes.
+
+        :param link_ints:    link integer columns, see PathSet.LINK_INT_*.  Links are in path number order.
+        :type  link_ints:    :py:class:`numpy.ndarray` of int32
+        :param link_doubles: link double columns, see PathSet.LINK_DOUBLE_*
+        :type  link_doubles: :py:class:`numpy.ndarray` of float64
+        :param path_costs:   path columns, see PathSet.PATH_COL_*
+        :type  path_costs:   :py:class:`numpy.ndarray` of float64
+        """
+        self.link_ints    = link_ints
+        self.link_doubles = link_doubles
+        self.path_costs   = path_costs
 
     def reset(self):
         """
-        Delete my states, something went wrong and it won't work out.
+        Delete my paths, something went wrong and it won't work out.
         """
-        self.pathdict = []
+        self.set_paths(numpy.empty((0,7), dtype=numpy.int32),
+                       numpy.empty((0,5), dtype=numpy.float64),
+                       numpy.empty((0,2), dtype=numpy.float64))
 
     def outbound(self):
         """
@@ -186,7 +215,7 @@ class PathSet:
         trip_list_df[new_colname] = trip_list_df.apply(PathSet.CONFIGURED_FUNCTIONS[PathSet.USER_CLASS_FUNCTION], axis=1)
 
     @staticmethod
-    def verify_weight_config(modes_df, output_dir, routes, capacity_constraint, trip_list_df):
+    def verify_weight_config(modes_df, routes, capacity_constraint, trip_list_df):
         """
         Verify that we have complete weight configurations for the user classes and modes in the given DataFrame.
 
@@ -347,17 +376,37 @@ class PathSet:
                                                     numeric_newcolname=PathSet.WEIGHTS_COLUMN_SUPPLY_MODE_NUM,
                                                     warn=True)  # don't fail if some supply modes are configured but not used, they may be for future runs
         FastTripsLogger.debug("PathSet weights: \n%s" % PathSet.WEIGHTS_DF)
-        PathSet.WEIGHTS_DF.to_csv(os.path.join(output_dir,PathSet.OUTPUT_WEIGHTS_FILE),
-                               columns=[PathSet.WEIGHTS_COLUMN_USER_CLASS,
-                                        PathSet.WEIGHTS_COLUMN_PURPOSE,
-                                        PathSet.WEIGHTS_COLUMN_DEMAND_MODE_TYPE,
-                                        PathSet.WEIGHTS_COLUMN_DEMAND_MODE,
-                                        PathSet.WEIGHTS_COLUMN_SUPPLY_MODE_NUM,
-                                        PathSet.WEIGHTS_COLUMN_WEIGHT_NAME,
-                                        PathSet.WEIGHTS_COLUMN_WEIGHT_VALUE],
-                               sep=" ", index=False)
         return trip_list_df
 
+    @staticmethod
+    def weights_for_extension():
+        """
+        Returns the path weights as a network table for the C++ extension: the user class, purpose, demand mode type,
+        demand mode, supply mode number and weight name, plus the weight value.  The string columns are passed as
+        codes into the table's strings.  Weights for supply modes that aren't in the network are left out.
+        See :py:meth:`Util.table_for_extension`.
+        """
+        weights_df = PathSet.WEIGHTS_DF.loc[pandas.notnull(PathSet.WEIGHTS_DF[PathSet.WEIGHTS_COLUMN_SUPPLY_MODE_NUM])].copy()
+
+        string_cols = [PathSet.WEIGHTS_COLUMN_USER_CLASS,
+                       PathSet.WEIGHTS_COLUMN_PURPOSE,
+                       PathSet.WEIGHTS_COLUMN_DEMAND_MODE_TYPE,
+                       PathSet.WEIGHTS_COLUMN_DEMAND_MODE,
+                       PathSet.WEIGHTS_COLUMN_WEIGHT_NAME]
+        string_nums = {}
+        for col in string_cols:
+            weights_df[col] = [string_nums.setdefault(str(string), len(string_nums)) for string in weights_df[col]]
+
+        return Util.table_for_extension(weights_df,
+                                        [PathSet.WEIGHTS_COLUMN_USER_CLASS,
+                                         PathSet.WEIGHTS_COLUMN_PURPOSE,
+                                         PathSet.WEIGHTS_COLUMN_DEMAND_MODE_TYPE,
+                                         PathSet.WEIGHTS_COLUMN_DEMAND_MODE,
+                                         PathSet.WEIGHTS_COLUMN_SUPPLY_MODE_NUM,
+                                         PathSet.WEIGHTS_COLUMN_WEIGHT_NAME],
+                                        [PathSet.WEIGHTS_COLUMN_WEIGHT_VALUE],
+                                        strings=sorted(string_nums, key=string_nums.get))
+
     def __str__(self):
         """
         Readable string version of the path.
@@ -53,6 +53,32 @@ class Performance:
     PERFORMANCE_COLUMN_WORKING_SET_BYTES      = "working set bytes"
     #: Performance column: Private usage in memroy, in bytes
     PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES    = "private usage bytes"
+    #: Performance column: 1 if the labeling came from the label cache
+    PERFORMANCE_COLUMN_LABEL_CACHE_HITS       = "label cache hits"
+    #: Performance column: 1 if the label cache was checked and didn't have the labeling
+    PERFORMANCE_COLUMN_LABEL_CACHE_MISSES     = "label cache misses"
+    #: Performance column: Number of labelings evicted from the label cache to make room for this one
+    PERFORMANCE_COLUMN_LABEL_CACHE_EVICTIONS  = "label cache evictions"
+    #: Performance column: Number of link arrays allocated for hyperlinks while labeling
+    PERFORMANCE_COLUMN_LINK_ALLOCATIONS       = "link allocations"
+    #: Performance column: Number of times link allocation while labeling went to the heap for more memory
+    PERFORMANCE_COLUMN_LINK_HEAP_ALLOCATIONS  = "link heap allocations"
+    #: Performance column: Peak working set in memory, in bytes
+    PERFORMANCE_COLUMN_PEAK_WORKING_SET_BYTES = "peak working set bytes"
+    #: Performance column: CPU time spent labeling and enumerating on the path finding thread (milliseconds)
+    PERFORMANCE_COLUMN_TIME_CPU_MS            = "time cpu milliseconds"
+    #: Performance column: Number of pushes onto the label stop queue while labeling
+    PERFORMANCE_COLUMN_LABEL_QUEUE_PUSHES     = "label queue pushes"
+    #: Performance column: Number of pops from the label stop queue while labeling
+    PERFORMANCE_COLUMN_LABEL_QUEUE_POPS       = "label queue pops"
+    #: Performance column: Number of trip stop times scanned while labeling
+    PERFORMANCE_COLUMN_TRIPS_SCANNED          = "trips scanned"
+    #: Performance column: Number of links added to stop hyperlinks while labeling
+    PERFORMANCE_COLUMN_LINKS_ACCEPTED         = "links accepted"
+    #: Performance column: Number of links rejected by stop hyperlinks while labeling
+    PERFORMANCE_COLUMN_LINKS_REJECTED         = "links rejected"
+    #: Performance column: Number of stochastic paths generated for the pathset (0 for deterministic)
+    PERFORMANCE_COLUMN_PATHSET_DRAWS          = "pathset draws"
 
     #: File with to write performance results
     OUTPUT_PERFORMANCE_FILE                   = 'ft_output_performance.csv'
@@ -75,7 +101,20 @@ class Performance:
             Performance.PERFORMANCE_COLUMN_TIME_ENUMERATING         :[],
             Performance.PERFORMANCE_COLUMN_TIME_ENUMERATING_MS      :[],
             Performance.PERFORMANCE_COLUMN_WORKING_SET_BYTES        :[],
-            Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES      :[]
+            Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES      :[],
+            Performance.PERFORMANCE_COLUMN_LABEL_CACHE_HITS         :[],
+            Performance.PERFORMANCE_COLUMN_LABEL_CACHE_MISSES       :[],
+            Performance.PERFORMANCE_COLUMN_LABEL_CACHE_EVICTIONS    :[],
+            Performance.PERFORMANCE_COLUMN_LINK_ALLOCATIONS         :[],
+            Performance.PERFORMANCE_COLUMN_LINK_HEAP_ALLOCATIONS    :[],
+            Performance.PERFORMANCE_COLUMN_PEAK_WORKING_SET_BYTES   :[],
+            Performance.PERFORMANCE_COLUMN_TIME_CPU_MS              :[],
+            Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_PUSHES       :[],
+            Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_POPS         :[],
+            Performance.PERFORMANCE_COLUMN_TRIPS_SCANNED            :[],
+            Performance.PERFORMANCE_COLUMN_LINKS_ACCEPTED           :[],
+            Performance.PERFORMANCE_COLUMN_LINKS_REJECTED           :[],
+            Performance.PERFORMANCE_COLUMN_PATHSET_DRAWS            :[]
         }
 
 
@@ -96,7 +135,20 @@ class Performance:
                     Performance.PERFORMANCE_COLUMN_TIME_LABELING_MS,
                     Performance.PERFORMANCE_COLUMN_TIME_ENUMERATING_MS,
                     Performance.PERFORMANCE_COLUMN_WORKING_SET_BYTES,
-                    Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES]:
+                    Performance.PERFORMANCE_COLUMN_PRIVATE_USAGE_BYTES,
+                    Performance.PERFORMANCE_COLUMN_LABEL_CACHE_HITS,
+                    Performance.PERFORMANCE_COLUMN_LABEL_CACHE_MISSES,
+                    Performance.PERFORMANCE_COLUMN_LABEL_CACHE_EVICTIONS,
+                    Performance.PERFORMANCE_COLUMN_LINK_ALLOCATIONS,
+                    Performance.PERFORMANCE_COLUMN_LINK_HEAP_ALLOCATIONS,
+                    Performance.PERFORMANCE_COLUMN_PEAK_WORKING_SET_BYTES,
+                    Performance.PERFORMANCE_COLUMN_TIME_CPU_MS,
+                    Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_PUSHES,
+                    Performance.PERFORMANCE_COLUMN_LABEL_QUEUE_POPS,
+                    Performance.PERFORMANCE_COLUMN_TRIPS_SCANNED,
+                    Performance.PERFORMANCE_COLUMN_LINKS_ACCEPTED,
+                    Performance.PERFORMANCE_COLUMN_LINKS_REJECTED,
+                    Performance.PERFORMANCE_COLUMN_PATHSET_DRAWS]:
             self.performance_dict[key].append(perf_dict[key])
 
         # convert milliseconds time to timedeltas
@@ -120,11 +120,6 @@ class Route(object):
     #: fasttrips Fare transfer rules column name: Transfer Rule
     FARE_TRANSFER_RULES_COLUMN_TRANSFER_RULE    = "transfer_rule"
 
-    #: File with route ID, route ID number correspondence
-    OUTPUT_ROUTE_ID_NUM_FILE                    = "ft_intermediate_route_id.txt"
-    #: File with mode, mode number correspondence
-    OUTPUT_MODE_NUM_FILE                        = "ft_intermediate_supply_mode_id.txt"
-
     def __init__(self, input_dir, output_dir, gtfs_schedule, today):
         """
         Constructor.  Reads the gtfs data from the transitfeed schedule, and the additional
@@ -179,11 +174,6 @@ class Route(object):
                                                    numeric_newcolname=Route.ROUTES_COLUMN_ROUTE_ID_NUM)
         FastTripsLogger.debug("Route ID to number correspondence\n" + str(self.route_id_df.head()))
         FastTripsLogger.debug(str(self.route_id_df.dtypes))
-        # write intermediate files
-        self.route_id_df.to_csv(os.path.join(output_dir, Route.OUTPUT_ROUTE_ID_NUM_FILE),
-                                columns=[Route.ROUTES_COLUMN_ROUTE_ID_NUM, Route.ROUTES_COLUMN_ROUTE_ID],
-                                sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(self.output_dir, Route.OUTPUT_ROUTE_ID_NUM_FILE))
 
         self.routes_df = self.add_numeric_route_id(self.routes_df,
                                                    id_colname=Route.ROUTES_COLUMN_ROUTE_ID,
@@ -336,11 +326,21 @@ class Route(object):
                                       egress_modes_df], axis=0)
         self.modes_df.reset_index(inplace=True)
 
-        # write intermediate files
-        self.modes_df.to_csv(os.path.join(self.output_dir, Route.OUTPUT_MODE_NUM_FILE),
-                             columns=[Route.ROUTES_COLUMN_MODE_NUM, Route.ROUTES_COLUMN_MODE],
-                             sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(self.output_dir, Route.OUTPUT_MODE_NUM_FILE))
+    def route_ids_for_extension(self):
+        """
+        Returns the route ID number to route ID correspondence as a network table for the C++ extension.
+        See :py:meth:`Util.table_for_extension`.
+        """
+        return Util.table_for_extension(self.route_id_df, [Route.ROUTES_COLUMN_ROUTE_ID_NUM],
+                                        strings=self.route_id_df[Route.ROUTES_COLUMN_ROUTE_ID])
+
+    def modes_for_extension(self):
+        """
+        Returns the supply mode number to supply mode correspondence as a network table for the C++ extension.
+        See :py:meth:`Util.table_for_extension`.
+        """
+        return Util.table_for_extension(self.modes_df, [Route.ROUTES_COLUMN_MODE_NUM],
+                                        strings=self.modes_df[Route.ROUTES_COLUMN_MODE])
 
     def add_numeric_mode_id(self, input_df, id_colname, numeric_newcolname, warn=False):
         """
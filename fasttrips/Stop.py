@@ -64,9 +64,6 @@ class Stop:
     STOPS_COLUMN_STOP_ID_NUM                = 'stop_id_num'
 
 
-    #: File with stop ID, stop ID number correspondence
-    OUTPUT_STOP_ID_NUM_FILE                   = 'ft_intermediate_stop_id.txt'
-
     def __init__(self, input_dir, output_dir, gtfs_schedule):
         """
         Constructor.  Reads the gtfs data from the transitfeed schedule, and the additional
@@ -182,12 +179,13 @@ class Stop:
         self.stop_id_df = pandas.concat([self.stop_id_df, tazs_unique_df], axis=0)
         ##############################################################################################
 
-        # write the stop id numbering file
-        self.stop_id_df.to_csv(os.path.join(self.output_dir, Stop.OUTPUT_STOP_ID_NUM_FILE),
-                               columns=[Stop.STOPS_COLUMN_STOP_ID_NUM, Stop.STOPS_COLUMN_STOP_ID],
-                               sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(self.output_dir, Stop.OUTPUT_STOP_ID_NUM_FILE))
-
+    def stop_ids_for_extension(self):
+        """
+        Returns the stop ID number to stop ID correspondence (including DAPs and TAZs) as a network table for the C++ extension.
+        See :py:meth:`Util.table_for_extension`.
+        """
+        return Util.table_for_extension(self.stop_id_df, [Stop.STOPS_COLUMN_STOP_ID_NUM],
+                                        strings=self.stop_id_df[Stop.STOPS_COLUMN_STOP_ID])
 
     def add_numeric_stop_id(self, input_df, id_colname, numeric_newcolname, warn=False, warn_msg=None):
         """
@@ -204,11 +204,6 @@ class TAZ:
     DRIVE_MODE_NUMS = [MODE_ACCESS_PNR, MODE_ACCESS_KNR,
                        MODE_EGRESS_PNR, MODE_EGRESS_KNR]
 
-    #: File with access/egress links for C++ extension
-    #: It's easier to pass it via a file rather than through the
-    #: initialize_fasttrips_extension() because of the strings involved, I think.
-    OUTPUT_ACCESS_EGRESS_FILE               = "ft_intermediate_access_egress.txt"
-
     def __init__(self, input_dir, output_dir, today, stops, transfers, routes):
         """
         Constructor.  Reads the TAZ data from the input files in *input_dir*.
@@ -448,8 +443,8 @@ class TAZ:
         # warn on stops that have no walk access
         self.warn_on_stops_without_walk_access(stops)
 
-        # write this to communicate to extension
-        self.write_access_egress_for_extension(output_dir)
+        # set up the access and egress link attributes for the extension
+        self.setup_access_egress_for_extension()
 
     def add_distance(self, links_df, dist_col):
         """
@@ -539,15 +534,11 @@ class TAZ:
         if len(no_access_stops) > 0:
             FastTripsLogger.warn("The following %d stop ids have no walk access: \n%s" % (len(no_access_stops), no_access_stops.to_string()))
 
-    def write_access_egress_for_extension(self, output_dir):
+    def setup_access_egress_for_extension(self):
         """
-        Write the access and egress links to a single output file for the C++ extension to read.
-        It's in this form because I'm not sure how to pass the strings to C++ in
-        Assignment.initialize_fasttrips_extension so I know that's inconsistent, but it's a
-        time sink to investigate, so I'll leave this for now
-
-        .. todo:: clean this up?  Rename intermediate files (they're not really output)
-
+        Sets up the walk and drive access and egress link attributes, indexed by TAZ num, supply mode num
+        and stop num, as *walk_df* and *drive_df*.  These are passed to the C++ extension via
+        :py:meth:`TAZ.access_egress_for_extension`.
         """
         # ========== Walk access/egres =================================================
         # print "walk_access columns"
@@ -613,33 +604,31 @@ class TAZ:
                                 TAZ.DRIVE_ACCESS_COLUMN_SUPPLY_MODE_NUM,
                                 TAZ.DRIVE_ACCESS_COLUMN_STOP_NUM], inplace=True)
 
-            # stack() this will make it so beyond taz num, supply mode num, and stop num
-            # the remaining columns collapse to variable name, variable value
-
-            # put walk and drive together
-            access_df = pandas.concat([self.walk_df.stack(), self.drive_df.stack()], axis=0).to_frame()
+    def access_egress_for_extension(self):
+        """
+        Returns the walk and drive access and egress links as a network table for the C++ extension:
+        the TAZ num, supply mode num and stop num, plus the link attributes.
+        See :py:meth:`Util.table_for_extension`.
+        """
+        index_cols = [TAZ.WALK_ACCESS_COLUMN_TAZ_NUM,
+                      TAZ.WALK_ACCESS_COLUMN_SUPPLY_MODE_NUM,
+                      TAZ.WALK_ACCESS_COLUMN_STOP_NUM]
+        # put walk and drive together; attributes that one doesn't have are null
+        if len(self.drive_df) > 0:
+            access_df = pandas.concat([self.walk_df.reset_index(), self.drive_df.reset_index()], axis=0, ignore_index=True)
         else:
-            access_df = self.walk_df.stack().to_frame()
-
-        access_df.reset_index(inplace=True)
-        # rename from these default column names
-        access_df.rename(columns={"level_3":"attr_name", 0:"attr_value"}, inplace=True)
-        # make attr_value a float instead of an object
-        access_df["attr_value"] = access_df["attr_value"].astype(float)
+            access_df = self.walk_df.reset_index()
 
         FastTripsLogger.debug("\n" + str(access_df.head()))
         FastTripsLogger.debug("\n" + str(access_df.tail()))
 
         # Check for null stop ids
-        null_stop_ids = access_df.loc[pandas.isnull(access_df["stop_id_num"])]
+        null_stop_ids = access_df.loc[pandas.isnull(access_df[TAZ.WALK_ACCESS_COLUMN_STOP_NUM])]
         if len(null_stop_ids) > 0:
-            FastTripsLogger.warn("write_access_egress_for_extension null_stop_ids:\n%s" % str(null_stop_ids))
+            FastTripsLogger.warn("access_egress_for_extension null_stop_ids:\n%s" % str(null_stop_ids))
 
             # for now, drop rows with null stop id nums
-            access_df = access_df.loc[ pandas.notnull(access_df["stop_id_num"]) ]
-
-        access_df["stop_id_num"] = access_df["stop_id_num"].astype(int)
+            access_df = access_df.loc[ pandas.notnull(access_df[TAZ.WALK_ACCESS_COLUMN_STOP_NUM]) ]
 
-        access_df.to_csv(os.path.join(output_dir, TAZ.OUTPUT_ACCESS_EGRESS_FILE),
-                         sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(output_dir, TAZ.OUTPUT_ACCESS_EGRESS_FILE))
\ No newline at end of file
+        attr_cols = [col for col in list(access_df.columns.values) if col not in index_cols]
+        return Util.table_for_extension(access_df, index_cols, attr_cols)
@@ -18,6 +18,7 @@ import pandas
 from .Error  import NetworkInputError
 from .Logger import FastTripsLogger
 from .Stop   import Stop
+from .Util   import Util
 
 class Transfer:
     """
@@ -83,11 +84,6 @@ class Transfer:
     TRANSFERS_COLUMN_TIME_MIN   = 'time_min'
     #: Transfers column name: Link generic cost.  Float.
 
-    #: File with transfer links for C++ extension
-    #: It's easier to pass it via file rather than through the
-    #: initialize_fasttrips_extension() because of the strings involved
-    OUTPUT_TRANSFERS_FILE       = "ft_intermediate_transfers.txt"
-
     def __init__(self, input_dir, output_dir, gtfs_schedule):
         """
         Constructor.  Reads the gtfs data from the transitfeed schedule, and the additional
@@ -207,8 +203,6 @@ class Transfer:
                                                          numeric_newcolname=Transfer.TRANSFERS_COLUMN_TO_STOP_NUM,
                                                          warn=True,
                                                          warn_msg="Numeric stop id not found for transfer to_stop_id")
-            # We're ready to write it
-            self.write_transfers_for_extension()
 
     def add_distance(self, links_df, dist_col):
         """
@@ -234,17 +228,26 @@ class Transfer:
         links_df.loc[ (links_df["linkmode"]=="transfer")&(links_df["A_id_num"]==links_df["B_id_num"]), dist_col ] = 0.0
         return links_df
 
-    def write_transfers_for_extension(self):
+    def transfers_for_extension(self):
         """
-        This writes to an intermediate file a formatted file for the C++ extension.
-        Since there are strings involved, it's easier than passing it to the extension.
+        Returns the transfer links as a network table for the C++ extension: the from and to stop ID numbers,
+        plus the numeric transfer attributes.
+        See :py:meth:`Util.table_for_extension`.
         """
+        index_cols = [Transfer.TRANSFERS_COLUMN_FROM_STOP_NUM, Transfer.TRANSFERS_COLUMN_TO_STOP_NUM]
+        if len(self.transfers_df) == 0:
+            return Util.table_for_extension(pandas.DataFrame(columns=index_cols), index_cols)
+
         transfers_df = self.transfers_df.copy()
 
         # drop transfer_type==3 => that means no transfer possible
         # https://github.com/osplanning-data-standards/GTFS-PLUS/blob/master/files/transfers.md
         transfers_df = transfers_df.loc[transfers_df[Transfer.TRANSFERS_COLUMN_TRANSFER_TYPE] != 3]
 
+        # drop transfers with stops we couldn't number
+        transfers_df = transfers_df.loc[pandas.notnull(transfers_df[Transfer.TRANSFERS_COLUMN_FROM_STOP_NUM])&
+                                        pandas.notnull(transfers_df[Transfer.TRANSFERS_COLUMN_TO_STOP_NUM])]
+
         # drop some of the attributes
         transfers_df.drop([Transfer.TRANSFERS_COLUMN_TIME,                # use numerical version
                            Transfer.TRANSFERS_COLUMN_FROM_STOP,           # use numerical version
@@ -258,14 +261,6 @@ class Transfer:
         # transfers time_min is really walk_time_min
         transfers_df["walk_time_min"] = transfers_df[Transfer.TRANSFERS_COLUMN_TIME_MIN]
 
-        # the index is from stop id num, to stop id num
-        transfers_df.set_index([Transfer.TRANSFERS_COLUMN_FROM_STOP_NUM,
-                                Transfer.TRANSFERS_COLUMN_TO_STOP_NUM], inplace=True)
-        # this will make it so beyond from stop num and to stop num,
-        # the remaining columns collapse to variable name, variable value
-        transfers_df = transfers_df.stack().reset_index()
-        transfers_df.rename(columns={"level_2":"attr_name", 0:"attr_value"}, inplace=True)
-
-        transfers_df.to_csv(os.path.join(self.output_dir, Transfer.OUTPUT_TRANSFERS_FILE),
-                            sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(self.output_dir, Transfer.OUTPUT_TRANSFERS_FILE))
\ No newline at end of file
+        # the index is from stop id num, to stop id num; the remaining columns are attributes
+        attr_cols = [col for col in list(transfers_df.columns.values) if col not in index_cols]
+        return Util.table_for_extension(transfers_df, index_cols, attr_cols)
\ No newline at end of file
@@ -163,11 +163,6 @@ class Trip:
     STOPTIMES_COLUMN_DWELL_TIME_SEC             = "dwell_time_sec"
 
 
-    #: File with trip ID, trip ID number correspondence
-    OUTPUT_TRIP_ID_NUM_FILE                     = 'ft_intermediate_trip_id.txt'
-    #: File with trip information
-    OUTPUT_TRIPINFO_FILE                        = 'ft_intermediate_trip_info.txt'
-
     #: Default headway if no previous matching route/trip
     DEFAULT_HEADWAY             = 60
 
@@ -204,6 +199,8 @@ class Trip:
         fast-trips stops data from the input files in *input_dir*.
         """
         self.output_dir = output_dir
+        # for the trip IDs passed to the extension
+        self.prepend_route_id_to_trip_id = prepend_route_id_to_trip_id
 
         # Read vehicles first
         self.vehicles_df = pandas.read_csv(os.path.join(input_dir, Trip.INPUT_VEHICLES_FILE))
@@ -297,21 +294,6 @@ class Trip:
                                                   numeric_newcolname=Trip.TRIPS_COLUMN_TRIP_ID_NUM)
         FastTripsLogger.debug("Trip ID to number correspondence\n" + str(self.trip_id_df.head()))
 
-        # prepend_route_id_to_trip_id
-        if prepend_route_id_to_trip_id:
-            # get the route id back again
-            trip_id_df = pandas.merge(self.trip_id_df, self.trips_df[[Trip.TRIPS_COLUMN_TRIP_ID, Trip.TRIPS_COLUMN_ROUTE_ID]],
-                                      how='left', on=Trip.TRIPS_COLUMN_TRIP_ID)
-            trip_id_df.rename(columns={Trip.TRIPS_COLUMN_TRIP_ID: 'trip_id_orig'}, inplace=True)
-            trip_id_df[Trip.TRIPS_COLUMN_TRIP_ID] = trip_id_df[Trip.TRIPS_COLUMN_ROUTE_ID].map(str) + str("_") + trip_id_df['trip_id_orig']
-        else:
-            trip_id_df = self.trip_id_df
-
-        trip_id_df.to_csv(os.path.join(output_dir, Trip.OUTPUT_TRIP_ID_NUM_FILE),
-                               columns=[Trip.TRIPS_COLUMN_TRIP_ID_NUM, Trip.TRIPS_COLUMN_TRIP_ID],
-                               sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(output_dir, Trip.OUTPUT_TRIP_ID_NUM_FILE))
-
         self.trips_df = pandas.merge(left=self.trips_df, right=self.trip_id_df, how='left')
 
         # Merge vehicles
@@ -416,8 +398,6 @@ class Trip:
         FastTripsLogger.info("Read %7d %15s from %25s, %25s" %
                              (len(self.stop_times_df), "stop times", "stop_times.txt", Trip.INPUT_STOPTIMES_FILE))
 
-        self.write_trips_for_extension()
-
     def has_capacity_configured(self):
         """
         Returns true if seated capacity and standing capacity are columns included in the vehicles input.
@@ -546,10 +526,29 @@ class Trip:
         df[Trip.SIM_COL_VEH_MSA_OVERCAP ] =-1.0 # assume there's room
         return df
 
-    def write_trips_for_extension(self):
+    def trip_ids_for_extension(self):
         """
-        This writes to an intermediate file a formatted file for the C++ extension.
-        Since there are strings involved, it's easier than passing it to the extension.
+        Returns the trip ID number to trip ID correspondence as a network table for the C++ extension.
+        If *prepend_route_id_to_trip_id* was passed to the constructor, the trip IDs are prefixed by their route ID.
+        See :py:meth:`Util.table_for_extension`.
+        """
+        if self.prepend_route_id_to_trip_id:
+            # get the route id back again
+            trip_id_df = pandas.merge(self.trip_id_df, self.trips_df[[Trip.TRIPS_COLUMN_TRIP_ID, Trip.TRIPS_COLUMN_ROUTE_ID]],
+                                      how='left', on=Trip.TRIPS_COLUMN_TRIP_ID)
+            trip_id_df.rename(columns={Trip.TRIPS_COLUMN_TRIP_ID: 'trip_id_orig'}, inplace=True)
+            trip_id_df[Trip.TRIPS_COLUMN_TRIP_ID] = trip_id_df[Trip.TRIPS_COLUMN_ROUTE_ID].map(str) + str("_") + trip_id_df['trip_id_orig']
+        else:
+            trip_id_df = self.trip_id_df
+
+        return Util.table_for_extension(trip_id_df, [Trip.TRIPS_COLUMN_TRIP_ID_NUM],
+                                        strings=trip_id_df[Trip.TRIPS_COLUMN_TRIP_ID])
+
+    def trips_for_extension(self):
+        """
+        Returns the trip information as a network table for the C++ extension: the trip ID number, mode number
+        and route ID number, plus the remaining numeric trip attributes.
+        See :py:meth:`Util.table_for_extension`.
         """
         trips_df = self.trips_df.copy()
 
@@ -583,16 +582,10 @@ class Trip:
         trips_df = trips_df.select_dtypes(exclude=['object'])
         FastTripsLogger.debug("\n"+str(trips_df.head()))
 
-        # the index is the trip_id_num
-        trips_df.set_index(Trip.TRIPS_COLUMN_TRIP_ID_NUM, inplace=True)
-        # this will make it so beyond trip id num
-        # the remaining columns collapse to variable name, variable value
-        trips_df = trips_df.stack().reset_index()
-        trips_df.rename(columns={"level_1":"attr_name", 0:"attr_value"}, inplace=True)
-
-        trips_df.to_csv(os.path.join(self.output_dir, Trip.OUTPUT_TRIPINFO_FILE),
-                        sep=" ", index=False)
-        FastTripsLogger.debug("Wrote %s" % os.path.join(self.output_dir, Trip.OUTPUT_TRIPINFO_FILE))
+        # the index is the trip_id_num, mode_num and route_id_num; the remaining columns are attributes
+        index_cols = [Trip.TRIPS_COLUMN_TRIP_ID_NUM, Route.ROUTES_COLUMN_MODE_NUM, Route.ROUTES_COLUMN_ROUTE_ID_NUM]
+        attr_cols  = [col for col in list(trips_df.columns.values) if col not in index_cols]
+        return Util.table_for_extension(trips_df, index_cols, attr_cols)
 
     @staticmethod
     def reset_onboard(df):
@@ -145,6 +145,21 @@ class Util:
 
         return input_df
 
+    @staticmethod
+    def table_for_extension(input_df, index_colnames, value_colnames=[], strings=None):
+        """
+        Returns the network table tuple (index, values, strings) that the C++ extension takes for
+        :py:meth:`Assignment.initialize_fasttrips_extension`.
+
+        The *index_colnames* columns become an int32 array, and the *value_colnames* columns become a float64 array
+        (null values mean the attribute isn't set).  *strings* defaults to *value_colnames*.
+        """
+        index  = input_df[index_colnames].values.astype('int32').reshape(len(input_df), len(index_colnames))
+        values = input_df[value_colnames].values.astype('float64').reshape(len(input_df), len(value_colnames))
+        if strings is None:
+            strings = value_colnames
+        return (index, values, [str(string) for string in strings])
+
     @staticmethod
     def datetime64_formatter(x):
         """
@@ -1,6 +1,8 @@
+#include <algorithm>
 #include <cassert>
 #include <exception>
 #include <stdexcept>
+#include <vector>
 
 namespace fasttrips {
 
@@ -12,14 +14,15 @@ namespace fasttrips {
         double  label_;                 ///< The label during path finding
         int     stop_id_;               ///< Stop ID corresponding to this label
         bool    is_trip_;               ///< Two labels: a trip-label and a non-trip-label
+        double  priority_;              ///< The label plus the lower bound on the rest of the path; set by LabelStopQueue::push
     } LabelStop;
 
 
-    /// Comparator to enable the fasttrips::LabelStopQueue to return the lowest labeled stop.
+    /// Comparator to enable the fasttrips::LabelStopQueue to return the lowest priority stop.
     struct LabelStopCompare {
         bool operator()(const LabelStop &cs1, const LabelStop &cs2) const {
-            if (cs1.label_ > cs2.label_) { return true;  }
-            if (cs1.label_ < cs2.label_) { return false; }
+            if (cs1.priority_ > cs2.priority_) { return true;  }
+            if (cs1.priority_ < cs2.priority_) { return false; }
 
             if (cs1.stop_id_ > cs2.stop_id_) { return true;  }
             if (cs1.stop_id_ < cs2.stop_id_) { return false; }
@@ -43,58 +46,127 @@ namespace fasttrips {
      * This is to save work; if we mark a stop for processing by adding it onto the queue, and then do that again shortly
      * after, we don't actually want to process twice.  We only want to process it once, for the lowest label.
      *
+     * It's implemented as a d-ary heap along with the heap position of each (stop ID, is trip bool), so pushing
+     * a lower label for a queued stop moves it up in place (decrease-key) rather than leaving stale entries behind.
+     *
+     * Stops come out in order of priority, which is the label plus an optional lower bound on the cost
+     * of the rest of the path from the stop (see LabelStopQueue::setLowerBounds).  Without lower bounds,
+     * that's just the label.
      **/
     class LabelStopQueue
     {
 
     private:
-        // underlying priority queue, contains (label, stop id, is trip bool)
-        std::priority_queue<LabelStop, std::vector<LabelStop>, struct LabelStopCompare> labelstop_priority_queue_;
+        /// Number of children per heap node.  Wider than binary for fewer levels and better locality.
+        static const int ARITY = 4;
+
+        /// The heap, ordered by struct fasttrips::LabelStopCompare.  Each (stop ID, is trip bool) appears at most once.
+        std::vector<LabelStop> heap_;
+
+        /// Position in heap_ for each (stop ID, is trip bool), indexed by 2*stop ID + is trip.  -1 if not queued.
+        std::vector<int> positions_;
 
-        typedef struct {
-            double label_;  ///< lowest label for this stop in the labelstop_priority_queue_ (e.g. the only valid one)
-            bool   valid_;  ///< is this stop valid in the queue?
-            int    count_;  ///< number of instances of this stop in the labelstop_priority_queue_ (valid and invalid)
-        } LabelCount;
+        /// Lower bound for each stop ID (before scaling), or NULL for none.  Not owned.
+        const std::vector<double>* lower_bounds_;
+        /// Multiplies the lower bounds to put them in label units
+        double lower_bound_scale_;
 
-        /** Keep track of the lowest label and the count for each (stop, is_trip bool) */
-        std::map< std::pair<int, bool>, LabelCount> labelstop_map_;
+        /// Number of calls to push() since the counts were reset
+        long pushes_;
+        /// Number of calls to pop_top() since the counts were reset
+        long pops_;
+
+        /// Returns true if cs1 should come out of the queue before cs2
+        static bool before(const LabelStop& cs1, const LabelStop& cs2) {
+            return LabelStopCompare()(cs2, cs1);
+        }
+
+        static size_t positionIndex(const LabelStop& ls) {
+            return 2*static_cast<size_t>(ls.stop_id_) + (ls.is_trip_ ? 1 : 0);
+        }
+
+        /// Place val at heap position pos (currently a hole) and move it up as needed.
+        void siftUp(size_t pos, const LabelStop& val) {
+            while (pos > 0) {
+                size_t parent = (pos-1)/ARITY;
+                if (!before(val, heap_[parent])) { break; }
+                heap_[pos] = heap_[parent];
+                positions_[positionIndex(heap_[pos])] = static_cast<int>(pos);
+                pos = parent;
+            }
+            heap_[pos] = val;
+            positions_[positionIndex(val)] = static_cast<int>(pos);
+        }
 
-        int valid_count_;
+        /// Place val at heap position pos (currently a hole) and move it down as needed.
+        void siftDown(size_t pos, const LabelStop& val) {
+            size_t heap_size = heap_.size();
+            while (true) {
+                size_t first_child = ARITY*pos + 1;
+                if (first_child >= heap_size) { break; }
+                size_t last_child  = std::min(first_child + ARITY, heap_size);
+                size_t best_child  = first_child;
+                for (size_t child = first_child+1; child < last_child; ++child) {
+                    if (before(heap_[child], heap_[best_child])) { best_child = child; }
+                }
+                if (!before(heap_[best_child], val)) { break; }
+                heap_[pos] = heap_[best_child];
+                positions_[positionIndex(heap_[pos])] = static_cast<int>(pos);
+                pos = best_child;
+            }
+            heap_[pos] = val;
+            positions_[positionIndex(val)] = static_cast<int>(pos);
+        }
 
     public:
-        LabelStopQueue() : valid_count_(0) {}
+        LabelStopQueue() : lower_bounds_(NULL), lower_bound_scale_(0), pushes_(0), pops_(0) {}
         ~LabelStopQueue() {}
 
-        void push(const LabelStop& val) {
-            // if the stop is not in here, no problem!
-            std::pair<int,bool> full_stop_id = std::make_pair(val.stop_id_, val.is_trip_);
+        /**
+         * Order the stops by label plus scale times the given lower bound for the stop, or by label alone
+         * if lower_bounds is NULL.  Stops past the end of lower_bounds get a bound of zero.
+         * The vector isn't copied, so it needs to outlive the pushes.  Stops already in the queue are reordered.
+         */
+        void setLowerBounds(const std::vector<double>* lower_bounds, double scale) {
+            lower_bounds_      = (scale > 0) ? lower_bounds : NULL;
+            lower_bound_scale_ = scale;
+
+            // these pushes are just reordering, so they don't count
+            long pushes = pushes_;
+            std::vector<LabelStop> queued(heap_);
+            clear();
+            for (size_t pos = 0; pos < queued.size(); ++pos) { push(queued[pos]); }
+            pushes_ = pushes;
+        }
 
-            if (labelstop_map_.find(full_stop_id) == labelstop_map_.end()) {
-                labelstop_priority_queue_.push(val);
-                LabelCount lc = { val.label_, true, 1 };
-                labelstop_map_[full_stop_id] = lc;
-                valid_count_++;
-                return;
+        /** Returns the scaled lower bound for the given stop. */
+        double lowerBound(int stop_id) const {
+            if ((lower_bounds_ == NULL) || (static_cast<size_t>(stop_id) >= lower_bounds_->size())) { return 0; }
+            return lower_bound_scale_*(*lower_bounds_)[stop_id];
+        }
+
+        void push(const LabelStop& pushed) {
+            LabelStop val = pushed;
+            val.priority_ = val.label_ + lowerBound(val.stop_id_);
+            ++pushes_;
+
+            size_t index = positionIndex(val);
+            if (index >= positions_.size()) {
+                positions_.resize(std::max(index+1, 2*positions_.size()), -1);
             }
 
-            // if not valid in the queue, then we've popped out all valid instances from the priority queue so it's like it's not here
-            if (!labelstop_map_[full_stop_id].valid_) {
-                labelstop_priority_queue_.push(val);
-                labelstop_map_[full_stop_id].label_     = val.label_;
-                labelstop_map_[full_stop_id].valid_     = true;
-                labelstop_map_[full_stop_id].count_    += 1;
-                valid_count_++;
+            // if the stop is not in here, no problem!
+            int pos = positions_[index];
+            if (pos < 0) {
+                heap_.push_back(val);
+                siftUp(heap_.size()-1, val);
                 return;
             }
 
-            // The stop is in the queue, valid.  Look at the label.
-            // If the label is smaller, add this one and invalidate the other
-            if (val.label_ < labelstop_map_[full_stop_id].label_) {
-                labelstop_priority_queue_.push(val);
-                labelstop_map_[full_stop_id].label_ = val.label_;
-                labelstop_map_[full_stop_id].count_ += 1;
-                // no additional valid counts
+            // The stop is in the queue.  Look at the label.
+            // If the label is smaller, update it in place
+            if (val.label_ < heap_[pos].label_) {
+                siftUp(static_cast<size_t>(pos), val);
             }
             // otherwise the label is bigger -- don't add it since the smaller one will cause reprocessing
             else {
@@ -102,87 +174,52 @@ namespace fasttrips {
             }
         }
 
-        /** Pop the top *valid* LabelStop */
+        /** Pop the top LabelStop */
         LabelStop pop_top(const std::map<int, std::string>& stop_num_to_str, bool trace, std::ofstream& trace_file) {
-            // this will crash if labelstop_priority_queue_ is empty.  I'm terrible.
-
-            while (true) {
-                // get the lowest cost stop
-                const LabelStop& ls = labelstop_priority_queue_.top();
-                std::pair<int, bool> full_stop_id = std::make_pair(ls.stop_id_, ls.is_trip_);
-
-                std::map< std::pair<int, bool>, LabelCount>::iterator ls_iter = labelstop_map_.find(full_stop_id);
-
-                // assert we have the count info
-                if (ls_iter == labelstop_map_.end()) {
-                    std::cerr << "LabelStopQueueError FATAL ERROR 1" << std::endl;
-                    throw LabelStopQueueError("FATAL ERROR 1");
-                }
-
-                // assert that the count is positive
-                if (ls_iter->second.count_ <= 0) {
-                    std::cerr << "LabelStopQueueError FATAL ERROR 2" << std::endl;
-                    throw LabelStopQueueError("FATAL ERROR 2");
-                }
+            if (heap_.empty()) {
+                std::cerr << "LabelStopQueueError FATAL ERROR pop_top() on empty queue" << std::endl;
+                throw LabelStopQueueError("FATAL ERROR pop_top() on empty queue");
+            }
 
-                // if it's not valid then continue
-                if (!ls_iter->second.valid_) {
-                    if (trace) {
-                        trace_file << "Skipping stop A (" << stop_num_to_str.find(ls.stop_id_)->second << "," << ls.is_trip_ << ")";
-                        trace_file << "; valid " << ls_iter->second.valid_;
-                        trace_file << "; count " << ls_iter->second.count_;
-                        trace_file << "; map label " << ls_iter->second.label_;
-                        trace_file << "; priq label " << ls.label_;
-                        trace_file << "; priq size " << labelstop_priority_queue_.size() << std::endl;
-                    }
-                    ls_iter->second.count_ -= 1;
-                    labelstop_priority_queue_.pop();
-                    continue;
-                }
+            LabelStop to_ret = heap_.front();
+            positions_[positionIndex(to_ret)] = -1;
+            ++pops_;
 
-                // this stop id is in the queue as valid
-                // but only the matching label is valid
-                if (ls_iter->second.label_ != ls.label_) {
-                    if (trace) {
-                        trace_file << "Skipping stop B (" << stop_num_to_str.find(ls.stop_id_)->second << "," << ls.is_trip_ << ")";
-                        trace_file << "; valid " << ls_iter->second.valid_;
-                        trace_file << "; count " << ls_iter->second.count_;
-                        trace_file << "; map label " << ls_iter->second.label_;
-                        trace_file << "; priq label " << ls.label_;
-                        trace_file << "; priq size " << labelstop_priority_queue_.size() << std::endl;
-                    }
-                    ls_iter->second.count_ -= 1;
-                    labelstop_priority_queue_.pop();
-                    continue;
-                }
+            LabelStop last = heap_.back();
+            heap_.pop_back();
+            if (!heap_.empty()) { siftDown(0, last); }
 
-                if (trace) {
-                    trace_file << "LabelStopQueue returning (" << stop_num_to_str.find(ls.stop_id_)->second << "," << ls.is_trip_ << ")";
-                    trace_file << "; valid " << ls_iter->second.valid_;
-                    trace_file << "; count " << ls_iter->second.count_;
-                    trace_file << "; map label " << ls_iter->second.label_;
-                    trace_file << "; priq label " << ls.label_;
-                    trace_file << "; priq size " << labelstop_priority_queue_.size();
-                    trace_file << "; valid count " << valid_count_ << std::endl;
-                }
-                // else the map label is equal to the priority queue one, it's the valid one -- return it
-                LabelStop to_ret = ls;
-                labelstop_priority_queue_.pop();
-                ls_iter->second.valid_  = false; // not valid any longer
-                ls_iter->second.count_ -= 1;     // decrement count
-                valid_count_ -= 1;
-                return to_ret;
+            if (trace) {
+                trace_file << "LabelStopQueue returning (" << stop_num_to_str.find(to_ret.stop_id_)->second << "," << to_ret.is_trip_ << ")";
+                trace_file << "; label " << to_ret.label_;
+                if (lower_bounds_ != NULL) { trace_file << "; priority " << to_ret.priority_; }
+                trace_file << "; queue size " << heap_.size() << std::endl;
+            }
+            return to_ret;
+        }
 
+        /** Empty the queue, keeping the allocated memory for reuse. */
+        void clear() {
+            for (size_t pos = 0; pos < heap_.size(); ++pos) {
+                positions_[positionIndex(heap_[pos])] = -1;
             }
+            heap_.clear();
         }
 
         size_t size() const {
-            return valid_count_;
+            return heap_.size();
         }
 
         bool empty() const {
-            return (valid_count_ == 0);
+            return heap_.empty();
         }
+
+        /// Number of pushes since the counts were reset, whether or not they changed the queue
+        long pushes() const { return pushes_; }
+        /// Number of pops since the counts were reset
+        long pops() const { return pops_; }
+        /// Starts counting pushes and pops from zero.
+        void resetCounts() { pushes_ = 0; pops_ = 0; }
     };
 
 };
@@ -0,0 +1,158 @@
+/**
+ * \file arena.h
+ *
+ * Defines the NodeArena class, a pool of blocks sorted into size classes, and ArenaAllocator, an STL allocator that uses one.
+ */
+
+#ifndef ARENA_H
+#define ARENA_H
+
+#include <cstddef>
+#include <limits>
+#include <new>
+#include <vector>
+
+namespace fasttrips {
+
+    /**
+     * A pool of blocks carved out of large chunks.  Freed blocks go onto a free list for their size
+     * and are handed out again by later allocations, so once the arena has grown to fit a path finding request,
+     * later requests don't go to the heap at all.  Blocks bigger than a chunk get a chunk of their own.
+     * The chunks are only freed when the arena is destroyed.
+     *
+     * This isn't thread safe; each arena belongs to one fasttrips::PathFinderWorkspace.
+     */
+    class NodeArena {
+    public:
+        NodeArena() : chunk_pos_(NULL), chunk_end_(NULL), chunk_bytes_(0), allocations_(0), heap_allocations_(0) {}
+        ~NodeArena()
+        {
+            for (size_t chunk_num = 0; chunk_num < chunks_.size(); ++chunk_num) { delete[] chunks_[chunk_num]; }
+        }
+
+        /// Returns a block of at least the given number of bytes.
+        void* allocate(size_t bytes)
+        {
+            size_t size_class = sizeClass(bytes);
+            ++allocations_;
+            if ((size_class < free_lists_.size()) && (free_lists_[size_class] != NULL)) {
+                FreeBlock* block        = free_lists_[size_class];
+                free_lists_[size_class] = block->next_;
+                return block;
+            }
+            size_t block_bytes = size_class*ALIGNMENT;
+            if (chunk_pos_ + block_bytes > chunk_end_) {
+                size_t new_chunk_bytes = (block_bytes > CHUNK_BYTES) ? block_bytes : CHUNK_BYTES;
+                chunks_.push_back(new char[new_chunk_bytes]);
+                chunk_pos_    = chunks_.back();
+                chunk_end_    = chunk_pos_ + new_chunk_bytes;
+                chunk_bytes_ += new_chunk_bytes;
+                ++heap_allocations_;
+            }
+            void* block = chunk_pos_;
+            chunk_pos_ += block_bytes;
+            return block;
+        }
+
+        /// Puts a block from NodeArena::allocate() with the same number of bytes back for reuse.
+        void deallocate(void* ptr, size_t bytes)
+        {
+            size_t size_class = sizeClass(bytes);
+            if (size_class >= free_lists_.size()) { free_lists_.resize(size_class+1, NULL); }
+            FreeBlock* block        = static_cast<FreeBlock*>(ptr);
+            block->next_            = free_lists_[size_class];
+            free_lists_[size_class] = block;
+        }
+
+        /// Memory held by the arena, in bytes, whether the blocks are in use or not.
+        size_t memoryBytes() const { return chunk_bytes_ + free_lists_.capacity()*sizeof(FreeBlock*); }
+
+        /// Number of blocks handed out since the counts were reset
+        long allocations() const { return allocations_; }
+        /// Number of chunks allocated from the heap since the counts were reset
+        long heapAllocations() const { return heap_allocations_; }
+        /// Starts counting allocations from zero.
+        void resetCounts() { allocations_ = 0; heap_allocations_ = 0; }
+
+    private:
+        struct FreeBlock {
+            FreeBlock* next_;
+        };
+
+        /// Block sizes are multiples of this, which keeps the blocks aligned for anything we put in them
+        static const size_t ALIGNMENT   = 16;
+        /// Size of the chunks blocks are carved out of
+        static const size_t CHUNK_BYTES = 16*1024;
+
+        static size_t sizeClass(size_t bytes) { return (bytes + ALIGNMENT - 1)/ALIGNMENT; }
+
+        /// Chunks allocated from the heap
+        std::vector<char*>      chunks_;
+        /// The unused part of the last chunk is [chunk_pos_, chunk_end_)
+        char*                   chunk_pos_;
+        char*                   chunk_end_;
+        /// Total size of chunks_
+        size_t                  chunk_bytes_;
+        /// Freed blocks, indexed by size class
+        std::vector<FreeBlock*> free_lists_;
+
+        long                    allocations_;
+        long                    heap_allocations_;
+
+        // not copyable
+        NodeArena(const NodeArena&);
+        NodeArena& operator=(const NodeArena&);
+    };
+
+    /**
+     * STL allocator that gets its memory from a fasttrips::NodeArena, so a container's nodes or array can be
+     * reused by another container of the same arena once they're freed.
+     * Everything allocated without an arena comes from the heap as usual.
+     */
+    template <class T>
+    class ArenaAllocator {
+    public:
+        typedef T               value_type;
+        typedef T*              pointer;
+        typedef const T*        const_pointer;
+        typedef T&              reference;
+        typedef const T&        const_reference;
+        typedef size_t          size_type;
+        typedef std::ptrdiff_t  difference_type;
+
+        template <class U> struct rebind { typedef ArenaAllocator<U> other; };
+
+        ArenaAllocator(NodeArena* arena = NULL) : arena_(arena) {}
+        template <class U> ArenaAllocator(const ArenaAllocator<U>& other) : arena_(other.arena()) {}
+
+        NodeArena* arena() const { return arena_; }
+
+        pointer allocate(size_type n, const void* hint = 0)
+        {
+            if (arena_ != NULL) { return static_cast<pointer>(arena_->allocate(n*sizeof(T))); }
+            return static_cast<pointer>(::operator new(n*sizeof(T)));
+        }
+        void deallocate(pointer ptr, size_type n)
+        {
+            if (arena_ != NULL) { arena_->deallocate(ptr, n*sizeof(T)); return; }
+            ::operator delete(ptr);
+        }
+
+        void construct(pointer ptr, const T& val) { new (static_cast<void*>(ptr)) T(val); }
+        void destroy(pointer ptr) { ptr->~T(); }
+
+        pointer         address(reference x)       const { return &x; }
+        const_pointer   address(const_reference x) const { return &x; }
+        size_type       max_size() const { return std::numeric_limits<size_type>::max()/sizeof(T); }
+
+    private:
+        NodeArena* arena_;
+    };
+
+    template <class T, class U>
+    bool operator==(const ArenaAllocator<T>& a1, const ArenaAllocator<U>& a2) { return a1.arena() == a2.arena(); }
+    template <class T, class U>
+    bool operator!=(const ArenaAllocator<T>& a1, const ArenaAllocator<U>& a2) { return a1.arena() != a2.arena(); }
+}
+
+#endif
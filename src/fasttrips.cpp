@@ -4,8 +4,12 @@
 #include <numpy/arrayobject.h>
 
 #include "pathfinder.h"
+#include "mutex.h"
+#include "threads.h"
+#include <map>
 #include <string>
 #include <queue>
+#include <vector>
 
 static PyObject *pyError;
 
@@ -18,20 +22,123 @@ _fasttrips_initialize_parameters(PyObject *self, PyObject *args)
     double     time_window;
     double     bump_buffer;
     int        stoch_pathset_size;
+    int        stoch_pathset_stall_draws;
+    double     stoch_pathset_unseen_probability;
     double     stoch_dispersion;
     int        stoch_max_stop_process_count;
     int        max_num_paths;
     double     min_path_probability;
-    if (!PyArg_ParseTuple(args, "ddidiid", &time_window, &bump_buffer, &stoch_pathset_size, &stoch_dispersion, &stoch_max_stop_process_count,
-                                           &max_num_paths, &min_path_probability)) {
+    double     label_cache_megabytes;
+    double     label_lower_bound_weight;
+    if (!PyArg_ParseTuple(args, "ddiiddiiddd", &time_window, &bump_buffer, &stoch_pathset_size, &stoch_pathset_stall_draws,
+                                               &stoch_pathset_unseen_probability, &stoch_dispersion, &stoch_max_stop_process_count,
+                                               &max_num_paths, &min_path_probability, &label_cache_megabytes, &label_lower_bound_weight)) {
         return NULL;
     }
-    pathfinder.initializeParameters(time_window, bump_buffer, stoch_pathset_size, stoch_dispersion, stoch_max_stop_process_count,
-                                    max_num_paths, min_path_probability);
+    pathfinder.initializeParameters(time_window, bump_buffer, stoch_pathset_size, stoch_pathset_stall_draws, stoch_pathset_unseen_probability,
+                                    stoch_dispersion, stoch_max_stop_process_count,
+                                    max_num_paths, min_path_probability, label_cache_megabytes, label_lower_bound_weight);
     Py_RETURN_NONE;
 
 }
 
+/**
+ * Reads the python tuple (index, values, strings) into table, for PathFinder::initializeNetwork.
+ * index must be an int32 array with num_index_cols columns and values a double array with the same number of rows;
+ * strings is a sequence of strings.  The arrays are appended to arrays, which the caller must release.
+ * Returns false on failure, with the python error set.
+ */
+static bool
+supplyTableFromTuple(PyObject *input, int num_index_cols, const char* name,
+                     fasttrips::SupplyTable& table, std::vector<PyArrayObject*>& arrays)
+{
+    PyObject *input_index, *input_values, *input_strings;
+    if (!PyArg_ParseTuple(input, "OOO", &input_index, &input_values, &input_strings)) { return false; }
+
+    PyArrayObject *index = (PyArrayObject*)PyArray_ContiguousFromObject(input_index, NPY_INT32, 2, 2);
+    if (index == NULL) { return false; }
+    arrays.push_back(index);
+    PyArrayObject *values = (PyArrayObject*)PyArray_ContiguousFromObject(input_values, NPY_DOUBLE, 2, 2);
+    if (values == NULL) { return false; }
+    arrays.push_back(values);
+
+    if ((PyArray_DIMS(index)[1] != num_index_cols) || (PyArray_DIMS(values)[0] != PyArray_DIMS(index)[0])) {
+        PyErr_Format(pyError, "initialize_network: %s has index shape (%ld, %ld) and values shape (%ld, %ld); expected %d index columns",
+                     name, (long)PyArray_DIMS(index)[0], (long)PyArray_DIMS(index)[1],
+                     (long)PyArray_DIMS(values)[0], (long)PyArray_DIMS(values)[1], num_index_cols);
+        return false;
+    }
+    table.num_rows_       = (int)PyArray_DIMS(index)[0];
+    table.num_index_cols_ = num_index_cols;
+    table.index_          = (const int*)PyArray_DATA(index);
+    table.num_value_cols_ = (int)PyArray_DIMS(values)[1];
+    table.values_         = (const double*)PyArray_DATA(values);
+
+    PyObject *strings_seq = PySequence_Fast(input_strings, "initialize_network: strings must be a sequence");
+    if (strings_seq == NULL) { return false; }
+    table.strings_.clear();
+    for (Py_ssize_t str_num = 0; str_num < PySequence_Fast_GET_SIZE(strings_seq); ++str_num) {
+        const char* str = PyString_AsString(PySequence_Fast_GET_ITEM(strings_seq, str_num));
+        if (str == NULL) { Py_DECREF(strings_seq); return false; }
+        table.strings_.push_back(str);
+    }
+    Py_DECREF(strings_seq);
+    return true;
+}
+
+static PyObject *
+_fasttrips_initialize_network(PyObject *self, PyObject *args)
+{
+    int proc_num;
+    PyObject *inputs[8];
+    if (!PyArg_ParseTuple(args, "iOOOOOOOO", &proc_num, &inputs[0], &inputs[1], &inputs[2], &inputs[3],
+                          &inputs[4], &inputs[5], &inputs[6], &inputs[7])) {
+        return NULL;
+    }
+    // See PathFinder::initializeNetwork
+    enum { TRIP_IDS, STOP_IDS, ROUTE_IDS, MODE_IDS, WEIGHTS, ACCESS_LINKS, TRANSFER_LINKS, TRIP_INFO, NUM_TABLES };
+    const char* names[NUM_TABLES]          = { "trip_ids", "stop_ids", "route_ids", "mode_ids", "weights",
+                                               "access_links", "transfer_links", "trip_info" };
+    const int   num_index_cols[NUM_TABLES] = { 1, 1, 1, 1, 6, 3, 2, 3 };
+
+    fasttrips::SupplyTable      tables[NUM_TABLES];
+    std::vector<PyArrayObject*> arrays;
+    bool tables_ok = true;
+    for (int table_num = 0; table_num < NUM_TABLES; ++table_num) {
+        tables_ok = supplyTableFromTuple(inputs[table_num], num_index_cols[table_num], names[table_num], tables[table_num], arrays);
+        if (!tables_ok) { break; }
+
+        // the id tables have a string per row; the weights have codes into the strings; the rest have a name per value column
+        const fasttrips::SupplyTable& table = tables[table_num];
+        if (table_num <= MODE_IDS) {
+            tables_ok = ((int)table.strings_.size() == table.num_rows_);
+        } else if (table_num == WEIGHTS) {
+            tables_ok = (table.num_value_cols_ == 1);
+            for (int row = 0; tables_ok && (row < table.num_rows_); ++row) {
+                for (int col = 0; col < table.num_index_cols_; ++col) {
+                    if (col == 4) { continue; } // supply mode num
+                    int code = table.index_[row*table.num_index_cols_ + col];
+                    if ((code < 0) || (code >= (int)table.strings_.size())) { tables_ok = false; }
+                }
+            }
+        } else {
+            tables_ok = ((int)table.strings_.size() == table.num_value_cols_);
+        }
+        if (!tables_ok) {
+            PyErr_Format(pyError, "initialize_network: %s strings don't match the table", names[table_num]);
+            break;
+        }
+    }
+
+    if (tables_ok) {
+        pathfinder.initializeNetwork(proc_num, tables[TRIP_IDS], tables[STOP_IDS], tables[ROUTE_IDS], tables[MODE_IDS], tables[WEIGHTS],
+                                     tables[ACCESS_LINKS], tables[TRANSFER_LINKS], tables[TRIP_INFO]);
+    }
+    for (size_t array_num = 0; array_num < arrays.size(); ++array_num) { Py_DECREF(arrays[array_num]); }
+    if (!tables_ok) { return NULL; }
+    Py_RETURN_NONE;
+}
+
 static PyObject *
 _fasttrips_initialize_supply(PyObject *self, PyObject *args)
 {
@@ -64,10 +171,6 @@ _fasttrips_initialize_supply(PyObject *self, PyObject *args)
     // keep them
     pathfinder.initializeSupply(output_dir, proc_num,
                                 stop_indexes, stop_times, num_stop_ind);
-
-    if (proc_num <= 1) {
-        std::cout << "RAND_MAX = " << RAND_MAX << std::endl;
-    }
     Py_RETURN_NONE;
 }
 
@@ -98,6 +201,55 @@ _fasttrips_set_bump_wait(PyObject* self, PyObject *args)
     Py_RETURN_NONE;
 }
 
+static PyObject *
+_fasttrips_set_process_number(PyObject* self, PyObject *args)
+{
+    int process_num;
+    if (!PyArg_ParseTuple(args, "i", &process_num)) {
+        return NULL;
+    }
+    pathfinder.setProcessNumber(process_num);
+    Py_RETURN_NONE;
+}
+
+/**
+ * Writes the links of the given pathset into ret_int and ret_double starting at row link_start,
+ * and the path cost and probability into ret_paths starting at row path_start.
+ * Path numbers (ret_int column 0) start at 0 for each pathset.
+ */
+static void
+fillPathSetArrays(const fasttrips::PathSet& pathset, PyArrayObject *ret_int, PyArrayObject *ret_double, PyArrayObject *ret_paths,
+                  int link_start, int path_start)
+{
+    int ind      = link_start;
+    int path_num = 0;
+    for (fasttrips::PathSet::const_iterator psi=pathset.begin(); psi != pathset.end(); ++psi) {
+        const fasttrips::Path& path = psi->first;
+
+        *(npy_double*)PyArray_GETPTR2(ret_paths, path_start+path_num, 0) = path.cost();
+        *(npy_double*)PyArray_GETPTR2(ret_paths, path_start+path_num, 1) = psi->second.probability_;
+
+        for (int link_num = 0; link_num < path.size(); ++link_num) {
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 0) = path_num;
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 1) = path[link_num].first;
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 2) = path[link_num].second.deparr_mode_;
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 3) = path[link_num].second.trip_id_;
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 4) = path[link_num].second.stop_succpred_;
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 5) = path[link_num].second.seq_;
+            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 6) = path[link_num].second.seq_succpred_;
+
+            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 0) = 0.0; // TODO: label
+            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 1) = path[link_num].second.deparr_time_;
+            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 2) = path[link_num].second.link_time_;
+            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 3) = path[link_num].second.cost_;
+            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 4) = path[link_num].second.arrdep_time_;
+
+            ind += 1;
+        }
+        path_num += 1;
+    }
+}
+
 static PyObject *
 _fasttrips_find_pathset(PyObject *self, PyObject *args)
 {
@@ -121,8 +273,12 @@ _fasttrips_find_pathset(PyObject *self, PyObject *args)
     path_spec.egress_mode_ = egress_mode;
 
     fasttrips::PathSet pathset;
-    fasttrips::PerformanceInfo perf_info = { 0, 0, 0, 0, 0, 0};
+    fasttrips::PerformanceInfo perf_info = { 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0 };
+    // Path finding doesn't touch any python objects and only reads the supply, so let other
+    // python threads run meanwhile.  (The supply must not be updated while this is happening.)
+    Py_BEGIN_ALLOW_THREADS
     pathfinder.findPathSet(path_spec, pathset, perf_info);
+    Py_END_ALLOW_THREADS
 
     // count links
     int num_links = 0;
@@ -147,46 +303,272 @@ _fasttrips_find_pathset(PyObject *self, PyObject *args)
     dims_paths[1] = 2;
     PyArrayObject *ret_paths = (PyArrayObject*)PyArray_SimpleNew(2, dims_paths, NPY_DOUBLE);
 
-    int ind      = 0;
-    int path_num = 0;
-    for (fasttrips::PathSet::const_iterator psi=pathset.begin(); psi != pathset.end(); ++psi) {
-        const fasttrips::Path& path = psi->first;
+    fillPathSetArrays(pathset, ret_int, ret_double, ret_paths, 0, 0);
 
-        *(npy_double*)PyArray_GETPTR2(ret_paths, path_num, 0) = path.cost();
-        *(npy_double*)PyArray_GETPTR2(ret_paths, path_num, 1) = psi->second.probability_;
+    PyObject *returnobj = Py_BuildValue("(OOOiiiilllliiillllllllli)",ret_int,ret_double,ret_paths, pathfinder.processNumber(),
+                                        perf_info.label_iterations_, perf_info.num_labeled_stops_, perf_info.max_process_count_,
+                                        perf_info.milliseconds_labeling_, perf_info.milliseconds_enumerating_,
+                                        perf_info.workingset_bytes_, perf_info.privateusage_bytes_,
+                                        perf_info.label_cache_hits_, perf_info.label_cache_misses_, perf_info.label_cache_evictions_,
+                                        perf_info.link_allocations_, perf_info.link_heap_allocations_,
+                                        perf_info.peak_workingset_bytes_, perf_info.milliseconds_cpu_,
+                                        perf_info.label_queue_pushes_, perf_info.label_queue_pops_, perf_info.trips_scanned_,
+                                        perf_info.links_accepted_, perf_info.links_rejected_, perf_info.pathset_draws_);
+    return returnobj;
+}
 
-        for (int link_num = 0; link_num < path.size(); ++link_num) {
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 0) = path_num;
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 1) = path[link_num].first;
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 2) = path[link_num].second.deparr_mode_;
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 3) = path[link_num].second.trip_id_;
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 4) = path[link_num].second.stop_succpred_;
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 5) = path[link_num].second.seq_;
-            *(npy_int32*)PyArray_GETPTR2(ret_int, ind, 6) = path[link_num].second.seq_succpred_;
+/// Shared state for the find_pathsets worker threads
+typedef struct {
+    const std::vector<fasttrips::PathSpecification>*   path_specs_;
+    const std::vector< std::vector<size_t> >*          groups_;         ///< request numbers that share a labeling
+    std::vector<fasttrips::PathSet>*                   pathsets_;
+    std::vector<fasttrips::PerformanceInfo>*           perf_infos_;
+    size_t                                             next_group_;     ///< next group to work on; guarded by mutex_
+    fasttrips::Mutex                                   mutex_;
+} FindPathSetsWork;
+
+static void
+findPathSetsWorker(void* arg)
+{
+    FindPathSetsWork* work = static_cast<FindPathSetsWork*>(arg);
+    while (true) {
+        size_t group_num;
+        {
+            fasttrips::ScopedLock lock(work->mutex_);
+            group_num = work->next_group_++;
+        }
+        if (group_num >= work->groups_->size()) { return; }
 
-            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 0) = 0.0; // TODO: label
-            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 1) = path[link_num].second.deparr_time_;
-            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 2) = path[link_num].second.link_time_;
-            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 3) = path[link_num].second.cost_;
-            *(npy_double*)PyArray_GETPTR2(ret_double, ind, 4) = path[link_num].second.arrdep_time_;
+        const std::vector<size_t>& group = (*work->groups_)[group_num];
+        if (group.size() == 1) {
+            pathfinder.findPathSet((*work->path_specs_)[group[0]], (*work->pathsets_)[group[0]], (*work->perf_infos_)[group[0]]);
+        } else {
+            pathfinder.findPathSetGroup(*work->path_specs_, group, *work->pathsets_, *work->perf_infos_);
+        }
+    }
+}
 
-            ind += 1;
+/**
+ * Groups the requests for find_pathsets.  If share_labeling, requests that can share a labeling
+ * (see fasttrips::SharedLabelingCompare) are grouped together, except for traced requests.
+ * Otherwise each request is its own group.
+ */
+static void
+groupPathSpecs(const std::vector<fasttrips::PathSpecification>& path_specs, bool share_labeling,
+               std::vector< std::vector<size_t> >& groups)
+{
+    std::map<fasttrips::PathSpecification, size_t, fasttrips::SharedLabelingCompare> group_nums;
+    for (size_t req = 0; req < path_specs.size(); ++req) {
+        if (share_labeling && !path_specs[req].trace_) {
+            std::map<fasttrips::PathSpecification, size_t, fasttrips::SharedLabelingCompare>::iterator gni = group_nums.find(path_specs[req]);
+            if (gni != group_nums.end()) {
+                groups[gni->second].push_back(req);
+                continue;
+            }
+            group_nums[path_specs[req]] = groups.size();
         }
-        path_num += 1;
+        groups.push_back(std::vector<size_t>(1, req));
     }
+}
 
-    PyObject *returnobj = Py_BuildValue("(OOOiiiillll)",ret_int,ret_double,ret_paths, pathfinder.processNumber(),
-                                        perf_info.label_iterations_, perf_info.num_labeled_stops_, perf_info.max_process_count_,
-                                        perf_info.milliseconds_labeling_, perf_info.milliseconds_enumerating_,
-                                        perf_info.workingset_bytes_, perf_info.privateusage_bytes_);
+/**
+ * Returns the given python object as a contiguous 1-dimensional int32 array of the given length, or NULL on failure
+ * (with the python error set).  The caller owns the reference.
+ */
+static PyArrayObject *
+intColumn(PyObject *input, npy_intp length, const char* name)
+{
+    PyArrayObject *pyo = (PyArrayObject*)PyArray_ContiguousFromObject(input, NPY_INT32, 1, 1);
+    if (pyo == NULL) { return NULL; }
+    if (PyArray_DIMS(pyo)[0] != length) {
+        PyErr_Format(pyError, "find_pathsets: %s has length %ld; expected %ld", name, (long)PyArray_DIMS(pyo)[0], (long)length);
+        Py_DECREF(pyo);
+        return NULL;
+    }
+    return pyo;
+}
+
+static PyObject *
+_fasttrips_find_pathsets(PyObject *self, PyObject *args)
+{
+    int iteration, hyperpath_i, num_threads, share_labeling_i;
+    PyObject *input_person, *input_trip_list, *input_otaz, *input_dtaz, *input_outbound, *input_pref_time, *input_trace;
+    PyObject *input_user_class, *input_purpose, *input_access, *input_transit, *input_egress, *input_strings;
+    if (!PyArg_ParseTuple(args, "iiiiOOOOOOOOOOOOO", &iteration, &hyperpath_i, &num_threads, &share_labeling_i,
+                          &input_person, &input_trip_list, &input_otaz, &input_dtaz, &input_outbound, &input_pref_time, &input_trace,
+                          &input_user_class, &input_purpose, &input_access, &input_transit, &input_egress, &input_strings)) {
+        return NULL;
+    }
+
+    // the strings that the user class, purpose and demand mode codes refer to
+    PyObject *strings_seq = PySequence_Fast(input_strings, "find_pathsets: strings must be a sequence");
+    if (strings_seq == NULL) { return NULL; }
+    std::vector<std::string> strings;
+    for (Py_ssize_t str_num = 0; str_num < PySequence_Fast_GET_SIZE(strings_seq); ++str_num) {
+        const char* str = PyString_AsString(PySequence_Fast_GET_ITEM(strings_seq, str_num));
+        if (str == NULL) { Py_DECREF(strings_seq); return NULL; }
+        strings.push_back(str);
+    }
+    Py_DECREF(strings_seq);
+
+    // preferred time is the only double column
+    PyArrayObject *pref_time = (PyArrayObject*)PyArray_ContiguousFromObject(input_pref_time, NPY_DOUBLE, 1, 1);
+    if (pref_time == NULL) { return NULL; }
+    npy_intp num_requests = PyArray_DIMS(pref_time)[0];
+
+    // the int columns
+    PyObject*   int_inputs[]  = { input_person, input_trip_list, input_otaz, input_dtaz, input_outbound, input_trace,
+                                  input_user_class, input_purpose, input_access, input_transit, input_egress };
+    const char* int_names[]   = { "person_id_num", "trip_list_id_num", "o_taz_num", "d_taz_num", "outbound", "trace",
+                                  "user_class", "purpose", "access_mode", "transit_mode", "egress_mode" };
+    const int   num_int_cols  = sizeof(int_inputs)/sizeof(int_inputs[0]);
+    PyArrayObject* int_cols[num_int_cols];
+    int*           int_data[num_int_cols];
+    for (int col = 0; col < num_int_cols; ++col) {
+        int_cols[col] = intColumn(int_inputs[col], num_requests, int_names[col]);
+        if (int_cols[col] == NULL) {
+            for (int prev = 0; prev < col; ++prev) { Py_DECREF(int_cols[prev]); }
+            Py_DECREF(pref_time);
+            return NULL;
+        }
+        int_data[col] = (int*)PyArray_DATA(int_cols[col]);
+    }
+
+    std::vector<fasttrips::PathSpecification> path_specs(num_requests);
+    bool codes_ok = true;
+    for (npy_intp req = 0; req < num_requests; ++req) {
+        fasttrips::PathSpecification& path_spec = path_specs[req];
+        path_spec.iteration_          = iteration;
+        path_spec.passenger_id_       = int_data[0][req];
+        path_spec.path_id_            = int_data[1][req];
+        path_spec.hyperpath_          = (hyperpath_i != 0);
+        path_spec.origin_taz_id_      = int_data[2][req];
+        path_spec.destination_taz_id_ = int_data[3][req];
+        path_spec.outbound_           = (int_data[4][req] != 0);
+        path_spec.preferred_time_     = ((double*)PyArray_DATA(pref_time))[req];
+        path_spec.trace_              = (int_data[5][req] != 0);
+        for (int col = 6; col < num_int_cols; ++col) {
+            if ((int_data[col][req] < 0) || (int_data[col][req] >= (int)strings.size())) { codes_ok = false; }
+        }
+        if (!codes_ok) {
+            PyErr_Format(pyError, "find_pathsets: string code out of range for request %ld", (long)req);
+            break;
+        }
+        path_spec.user_class_         = strings[int_data[6][req]];
+        path_spec.purpose_            = strings[int_data[7][req]];
+        path_spec.access_mode_        = strings[int_data[8][req]];
+        path_spec.transit_mode_       = strings[int_data[9][req]];
+        path_spec.egress_mode_        = strings[int_data[10][req]];
+    }
+    for (int col = 0; col < num_int_cols; ++col) { Py_DECREF(int_cols[col]); }
+    Py_DECREF(pref_time);
+    if (!codes_ok) { return NULL; }
+
+    std::vector< std::vector<size_t> > groups;
+    groupPathSpecs(path_specs, share_labeling_i != 0, groups);
+
+    fasttrips::PerformanceInfo empty_perf_info = { 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0 };
+    std::vector<fasttrips::PathSet>         pathsets(num_requests);
+    std::vector<fasttrips::PerformanceInfo> perf_infos(num_requests, empty_perf_info);
+    FindPathSetsWork work;
+    work.path_specs_    = &path_specs;
+    work.groups_        = &groups;
+    work.pathsets_      = &pathsets;
+    work.perf_infos_    = &perf_infos;
+    work.next_group_    = 0;
+
+    // See _fasttrips_find_pathset
+    Py_BEGIN_ALLOW_THREADS
+    fasttrips::runThreads(num_threads, findPathSetsWorker, &work);
+    Py_END_ALLOW_THREADS
+
+    // offsets into the links and paths for each request
+    npy_intp dims_offsets[1] = { num_requests+1 };
+    PyArrayObject *link_offsets = (PyArrayObject *)PyArray_SimpleNew(1, dims_offsets, NPY_INT32);
+    PyArrayObject *path_offsets = (PyArrayObject *)PyArray_SimpleNew(1, dims_offsets, NPY_INT32);
+    if ((link_offsets == NULL) || (path_offsets == NULL)) {
+        Py_XDECREF(link_offsets);
+        Py_XDECREF(path_offsets);
+        return NULL;
+    }
+    int num_links = 0, num_paths = 0;
+    for (npy_intp req = 0; req < num_requests; ++req) {
+        *(npy_int32*)PyArray_GETPTR1(link_offsets, req) = num_links;
+        *(npy_int32*)PyArray_GETPTR1(path_offsets, req) = num_paths;
+        for (fasttrips::PathSet::const_iterator psi=pathsets[req].begin(); psi != pathsets[req].end(); ++psi) {
+            num_links += (int)psi->first.size();
+        }
+        num_paths += (int)pathsets[req].size();
+    }
+    *(npy_int32*)PyArray_GETPTR1(link_offsets, num_requests) = num_links;
+    *(npy_int32*)PyArray_GETPTR1(path_offsets, num_requests) = num_paths;
+
+    // See _fasttrips_find_pathset for columns
+    npy_intp dims_int[2]    = { num_links, 7 };
+    PyArrayObject *ret_int    = (PyArrayObject *)PyArray_SimpleNew(2, dims_int, NPY_INT32);
+    npy_intp dims_double[2] = { num_links, 5 };
+    PyArrayObject *ret_double = (PyArrayObject *)PyArray_SimpleNew(2, dims_double, NPY_DOUBLE);
+    npy_intp dims_paths[2]  = { num_paths, 2 };
+    PyArrayObject *ret_paths  = (PyArrayObject *)PyArray_SimpleNew(2, dims_paths, NPY_DOUBLE);
+
+    // label_iterations, num_labeled_stops, max_process_count, ms_labeling, ms_enumerating, workingset_bytes, privateusage_bytes,
+    // label_cache_hits, label_cache_misses, label_cache_evictions, link_allocations, link_heap_allocations,
+    // peak_workingset_bytes, ms_cpu, label_queue_pushes, label_queue_pops, trips_scanned, links_accepted, links_rejected,
+    // pathset_draws
+    npy_intp dims_perf[2]   = { num_requests, 20 };
+    PyArrayObject *ret_perf   = (PyArrayObject *)PyArray_SimpleNew(2, dims_perf, NPY_INT64);
+
+    // numpy has set MemoryError if any of these failed
+    if ((ret_int == NULL) || (ret_double == NULL) || (ret_paths == NULL) || (ret_perf == NULL)) {
+        Py_DECREF(link_offsets);
+        Py_DECREF(path_offsets);
+        Py_XDECREF(ret_int);
+        Py_XDECREF(ret_double);
+        Py_XDECREF(ret_paths);
+        Py_XDECREF(ret_perf);
+        return NULL;
+    }
+
+    for (npy_intp req = 0; req < num_requests; ++req) {
+        fillPathSetArrays(pathsets[req], ret_int, ret_double, ret_paths,
+                          *(npy_int32*)PyArray_GETPTR1(link_offsets, req), *(npy_int32*)PyArray_GETPTR1(path_offsets, req));
+
+        const fasttrips::PerformanceInfo& perf_info = perf_infos[req];
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 0) = perf_info.label_iterations_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 1) = perf_info.num_labeled_stops_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 2) = perf_info.max_process_count_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 3) = perf_info.milliseconds_labeling_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 4) = perf_info.milliseconds_enumerating_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 5) = perf_info.workingset_bytes_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 6) = perf_info.privateusage_bytes_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 7) = perf_info.label_cache_hits_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 8) = perf_info.label_cache_misses_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req, 9) = perf_info.label_cache_evictions_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,10) = perf_info.link_allocations_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,11) = perf_info.link_heap_allocations_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,12) = perf_info.peak_workingset_bytes_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,13) = perf_info.milliseconds_cpu_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,14) = perf_info.label_queue_pushes_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,15) = perf_info.label_queue_pops_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,16) = perf_info.trips_scanned_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,17) = perf_info.links_accepted_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,18) = perf_info.links_rejected_;
+        *(npy_int64*)PyArray_GETPTR2(ret_perf, req,19) = perf_info.pathset_draws_;
+    }
+
+    PyObject *returnobj = Py_BuildValue("(NNNNNNi)", ret_int, ret_double, ret_paths, link_offsets, path_offsets, ret_perf,
+                                        pathfinder.processNumber());
     return returnobj;
 }
 
 static PyMethodDef fasttripsMethods[] = {
     {"initialize_parameters",   _fasttrips_initialize_parameters, METH_VARARGS, "Initialize path finding parameters" },
+    {"initialize_network",      _fasttrips_initialize_network,    METH_VARARGS, "Initialize network ids, weights and link attributes" },
     {"initialize_supply",       _fasttrips_initialize_supply,     METH_VARARGS, "Initialize network supply" },
     {"set_bump_wait",           _fasttrips_set_bump_wait,         METH_VARARGS, "Update bump wait"          },
+    {"set_process_number",      _fasttrips_set_process_number,    METH_VARARGS, "Set the process number of a forked worker" },
     {"find_pathset",            _fasttrips_find_pathset,          METH_VARARGS, "Find trip-based path set"  },
+    {"find_pathsets",           _fasttrips_find_pathsets,         METH_VARARGS, "Find trip-based path sets for a batch of requests" },
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -9,11 +9,11 @@
 
 #include <Python.h>
 #include <math.h>
+#include <algorithm>
 #include <ios>
 #include <iostream>
 #include <iomanip>
 #include <sstream>
-#include <stack>
 
 namespace fasttrips {
 
@@ -35,6 +35,10 @@ namespace fasttrips {
         stop_id_(stop_id), linkset_trip_(outbound), linkset_nontrip_(outbound)
     {}
 
+    Hyperlink::Hyperlink(NodeArena* arena) :
+        stop_id_(0), linkset_trip_(false, arena), linkset_nontrip_(false, arena)
+    {}
+
     // Destructor
     Hyperlink::~Hyperlink()
     {
@@ -42,24 +46,220 @@ namespace fasttrips {
         this->clear(false);
     }
 
-    // Remove the given stop state from cost_map_
-    void Hyperlink::removeFromCostMap(const StopStateKey& ssk, const StopState& ss)
+    void LinkArray::insert(size_t link_num, const Link& link)
     {
-        LinkSet& linkset = (isTrip(ssk.deparr_mode_) ? linkset_trip_ : linkset_nontrip_);
+        unsigned int slot_num;
+        if (free_slots_.empty()) {
+            slot_num = static_cast<unsigned int>(slots_.size());
+            slots_.push_back(link);
+        } else {
+            slot_num = free_slots_.back();
+            free_slots_.pop_back();
+            slots_[slot_num] = link;
+        }
+        order_.insert(order_.begin() + link_num, slot_num);
+    }
 
-        // todo: switch this to cost_
-        std::pair<CostToStopState::iterator, CostToStopState::iterator> iter_range = linkset.cost_map_.equal_range(ss.cost_);
-        CostToStopState::iterator cm_iter = iter_range.first;
-        while (cm_iter != iter_range.second) {
-            if (cm_iter->second == ssk) {
-                break;
+    void LinkArray::erase(size_t first_link_num, size_t last_link_num)
+    {
+        free_slots_.insert(free_slots_.end(), order_.begin() + first_link_num, order_.begin() + last_link_num);
+        order_.erase(order_.begin() + first_link_num, order_.begin() + last_link_num);
+    }
+
+    void LinkArray::clear()
+    {
+        slots_.clear();
+        free_slots_.clear();
+        order_.clear();
+    }
+
+    size_t LinkKeyIndex::slotNum(const StopStateKey& ssk) const
+    {
+        unsigned long hash = static_cast<unsigned long>(ssk.trip_id_);
+        hash = hash*1000003UL + static_cast<unsigned long>(ssk.deparr_mode_);
+        hash = hash*1000003UL + static_cast<unsigned long>(ssk.stop_succpred_);
+        hash = hash*1000003UL + static_cast<unsigned long>(ssk.seq_);
+        hash = hash*1000003UL + static_cast<unsigned long>(ssk.seq_succpred_);
+        // the table size is a power of two, so fold the high bits into the ones the mask keeps
+        hash ^= (hash >> 16);
+        return static_cast<size_t>(hash) & (slots_.size() - 1);
+    }
+
+    bool LinkKeyIndex::find(const StopStateKey& ssk, double& deparr_time) const
+    {
+        if (size_ == 0) { return false; }
+        const size_t mask = slots_.size() - 1;
+        for (size_t slot_num = slotNum(ssk); ; slot_num = (slot_num + 1) & mask) {
+            const Slot& slot = slots_[slot_num];
+            if (slot.state_ == SLOT_EMPTY) { return false; }
+            if ((slot.state_ == SLOT_FULL) && (slot.ssk_ == ssk)) {
+                deparr_time = slot.deparr_time_;
+                return true;
             }
-            ++cm_iter;
         }
-        if (cm_iter->second != ssk) {
-            std::cerr << "Hyperlink::removeFromCostMap() This shouldn't happen" << std::endl;
+    }
+
+    void LinkKeyIndex::set(const StopStateKey& ssk, double deparr_time)
+    {
+        // keep at least a quarter of the slots empty so the probe sequences stay short and always end
+        if (4*(used_ + 1) > 3*slots_.size()) {
+            size_t num_slots = 32;
+            while (num_slots < 2*(size_ + 1)) { num_slots *= 2; }
+            rehash(num_slots);
+        }
+        const size_t mask       = slots_.size() - 1;
+        size_t       erased_num = slots_.size();
+        size_t       slot_num   = slotNum(ssk);
+        for (; slots_[slot_num].state_ != SLOT_EMPTY; slot_num = (slot_num + 1) & mask) {
+            Slot& slot = slots_[slot_num];
+            if ((slot.state_ == SLOT_FULL) && (slot.ssk_ == ssk)) {
+                slot.deparr_time_ = deparr_time;
+                return;
+            }
+            if ((slot.state_ == SLOT_ERASED) && (erased_num == slots_.size())) { erased_num = slot_num; }
+        }
+        // it's new; reuse the first erased slot in its probe sequence, if there was one
+        if (erased_num != slots_.size()) { slot_num = erased_num; } else { used_ += 1; }
+        slots_[slot_num].ssk_         = ssk;
+        slots_[slot_num].deparr_time_ = deparr_time;
+        slots_[slot_num].state_       = SLOT_FULL;
+        size_ += 1;
+    }
+
+    void LinkKeyIndex::erase(const StopStateKey& ssk)
+    {
+        if (size_ == 0) { return; }
+        const size_t mask = slots_.size() - 1;
+        for (size_t slot_num = slotNum(ssk); slots_[slot_num].state_ != SLOT_EMPTY; slot_num = (slot_num + 1) & mask) {
+            Slot& slot = slots_[slot_num];
+            if ((slot.state_ == SLOT_FULL) && (slot.ssk_ == ssk)) {
+                slot.state_ = SLOT_ERASED;
+                size_ -= 1;
+                return;
+            }
+        }
+    }
+
+    void LinkKeyIndex::clear()
+    {
+        if (used_ == 0) { return; }
+        for (size_t slot_num = 0; slot_num < slots_.size(); ++slot_num) { slots_[slot_num].state_ = SLOT_EMPTY; }
+        size_ = 0;
+        used_ = 0;
+    }
+
+    void LinkKeyIndex::rehash(size_t num_slots)
+    {
+        SlotVector old_slots(slots_.get_allocator());
+        old_slots.swap(slots_);
+        const Slot empty_slot = { { 0, 0, 0, 0, 0 }, 0, SLOT_EMPTY };
+        slots_.assign(num_slots, empty_slot);
+        size_ = 0;
+        used_ = 0;
+
+        const size_t mask = num_slots - 1;
+        for (size_t old_num = 0; old_num < old_slots.size(); ++old_num) {
+            if (old_slots[old_num].state_ != SLOT_FULL) { continue; }
+            size_t slot_num = slotNum(old_slots[old_num].ssk_);
+            while (slots_[slot_num].state_ != SLOT_EMPTY) { slot_num = (slot_num + 1) & mask; }
+            slots_[slot_num] = old_slots[old_num];
+            size_ += 1;
+            used_ += 1;
+        }
+    }
+
+    size_t LinkSet::find(const StopStateKey& ssk) const
+    {
+        size_t link_num = first_link_;
+        // with the key's time, only the links with that time need to be checked
+        if (key_index_.size() > 0) {
+            double deparr_time;
+            if (!key_index_.find(ssk, deparr_time)) { return links_.size(); }
+            // binary search for the first link with that time
+            double window_time = windowTime(deparr_time);
+            size_t hi = links_.size();
+            while (link_num < hi) {
+                size_t mid = link_num + (hi - link_num)/2;
+                if (windowTime(links_[mid].stop_state_.deparr_time_) < window_time) { link_num = mid + 1; } else { hi = mid; }
+            }
+        }
+        for (; link_num < links_.size(); ++link_num) {
+            const StopState& ss = links_[link_num].stop_state_;
+            if ((ss.deparr_mode_   == ssk.deparr_mode_  ) &&
+                (ss.trip_id_       == ssk.trip_id_      ) &&
+                (ss.stop_succpred_ == ssk.stop_succpred_) &&
+                (ss.seq_           == ssk.seq_          ) &&
+                (ss.seq_succpred_  == ssk.seq_succpred_ )) { return link_num; }
         }
-        linkset.cost_map_.erase(cm_iter);
+        return links_.size();
+    }
+
+    size_t LinkSet::lowestCost(size_t start) const
+    {
+        size_t lowest = links_.size();
+        for (size_t link_num = std::max(start, first_link_); link_num < links_.size(); ++link_num) {
+            if ((lowest == links_.size()) || links_[link_num].costLess(links_[lowest])) { lowest = link_num; }
+        }
+        return lowest;
+    }
+
+    size_t LinkSet::insertPosition(double deparr_time) const
+    {
+        // binary search for the first link that falls out of the window after this one
+        double window_time = windowTime(deparr_time);
+        size_t lo = first_link_, hi = links_.size();
+        while (lo < hi) {
+            size_t mid = lo + (hi - lo)/2;
+            if (windowTime(links_[mid].stop_state_.deparr_time_) <= window_time) { lo = mid + 1; } else { hi = mid; }
+        }
+        return lo;
+    }
+
+    void LinkSet::indexLink(const StopState& ss)
+    {
+        if (key_index_.size() > 0) {
+            const StopStateKey ssk = { ss.deparr_mode_, ss.trip_id_, ss.stop_succpred_, ss.seq_, ss.seq_succpred_ };
+            key_index_.set(ssk, ss.deparr_time_);
+        } else if (size() > LINEAR_FIND_MAX) {
+            for (size_t link_num = first_link_; link_num < links_.size(); ++link_num) {
+                key_index_.set(links_[link_num].key(), links_[link_num].stop_state_.deparr_time_);
+            }
+        }
+    }
+
+    /// Orders link indices by cost, the way the links were ordered when they were in a std::multimap keyed by cost
+    struct LinkNumCostLess {
+        const LinkArray* links_;
+        bool operator()(size_t link_num1, size_t link_num2) const {
+            return (*links_)[link_num1].costLess((*links_)[link_num2]);
+        }
+    };
+
+    /// Fills link_nums with the indices of the links in the given link set, in cost order
+    static void linksInCostOrder(const LinkSet& linkset, std::vector<size_t>& link_nums)
+    {
+        link_nums.clear();
+        for (size_t link_num = linkset.first_link_; link_num < linkset.links_.size(); ++link_num) { link_nums.push_back(link_num); }
+        LinkNumCostLess cost_less = { &linkset.links_ };
+        std::sort(link_nums.begin(), link_nums.end(), cost_less);
+    }
+
+    // Insert the given link into the link set, keeping the time window order
+    size_t Hyperlink::insertLink(LinkSet& linkset, const StopState& ss)
+    {
+        Link link = { ss, exp(-1.0*STOCH_DISPERSION_*ss.cost_), linkset.next_cost_order_++ };
+        size_t link_num = linkset.insertPosition(ss.deparr_time_);
+        // reuse the space pruned links left at the front if the new link goes first
+        if ((link_num == linkset.first_link_) && (linkset.first_link_ > 0)) {
+            linkset.first_link_ -= 1;
+            link_num            -= 1;
+            linkset.links_[link_num] = link;
+        } else {
+            linkset.links_.insert(link_num, link);
+        }
+        linkset.sum_exp_cost_ += link.exp_cost_;
+        linkset.indexLink(ss);
+        return link_num;
     }
 
 
@@ -75,23 +275,19 @@ namespace fasttrips {
         linkset.lder_ssk_.seq_           = 0;
         linkset.lder_ssk_.seq_succpred_  = 0;
 
-        for (StopStateMap::const_iterator it = linkset.stop_state_map_.begin(); it != linkset.stop_state_map_.end(); ++it)
+        if (linkset.size() == 0) { return; }
+
+        // this is the earliest departure (outbound) or latest arrival (inbound), which is at the front of the window
+        // order.  Of the links with that time, take the one with the lowest key.
+        linkset.latest_dep_earliest_arr_ = linkset.links_[linkset.first_link_].stop_state_.deparr_time_;
+        linkset.lder_ssk_                = linkset.links_[linkset.first_link_].key();
+        for (size_t link_num = linkset.first_link_+1; link_num < linkset.links_.size(); ++link_num)
         {
-            const StopStateKey& ssk = it->first;
-            const StopState&    ss  = it->second;
+            if (linkset.links_[link_num].stop_state_.deparr_time_ != linkset.latest_dep_earliest_arr_) { break; }
 
-            if (linkset.lder_ssk_.deparr_mode_ == MODE_UNSET)
-            {
-                linkset.latest_dep_earliest_arr_ = ss.deparr_time_;
-                linkset.lder_ssk_                = ssk;
-            } else if (( path_spec.outbound_ && (linkset.latest_dep_earliest_arr_ > ss.deparr_time_)) ||
-                       (!path_spec.outbound_ && (linkset.latest_dep_earliest_arr_ < ss.deparr_time_)))
-            {
-                linkset.latest_dep_earliest_arr_ = ss.deparr_time_;
-                linkset.lder_ssk_                = ssk;
-            }
+            StopStateKey ssk = linkset.links_[link_num].key();
+            if (ssk < linkset.lder_ssk_) { linkset.lder_ssk_ = ssk; }
         }
-
     }
 
     // Update the low cost path for this stop state
@@ -104,7 +300,9 @@ namespace fasttrips {
     {
         LinkSet& linkset = (isTrip(ssk.deparr_mode_) ? linkset_trip_ : linkset_nontrip_);
         // get the link
-        StopState& ss = linkset.stop_state_map_[ssk];
+        size_t link_num = linkset.find(ssk);
+        if (link_num == linkset.links_.size()) { std::cerr << "updateLowCostPath error0" << std::endl; return; }
+        StopState& ss = linkset.links_[link_num].stop_state_;
 
         // if it's a start link, it's a new path
         if (( path_spec.outbound_ && ssk.deparr_mode_ == MODE_EGRESS) ||
@@ -121,11 +319,10 @@ namespace fasttrips {
         if (prev_link == NULL) { std::cerr << "updateLowCostPath error2" << std::endl; return; }
 
         // pull trips (for non-trip links) or non-trips for trip links
-        const StopStateMap& prev_link_map = prev_link->getStopStateMap(!isTrip(ssk.deparr_mode_));
-        for (StopStateMap::const_iterator it = prev_link_map.begin(); it != prev_link_map.end(); ++it)
+        const LinkSet& prev_linkset = prev_link->getLinkSet(!isTrip(ssk.deparr_mode_));
+        for (size_t prev_link_num = prev_linkset.first_link_; prev_link_num < prev_linkset.links_.size(); ++prev_link_num)
         {
-            const StopStateKey& prev_ssk = it->first;
-            const StopState&    prev_ss  = it->second;
+            const StopState& prev_ss = prev_linkset.links_[prev_link_num].stop_state_;
 
             if (prev_ss.low_cost_path_ == NULL) { continue; }
 
@@ -156,20 +353,19 @@ namespace fasttrips {
     // How many links make up the hyperlink?
     size_t Hyperlink::size() const
     {
-        return linkset_trip_.stop_state_map_.size() + linkset_nontrip_.stop_state_map_.size();
+        return linkset_trip_.size() + linkset_nontrip_.size();
     }
 
     // How many links make up the trip/nontrip hyperlink
     size_t Hyperlink::size(bool of_trip_links) const
     {
         const LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
-        return linkset.stop_state_map_.size();
+        return linkset.size();
     }
 
-    const StopStateMap& Hyperlink::getStopStateMap(bool of_trip_links) const
+    const LinkSet& Hyperlink::getLinkSet(bool of_trip_links) const
     {
-        const LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
-        return linkset.stop_state_map_;
+        return (of_trip_links ? linkset_trip_ : linkset_nontrip_);
     }
 
     // Accessor for the low cost path
@@ -179,9 +375,9 @@ namespace fasttrips {
         double low_cost = 0;
 
         const LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
-        for (StopStateMap::const_iterator it = linkset.stop_state_map_.begin(); it != linkset.stop_state_map_.end(); ++it)
+        for (size_t link_num = linkset.first_link_; link_num < linkset.links_.size(); ++link_num)
         {
-            const StopState& ss = it->second;
+            const StopState& ss = linkset.links_[link_num].stop_state_;
 
             if (ss.low_cost_path_ == NULL) { continue; }
 
@@ -200,52 +396,68 @@ namespace fasttrips {
         return low_cost_path;
     }
 
+    template <bool TRACE>
+    bool Hyperlink::setLabel(const StopState& ss, bool& rejected,
+                             std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf)
+    {
+        LinkSet& linkset = (isTrip(ss.deparr_mode_) ? linkset_trip_ : linkset_nontrip_);
+
+        // if the cost isn't better, reject
+        rejected = ((linkset.size() > 0) && (ss.cost_ >= linkset.links_[linkset.first_link_].stop_state_.cost_));
+        if (TRACE) {
+            trace_file << "  + new ";
+            Hyperlink::printStopState(trace_file, stop_id_, ss, path_spec, pf);
+            trace_file << (rejected ? " (rejected)" : "") << std::endl;
+        }
+        if (rejected) { return false; }
+
+        // otherwise it replaces the label in place.  There's no window, so the label is the latest departure/earliest arrival,
+        // and no probabilities, so exp_cost_ and sum_exp_cost_ stay zero.
+        if (linkset.size() == 0) {
+            Link link = { ss, 0, 0 };
+            linkset.links_.push_back(link);
+        } else {
+            StopState& old_label = linkset.links_[linkset.first_link_].stop_state_;
+            if (old_label.low_cost_path_) { delete old_label.low_cost_path_; }
+            old_label = ss;
+        }
+        const StopStateKey ssk = { ss.deparr_mode_, ss.trip_id_, ss.stop_succpred_, ss.seq_, ss.seq_succpred_ };
+        linkset.latest_dep_earliest_arr_ = ss.deparr_time_;
+        linkset.lder_ssk_                = ssk;
+        linkset.hyperpath_cost_          = std::max(ss.cost_, MIN_COST);
+        return true;
+    }
+
+    const StopState& Hyperlink::label(bool of_trip_links) const
+    {
+        const LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
+        return linkset.links_[linkset.first_link_].stop_state_;
+    }
+
+    template <bool TRACE>
     bool Hyperlink::addLink(const StopState& ss, const Hyperlink* prev_link, bool& rejected,
                             std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf)
     {
+        // deterministic -- we only keep one, the low cost link
+        if (path_spec.hyperpath_ == false) { return setLabel<TRACE>(ss, rejected, trace_file, path_spec, pf); }
+
         rejected = false;
         const StopStateKey ssk = { ss.deparr_mode_, ss.trip_id_, ss.stop_succpred_, ss.seq_, ss.seq_succpred_ };
 
         // add to the linkset based on the mode
         LinkSet& linkset = (isTrip(ssk.deparr_mode_) ? linkset_trip_ : linkset_nontrip_);
 
-        // deterministic -- we only keep one, the low cost link
-        if (path_spec.hyperpath_ == false)
-        {
-            // if the cost isn't better, reject
-            if ((linkset.cost_map_.size() > 0) && (ss.cost_ >= linkset.cost_map_.begin()->first))
-            {
-                rejected = true;
-
-                // log it
-                if (path_spec.trace_) {
-                    trace_file << "  + new ";
-                    Hyperlink::printStopState(trace_file, stop_id_, ss, path_spec, pf);
-                    trace_file << " (rejected)" << std::endl;
-                }
-
-                return false;
-            }
-            // otherwise, accept by clearing out
-            clear(isTrip(ssk.deparr_mode_));
-            // fall through to add it below
-        }
         // simplest case -- we have no stop states/links, so just add it
-        if (linkset.stop_state_map_.size() == 0)
+        if (linkset.size() == 0)
         {
             linkset.latest_dep_earliest_arr_ = ss.deparr_time_;
             linkset.lder_ssk_                = ssk;
-            linkset.sum_exp_cost_            = exp(-1.0*STOCH_DISPERSION_*ss.cost_);
+            linkset.sum_exp_cost_            = 0;
+            insertLink(linkset, ss);
             linkset.hyperpath_cost_          = std::max(ss.cost_, MIN_COST);
 
-            // add to the map
-            linkset.stop_state_map_[ssk] = ss;
-
-            // assume success
-            linkset.cost_map_.insert (std::pair<double, StopStateKey>(ss.cost_,ssk));
-
             // log it
-            if (path_spec.trace_) {
+            if (TRACE) {
                 trace_file << "  + new ";
                 Hyperlink::printStopState(trace_file, stop_id_, ss, path_spec, pf);
                 trace_file << std::endl;
@@ -269,7 +481,7 @@ namespace fasttrips {
             rejected = true;
 
             // log it
-            if (path_spec.trace_) {
+            if (TRACE) {
                 trace_file << "  + new ";
                 Hyperlink::printStopState(trace_file, stop_id_, ss, path_spec, pf);
                 trace_file << " (rejected)" << std::endl;
@@ -281,76 +493,32 @@ namespace fasttrips {
         // ========= now it's definitely going in =========
 
         bool update_state = false;
-        // we have some stop states/links, so try to insert but we may fail
-        std::pair<StopStateMap::iterator, bool> result_l = linkset.stop_state_map_.insert(std::pair<StopStateKey,StopState>(ssk,ss));
+        // only built when tracing
+        std::string notes;
 
-        // if we succeeded, the key isn't in here already
-        if (result_l.second == true) {
-            std::string notes;
-
-            linkset.cost_map_.insert (std::pair<double, StopStateKey>(ss.cost_,ssk));
-
-            // check if the window is updated -- this is a state update
-            if ((!is_last_link) &&
-                (( path_spec.outbound_ && (ss.deparr_time_ > linkset.latest_dep_earliest_arr_)) ||
-                 (!path_spec.outbound_ && (ss.deparr_time_ < linkset.latest_dep_earliest_arr_))))
-            {
-                linkset.latest_dep_earliest_arr_  = ss.deparr_time_;
-                linkset.lder_ssk_                 = ssk;
-                update_state                      = true;
-                notes                            += " (window)";
-                // if the window changes, we need to prune states out of bounds -- this recalculates sum_exp_cost_
-                pruneWindow(trace_file, path_spec, pf, isTrip(ssk.deparr_mode_));
-            } else {
-                linkset.sum_exp_cost_         += exp(-1.0*STOCH_DISPERSION_*ss.cost_);
-            }
-
-            // check if the hyperpath cost is affected -- this would be a state update
-            double hyperpath_cost  = std::max((-1.0/STOCH_DISPERSION_)*log(linkset.sum_exp_cost_), MIN_COST);
-            if (abs(hyperpath_cost - linkset.hyperpath_cost_) > 0.0001)
-            {
-                std::ostringstream oss;
-                oss << " (hp cost " << std::setprecision(6) << std::fixed << linkset.hyperpath_cost_ << "->" << hyperpath_cost << ")";
-                notes                   += oss.str();
-                update_state             = true;
-                linkset.hyperpath_cost_  = hyperpath_cost;
-            }
-
-            // log it
-            if (path_spec.trace_) {
-                trace_file << "  + new ";
-                Hyperlink::printStopState(trace_file, stop_id_, ss, path_spec, pf);
-                trace_file << notes << std::endl;
+        size_t link_num = linkset.find(ssk);
+        bool   replaced = (link_num != linkset.links_.size());
+        if (replaced)
+        {
+            // ========= the key is in already in here so replace the values =========
+            if (TRACE) { notes = " (sub)"; }
+
+            Link& old_link = linkset.links_[link_num];
+            linkset.sum_exp_cost_ -= old_link.exp_cost_;
+            // we're replacing the stopstate so delete the old path
+            if (old_link.stop_state_.low_cost_path_) {
+                delete old_link.stop_state_.low_cost_path_;
+                old_link.stop_state_.low_cost_path_ = NULL;
             }
-
-            // updateLowCostPath(ssk, prev_link, trace_file, path_spec, pf);
-            return update_state;
-        }
-
-        // ========= the key is in already in here so replace the values =========
-        std::string notes(" (sub)");
-
-        // update the cost map
-        removeFromCostMap(ssk, linkset.stop_state_map_[ssk]);
-        linkset.cost_map_.insert (std::pair<double, StopStateKey>(ss.cost_,ssk));
-
-        // update the cost
-        linkset.sum_exp_cost_ -= exp(-1.0*STOCH_DISPERSION_*linkset.stop_state_map_[ssk].cost_);
-
-        // we're replacing the stopstate so delete the old path
-        if (linkset.stop_state_map_[ssk].low_cost_path_) {
-            delete linkset.stop_state_map_[ssk].low_cost_path_;
-            linkset.stop_state_map_[ssk].low_cost_path_ = NULL;
+            linkset.links_.erase(link_num, link_num + 1);
         }
-        // and the other state elements
-        linkset.stop_state_map_[ssk] = ss;
-        // stop_state_map_[ssk].iteration_ = old_iteration; // remove this
-        linkset.sum_exp_cost_ += exp(-1.0*STOCH_DISPERSION_*ss.cost_);
+        // the new link, or the replacement, goes in its time window place and to the end of the links with its cost
+        insertLink(linkset, ss);
 
         // if the the latest_dep_earliest_arr_ were set to the previous value, we need to check
-        if (linkset.lder_ssk_ == ssk)
+        if (replaced && (linkset.lder_ssk_ == ssk))
         {
-            if (path_spec.trace_) { trace_file << "Resetting lder" << std::endl; }
+            if (TRACE) { trace_file << "Resetting lder" << std::endl; }
             resetLatestDepartureEarliestArrival(isTrip(ssk.deparr_mode_), path_spec);
         }
 
@@ -362,23 +530,26 @@ namespace fasttrips {
             linkset.latest_dep_earliest_arr_  = ss.deparr_time_;
             linkset.lder_ssk_                 = ssk;
             update_state                      = true;
-            notes                            += " (window)";
-            // if the window changes, we need to prune states out of bounds -- this recalculates sum_exp_cost_
+            if (TRACE) { notes               += " (window)"; }
+            // if the window changes, we need to prune states out of bounds -- this updates sum_exp_cost_
             pruneWindow(trace_file, path_spec, pf, isTrip(ssk.deparr_mode_));
         }
 
-        double hyperpath_cost  = std::max((-1.0/STOCH_DISPERSION_)*log(linkset.sum_exp_cost_),MIN_COST);
+        // check if the hyperpath cost is affected -- this would be a state update
+        double hyperpath_cost  = std::max((-1.0/STOCH_DISPERSION_)*log(linkset.sum_exp_cost_), MIN_COST);
         if (abs(hyperpath_cost - linkset.hyperpath_cost_) > 0.0001)
         {
-            std::ostringstream oss;
-            oss << " (hp cost " << std::setprecision(6) << std::fixed << linkset.hyperpath_cost_ << "->" << hyperpath_cost << ")";
-            notes                   += oss.str();
+            if (TRACE) {
+                std::ostringstream oss;
+                oss << " (hp cost " << std::setprecision(6) << std::fixed << linkset.hyperpath_cost_ << "->" << hyperpath_cost << ")";
+                notes               += oss.str();
+            }
             update_state             = true;
             linkset.hyperpath_cost_  = hyperpath_cost;
         }
 
         // log it
-        if (path_spec.trace_) {
+        if (TRACE) {
             trace_file << "  + new ";
             Hyperlink::printStopState(trace_file, stop_id_, ss, path_spec, pf);
             trace_file << notes << std::endl;
@@ -388,6 +559,12 @@ namespace fasttrips {
         return update_state;
     }
 
+    // PathFinder's labeling loop uses both
+    template bool Hyperlink::addLink<true >(const StopState& ss, const Hyperlink* prev_link, bool& rejected,
+                                            std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf);
+    template bool Hyperlink::addLink<false>(const StopState& ss, const Hyperlink* prev_link, bool& rejected,
+                                            std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf);
+
     void Hyperlink::clear(bool of_trip_links)
     {
         const StopStateKey zero_ssk = { 0.0, 0, 0, 0, 0.0 };
@@ -395,17 +572,20 @@ namespace fasttrips {
         LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
 
         // this memory needs to be freed
-        for (StopStateMap::iterator it = linkset.stop_state_map_.begin(); it != linkset.stop_state_map_.end(); ++it)
+        for (size_t link_num = linkset.first_link_; link_num < linkset.links_.size(); ++link_num)
         {
-            StopState& ss = it->second;
+            StopState& ss = linkset.links_[link_num].stop_state_;
             if (ss.low_cost_path_) {
                 delete ss.low_cost_path_;
                 ss.low_cost_path_ = NULL;
             }
         }
 
-        linkset.stop_state_map_.clear();
-        linkset.cost_map_.clear();
+        // this keeps the array for the next request
+        linkset.links_.clear();
+        linkset.key_index_.clear();
+        linkset.first_link_                 = 0;
+        linkset.next_cost_order_            = 0;
         linkset.sum_exp_cost_               = 0;
         linkset.hyperpath_cost_             = 0;
         linkset.latest_dep_earliest_arr_    = 0;
@@ -414,12 +594,24 @@ namespace fasttrips {
         // don't reset process counts
     }
 
+    void Hyperlink::reset(int stop_id, bool outbound)
+    {
+        this->clear(true);
+        this->clear(false);
+        // back to as constructed, keeping the allocators
+        stop_id_                         = stop_id;
+        linkset_trip_.outbound_          = outbound;
+        linkset_nontrip_.outbound_       = outbound;
+        linkset_trip_.hyperpath_cost_    = MAX_COST;
+        linkset_trip_.process_count_     = 0;
+        linkset_nontrip_.hyperpath_cost_ = MAX_COST;
+        linkset_nontrip_.process_count_  = 0;
+    }
+
     const StopState& Hyperlink::lowestCostStopState(bool of_trip_links) const
     {
         const LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
-
-        const StopStateKey& ssk = linkset.cost_map_.begin()->second;
-        return linkset.stop_state_map_.find(ssk)->second;
+        return linkset.links_[linkset.lowestCost(0)].stop_state_;
     }
 
     // Given an arrival time into this hyperlink (outbound) or a departure time out of this hyperlink (inbound),
@@ -427,19 +619,18 @@ namespace fasttrips {
     // arrdep time is for a trip so looks at nontrip
     const StopState& Hyperlink::bestGuessLink(bool outbound, double arrdep_time) const
     {
-        for (CostToStopState::const_iterator iter = linkset_nontrip_.cost_map_.begin(); iter != linkset_nontrip_.cost_map_.end(); ++iter)
-        {
-            const StopStateKey& ssk = iter->second;
-            const StopState&    ss  = linkset_nontrip_.stop_state_map_.find(ssk)->second;
-            if (outbound && (ss.deparr_time_ >= arrdep_time)) {
-                return ss;
-            }
-
-            if (!outbound && (arrdep_time >= ss.deparr_time_)) {
-                return ss;
-            }
-        }
-        return linkset_nontrip_.stop_state_map_.find(linkset_nontrip_.cost_map_.begin()->second)->second;
+        // the lowest cost link departing after we arrive (outbound) or arriving before we depart (inbound).
+        // Those are the last links in the window order.
+        size_t first_usable = linkset_nontrip_.first_link_;
+        while ((first_usable < linkset_nontrip_.links_.size()) &&
+               (( outbound && (linkset_nontrip_.links_[first_usable].stop_state_.deparr_time_ <  arrdep_time)) ||
+                (!outbound && (linkset_nontrip_.links_[first_usable].stop_state_.deparr_time_ >  arrdep_time)))) {
+            ++first_usable;
+        }
+        size_t link_num = linkset_nontrip_.lowestCost(first_usable);
+        if (link_num != linkset_nontrip_.links_.size()) { return linkset_nontrip_.links_[link_num].stop_state_; }
+
+        return linkset_nontrip_.links_[linkset_nontrip_.lowestCost(0)].stop_state_;
     }
 
     // Given an arrival link into this hyperlink (outbound) or a departure time out of this hyperlink (inbound),
@@ -447,9 +638,9 @@ namespace fasttrips {
     double Hyperlink::bestGuessCost(bool outbound, double arrdep_time) const
     {
         double sum_exp = 0.0;
-        for (StopStateMap::const_iterator it = linkset_nontrip_.stop_state_map_.begin(); it != linkset_nontrip_.stop_state_map_.end(); ++it)
+        for (size_t link_num = linkset_nontrip_.first_link_; link_num < linkset_nontrip_.links_.size(); ++link_num)
         {
-            const StopState& ss = it->second;
+            const StopState& ss = linkset_nontrip_.links_[link_num].stop_state_;
             if (outbound && (ss.deparr_time_ >= arrdep_time)) {
                 sum_exp += exp(-1.0*STOCH_DISPERSION_*ss.cost_);
             } else if (!outbound && (arrdep_time >= ss.deparr_time_)) {
@@ -468,13 +659,16 @@ namespace fasttrips {
     {
         const LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
 
+        // that's the first link in the window order
+        if (outbound == linkset.outbound_) { return linkset.links_[linkset.first_link_].stop_state_.deparr_time_; }
+
         double earliest_dep_latest_arr = lowestCostStopState(of_trip_links).deparr_time_;
-        for (StopStateMap::const_iterator it = linkset.stop_state_map_.begin(); it != linkset.stop_state_map_.end(); ++it)
+        for (size_t link_num = linkset.first_link_; link_num < linkset.links_.size(); ++link_num)
         {
             if (outbound) {
-                earliest_dep_latest_arr = std::min(earliest_dep_latest_arr, it->second.deparr_time_);
+                earliest_dep_latest_arr = std::min(earliest_dep_latest_arr, linkset.links_[link_num].stop_state_.deparr_time_);
             } else {
-                earliest_dep_latest_arr = std::max(earliest_dep_latest_arr, it->second.deparr_time_);
+                earliest_dep_latest_arr = std::max(earliest_dep_latest_arr, linkset.links_[link_num].stop_state_.deparr_time_);
             }
         }
         return earliest_dep_latest_arr;
@@ -571,7 +765,7 @@ namespace fasttrips {
 
     void Hyperlink::printLinkSet(std::ostream& ostr, int stop_id, bool is_trip, const LinkSet& linkset, const PathSpecification& path_spec, const PathFinder& pf)
     {
-        ostr << " (size " << linkset.cost_map_.size();
+        ostr << " (size " << linkset.size();
         ostr << "; count " << linkset.process_count_;
         ostr << "; lder ";
         pf.printTime(ostr, linkset.latest_dep_earliest_arr_);
@@ -591,24 +785,25 @@ namespace fasttrips {
         ostr << ")" << std::endl << "  ";
         Hyperlink::printStopStateHeader(ostr, path_spec);
         ostr << std::endl;
-        for (CostToStopState::const_iterator iter = linkset.cost_map_.begin(); iter != linkset.cost_map_.end(); ++iter) {
+        std::vector<size_t> link_nums;
+        linksInCostOrder(linkset, link_nums);
+        for (size_t idx = 0; idx < link_nums.size(); ++idx) {
             ostr << "  ";
-            const StopStateKey& ssk = iter->second;
-            Hyperlink::printStopState(ostr, stop_id, linkset.stop_state_map_.find(ssk)->second, path_spec, pf);
+            Hyperlink::printStopState(ostr, stop_id, linkset.links_[link_nums[idx]].stop_state_, path_spec, pf);
             ostr << std::endl;
         }
     }
 
     void Hyperlink::print(std::ostream& ostr, const PathSpecification& path_spec, const PathFinder& pf) const
     {
-        if (linkset_trip_.cost_map_.size() == 0) {
+        if (linkset_trip_.size() == 0) {
             ostr << "   No trip links" << std::endl;
         } else {
             ostr << " Trip links";
             Hyperlink::printLinkSet(ostr, stop_id_, true, linkset_trip_, path_spec, pf);
         }
 
-        if (linkset_nontrip_.cost_map_.size() == 0) {
+        if (linkset_nontrip_.size() == 0) {
             ostr << "   No non-trip links" << std::endl;
         } else {
             ostr << " Non-Trip links";
@@ -616,52 +811,57 @@ namespace fasttrips {
         }
     }
 
-    // Go through stop states (links) and remove any outside the time window
-    // Recalculates sum_exp_cost_ but not hyperpath_cost_
+    // Remove the stop states (links) outside the time window, which are at the front of the window order
+    // Updates sum_exp_cost_ but not hyperpath_cost_
     void Hyperlink::pruneWindow(std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf, bool of_trip_links)
     {
 
         LinkSet& linkset = (of_trip_links ? linkset_trip_ : linkset_nontrip_);
 
-        std::stack<StopStateKey> prune_keys;
-
-        // recalculate this
-        linkset.sum_exp_cost_ = 0;
-
-        for (StopStateMap::const_iterator ssm_iter = linkset.stop_state_map_.begin(); ssm_iter != linkset.stop_state_map_.end(); ++ssm_iter)
+        size_t pruned          = 0;
+        double pruned_exp_cost = 0;
+        while (linkset.first_link_ < linkset.links_.size())
         {
-            const StopStateKey& ssk = ssm_iter->first;
-            const StopState&    ss  = ssm_iter->second;
+            StopState& ss = linkset.links_[linkset.first_link_].stop_state_;
 
-            if (( path_spec.outbound_ && (ss.deparr_time_ < linkset.latest_dep_earliest_arr_ - TIME_WINDOW_)) ||
-                (!path_spec.outbound_ && (ss.deparr_time_ > linkset.latest_dep_earliest_arr_ + TIME_WINDOW_))) {
-                prune_keys.push(ssk);
-            } else {
-                linkset.sum_exp_cost_ += exp(-1.0*STOCH_DISPERSION_*ss.cost_);
+            if (!(( path_spec.outbound_ && (ss.deparr_time_ < linkset.latest_dep_earliest_arr_ - TIME_WINDOW_)) ||
+                  (!path_spec.outbound_ && (ss.deparr_time_ > linkset.latest_dep_earliest_arr_ + TIME_WINDOW_)))) {
+                break;
             }
-        }
-
-        if (prune_keys.size() == 0) { return; }
-
-        // window-pruning
-        while (!prune_keys.empty()) {
-            const StopStateKey& ssk = prune_keys.top();
 
             if (path_spec.trace_) {
                 trace_file << "  + del ";
-                printStopState(trace_file, stop_id_, linkset.stop_state_map_[ssk], path_spec, pf);
+                printStopState(trace_file, stop_id_, ss, path_spec, pf);
                 trace_file << " (prune-window)" << std::endl;
             }
 
-            removeFromCostMap(ssk, linkset.stop_state_map_[ssk]);
-            if (linkset.stop_state_map_[ssk].low_cost_path_) {
-                delete linkset.stop_state_map_[ssk].low_cost_path_;
-                linkset.stop_state_map_[ssk].low_cost_path_ = NULL;
+            if (ss.low_cost_path_) {
+                delete ss.low_cost_path_;
+                ss.low_cost_path_ = NULL;
+            }
+            if (linkset.key_index_.size() > 0) { linkset.key_index_.erase(linkset.links_[linkset.first_link_].key()); }
+            pruned          += 1;
+            pruned_exp_cost += linkset.links_[linkset.first_link_].exp_cost_;
+            linkset.first_link_ += 1;
+        }
+
+        if (pruned == 0) { return; }
+
+        if (2*pruned_exp_cost <= linkset.sum_exp_cost_) {
+            linkset.sum_exp_cost_ -= pruned_exp_cost;
+        } else {
+            // most of the sum is gone, so subtracting would leave mostly rounding error; add up what's left
+            linkset.sum_exp_cost_ = 0;
+            for (size_t link_num = linkset.first_link_; link_num < linkset.links_.size(); ++link_num) {
+                linkset.sum_exp_cost_ += linkset.links_[link_num].exp_cost_;
             }
-            linkset.stop_state_map_.erase( ssk );
-            prune_keys.pop();
         }
 
+        // once the pruned links are most of the array, move the rest down so the array doesn't grow without bound
+        if (2*linkset.first_link_ > linkset.links_.size()) {
+            linkset.links_.erase(0, linkset.first_link_);
+            linkset.first_link_ = 0;
+        }
     }
 
     // Choose a link from this hyperlink based on the probabilities
@@ -671,19 +871,21 @@ namespace fasttrips {
     {
         const LinkSet& linkset = (prev_link && !isTrip(prev_link->deparr_mode_) ? linkset_trip_ : linkset_nontrip_);
 
-        static int COST_CUTOFF = 1;
+        const int COST_CUTOFF = 1;
 
         // Build a vector of probabilities in order of the costmap iteration
         if (path_spec.trace_) { Hyperlink::printStopStateHeader(trace_file, path_spec);  trace_file << std::endl; }
 
         double sum_exp     = 0;
 
+        std::vector<size_t> link_nums;
+        linksInCostOrder(linkset, link_nums);
+
         // Setup the probabilities
-        for (CostToStopState::const_iterator iter = linkset.cost_map_.begin(); iter != linkset.cost_map_.end(); ++iter)
+        for (size_t idx = 0; idx < link_nums.size(); ++idx)
         {
-            const StopStateKey& ssk   = iter->second;
-            const StopState&     ss   = linkset.stop_state_map_.find(ssk)->second;
-            ProbabilityStopState pss  = { 0.0, 0, ssk };
+            const StopState&     ss   = linkset.links_[link_nums[idx]].stop_state_;
+            ProbabilityStopState pss  = { 0.0, 0, link_nums[idx] };
 
             // some checks if we have a previous link -- this will be a two-pass :p
             if (prev_link != NULL)
@@ -711,7 +913,7 @@ namespace fasttrips {
                 // we have no additional information so we trust the hyperpath cost and can go ahead
                 pss.probability_ = exp(-1.0*STOCH_DISPERSION_*ss.cost_) /
                                    exp(-1.0*STOCH_DISPERSION_*linkset.hyperpath_cost_);
-                pss.prob_i_      = static_cast<int>(RAND_MAX*pss.probability_);
+                pss.prob_i_      = static_cast<int>(RandomGenerator::MAX*pss.probability_);
 
                 // too small to consider
                 if (pss.prob_i_ < COST_CUTOFF) { continue; }
@@ -742,9 +944,9 @@ namespace fasttrips {
         // fix up the probabilities
         for (int idx = 0; idx < probabilities.size(); ++idx)
         {
-            const StopState& ss = linkset.stop_state_map_.find(probabilities[idx].ssk_)->second;
+            const StopState& ss = linkset.links_[probabilities[idx].link_num_].stop_state_;
             probabilities[idx].probability_ = exp(-1.0*STOCH_DISPERSION_*ss.cost_) / sum_exp;
-            probabilities[idx].prob_i_      = static_cast<int>(RAND_MAX*probabilities[idx].probability_);
+            probabilities[idx].prob_i_      = static_cast<int>(RandomGenerator::MAX*probabilities[idx].probability_);
 
             // make it cumulative
             if (idx > 0) { probabilities[idx].prob_i_ += probabilities[idx-1].prob_i_; }
@@ -763,11 +965,12 @@ namespace fasttrips {
         const PathSpecification& path_spec,
         std::ostream& trace_file,
         const std::vector<ProbabilityStopState>& prob_stops,
+        RandomGenerator& random_generator,
         const StopState* prev_link) const
     {
         const LinkSet& linkset = (prev_link && !isTrip(prev_link->deparr_mode_) ? linkset_trip_ : linkset_nontrip_);
 
-        int random_num = rand();
+        int random_num = random_generator.next();
         if (path_spec.trace_) { trace_file << "random_num " << random_num << " -> "; }
 
         // mod it by max prob
@@ -777,10 +980,30 @@ namespace fasttrips {
         for (size_t ind = 0; ind < prob_stops.size(); ++ind)
         {
             if (prob_stops[ind].prob_i_==0) { continue; }
-            if (random_num <= prob_stops[ind].prob_i_) { return linkset.stop_state_map_.find(prob_stops[ind].ssk_)->second; }
+            if (random_num <= prob_stops[ind].prob_i_) { return linkset.links_[prob_stops[ind].link_num_].stop_state_; }
         }
         // shouldn't get here
         printf("PathFinder::chooseState() This should never happen!\n");
-        return linkset.stop_state_map_.begin()->second;
+        return linkset.links_[linkset.first_link_].stop_state_;
+    }
+
+    void StopStates::reset(int max_stop_id, bool outbound)
+    {
+        if (max_stop_id >= static_cast<int>(hyperlinks_.size())) {
+            // empty the old hyperlinks before they're copied over
+            for (size_t stop_id = 0; stop_id < hyperlinks_.size(); ++stop_id) {
+                hyperlinks_[stop_id].reset(static_cast<int>(stop_id), outbound);
+            }
+            hyperlinks_.resize(max_stop_id+1, Hyperlink(&arena_));
+        }
+        initialized_.reset(max_stop_id);
+        num_stops_ = 0;
+        outbound_  = outbound;
+    }
+
+    size_t StopStates::memoryBytes() const
+    {
+        // the links are all in the arena
+        return hyperlinks_.capacity()*sizeof(Hyperlink) + initialized_.memoryBytes() + arena_.memoryBytes();
     }
 }
@@ -5,11 +5,13 @@
  */
 #include <iostream>
 #include <map>
-#include <set>
 #include <vector>
 
+#include "arena.h"
 #include "pathspec.h"
 #include "path.h"
+#include "randomgenerator.h"
+#include "visitedset.h"
 
 #ifndef HYPERLINK_H
 #define HYPERLINK_H
@@ -35,25 +37,179 @@ namespace fasttrips {
     /// Structure used in PathFinder::hyperpathChoosePath
     typedef struct {
         double         probability_;   ///< Probability of this stop
-        int            prob_i_;        ///< Cumulative probability * 1000
-        StopStateKey   ssk_;           ///< Pointer to relevant stop state
+        int            prob_i_;        ///< Cumulative probability * RandomGenerator::MAX
+        size_t         link_num_;      ///< Index of the relevant stop state in LinkSet::links_
     } ProbabilityStopState;
 
-    typedef std::map<StopStateKey, StopState> StopStateMap;
-    // cost to stop state key
-    typedef std::multimap< double, StopStateKey> CostToStopState;
+    /**
+     * Which link probabilities Hyperlink::setupProbabilities sets up depends only on the stop, which links it uses
+     * (trip or non-trip) and, if there's a previous link, that link's time and the last trip taken.
+     * So this is the key for caching them; see PathFinder::hyperpathGeneratePath
+     */
+    typedef struct {
+        int     stop_id_;
+        bool    has_prev_link_;    ///< false for the access/egress links at the TAZ
+        bool    trip_links_;       ///< true if the previous link is not a trip, so we're choosing a trip
+        double  prev_time_;        ///< previous link's arrival time (outbound) or departure time (inbound)
+        int     last_trip_id_;
+    } ProbabilityKey;
+
+    /// Comparator to enable the fasttrips::ProbabilityCache to use ProbabilityKey as a lookup
+    struct ProbabilityKeyCompare {
+        // less than
+        bool operator()(const ProbabilityKey &pk1, const ProbabilityKey &pk2) const {
+            if (pk1.stop_id_       < pk2.stop_id_      ) { return true;  }
+            if (pk1.stop_id_       > pk2.stop_id_      ) { return false; }
+            if (pk1.has_prev_link_ < pk2.has_prev_link_) { return true;  }
+            if (pk1.has_prev_link_ > pk2.has_prev_link_) { return false; }
+            if (pk1.trip_links_    < pk2.trip_links_   ) { return true;  }
+            if (pk1.trip_links_    > pk2.trip_links_   ) { return false; }
+            if (pk1.prev_time_     < pk2.prev_time_    ) { return true;  }
+            if (pk1.prev_time_     > pk2.prev_time_    ) { return false; }
+            if (pk1.last_trip_id_  < pk2.last_trip_id_ ) { return true;  }
+            if (pk1.last_trip_id_  > pk2.last_trip_id_ ) { return false; }
+            return false;
+        }
+    };
 
+    /// Cumulative link probabilities for one path finding request, so each draw doesn't set them up again
+    typedef std::map<ProbabilityKey, std::vector<ProbabilityStopState>, struct ProbabilityKeyCompare> ProbabilityCache;
+
+    /// A link in a fasttrips::LinkSet
+    struct Link {
+        StopState   stop_state_;
+        double      exp_cost_;              ///< exp(-STOCH_DISPERSION_*cost), this link's part of LinkSet::sum_exp_cost_
+        long        cost_order_;            ///< When the link was added or last replaced.  Of links with the same cost, the older comes first.
+
+        /// The key that makes this link unique in its fasttrips::LinkSet
+        StopStateKey key() const
+        {
+            StopStateKey ssk = { stop_state_.deparr_mode_, stop_state_.trip_id_, stop_state_.stop_succpred_, stop_state_.seq_, stop_state_.seq_succpred_ };
+            return ssk;
+        }
+        /// Lower cost first, then older first
+        bool costLess(const Link& rhs) const
+        {
+            if (stop_state_.cost_ < rhs.stop_state_.cost_) { return true;  }
+            if (stop_state_.cost_ > rhs.stop_state_.cost_) { return false; }
+            return (cost_order_ < rhs.cost_order_);
+        }
+    };
+
+    /// The link arrays come from the fasttrips::NodeArena of the fasttrips::StopStates the hyperlink is in
+    typedef std::vector<Link, ArenaAllocator<Link> > LinkVector;
+
+    /**
+     * The links of a fasttrips::LinkSet, indexed by their place in the time window order.
+     * Each link stays in its slot while it's in the array; the order is an array of slot numbers, so inserting or
+     * erasing a link in the middle of a big link set only moves slot numbers rather than links.
+     */
+    class LinkArray {
+    public:
+        typedef std::vector<unsigned int, ArenaAllocator<unsigned int> > SlotNumVector;
+
+        LinkArray(NodeArena* arena = NULL) : slots_(LinkVector::allocator_type(arena)),
+            free_slots_(SlotNumVector::allocator_type(arena)), order_(SlotNumVector::allocator_type(arena)) {}
+
+        /// Number of links
+        size_t size() const { return order_.size(); }
+        /// The link at the given place in the order
+        Link&       operator[](size_t link_num)       { return slots_[order_[link_num]]; }
+        const Link& operator[](size_t link_num) const { return slots_[order_[link_num]]; }
+
+        /// Insert the link at the given place in the order
+        void insert(size_t link_num, const Link& link);
+        /// Add the link at the end of the order
+        void push_back(const Link& link) { insert(order_.size(), link); }
+        /// Erase the links in [first_link_num, last_link_num) from the order and free their slots
+        void erase(size_t first_link_num, size_t last_link_num);
+        /// Erase all the links but keep the arrays for the next request
+        void clear();
+
+    private:
+        LinkVector      slots_;                    ///< the links, in no particular order
+        SlotNumVector   free_slots_;               ///< slots_ that aren't in order_
+        SlotNumVector   order_;                    ///< slot numbers in time window order
+    };
+
+    /**
+     * Open-addressed hash table from the keys of the links in a fasttrips::LinkSet to their times.
+     * With the time, LinkSet::find can binary search the time window order for a link instead of scanning all of them.
+     * Erased keys leave a marker behind so the keys after them in a probe sequence are still found.
+     */
+    class LinkKeyIndex {
+    public:
+        LinkKeyIndex(NodeArena* arena = NULL) : slots_(SlotVector::allocator_type(arena)), size_(0), used_(0) {}
+
+        /// Number of keys
+        size_t size() const { return size_; }
+        /// Sets deparr_time to the time of the link with the given key and returns true, or returns false if there isn't one
+        bool find(const StopStateKey& ssk, double& deparr_time) const;
+        /// Add the key with the given time, or update its time if it's already there
+        void set(const StopStateKey& ssk, double deparr_time);
+        /// Remove the key if it's there
+        void erase(const StopStateKey& ssk);
+        /// Remove all the keys but keep the table for the next request
+        void clear();
+
+    private:
+        enum SlotState { SLOT_EMPTY = 0, SLOT_FULL, SLOT_ERASED };
+        struct Slot {
+            StopStateKey    ssk_;
+            double          deparr_time_;
+            int             state_;                ///< a fasttrips::LinkKeyIndex::SlotState
+        };
+        typedef std::vector<Slot, ArenaAllocator<Slot> > SlotVector;
+
+        SlotVector  slots_;                         ///< the table; its size is zero or a power of two
+        size_t      size_;                          ///< number of SLOT_FULL slots
+        size_t      used_;                          ///< number of SLOT_FULL and SLOT_ERASED slots
+
+        /// Where the probe sequence for the given key starts
+        size_t slotNum(const StopStateKey& ssk) const;
+        /// Re-insert the keys into a table with the given number of slots, dropping the erased markers
+        void rehash(size_t num_slots);
+    };
+
+    /**
+     * The links are kept in a flat array in time window order: the first link is the first to fall out of the
+     * window, so outbound links are sorted by increasing departure time and inbound links by decreasing arrival time.
+     * Pruning the window just moves first_link_ forward, and sum_exp_cost_ is kept up to date as links come and go.
+     *
+     * Once a link set grows past LINEAR_FIND_MAX links, key_index_ keeps each key's time so finding a link doesn't
+     * mean scanning the set.  Until then it's empty, since a scan of a few links is cheaper than hashing.
+     */
     struct LinkSet {
+        /// Link sets up to this size are searched by scanning; bigger ones use key_index_
+        static const size_t LINEAR_FIND_MAX = 16;
+
         double          latest_dep_earliest_arr_;  ///< latest departure time from this stop for outbound trips, earliest arrival time to this stop for inbound trips
         StopStateKey    lder_ssk_;                 ///< trip for the latest departure/earliest arrival
         double          sum_exp_cost_;             ///< sum of the exponentiated cost
         double          hyperpath_cost_;           ///< hyperpath cost for this stop state
         int             process_count_;            ///< increment this every time the stop is processed
-
-        StopStateMap    stop_state_map_;           ///< the links.  (or a set of stop states where compare means the key is unique)
-        CostToStopState cost_map_;                 ///< multimap of cost -> stop state pointers into the stop_state_set_ above
-
-        LinkSet(bool outbound) : latest_dep_earliest_arr_(0), sum_exp_cost_(0), hyperpath_cost_(MAX_COST), process_count_(0) {}
+        bool            outbound_;                 ///< direction, which decides the time window order
+
+        LinkArray       links_;                    ///< the links.  Only those from first_link_ on are in the link set, and each key is unique.
+        size_t          first_link_;               ///< links before this were pruned and haven't been compacted away yet
+        long            next_cost_order_;          ///< Link::cost_order_ for the next link added
+        LinkKeyIndex    key_index_;                ///< time of each link by key, once there are more than LINEAR_FIND_MAX links.  Empty before then.
+
+        LinkSet(bool outbound, NodeArena* arena = NULL) : latest_dep_earliest_arr_(0), sum_exp_cost_(0), hyperpath_cost_(MAX_COST), process_count_(0),
+            outbound_(outbound), links_(arena), first_link_(0), next_cost_order_(0), key_index_(arena) {}
+
+        /// Number of links in the link set
+        size_t size() const { return links_.size() - first_link_; }
+        /// Position in the time window order; links with lower values fall out of the window first
+        double windowTime(double deparr_time) const { return outbound_ ? deparr_time : -deparr_time; }
+        /// Index of the link with the given key, or links_.size() if there isn't one
+        size_t find(const StopStateKey& ssk) const;
+        /// Index of the lowest cost link in [start, links_.size()), or links_.size() if there are none
+        size_t lowestCost(size_t start) const;
+        /// Index where a link with the given time goes to keep the time window order, after links with the same time
+        size_t insertPosition(double deparr_time) const;
+        /// Keep key_index_ up to date for a link that was just inserted, building it if the set just got too big to scan
+        void indexLink(const StopState& ss);
     } ;
 
     class PathFinder;
@@ -79,8 +235,15 @@ namespace fasttrips {
         /// link set with non-trip link
         LinkSet linkset_nontrip_;
 
-        /// Remove the given stop state from cost_map_
-        void removeFromCostMap(const StopStateKey& ssk, const StopState& ss);
+        /// Insert the given link into the link set, keeping the time window order.  Returns its index.
+        size_t insertLink(LinkSet& linkset, const StopState& ss);
+
+        /// For deterministic: the link set keeps one link, the label, which points back toward the start TAZ with StopState::stop_succpred_.
+        /// Replace it in place iff the new cost is lower.  Returns true iff it was replaced.  This is Hyperlink::addLink without
+        /// the time window, probabilities or link lookup.
+        template <bool TRACE>
+        bool setLabel(const StopState& ss, bool& rejected,
+                      std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf);
 
         /// Reset latest departure/earliest arrival
         void resetLatestDepartureEarliestArrival(bool of_trip_links, const PathSpecification& path_spec);
@@ -101,6 +264,8 @@ namespace fasttrips {
         Hyperlink();
         /// Constructor we should call
         Hyperlink(int stop_id, bool outbound);
+        /// Constructor for a hyperlink whose links are allocated from the given arena.  Copies share the arena.
+        explicit Hyperlink(NodeArena* arena);
         /// Destructor
         ~Hyperlink();
 
@@ -109,8 +274,8 @@ namespace fasttrips {
         /// How many links make up the trip/nontrip hyperlink
         size_t size(bool of_trip_links) const;
 
-        /// Accessor for stop state map
-        const StopStateMap& getStopStateMap(bool of_trip_links) const;
+        /// Accessor for the link set
+        const LinkSet& getLinkSet(bool of_trip_links) const;
         /// Accessor for the low cost path
         const Path* getLowCostPath(bool of_trip_links) const;
 
@@ -120,15 +285,21 @@ namespace fasttrips {
         /// - If it's outside the time window, reject it.
         /// - If it's already here according to the key, then replace the state.
         /// - Return true iff the hyperlink state was affected (e.g. the stop needs to be re-processed)
+        /// TRACE must match path_spec.trace_; when it's false, the trace output is compiled out.
+        template <bool TRACE>
         bool addLink(const StopState& ss, const Hyperlink* prev_link, bool& rejected,
                      std::ostream& trace_file, const PathSpecification& path_spec, const PathFinder& pf);
 
         /// Clears data
         void clear(bool of_trip_links);
+        /// Clears all data, including the process counts, and reinitializes for the given stop.
+        void reset(int stop_id, bool outbound);
 
         /// Returns the lowest cost stop state (link) in this hyperlink
         /// If for_trip_link, lowest trip link. Otherwise, lowest non-trip link.
         const StopState& lowestCostStopState(bool of_trip_links) const;
+        /// For deterministic: the label set by Hyperlink::setLabel.  Same as lowestCostStopState() without the search.
+        const StopState& label(bool of_trip_links) const;
         /// Given an arrival time into this hyperlink (outbound) or a departure time out of this hyperlink (inbound),
         /// returns the best guess link
         const StopState& bestGuessLink(bool outbound, double arrdep_time) const;
@@ -173,22 +344,99 @@ namespace fasttrips {
         /**
          * Given a vector of fasttrips::ProbabilityStopState instances,
          * randomly selects one based on the cumulative probability
-         * (fasttrips::ProbabilityStopState.prob_i_)
+         * (fasttrips::ProbabilityStopState.prob_i_), drawing from the given generator.
          *
          * @return a const reference to the chosen StopState.
          */
         const StopState& chooseState(const PathSpecification& path_spec,
                                      std::ostream& trace_file,
                                      const std::vector<ProbabilityStopState>& prob_stops,
+                                     RandomGenerator& random_generator,
                                      const StopState* prev_link = NULL) const;
     };
 
     /**
      * The path finding algorithm stores StopState data in this structure.
-     * For the stochastic algorithm, a stop ID maps to a vector of StopState instances.
-     * For the deterministic algorithm, the vector only has a single instance of StopState.
+     * For the stochastic algorithm, a stop ID maps to a Hyperlink of many StopState instances.
+     * For the deterministic algorithm, the Hyperlink only has a single instance of StopState.
+     *
+     * The hyperlinks are stored densely by stop ID and kept from one path finding request to the next.
+     * StopStates::reset() just starts a new generation (see fasttrips::VisitedSet); a stop's hyperlink
+     * is cleared the first time it's used in the new generation, so the setup and teardown cost of
+     * a request is in the number of stops it touches.
      */
-    typedef std::map<int, Hyperlink> StopStates;
+    class StopStates {
+    public:
+        StopStates() : num_stops_(0), outbound_(true), links_accepted_(0), links_rejected_(0), trips_scanned_(0) {}
+
+        /// Forget the stop states of the previous request and make room for stop IDs up to max_stop_id.
+        void reset(int max_stop_id, bool outbound);
+
+        /// How many stops have a hyperlink in this request?
+        size_t size() const { return num_stops_; }
+
+        /// Estimate of the memory used by the hyperlinks, in bytes.  This includes the dense per-stop arrays.
+        size_t memoryBytes() const;
+
+        /// The arena the links are allocated from, for allocation counts
+        NodeArena& arena() { return arena_; }
+
+        /// Count a link offered to Hyperlink::addLink
+        void countLink(bool rejected) { if (rejected) { ++links_rejected_; } else { ++links_accepted_; } }
+        /// Count trip stop times scanned for labeling
+        void countTripsScanned(long num_trips) { trips_scanned_ += num_trips; }
+        /// Number of links accepted since the counts were reset
+        long linksAccepted() const { return links_accepted_; }
+        /// Number of links rejected since the counts were reset
+        long linksRejected() const { return links_rejected_; }
+        /// Number of trip stop times scanned since the counts were reset
+        long tripsScanned() const { return trips_scanned_; }
+        /// Starts counting links, trips and arena allocations from zero.
+        void resetCounts() { links_accepted_ = 0; links_rejected_ = 0; trips_scanned_ = 0; arena_.resetCounts(); }
+
+        /// Returns the hyperlink for the given stop, or NULL if there isn't one in this request.
+        const Hyperlink* find(int stop_id) const
+        {
+            return initialized_.contains(stop_id) ? &hyperlinks_[stop_id] : NULL;
+        }
+
+        /// Empties the hyperlink for the given stop, if it has one, so it can be labeled again.
+        void resetStop(int stop_id)
+        {
+            if (initialized_.contains(stop_id)) { hyperlinks_[stop_id].reset(stop_id, outbound_); }
+        }
+
+        /// Returns the hyperlink for the given stop, starting a new one if needed.
+        /// Assumes the stop ID is no greater than the max_stop_id passed to StopStates::reset().
+        Hyperlink& operator[](int stop_id)
+        {
+            if (initialized_.insert(stop_id)) {
+                hyperlinks_[stop_id].reset(stop_id, outbound_);
+                num_stops_++;
+            }
+            return hyperlinks_[stop_id];
+        }
+
+    private:
+        /// The hyperlinks' links are allocated from here.  Declared first so it outlives them.
+        NodeArena               arena_;
+        /// Indexed by stop ID.  Only valid where initialized_ contains the stop ID.
+        std::vector<Hyperlink>  hyperlinks_;
+        /// Which of the hyperlinks_ belong to the current request
+        VisitedSet              initialized_;
+        /// Number of stops in initialized_
+        size_t                  num_stops_;
+        /// Direction of the current request
+        bool                    outbound_;
+        /// Counts for fasttrips::PerformanceInfo
+        long                    links_accepted_;
+        long                    links_rejected_;
+        long                    trips_scanned_;
+
+        // not copyable
+        StopStates(const StopStates&);
+        StopStates& operator=(const StopStates&);
+    };
 
 }
 
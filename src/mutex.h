@@ -0,0 +1,68 @@
+/**
+ * \file mutex.h
+ *
+ * Defines a minimal portable mutex and scoped lock, since std::mutex is only c++11.
+ */
+
+#ifndef MUTEX_H
+#define MUTEX_H
+
+#ifdef _WIN32
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#include <windows.h>
+#else
+#include <pthread.h>
+#endif
+
+namespace fasttrips {
+
+    /**
+     * A non-recursive mutex wrapping a CRITICAL_SECTION (windows) or a pthread_mutex_t.
+     */
+    class Mutex {
+    public:
+#ifdef _WIN32
+        Mutex()       { InitializeCriticalSection(&mutex_); }
+        ~Mutex()      { DeleteCriticalSection(&mutex_);     }
+        void lock()   { EnterCriticalSection(&mutex_);      }
+        void unlock() { LeaveCriticalSection(&mutex_);      }
+#else
+        Mutex()       { pthread_mutex_init(&mutex_, NULL);  }
+        ~Mutex()      { pthread_mutex_destroy(&mutex_);     }
+        void lock()   { pthread_mutex_lock(&mutex_);        }
+        void unlock() { pthread_mutex_unlock(&mutex_);      }
+#endif
+
+    private:
+#ifdef _WIN32
+        CRITICAL_SECTION mutex_;
+#else
+        pthread_mutex_t  mutex_;
+#endif
+        // not copyable
+        Mutex(const Mutex&);
+        Mutex& operator=(const Mutex&);
+    };
+
+    /**
+     * Locks the given fasttrips::Mutex for the lifetime of this object.
+     * If the lock is not active (e.g. it's only needed sometimes), it does nothing.
+     */
+    class ScopedLock {
+    public:
+        explicit ScopedLock(Mutex& mutex, bool active=true) : mutex_(mutex), active_(active) { if (active_) { mutex_.lock(); } }
+        ~ScopedLock() { if (active_) { mutex_.unlock(); } }
+
+    private:
+        Mutex& mutex_;
+        bool   active_;
+
+        // not copyable
+        ScopedLock(const ScopedLock&);
+        ScopedLock& operator=(const ScopedLock&);
+    };
+}
+
+#endif
@@ -8,20 +8,32 @@
 #include "pathfinder.h"
 #include "hyperlink.h"
 
+#include <string.h>
+
 namespace fasttrips {
+
+    /// Mix the given value into the hash
+    static PathHash hashCombine(PathHash hash, long long value)
+    {
+        hash ^= static_cast<PathHash>(value) + 0x9e3779b97f4a7c15ULL + (hash << 6) + (hash >> 2);
+        return hash;
+    }
+
     // Default constructor
     Path::Path() :
         outbound_(false),
         enumerating_(false),
         cost_(0),
-        capacity_problem_(false)
+        capacity_problem_(false),
+        links_hash_(0)
     {}
 
     Path::Path(bool outbound, bool enumerating) :
         outbound_(outbound),
         enumerating_(enumerating),
         cost_(0),
-        capacity_problem_(false)
+        capacity_problem_(false),
+        links_hash_(0)
     {}
 
     Path::~Path()
@@ -43,6 +55,7 @@ namespace fasttrips {
     void Path::clear()
     {
         links_.clear();
+        links_hash_ = 0;
         cost_ = 0;
         capacity_problem_ = false;
     }
@@ -84,6 +97,26 @@ namespace fasttrips {
         return false;
     }
 
+    bool Path::operator==(const Path& path2) const
+    {
+        if (cost() != path2.cost()) { return false; }
+        if (size() != path2.size()) { return false; }
+        for (int ind=0; ind<size(); ++ind) {
+            if (links_[ind].first                != path2[ind].first               ) { return false; }
+            if (links_[ind].second.deparr_mode_  != path2[ind].second.deparr_mode_ ) { return false; }
+            if (links_[ind].second.trip_id_      != path2[ind].second.trip_id_     ) { return false; }
+        }
+        return true;
+    }
+
+    PathHash Path::hash() const
+    {
+        // hash the bits of the cost; 0.0 and -0.0 are equal so make sure they hash the same
+        long long cost_bits = 0;
+        if (cost_ != 0) { memcpy(&cost_bits, &cost_, sizeof(cost_bits)); }
+        return hashCombine(links_hash_, cost_bits);
+    }
+
     // Add link to the path, modifying if necessary
     // Return feasibility (infeasible if two out of order trips)
     bool Path::addLink(int stop_id,
@@ -217,6 +250,9 @@ namespace fasttrips {
         cost_          += new_link.link_cost_;
         new_link.cost_  = cost_;
         links_.push_back( std::make_pair(stop_id, new_link) );
+        links_hash_ = hashCombine(links_hash_, stop_id);
+        links_hash_ = hashCombine(links_hash_, new_link.deparr_mode_);
+        links_hash_ = hashCombine(links_hash_, new_link.trip_id_);
 
         if (path_spec.trace_)
         {
@@ -277,11 +313,11 @@ namespace fasttrips {
                 double preference_delay           = (path_spec.outbound_ ? 0 : orig_departure_time - path_spec.preferred_time_);
 
                 int transit_stop                  = (path_spec.outbound_ ? stop_state.stop_succpred_ : stop_id);
-                const NamedWeights* named_weights = pf.getNamedWeights( path_spec.user_class_, path_spec.purpose_, MODE_ACCESS, path_spec.access_mode_, stop_state.trip_id_);
+                const LinkWeights*  link_weights  = pf.getLinkWeights( path_spec.user_class_num_, path_spec.purpose_num_, MODE_ACCESS, path_spec.access_mode_num_, stop_state.trip_id_);
                 Attributes          attributes    = *(pf.getAccessAttributes( path_spec.origin_taz_id_, stop_state.trip_id_, transit_stop ));
-                attributes["preferred_delay_min"] = preference_delay;
+                attributes[ATTR_PREFERRED_DELAY_MIN] = preference_delay;
 
-                stop_state.link_cost_             = pf.tallyLinkCost(stop_state.trip_id_, path_spec, trace_file, *named_weights, attributes, hush);
+                stop_state.link_cost_             = pf.tallyLinkCost(stop_state.trip_id_, path_spec, trace_file, *link_weights, attributes, hush);
             }
             // ============= egress =============
             else if (stop_state.deparr_mode_ == MODE_EGRESS)
@@ -291,11 +327,11 @@ namespace fasttrips {
                 double preference_delay           = (path_spec.outbound_ ? path_spec.preferred_time_ - dest_arrival_time : 0);
 
                 int transit_stop                  = (path_spec.outbound_ ? stop_id : stop_state.stop_succpred_);
-                const NamedWeights* named_weights = pf.getNamedWeights(  path_spec.user_class_, path_spec.purpose_, MODE_EGRESS, path_spec.egress_mode_, stop_state.trip_id_);
+                const LinkWeights*  link_weights  = pf.getLinkWeights( path_spec.user_class_num_, path_spec.purpose_num_, MODE_EGRESS, path_spec.egress_mode_num_, stop_state.trip_id_);
                 Attributes          attributes    = *(pf.getAccessAttributes( path_spec.destination_taz_id_, stop_state.trip_id_, transit_stop ));
-                attributes["preferred_delay_min"] = preference_delay;
+                attributes[ATTR_PREFERRED_DELAY_MIN] = preference_delay;
 
-                stop_state.link_cost_             = pf.tallyLinkCost(stop_state.trip_id_, path_spec, trace_file, *named_weights, attributes, hush);
+                stop_state.link_cost_             = pf.tallyLinkCost(stop_state.trip_id_, path_spec, trace_file, *link_weights, attributes, hush);
 
             }
             // ============= transfer =============
@@ -305,8 +341,8 @@ namespace fasttrips {
                 int dest_stop                     = (path_spec.outbound_? stop_state.stop_succpred_ : stop_id);
 
                 const Attributes* link_attr       = pf.getTransferAttributes(orig_stop, dest_stop);
-                const NamedWeights* named_weights = pf.getNamedWeights( path_spec.user_class_, path_spec.purpose_, MODE_TRANSFER, "transfer", pf.transferSupplyMode());
-                stop_state.link_cost_             = pf.tallyLinkCost(pf.transferSupplyMode(), path_spec, trace_file, *named_weights, *link_attr, hush);
+                const LinkWeights*  link_weights  = pf.getLinkWeights( path_spec.user_class_num_, path_spec.purpose_num_, MODE_TRANSFER, pf.transferDemandModeNum(), pf.transferSupplyMode());
+                stop_state.link_cost_             = pf.tallyLinkCost(pf.transferSupplyMode(), path_spec, trace_file, *link_weights, *link_attr, hush);
             }
             // ============= trip =============
             else
@@ -316,16 +352,16 @@ namespace fasttrips {
 
                 const TripInfo& trip_info         = *(pf.getTripInfo(stop_state.trip_id_));
                 int supply_mode_num               = trip_info.supply_mode_num_;
-                const NamedWeights* named_weights = pf.getNamedWeights( path_spec.user_class_, path_spec.purpose_, MODE_TRANSIT, path_spec.transit_mode_, supply_mode_num);
+                const LinkWeights*  link_weights  = pf.getLinkWeights( path_spec.user_class_num_, path_spec.purpose_num_, MODE_TRANSIT, path_spec.transit_mode_num_, supply_mode_num);
                 Attributes link_attr              = trip_info.trip_attr_;
-                link_attr["in_vehicle_time_min"]  = trip_ivt_min;
-                link_attr["wait_time_min"]        = wait_min;
-                link_attr["overcap"]              = pf.getTripStopTime(stop_state.trip_id_, stop_state.seq_).overcap_;
-                link_attr["at_capacity"]          = (link_attr["overcap"] >= 0 ? 1.0 : 0.0);  // binary, 0 means at capacity
+                link_attr[ATTR_IN_VEHICLE_TIME_MIN]  = trip_ivt_min;
+                link_attr[ATTR_WAIT_TIME_MIN]        = wait_min;
+                link_attr[ATTR_OVERCAP]              = pf.getTripStopTime(stop_state.trip_id_, stop_state.seq_).overcap_;
+                link_attr[ATTR_AT_CAPACITY]          = (link_attr[ATTR_OVERCAP] >= 0 ? 1.0 : 0.0);  // binary, 0 means at capacity
                 // overcap should be non-negative
-                if (link_attr["overcap"] < 0) { link_attr["overcap"] = 0; }
+                if (link_attr[ATTR_OVERCAP] < 0) { link_attr[ATTR_OVERCAP] = 0; }
 
-                stop_state.link_cost_             = pf.tallyLinkCost(supply_mode_num, path_spec, trace_file, *named_weights, link_attr, hush);
+                stop_state.link_cost_             = pf.tallyLinkCost(supply_mode_num, path_spec, trace_file, *link_weights, link_attr, hush);
 
                 first_trip = false;
             }
@@ -387,4 +423,65 @@ namespace fasttrips {
 
     }
 
-}
\ No newline at end of file
+
+    PathCounter::PathCounter() : slots_(16, -1), num_singletons_(0)
+    {}
+
+    bool PathCounter::add(const Path& path)
+    {
+        PathHash hash = path.hash();
+        size_t   mask = slots_.size() - 1;
+        for (size_t slot = static_cast<size_t>(hash) & mask; ; slot = (slot + 1) & mask)
+        {
+            int index = slots_[slot];
+            if (index < 0) {
+                slots_[slot] = static_cast<int>(paths_.size());
+                paths_.push_back(path);
+                counts_.push_back(1);
+                hashes_.push_back(hash);
+                num_singletons_ += 1;
+                // keep the table at most half full
+                if (2*paths_.size() > slots_.size()) { grow(); }
+                return true;
+            }
+            // full comparison only if the hashes match
+            if ((hashes_[index] == hash) && (paths_[index] == path)) {
+                if (counts_[index] == 1) { num_singletons_ -= 1; }
+                counts_[index] += 1;
+                return false;
+            }
+        }
+    }
+
+    void PathCounter::grow()
+    {
+        slots_.assign(2*slots_.size(), -1);
+        size_t mask = slots_.size() - 1;
+        for (size_t index = 0; index < paths_.size(); ++index)
+        {
+            size_t slot = static_cast<size_t>(hashes_[index]) & mask;
+            while (slots_[slot] >= 0) { slot = (slot + 1) & mask; }
+            slots_[slot] = static_cast<int>(index);
+        }
+    }
+
+    size_t PathCounter::size() const
+    {
+        return paths_.size();
+    }
+
+    const Path& PathCounter::path(size_t n) const
+    {
+        return paths_[n];
+    }
+
+    int PathCounter::count(size_t n) const
+    {
+        return counts_[n];
+    }
+
+    size_t PathCounter::numSingletons() const
+    {
+        return num_singletons_;
+    }
+}
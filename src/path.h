@@ -19,9 +19,12 @@ namespace fasttrips {
     typedef struct {
         int     count_;             ///< Number of times this path was generated (for stochastic)
         double  probability_;       ///< Probability of this stop          (for stochastic)
-        int     prob_i_;            ///< Cumulative probability * RAND_MAX (for stochastic)
+        int     prob_i_;            ///< Cumulative probability * RandomGenerator::MAX (for stochastic)
     } PathInfo;
 
+    /// 64-bit hash of a path; see Path::hash()
+    typedef unsigned long long PathHash;
+
     // Forward declarations
     class PathFinder;
 
@@ -40,6 +43,8 @@ namespace fasttrips {
         /// They are in origin to destination order for outbound trips,
         /// and destination to origin order for inbound trips.
         std::vector< std::pair<int, StopState> > links_;
+        /// Hash of the stop ids, modes and trip ids of links_, updated as links are added
+        PathHash links_hash_;
 
     public:
         /// Default constructor
@@ -63,6 +68,10 @@ namespace fasttrips {
 
         /// Comparison operator; determines ordering in PathSet
         bool operator<(const Path& other) const;
+        /// Equality in the sense of operator<: the same cost, stop ids, modes and trip ids
+        bool operator==(const Path& other) const;
+        /// Hash of what operator== compares; equal paths have equal hashes
+        PathHash hash() const;
 
         /// Add link to the path, modifying if necessary
         /// Return feasibility (infeasible if two out of order trips)
@@ -94,6 +103,40 @@ namespace fasttrips {
      */
     typedef std::map<Path, PathInfo> PathSet;
 
+    /**
+     * Counts the distinct paths generated by path enumeration.  Paths are looked up in a hash table by
+     * Path::hash(), and only compared in full when their hashes match, so this is cheaper than inserting
+     * each generated path into a fasttrips::PathSet.  Paths are kept in the order they were first added.
+     */
+    class PathCounter
+    {
+    private:
+        std::vector<Path>       paths_;     ///< distinct paths, in the order they were first added
+        std::vector<int>        counts_;    ///< number of times each of paths_ was added
+        std::vector<PathHash>   hashes_;    ///< hash of each of paths_
+        /// Open addressing hash table of indices into paths_, or -1 for an empty slot.  The size is a power of two.
+        std::vector<int>        slots_;
+        /// Number of paths_ added exactly once
+        size_t                  num_singletons_;
+
+        /// Double the size of the hash table
+        void grow();
+
+    public:
+        PathCounter();
+
+        /// Count the given path.  Returns true if it hasn't been added before.
+        bool add(const Path& path);
+        /// How many distinct paths have been added?
+        size_t size() const;
+        /// The nth distinct path
+        const Path& path(size_t n) const;
+        /// The number of times the nth distinct path was added
+        int count(size_t n) const;
+        /// How many distinct paths have been added exactly once?
+        size_t numSingletons() const;
+    };
+
 }
 
 #endif
\ No newline at end of file
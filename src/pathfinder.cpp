@@ -1,4 +1,6 @@
 #include "pathfinder.h"
+#include "mutex.h"
+#include "randomgenerator.h"
 
 #ifdef _WIN32
 #define NOMINMAX
@@ -6,9 +8,12 @@
 #include <psapi.h>
 #else
 #include <sys/time.h>
+#include <time.h>
 #endif
 
 #include <assert.h>
+#include <stdio.h>
+#include <fstream>
 #include <sstream>
 #include <ios>
 #include <iostream>
@@ -17,6 +22,7 @@
 #include <string>
 #include <math.h>
 #include <algorithm>
+#include <functional>
 
 const char kPathSeparator =
 #ifdef _WIN32
@@ -27,313 +33,398 @@ const char kPathSeparator =
 
 #define SSTR( x ) dynamic_cast< std::ostringstream & >( std::ostringstream() << std::dec << x ).str()
 
+// These are only used when tracing.  Traced path finding holds trace_mutex throughout.
 static std::ofstream label_file;
 static std::ofstream stopids_file;
+static int           label_link_num = 1;   // unique ID for the link in the label file
+static fasttrips::Mutex trace_mutex;
 
-namespace fasttrips {
+// For timing labeling and enumeration
+#ifdef _WIN32
+typedef LARGE_INTEGER  TimeStamp;
+#else
+typedef struct timeval TimeStamp;
+#endif
+
+/// Sets time_stamp to now
+static void getTimeStamp(TimeStamp& time_stamp)
+{
+#ifdef _WIN32
+    QueryPerformanceCounter(&time_stamp);
+#else
+    // using gettimeofday() since std::chrono is only c++11
+    gettimeofday(&time_stamp, NULL);
+#endif
+}
+
+/// Returns the milliseconds elapsed between the two time stamps
+static long millisecondsElapsed(const TimeStamp& start_time, const TimeStamp& end_time)
+{
+#ifdef _WIN32
+    // QueryPerformanceFrequency reference: https://msdn.microsoft.com/en-us/library/windows/desktop/dn553408(v=vs.85).aspx
+    LARGE_INTEGER frequency, elapsed;
+    QueryPerformanceFrequency(&frequency);
+    elapsed.QuadPart = end_time.QuadPart - start_time.QuadPart;
+    // We now have the elapsed number of ticks, along with the
+    // number of ticks-per-second. We use these values
+    // to convert to the number of elapsed milliseconds.
+    // To guard against loss-of-precision, we convert
+    // to microseconds *before* dividing by ticks-per-second.
+    elapsed.QuadPart *= 1000;
+    elapsed.QuadPart /= frequency.QuadPart;
+    return (long)elapsed.QuadPart;
+#else
+    // microseconds
+    long int diff = (end_time.tv_usec   + 1000000*end_time.tv_sec) -
+                    (start_time.tv_usec + 1000000*start_time.tv_sec);
+    return 0.001*diff;
+#endif
+}
+
+// For timing the CPU used by the path finding thread
+#ifdef _WIN32
+typedef ULONGLONG       CpuTimeStamp;   // 100-nanosecond units
+#else
+typedef struct timespec CpuTimeStamp;
+#endif
 
-    // access this through getTransferAttributes()
-    Attributes* PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_ = NULL;
+/// Sets cpu_time_stamp to the CPU time used by the calling thread so far
+static void getCpuTimeStamp(CpuTimeStamp& cpu_time_stamp)
+{
+#ifdef _WIN32
+    FILETIME creation_time, exit_time, kernel_time, user_time;
+    GetThreadTimes(GetCurrentThread(), &creation_time, &exit_time, &kernel_time, &user_time);
+    cpu_time_stamp = ((static_cast<ULONGLONG>(kernel_time.dwHighDateTime) << 32) | kernel_time.dwLowDateTime) +
+                     ((static_cast<ULONGLONG>(user_time.dwHighDateTime  ) << 32) | user_time.dwLowDateTime  );
+#else
+    clock_gettime(CLOCK_THREAD_CPUTIME_ID, &cpu_time_stamp);
+#endif
+}
+
+/// Returns the CPU milliseconds used between the two CPU time stamps
+static long cpuMillisecondsElapsed(const CpuTimeStamp& start_time, const CpuTimeStamp& end_time)
+{
+#ifdef _WIN32
+    return (long)((end_time - start_time)/10000);
+#else
+    return (end_time.tv_sec  - start_time.tv_sec )*1000 +
+           (end_time.tv_nsec - start_time.tv_nsec)/1000000;
+#endif
+}
+
+/// Sets the memory usage in the performance information, where supported
+static void setMemoryUsage(fasttrips::PerformanceInfo& performance_info)
+{
+#ifdef _WIN32
+    PROCESS_MEMORY_COUNTERS_EX pmc;
+    if ( GetProcessMemoryInfo(GetCurrentProcess(), (PROCESS_MEMORY_COUNTERS*)&pmc, sizeof(pmc)) )
+    {
+        performance_info.workingset_bytes_      = pmc.WorkingSetSize;
+        performance_info.privateusage_bytes_    = pmc.PrivateUsage;
+        performance_info.peak_workingset_bytes_ = pmc.PeakWorkingSetSize;
+    }
+#else
+    // Linux: the resident set size is the working set, and the data segment (heap and private
+    // anonymous mappings) is the closest thing to private usage.  These are in kB.
+    std::ifstream status_file("/proc/self/status");
+    std::string   line;
+    while (std::getline(status_file, line))
+    {
+        long kbytes = 0;
+        if      (sscanf(line.c_str(), "VmRSS: %ld kB",  &kbytes) == 1) { performance_info.workingset_bytes_      = 1024*kbytes; }
+        else if (sscanf(line.c_str(), "VmHWM: %ld kB",  &kbytes) == 1) { performance_info.peak_workingset_bytes_ = 1024*kbytes; }
+        else if (sscanf(line.c_str(), "VmData: %ld kB", &kbytes) == 1) { performance_info.privateusage_bytes_    = 1024*kbytes; }
+    }
+#endif
+}
+
+namespace fasttrips {
 
     /**
      * This doesn't really do anything.
      */
-    PathFinder::PathFinder() : process_num_(-1), BUMP_BUFFER_(-1), STOCH_PATHSET_SIZE_(-1)
+    PathFinder::PathFinder() : process_num_(-1), BUMP_BUFFER_(-1), STOCH_PATHSET_SIZE_(-1), STOCH_PATHSET_STALL_DRAWS_(0),
+                               STOCH_PATHSET_UNSEEN_PROBABILITY_(0), transfer_demand_mode_num_(-1),
+                               max_stop_id_(0), max_trip_id_(0), label_cache_max_bytes_(0), label_cache_bytes_(0),
+                               label_lower_bound_weight_(0)
     {
+        // these are numbered by AttributeNum
+        addAttribute("time_min");
+        addAttribute("walk_time_min");
+        addAttribute("drive_time_min");
+        addAttribute("elevation_gain");
+        addAttribute("preferred_delay_min");
+        addAttribute("in_vehicle_time_min");
+        addAttribute("wait_time_min");
+        addAttribute("overcap");
+        addAttribute("at_capacity");
+        addAttribute("transfer_penalty");
     }
 
     void PathFinder::initializeParameters(
         double     time_window,
         double     bump_buffer,
         int        stoch_pathset_size,
+        int        stoch_pathset_stall_draws,
+        double     stoch_pathset_unseen_probability,
         double     stoch_dispersion,
         int        stoch_max_stop_process_count,
         int        max_num_paths,
-        double     min_path_probability)
+        double     min_path_probability,
+        double     label_cache_megabytes,
+        double     label_lower_bound_weight)
     {
+        // the cached labelings used the old parameters
+        clearLabelCache();
+        label_cache_max_bytes_          = (label_cache_megabytes > 0) ? (size_t)(label_cache_megabytes*1024*1024) : 0;
+
         BUMP_BUFFER_                    = bump_buffer;
         STOCH_PATHSET_SIZE_             = stoch_pathset_size;
+        STOCH_PATHSET_STALL_DRAWS_      = std::max(stoch_pathset_stall_draws, 0);
+        STOCH_PATHSET_UNSEEN_PROBABILITY_ = std::max(stoch_pathset_unseen_probability, 0.0);
         STOCH_MAX_STOP_PROCESS_COUNT_   = stoch_max_stop_process_count;
         MAX_NUM_PATHS_                  = max_num_paths;
         MIN_PATH_PROBABILITY_           = min_path_probability;
+        label_lower_bound_weight_       = std::max(label_lower_bound_weight, 0.0);
 
         Hyperlink::TIME_WINDOW_         = time_window;
         Hyperlink::STOCH_DISPERSION_    = stoch_dispersion;
     }
 
-    void PathFinder::readIntermediateFiles()
+    void PathFinder::initializeNetwork(
+        int                process_num,
+        const SupplyTable& trip_ids,
+        const SupplyTable& stop_ids,
+        const SupplyTable& route_ids,
+        const SupplyTable& mode_ids,
+        const SupplyTable& weights,
+        const SupplyTable& access_links,
+        const SupplyTable& transfer_links,
+        const SupplyTable& trip_info)
     {
-        readTripIds();
-        readStopIds();
-        readRouteIds();
-        readModeIds();
-        readAccessLinks();
-        readTransferLinks();
-        readTripInfo();
-        readWeights();
+        process_num_ = process_num;
+        clearLabelCache();
+
+        // forget any previous network, keeping the fixed attribute numbers
+        attribute_names_.resize(NUM_FIXED_ATTRIBUTES);
+        attribute_num_.clear();
+        for (int attr_num = 0; attr_num < NUM_FIXED_ATTRIBUTES; ++attr_num) { attribute_num_[attribute_names_[attr_num]] = attr_num; }
+        weight_lookup_.clear();
+        demand_str_to_num_.clear();
+        taz_access_links_.clear();
+        transfer_links_o_d_.clear();
+        transfer_links_d_o_.clear();
+        trip_info_.clear();
+        // these depend on the access links
+        stop_time_bounds_.clear();
+        taz_links_.clear();
+
+        setIdStrings(trip_ids,  trip_num_to_str_,  "trip ids");
+        setIdStrings(stop_ids,  stop_num_to_str_,  "stop ids");
+        setIdStrings(route_ids, route_num_to_str_, "route ids");
+        setIdStrings(mode_ids,  mode_num_to_str_,  "supply mode ids");
+        for (std::map<int, std::string>::const_iterator iter = mode_num_to_str_.begin(); iter != mode_num_to_str_.end(); ++iter) {
+            if (iter->second == "transfer") { transfer_supply_mode_ = iter->first; }
+        }
+        // set the weights first so we know which attributes we need
+        setWeights(weights);
+        setAccessLinks(access_links);
+        setTransferLinks(transfer_links);
+        setTripInfo(trip_info);
+
+        // TODO: make this configurable
+        zero_walk_transfer_attributes_                          = newAttributes();
+        zero_walk_transfer_attributes_[ATTR_WALK_TIME_MIN     ] = 0.0;
+        zero_walk_transfer_attributes_[ATTR_TRANSFER_PENALTY  ] = 1.0;
+        zero_walk_transfer_attributes_[ATTR_ELEVATION_GAIN    ] = 0.0;
     }
 
-    void PathFinder::readTripIds() {
-        // Trips have been renumbered by fasttrips.  Read string IDs.
-        // Trip num -> id
-        std::ifstream trip_id_file;
-        std::ostringstream ss_trip;
-        ss_trip << output_dir_ << kPathSeparator << "ft_intermediate_trip_id.txt";
-        trip_id_file.open(ss_trip.str().c_str(), std::ios_base::in);
-
-        std::string string_trip_id_num, string_trip_id;
-        int trip_id_num;
+    int PathFinder::addAttribute(const std::string& attr_name)
+    {
+        std::map<std::string, int>::const_iterator iter = attribute_num_.find(attr_name);
+        if (iter != attribute_num_.end()) { return iter->second; }
 
-        trip_id_file >> string_trip_id_num >> string_trip_id;
-        if (process_num_ <= 1) { 
-            std::cout << "Reading " << ss_trip.str() << ": ";
-            std::cout << "[" << string_trip_id_num   << "] ";
-            std::cout << "[" << string_trip_id       << "] ";
-        }
-        while (trip_id_file >> trip_id_num >> string_trip_id) {
-            trip_num_to_str_[trip_id_num] = string_trip_id;
-        }
-        if (process_num_ <= 1) {
-            std::cout << " => Read " << trip_num_to_str_.size() << " lines" << std::endl;
-        }
-        trip_id_file.close();
+        int attr_num = static_cast<int>(attribute_names_.size());
+        attribute_num_[attr_name] = attr_num;
+        attribute_names_.push_back(attr_name);
+        return attr_num;
     }
 
-    void PathFinder::readStopIds() {
-        // Stops have been renumbered by fasttrips.  Read string IDs.
-        // Stop num -> id
-        std::ifstream stop_id_file;
-        std::ostringstream ss_stop;
-        ss_stop << output_dir_ << kPathSeparator << "ft_intermediate_stop_id.txt";
-        stop_id_file.open(ss_stop.str().c_str(), std::ios_base::in);
-
-        std::string string_stop_id_num, string_stop_id;
-        int stop_id_num;
+    void PathFinder::setAttribute(Attributes& attributes, const std::string& attr_name, double attr_value) const
+    {
+        if (attributes.empty()) { attributes = newAttributes(); }
 
-        stop_id_file >> string_stop_id_num >> string_stop_id;
-        if (process_num_ <= 1) { 
-            std::cout << "Reading " << ss_stop.str() << ": ";
-            std::cout << "[" << string_stop_id_num   << "] ";
-            std::cout << "[" << string_stop_id       << "] ";
-        }
-        while (stop_id_file >> stop_id_num >> string_stop_id) {
-            stop_num_to_str_[stop_id_num] = string_stop_id;
-        }
-        if (process_num_ <= 1) {
-            std::cout << " => Read " << stop_num_to_str_.size() << " lines" << std::endl;
-        }
-        stop_id_file.close();
+        // if no weights use it, we don't need it
+        std::map<std::string, int>::const_iterator iter = attribute_num_.find(attr_name);
+        if (iter == attribute_num_.end()) { return; }
+        attributes[iter->second] = attr_value;
     }
 
-    void PathFinder::readRouteIds() {
-        // Routes have been renumbered by fasttrips. Read string IDs.
-        // Route num -> id
-        std::ifstream route_id_file;
-        std::ostringstream ss_route;
-        ss_route << output_dir_ << kPathSeparator << "ft_intermediate_route_id.txt";
-        route_id_file.open(ss_route.str().c_str(), std::ios_base::in);
-
-        std::string string_route_id_num, string_route_id;
-        int route_id_num;
+    int PathFinder::internDemandString(const std::string& demand_str)
+    {
+        std::map<std::string, int>::const_iterator iter = demand_str_to_num_.find(demand_str);
+        if (iter != demand_str_to_num_.end()) { return iter->second; }
 
-        route_id_file >> string_route_id_num >> string_route_id;
-        if (process_num_ <= 1) { 
-            std::cout << "Reading " << ss_route.str() << ": ";
-            std::cout << "[" << string_route_id_num   << "] ";
-            std::cout << "[" << string_route_id       << "] ";
-        }
-        while (route_id_file >> route_id_num >> string_route_id) {
-            route_num_to_str_[route_id_num] = string_route_id;
-        }
-        if (process_num_ <= 1) {
-            std::cout << " => Read " << route_num_to_str_.size() << " lines" << std::endl;
-        }
-        route_id_file.close();
+        int demand_str_num = static_cast<int>(demand_str_to_num_.size());
+        demand_str_to_num_[demand_str] = demand_str_num;
+        return demand_str_num;
     }
 
-    void PathFinder::readModeIds() {
-        // Supply modes have been renumbered by fasttrips. Read string IDs.
-        // Supply mode num -> id
-        std::ifstream mode_id_file;
-        std::ostringstream ss_mode;
-        ss_mode << output_dir_ << kPathSeparator << "ft_intermediate_supply_mode_id.txt";
-        mode_id_file.open(ss_mode.str().c_str(), std::ios_base::in);
+    int PathFinder::demandStringNum(const std::string& demand_str) const
+    {
+        std::map<std::string, int>::const_iterator iter = demand_str_to_num_.find(demand_str);
+        if (iter == demand_str_to_num_.end()) { return -1; }
+        return iter->second;
+    }
 
-        std::string string_mode_num, string_mode;
-        int mode_num;
+    void PathFinder::setDemandStringNums(PathSpecification& path_spec) const
+    {
+        path_spec.user_class_num_   = demandStringNum(path_spec.user_class_);
+        path_spec.purpose_num_      = demandStringNum(path_spec.purpose_);
+        path_spec.access_mode_num_  = demandStringNum(path_spec.access_mode_);
+        path_spec.transit_mode_num_ = demandStringNum(path_spec.transit_mode_);
+        path_spec.egress_mode_num_  = demandStringNum(path_spec.egress_mode_);
+    }
 
-        mode_id_file >> string_mode_num >> string_mode;
-        if (process_num_ <= 1) {
-            std::cout << "Reading " << ss_mode.str() << ": ";
-            std::cout << "[" << string_mode_num      << "] ";
-            std::cout << "[" << string_mode          << "] ";
-        }
-        while (mode_id_file >> mode_num >> string_mode) {
-            mode_num_to_str_[mode_num] = string_mode;
-            if (string_mode == "transfer") { transfer_supply_mode_ = mode_num; }
+    void PathFinder::setIdStrings(const SupplyTable& ids, std::map<int, std::string>& num_to_str, const char* description)
+    {
+        // IDs have been renumbered by fasttrips.  Keep the string IDs for output.
+        num_to_str.clear();
+        for (int row = 0; row < ids.num_rows_; ++row) {
+            num_to_str[ids.index_[row*ids.num_index_cols_]] = ids.strings_[row];
         }
         if (process_num_ <= 1) {
-            std::cout << " => Read " << mode_num_to_str_.size() << " lines" << std::endl;
+            std::cout << "Received " << std::setw(7) << num_to_str.size() << " " << description << std::endl;
         }
-        mode_id_file.close();
     }
 
-    void PathFinder::readAccessLinks() {
-        // Taz Access and Egress links (various supply modes)
-        std::ifstream acceggr_file;
-        std::ostringstream ss_accegr;
-        ss_accegr << output_dir_ << kPathSeparator << "ft_intermediate_access_egress.txt";
-        acceggr_file.open(ss_accegr.str().c_str(), std::ios_base::in);
-
-
-        std::string string_taz_num, string_supply_mode_num, string_stop_id_num, attr_name, string_attr_value;
-        int taz_num, supply_mode_num, stop_id_num;
-        double attr_value;
-
-        acceggr_file >> string_taz_num >> string_supply_mode_num >> string_stop_id_num >> attr_name >> string_attr_value;
-        if (process_num_ <= 1) {
-            std::cout << "Reading " << ss_accegr.str() << ": ";
-            std::cout << "[" << string_taz_num         << "] ";
-            std::cout << "[" << string_supply_mode_num << "] ";
-            std::cout << "[" << string_stop_id_num     << "] ";
-            std::cout << "[" << attr_name              << "] ";
-            std::cout << "[" << string_attr_value      << "] ";
-        }
-        int attrs_read = 0;
-        while (acceggr_file >> taz_num >> supply_mode_num >> stop_id_num >> attr_name >> attr_value) {
-            taz_access_links_[taz_num][supply_mode_num][stop_id_num][attr_name] = attr_value;
-            attrs_read++;
+    void PathFinder::setAccessLinks(const SupplyTable& access_links)
+    {
+        // Taz Access and Egress links (various supply modes): taz num, supply mode num, stop id num
+        int links_set = 0;
+        for (int row = 0; row < access_links.num_rows_; ++row) {
+            const int*    index  = access_links.index_  + row*access_links.num_index_cols_;
+            const double* values = access_links.values_ + row*access_links.num_value_cols_;
+
+            if (!anyAttributeSet(values, access_links.num_value_cols_)) { continue; }
+
+            // later rows for the same link add to it
+            Attributes& attributes = taz_access_links_[index[0]][index[1]][index[2]];
+            for (int col = 0; col < access_links.num_value_cols_; ++col) {
+                if (isAttributeSet(values[col])) { setAttribute(attributes, access_links.strings_[col], values[col]); }
+            }
+            links_set++;
         }
         if (process_num_ <= 1) {
-            std::cout << " => Read " << attrs_read << " lines" << std::endl;
+            std::cout << "Received " << std::setw(7) << links_set << " access/egress links" << std::endl;
         }
-        acceggr_file.close();
     }
 
-    void PathFinder::readTransferLinks() {
-        // Transfer links
-        std::ifstream transfer_file;
-        std::ostringstream ss_transfer;
-        ss_transfer << output_dir_ << kPathSeparator << "ft_intermediate_transfers.txt";
-        transfer_file.open(ss_transfer.str().c_str(), std::ios_base::in);
-
-        std::string string_from_stop_id_num, string_to_stop_id_num, attr_name, string_attr_value;
-        int from_stop_id_num, to_stop_id_num;
-        double attr_value;
-
-        transfer_file >> string_from_stop_id_num >> string_to_stop_id_num >> attr_name >> string_attr_value;
-        if (process_num_ <= 1) {
-            std::cout << "Reading " << ss_transfer.str() << ": ";
-            std::cout << "[" << string_from_stop_id_num  << "] ";
-            std::cout << "[" << string_to_stop_id_num    << "] ";
-            std::cout << "[" << attr_name                << "] ";
-            std::cout << "[" << string_attr_value        << "] ";
-        }
-        int attrs_read = 0;
-        while (transfer_file >> from_stop_id_num >> to_stop_id_num >> attr_name >> attr_value) {
-            // o -> d -> attrs
-            transfer_links_o_d_[from_stop_id_num][to_stop_id_num][attr_name] = attr_value;
-
-            // d -> o -> attrs
-            transfer_links_d_o_[to_stop_id_num][from_stop_id_num][attr_name] = attr_value;
-            attrs_read++;
+    void PathFinder::setTransferLinks(const SupplyTable& transfer_links)
+    {
+        // Transfer links: from stop id num, to stop id num
+        int links_set = 0;
+        for (int row = 0; row < transfer_links.num_rows_; ++row) {
+            const int*    index  = transfer_links.index_  + row*transfer_links.num_index_cols_;
+            const double* values = transfer_links.values_ + row*transfer_links.num_value_cols_;
+
+            if (!anyAttributeSet(values, transfer_links.num_value_cols_)) { continue; }
+
+            // o -> d -> attrs and d -> o -> attrs; later rows for the same link add to it
+            Attributes& attributes_o_d = transfer_links_o_d_[index[0]][index[1]];
+            Attributes& attributes_d_o = transfer_links_d_o_[index[1]][index[0]];
+            for (int col = 0; col < transfer_links.num_value_cols_; ++col) {
+                if (!isAttributeSet(values[col])) { continue; }
+                setAttribute(attributes_o_d, transfer_links.strings_[col], values[col]);
+                setAttribute(attributes_d_o, transfer_links.strings_[col], values[col]);
+            }
+            links_set++;
         }
         if (process_num_ <= 1) {
-            std::cout << " => Read " << attrs_read << " lines" << std::endl;
+            std::cout << "Received " << std::setw(7) << links_set << " transfer links" << std::endl;
         }
-        transfer_file.close();
     }
 
-    void PathFinder::readTripInfo() {
-        std::ifstream tripinfo_file;
-        std::ostringstream ss_tripinfo;
-        ss_tripinfo << output_dir_ << kPathSeparator << "ft_intermediate_trip_info.txt";
-        tripinfo_file.open(ss_tripinfo.str().c_str(), std::ios_base::in);
-
-        std::string string_trip_id_num, attr_name, string_attr_value;
-        int trip_id_num;
-        double attr_value;
-
-        tripinfo_file >> string_trip_id_num >> attr_name >> string_attr_value;
-        if (process_num_ <= 1) {
-            std::cout << "Reading " << ss_tripinfo.str() << ": ";
-            std::cout << "[" << string_trip_id_num       << "] ";
-            std::cout << "[" << attr_name                << "] ";
-            std::cout << "[" << string_attr_value        << "] ";
-        }
-        int attrs_read = 0;
-        while (tripinfo_file >> trip_id_num >> attr_name >> attr_value) {
-
-            // these are special
-            if (attr_name == "mode_num") {
-                trip_info_[trip_id_num].supply_mode_num_ = int(attr_value);
-            } else if (attr_name == "route_id_num") {
-                trip_info_[trip_id_num].route_id_ = int(attr_value);
-            } else {
-                trip_info_[trip_id_num].trip_attr_[attr_name] = attr_value;
+    void PathFinder::setTripInfo(const SupplyTable& trip_info)
+    {
+        // Trip info: trip id num, supply mode num, route id num
+        for (int row = 0; row < trip_info.num_rows_; ++row) {
+            const int*    index  = trip_info.index_  + row*trip_info.num_index_cols_;
+            const double* values = trip_info.values_ + row*trip_info.num_value_cols_;
+            int trip_id_num = index[0];
+
+            // trip ids are dense so store the info in a vector
+            if (trip_id_num >= static_cast<int>(trip_info_.size())) {
+                TripInfo no_trip_info = { -1, -1 };
+                trip_info_.resize(trip_id_num+1, no_trip_info);
+            }
+            TripInfo& info = trip_info_[trip_id_num];
+            info.supply_mode_num_ = index[1];
+            info.route_id_        = index[2];
+            info.trip_attr_       = newAttributes();
+            for (int col = 0; col < trip_info.num_value_cols_; ++col) {
+                if (isAttributeSet(values[col])) { setAttribute(info.trip_attr_, trip_info.strings_[col], values[col]); }
             }
-            attrs_read++;
         }
         if (process_num_ <= 1) {
-            std::cout << " => Read " << attrs_read << " lines" << std::endl;
+            std::cout << "Received " << std::setw(7) << trip_info.num_rows_ << " trip infos" << std::endl;
         }
-        tripinfo_file.close();
     }
 
-    void PathFinder::readWeights() {
-        // Weights
-        std::ifstream weights_file;
-        std::ostringstream ss_weights;
-        ss_weights << output_dir_ << kPathSeparator << "ft_intermediate_weights.txt";
-        weights_file.open(ss_weights.str().c_str(), std::ios_base::in);
-
-        std::string user_class, purpose, demand_mode_type, demand_mode, string_supply_mode_num, weight_name, string_weight_value;
-        int supply_mode_num;
-        double weight_value;
-
-        weights_file >> user_class >> purpose >> demand_mode_type >> demand_mode >> string_supply_mode_num >> weight_name >> string_weight_value;
-        if (process_num_ <= 1) {
-            std::cout << "Reading " << ss_weights.str() << ": ";
-            std::cout << "[" << user_class              << "] ";
-            std::cout << "[" << purpose                 << "] ";
-            std::cout << "[" << demand_mode_type        << "] ";
-            std::cout << "[" << demand_mode             << "] ";
-            std::cout << "[" << string_supply_mode_num  << "] ";
-            std::cout << "[" << weight_name             << "] ";
-            std::cout << "[" << string_weight_value     << "] ";
-        }
-        int weights_read = 0;
-        while (weights_file >> user_class >> purpose >> demand_mode_type >> demand_mode >> supply_mode_num >> weight_name >> weight_value) {
-            UserClassPurposeMode ucpm = { user_class, purpose, fasttrips::MODE_ACCESS, demand_mode };
+    void PathFinder::setWeights(const SupplyTable& weights)
+    {
+        // Weights: user class, purpose, demand mode type, demand mode, supply mode num, weight name
+        // Everything but the supply mode num is a code into weights.strings_.
+        // Intern the strings; the weight names are collected by name first, to keep them in name order
+        std::map< UserClassPurposeMode, std::map<int, std::map<std::string, double> >, struct fasttrips::UCPMCompare > named_weights;
+        for (int row = 0; row < weights.num_rows_; ++row) {
+            const int* index = weights.index_ + row*weights.num_index_cols_;
+            const std::string& demand_mode_type = weights.strings_[index[2]];
+
+            UserClassPurposeMode ucpm = { internDemandString(weights.strings_[index[0]]), internDemandString(weights.strings_[index[1]]),
+                                          fasttrips::MODE_ACCESS, internDemandString(weights.strings_[index[3]]) };
             if      (demand_mode_type == "access"  ) { ucpm.demand_mode_type_ = MODE_ACCESS;  }
             else if (demand_mode_type == "egress"  ) { ucpm.demand_mode_type_ = MODE_EGRESS;  }
             else if (demand_mode_type == "transit" ) { ucpm.demand_mode_type_ = MODE_TRANSIT; }
             else if (demand_mode_type == "transfer") { ucpm.demand_mode_type_ = MODE_TRANSFER;}
             else {
-                std::cerr << "Do not understand demand_mode_type [" << demand_mode_type << "] in " << ss_weights.str() << std::endl;
+                std::cerr << "Do not understand demand_mode_type [" << demand_mode_type << "] in weights" << std::endl;
                 exit(2);
             }
 
-            weight_lookup_[ucpm][supply_mode_num][weight_name] = weight_value;
-            weights_read++;
+            named_weights[ucpm][index[4]][weights.strings_[index[5]]] = weights.values_[row*weights.num_value_cols_];
         }
         if (process_num_ <= 1) {
-            std::cout << " => Read " << weights_read << " lines" << std::endl;
+            std::cout << "Received " << std::setw(7) << weights.num_rows_ << " weights" << std::endl;
+        }
+
+        // resolve the weight names to attribute numbers
+        for (std::map< UserClassPurposeMode, std::map<int, std::map<std::string, double> >, struct fasttrips::UCPMCompare >::const_iterator iter_ucpm = named_weights.begin();
+             iter_ucpm != named_weights.end(); ++iter_ucpm) {
+            for (std::map<int, std::map<std::string, double> >::const_iterator iter_sm = iter_ucpm->second.begin();
+                 iter_sm != iter_ucpm->second.end(); ++iter_sm) {
+                LinkWeights& link_weights = weight_lookup_[iter_ucpm->first][iter_sm->first];
+                for (std::map<std::string, double>::const_iterator iter_w = iter_sm->second.begin();
+                     iter_w != iter_sm->second.end(); ++iter_w) {
+                    AttributeWeight aw = { addAttribute(iter_w->first), iter_w->second };
+                    link_weights.push_back(aw);
+                }
+            }
         }
-        weights_file.close();
+        transfer_demand_mode_num_ = demandStringNum("transfer");
     }
 
-    const NamedWeights* PathFinder::getNamedWeights(
-        const std::string& user_class,
-        const std::string& purpose,
+    const LinkWeights* PathFinder::getLinkWeights(
+        int                user_class_num,
+        int                purpose_num,
         DemandModeType     demand_mode_type,
-        const std::string& demand_mode,
+        int                demand_mode_num,
         int                suppy_mode_num) const
     {
-        UserClassPurposeMode ucpm = { user_class, purpose, demand_mode_type, demand_mode};
+        UserClassPurposeMode ucpm = { user_class_num, purpose_num, demand_mode_type, demand_mode_num };
         WeightLookup::const_iterator iter_wl = weight_lookup_.find(ucpm);
         if (iter_wl == weight_lookup_.end()) { return NULL; }
-        SupplyModeToNamedWeights::const_iterator iter_sm2nw = iter_wl->second.find(suppy_mode_num);
+        SupplyModeToLinkWeights::const_iterator iter_sm2nw = iter_wl->second.find(suppy_mode_num);
         if (iter_sm2nw == iter_wl->second.end()) { return NULL; }
 
         return &(iter_sm2nw->second);
@@ -363,16 +454,8 @@ namespace fasttrips {
         int origin_stop_id,
         int destination_stop_id) const
     {
-        if (PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_ == NULL) {
-            PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_ = new Attributes();
-            // TODO: make this configurable
-            (*PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_)["walk_time_min"   ] = 0.0;
-            (*PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_)["transfer_penalty"] = 1.0;
-            (*PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_)["elevation_gain"  ] = 0.0;
-        }
-
         if (origin_stop_id == destination_stop_id) {
-            return PathFinder::ZERO_WALK_TRANSFER_ATTRIBUTES_;
+            return &zero_walk_transfer_attributes_;
         }
         StopStopToAttr::const_iterator ssa_iter = transfer_links_o_d_.find(origin_stop_id);
         if (ssa_iter == transfer_links_o_d_.end()) { return NULL; }
@@ -387,22 +470,40 @@ namespace fasttrips {
 
     const TripInfo* PathFinder::getTripInfo(int trip_id_num) const
     {
-        std::map<int, TripInfo>::const_iterator it = trip_info_.find(trip_id_num);
-        if (it == trip_info_.end()) { return NULL; }
+        if ((trip_id_num < 0) || (trip_id_num >= static_cast<int>(trip_info_.size()))) { return NULL; }
+        if (trip_info_[trip_id_num].supply_mode_num_ < 0) { return NULL; }
 
-        return &(it->second);
+        return &(trip_info_[trip_id_num]);
     }
 
     // Accessor for TripStopTime for given trip id, stop sequence
     const TripStopTime& PathFinder::getTripStopTime(int trip_id, int stop_seq) const
     {
-        const TripStopTime& tst = trip_stop_times_.find(trip_id)->second[stop_seq-1];  // stop sequences start at 1
+        const TripStopTime& tst = trip_stop_times_[trip_stop_time_offsets_[trip_id] + stop_seq-1];  // stop sequences start at 1
         if (tst.seq_ != stop_seq) {
             printf("getTripStopTime: this shouldn't happen!");
         }
         return tst;
     }
 
+    bool PathFinder::getBumpWait(int trip_id, int stop_seq, double& latest_time) const
+    {
+        if (bump_wait_.empty()) { return false; }
+        TripStopTimeRange trip_stops = getTripStopTimes(trip_id);
+        if ((stop_seq < 1) || (stop_seq > trip_stops.second - trip_stops.first)) { return false; }
+        latest_time = bump_wait_[trip_stop_time_offsets_[trip_id] + stop_seq-1];  // stop sequences start at 1
+        return (latest_time == latest_time);  // not NO_BUMP_WAIT
+    }
+
+    TripStopTimeRange PathFinder::getTripStopTimes(int trip_id) const
+    {
+        if ((trip_id < 0) || (trip_id+1 >= static_cast<int>(trip_stop_time_offsets_.size()))) {
+            return TripStopTimeRange(NULL, NULL);
+        }
+        const TripStopTime* base = trip_stop_times_.empty() ? NULL : &trip_stop_times_[0];
+        return TripStopTimeRange(base + trip_stop_time_offsets_[trip_id], base + trip_stop_time_offsets_[trip_id+1]);
+    }
+
     void PathFinder::initializeSupply(
         const char* output_dir,
         int         process_num,
@@ -412,15 +513,52 @@ namespace fasttrips {
     {
         output_dir_  = output_dir;
         process_num_ = process_num;
-        if (trip_stop_times_.size() == 0)
-        {
-            readIntermediateFiles();
-        } else
-        {
-            // reset these
-            trip_stop_times_.clear();
-            stop_trip_times_.clear();
+        // the cached labelings are for the old supply
+        clearLabelCache();
+        setupStopTimes(stoptime_index, stoptime_times, num_stoptimes);
+
+        // TAZs are numbered like stops so they're included in stop_num_to_str_
+        max_stop_id_ = static_cast<int>(stop_trip_time_offsets_.size()) - 2;
+        if (!stop_num_to_str_.empty()) { max_stop_id_ = std::max(max_stop_id_, stop_num_to_str_.rbegin()->first); }
+        max_trip_id_ = static_cast<int>(trip_stop_time_offsets_.size()) - 2;
+
+        setupMinTimeLinks();
+    }
+
+    void PathFinder::setupStopTimes(
+        int*        stoptime_index,
+        double*     stoptime_times,
+        int         num_stoptimes)
+    {
+        // reset these
+        trip_stop_times_.clear();
+        trip_stop_time_offsets_.clear();
+        stop_trip_arrivals_.clear();
+        stop_trip_departures_.clear();
+        stop_trip_time_offsets_.clear();
+
+        // size the offsets by the largest ids
+        int max_trip_id = 0, max_stop_id = 0;
+        for (int i=0; i<num_stoptimes; ++i) {
+            max_trip_id = std::max(max_trip_id, stoptime_index[3*i]);
+            max_stop_id = std::max(max_stop_id, stoptime_index[3*i+2]);
+        }
+        // count the stop times for each id; offsets[x+1] holds the count for x
+        trip_stop_time_offsets_.resize(max_trip_id+2, 0);
+        stop_trip_time_offsets_.resize(max_stop_id+2, 0);
+        for (int i=0; i<num_stoptimes; ++i) {
+            trip_stop_time_offsets_[stoptime_index[3*i  ]+1] += 1;
+            stop_trip_time_offsets_[stoptime_index[3*i+2]+1] += 1;
         }
+        // cumulative sum => offsets
+        for (size_t idx=1; idx<trip_stop_time_offsets_.size(); ++idx) { trip_stop_time_offsets_[idx] += trip_stop_time_offsets_[idx-1]; }
+        for (size_t idx=1; idx<stop_trip_time_offsets_.size(); ++idx) { stop_trip_time_offsets_[idx] += stop_trip_time_offsets_[idx-1]; }
+
+        // place the records, keeping the input order within each id
+        trip_stop_times_.resize(num_stoptimes);
+        stop_trip_arrivals_.resize(num_stoptimes);
+        std::vector<int> trip_fill(trip_stop_time_offsets_.begin(), trip_stop_time_offsets_.end()-1);
+        std::vector<int> stop_fill(stop_trip_time_offsets_.begin(), stop_trip_time_offsets_.end()-1);
 
         for (int i=0; i<num_stoptimes; ++i) {
             TripStopTime stt = {
@@ -432,10 +570,10 @@ namespace fasttrips {
                 stoptime_times[3*i+2]   // overcap
             };
             // verify the sequence number makes sense: sequential, starts with 1
-            assert(stt.sequence_ == trip_stop_times_[stt.trip_id_].size()+1);
+            assert(stt.seq_ == trip_fill[stt.trip_id_] - trip_stop_time_offsets_[stt.trip_id_] + 1);
 
-            trip_stop_times_[stt.trip_id_].push_back(stt);
-            stop_trip_times_[stt.stop_id_].push_back(stt);
+            trip_stop_times_   [trip_fill[stt.trip_id_]++] = stt;
+            stop_trip_arrivals_[stop_fill[stt.stop_id_]++] = stt;
             // if (false && (process_num <= 1) && ((i<5) || (i>num_stoptimes-5))) {
             if (stt.overcap_ > 0) {
                 std::cerr << "stoptimes[" << tripStringForId(stt.trip_id_) << "," << stt.seq_ << "," << stopStringForId(stt.stop_id_) << "] = ";
@@ -446,15 +584,337 @@ namespace fasttrips {
                 std::cerr << ", overcap:" << stt.overcap_ << std::endl;
             }
         }
+
+        // sort the stop views by time so getTripsWithinTime() can binary search them
+        // stable, so trips with the same time stay in stop time order
+        stop_trip_departures_ = stop_trip_arrivals_;
+        for (size_t stop_id=0; stop_id+1<stop_trip_time_offsets_.size(); ++stop_id) {
+            std::stable_sort(stop_trip_arrivals_.begin()   + stop_trip_time_offsets_[stop_id],
+                             stop_trip_arrivals_.begin()   + stop_trip_time_offsets_[stop_id+1], TripStopTimeArrivalCompare());
+            std::stable_sort(stop_trip_departures_.begin() + stop_trip_time_offsets_[stop_id],
+                             stop_trip_departures_.begin() + stop_trip_time_offsets_[stop_id+1], TripStopTimeDepartureCompare());
+        }
+
+        if (process_num_ <= 1) {
+            size_t timetable_bytes = sizeof(TripStopTime)*(trip_stop_times_.capacity() + stop_trip_arrivals_.capacity() + stop_trip_departures_.capacity()) +
+                                     sizeof(int)*(trip_stop_time_offsets_.capacity() + stop_trip_time_offsets_.capacity());
+            std::cout << "Timetable: " << num_stoptimes << " stop times, " << max_trip_id << " trips, " << max_stop_id << " stops => ";
+            std::cout << timetable_bytes << " bytes" << std::endl;
+        }
+    }
+
+    void PathFinder::setupMinTimeLinks()
+    {
+        stop_time_bounds_.clear();
+
+        // from stop id => to stop id => shortest time
+        std::map<int, std::map<int, double> > min_times;
+
+        // ride between consecutive stops, without the dwell time
+        for (size_t trip_id = 0; trip_id+1 < trip_stop_time_offsets_.size(); ++trip_id) {
+            for (int idx = trip_stop_time_offsets_[trip_id]; idx+1 < trip_stop_time_offsets_[trip_id+1]; ++idx) {
+                const TripStopTime& from_stt = trip_stop_times_[idx];
+                const TripStopTime& to_stt   = trip_stop_times_[idx+1];
+                double ride_time = std::max(to_stt.arrive_time_ - from_stt.depart_time_, 0.0);
+
+                std::map<int, double>& from_times = min_times[from_stt.stop_id_];
+                std::map<int, double>::iterator time_iter = from_times.find(to_stt.stop_id_);
+                if (time_iter == from_times.end()) { from_times[to_stt.stop_id_] = ride_time; }
+                else { time_iter->second = std::min(time_iter->second, ride_time); }
+            }
+        }
+        // transfer
+        for (StopStopToAttr::const_iterator iter_o = transfer_links_o_d_.begin(); iter_o != transfer_links_o_d_.end(); ++iter_o) {
+            for (StopToAttr::const_iterator iter_d = iter_o->second.begin(); iter_d != iter_o->second.end(); ++iter_d) {
+                double transfer_time = iter_d->second[ATTR_TIME_MIN];
+                transfer_time = isAttributeSet(transfer_time) ? std::max(transfer_time, 0.0) : 0.0;
+
+                std::map<int, double>& from_times = min_times[iter_o->first];
+                std::map<int, double>::iterator time_iter = from_times.find(iter_d->first);
+                if (time_iter == from_times.end()) { from_times[iter_d->first] = transfer_time; }
+                else { time_iter->second = std::min(time_iter->second, transfer_time); }
+            }
+        }
+
+        // compressed sparse row form, both ways
+        size_t num_stops = static_cast<size_t>(max_stop_id_) + 1;
+        min_time_link_out_offsets_.assign(num_stops+1, 0);
+        min_time_link_in_offsets_.assign(num_stops+1, 0);
+        size_t num_links = 0;
+        for (std::map<int, std::map<int, double> >::const_iterator iter_o = min_times.begin(); iter_o != min_times.end(); ++iter_o) {
+            for (std::map<int, double>::const_iterator iter_d = iter_o->second.begin(); iter_d != iter_o->second.end(); ++iter_d) {
+                if ((static_cast<size_t>(iter_o->first) >= num_stops) || (static_cast<size_t>(iter_d->first) >= num_stops)) { continue; }
+                min_time_link_out_offsets_[iter_o->first+1] += 1;
+                min_time_link_in_offsets_ [iter_d->first+1] += 1;
+                num_links += 1;
+            }
+        }
+        for (size_t idx=1; idx<=num_stops; ++idx) {
+            min_time_link_out_offsets_[idx] += min_time_link_out_offsets_[idx-1];
+            min_time_link_in_offsets_ [idx] += min_time_link_in_offsets_ [idx-1];
+        }
+        min_time_links_out_.resize(num_links);
+        min_time_links_in_.resize(num_links);
+        std::vector<int> out_fill(min_time_link_out_offsets_.begin(), min_time_link_out_offsets_.end()-1);
+        std::vector<int> in_fill (min_time_link_in_offsets_.begin(),  min_time_link_in_offsets_.end()-1);
+        for (std::map<int, std::map<int, double> >::const_iterator iter_o = min_times.begin(); iter_o != min_times.end(); ++iter_o) {
+            for (std::map<int, double>::const_iterator iter_d = iter_o->second.begin(); iter_d != iter_o->second.end(); ++iter_d) {
+                if ((static_cast<size_t>(iter_o->first) >= num_stops) || (static_cast<size_t>(iter_d->first) >= num_stops)) { continue; }
+                MinTimeLink out_link = { iter_d->first, iter_d->second };
+                MinTimeLink in_link  = { iter_o->first, iter_d->second };
+                min_time_links_out_[out_fill[iter_o->first]++] = out_link;
+                min_time_links_in_ [in_fill [iter_d->first]++] = in_link;
+            }
+        }
+    }
+
+    const std::vector<double>& PathFinder::stopTimeBounds(int end_taz_id, bool outbound) const
+    {
+        ScopedLock bounds_lock(stop_time_bounds_mutex_);
+
+        int bounds_key = 2*end_taz_id + (outbound ? 1 : 0);
+        std::map<int, std::vector<double> >::iterator bounds_iter = stop_time_bounds_.find(bounds_key);
+        if (bounds_iter != stop_time_bounds_.end()) { return bounds_iter->second; }
+
+        std::vector<double>& bounds = stop_time_bounds_[bounds_key];
+        bounds.assign(min_time_link_out_offsets_.size()-1, MAX_COST);
+
+        // Dijkstra from the end TAZ.  Outbound labeling works back towards the origin, so the bound for a stop is the
+        // time from the origin to it; inbound labeling works forward towards the destination, so it's the time from it
+        // to the destination.
+        typedef std::pair<double, int> TimeStop;
+        std::priority_queue<TimeStop, std::vector<TimeStop>, std::greater<TimeStop> > time_stop_queue;
+
+        // any supply mode will do since this is a lower bound
+        TAZSupplyStopToAttr::const_iterator iter_tss2a = taz_access_links_.find(end_taz_id);
+        if (iter_tss2a != taz_access_links_.end()) {
+            for (SupplyStopToAttr::const_iterator iter_ss2a = iter_tss2a->second.begin(); iter_ss2a != iter_tss2a->second.end(); ++iter_ss2a) {
+                for (StopToAttr::const_iterator link_iter = iter_ss2a->second.begin(); link_iter != iter_ss2a->second.end(); ++link_iter) {
+                    if (static_cast<size_t>(link_iter->first) >= bounds.size()) { continue; }
+                    double access_time = link_iter->second[ATTR_TIME_MIN];
+                    access_time = isAttributeSet(access_time) ? std::max(access_time, 0.0) : 0.0;
+                    if (access_time < bounds[link_iter->first]) {
+                        bounds[link_iter->first] = access_time;
+                        time_stop_queue.push(TimeStop(access_time, link_iter->first));
+                    }
+                }
+            }
+        }
+
+        const std::vector<MinTimeLink>& links   = outbound ? min_time_links_out_        : min_time_links_in_;
+        const std::vector<int>&         offsets = outbound ? min_time_link_out_offsets_ : min_time_link_in_offsets_;
+        while (!time_stop_queue.empty()) {
+            TimeStop time_stop = time_stop_queue.top();
+            time_stop_queue.pop();
+            if (time_stop.first > bounds[time_stop.second]) { continue; }
+
+            for (int idx = offsets[time_stop.second]; idx < offsets[time_stop.second+1]; ++idx) {
+                double time_min = time_stop.first + links[idx].time_min_;
+                if (time_min < bounds[links[idx].stop_id_]) {
+                    bounds[links[idx].stop_id_] = time_min;
+                    time_stop_queue.push(TimeStop(time_min, links[idx].stop_id_));
+                }
+            }
+        }
+        return bounds;
+    }
+
+    TazLinkRange TazLinks::stopLinks(int stop_id) const
+    {
+        std::vector<int>::const_iterator stop_iter = std::lower_bound(stops_.begin(), stops_.end(), stop_id);
+        if ((stop_iter == stops_.end()) || (*stop_iter != stop_id)) { return TazLinkRange(NULL, NULL); }
+
+        size_t stop_num = stop_iter - stops_.begin();
+        return TazLinkRange(&stop_links_[0] + stop_link_offsets_[stop_num], &stop_links_[0] + stop_link_offsets_[stop_num+1]);
+    }
+
+    /// Comparator for sorting fasttrips::TazLink instances by stop
+    struct TazLinkStopCompare {
+        bool operator()(const TazLink& link1, const TazLink& link2) const { return link1.stop_id_ < link2.stop_id_; }
+    };
+
+    template <bool TRACE>
+    void PathFinder::buildTazLinks(
+        const PathSpecification& path_spec,
+        std::ofstream& trace_file,
+        int taz_id,
+        const SupplyModeToLinkWeights& weights,
+        TazLinks& taz_links) const
+    {
+        TAZSupplyStopToAttr::const_iterator iter_tss2a = taz_access_links_.find(taz_id);
+        if (iter_tss2a == taz_access_links_.end()) { return; }
+
+        // in the order the requests used to go through them: by supply mode with weights, then by stop
+        for (SupplyModeToLinkWeights::const_iterator iter_s2w = weights.begin(); iter_s2w != weights.end(); ++iter_s2w) {
+            int supply_mode_num = iter_s2w->first;
+
+            if (TRACE) {
+                trace_file << "Weights exist for supply mode " << supply_mode_num << " => ";
+                trace_file << mode_num_to_str_.find(supply_mode_num)->second << std::endl;
+            }
+
+            // Are there any egress/access links for the supply mode?
+            SupplyStopToAttr::const_iterator iter_ss2a = iter_tss2a->second.find(supply_mode_num);
+            if (iter_ss2a == iter_tss2a->second.end()) {
+                if (TRACE) { trace_file << "No links for this supply mode" << std::endl; }
+                continue;
+            }
+
+            for (StopToAttr::const_iterator link_iter = iter_ss2a->second.begin(); link_iter != iter_ss2a->second.end(); ++link_iter) {
+                Attributes link_attr = link_iter->second;
+                // we start out with no delay
+                link_attr[ATTR_PREFERRED_DELAY_MIN] = 0.0;
+
+                if (TRACE) {
+                    trace_file << "Stop " << stop_num_to_str_.find(link_iter->first)->second << " reachable by supply mode " << supply_mode_num << std::endl;
+                }
+                TazLink taz_link = {
+                    link_iter->first,
+                    supply_mode_num,
+                    link_attr[ATTR_TIME_MIN],
+                    tallyLinkCost<TRACE>(supply_mode_num, path_spec, trace_file, iter_s2w->second, link_attr, !TRACE)
+                };
+                taz_links.links_.push_back(taz_link);
+            }
+        }
+
+        // stable, so each stop's links stay in supply mode order
+        taz_links.stop_links_ = taz_links.links_;
+        std::stable_sort(taz_links.stop_links_.begin(), taz_links.stop_links_.end(), TazLinkStopCompare());
+        for (size_t link_num = 0; link_num < taz_links.stop_links_.size(); ++link_num) {
+            if (taz_links.stops_.empty() || (taz_links.stops_.back() != taz_links.stop_links_[link_num].stop_id_)) {
+                taz_links.stops_.push_back(taz_links.stop_links_[link_num].stop_id_);
+                taz_links.stop_link_offsets_.push_back(static_cast<int>(link_num));
+            }
+        }
+        taz_links.stop_link_offsets_.push_back(static_cast<int>(taz_links.stop_links_.size()));
+    }
+
+    const TazLinks& PathFinder::tazLinks(
+        const PathSpecification& path_spec,
+        std::ofstream& trace_file,
+        int taz_id,
+        const UserClassPurposeMode& ucpm,
+        const SupplyModeToLinkWeights& weights) const
+    {
+        ScopedLock taz_links_lock(taz_links_mutex_);
+
+        UCPMToTazLinks& ucpm_taz_links = taz_links_[taz_id];
+        UCPMToTazLinks::iterator taz_links_iter = ucpm_taz_links.find(ucpm);
+        if (taz_links_iter != ucpm_taz_links.end()) { return taz_links_iter->second; }
+
+        TazLinks& taz_links = ucpm_taz_links[ucpm];
+        buildTazLinks<false>(path_spec, trace_file, taz_id, weights, taz_links);
+        return taz_links;
+    }
+
+    double PathFinder::minTimeWeight(const PathSpecification& path_spec) const
+    {
+        // the demand modes the path might use
+        UserClassPurposeMode ucpms[] = {
+            { path_spec.user_class_num_, path_spec.purpose_num_, MODE_ACCESS,   path_spec.access_mode_num_  },
+            { path_spec.user_class_num_, path_spec.purpose_num_, MODE_EGRESS,   path_spec.egress_mode_num_  },
+            { path_spec.user_class_num_, path_spec.purpose_num_, MODE_TRANSIT,  path_spec.transit_mode_num_ },
+            { path_spec.user_class_num_, path_spec.purpose_num_, MODE_TRANSFER, transfer_demand_mode_num_   }
+        };
+        double min_weight = MAX_COST;
+        for (size_t ucpm_num = 0; ucpm_num < sizeof(ucpms)/sizeof(ucpms[0]); ++ucpm_num) {
+            WeightLookup::const_iterator iter_weights = weight_lookup_.find(ucpms[ucpm_num]);
+            if (iter_weights == weight_lookup_.end()) { continue; }
+
+            for (SupplyModeToLinkWeights::const_iterator iter_s2w  = iter_weights->second.begin();
+                 iter_s2w != iter_weights->second.end(); ++iter_s2w) {
+                // the weight on the link's time; negative weights could make up for it, so those links count as free
+                double link_weight = 0;
+                bool   negative    = false;
+                for (LinkWeights::const_iterator iter_lw = iter_s2w->second.begin(); iter_lw != iter_s2w->second.end(); ++iter_lw) {
+                    if (iter_lw->weight_ < 0) { negative = true; }
+                    if ((iter_lw->attribute_num_ == ATTR_TIME_MIN           ) ||
+                        (iter_lw->attribute_num_ == ATTR_WALK_TIME_MIN      ) ||
+                        (iter_lw->attribute_num_ == ATTR_DRIVE_TIME_MIN     ) ||
+                        (iter_lw->attribute_num_ == ATTR_IN_VEHICLE_TIME_MIN)) {
+                        link_weight = std::max(link_weight, iter_lw->weight_);
+                    }
+                }
+                min_weight = std::min(min_weight, negative ? 0.0 : link_weight);
+            }
+        }
+        return (min_weight == MAX_COST) ? 0.0 : min_weight;
+    }
+
+    void PathFinder::setLowerBounds(
+        const PathSpecification& path_spec,
+        const std::vector<FinalStops>& final_stops,
+        PathFinderWorkspace& workspace) const
+    {
+        // deterministic labeling depends on the order stops are processed in (each trip is labeled from the stop's
+        // label at the time), so reordering it changes its paths.  Only hyperpath labeling uses the bounds.
+        double scale = path_spec.hyperpath_ ? label_lower_bound_weight_*minTimeWeight(path_spec) : 0.0;
+        if ((scale <= 0) || final_stops.empty() || min_time_link_out_offsets_.empty()) {
+            workspace.label_stop_queue_.setLowerBounds(NULL, 0);
+            return;
+        }
+        if (final_stops.size() == 1) {
+            workspace.label_stop_queue_.setLowerBounds(&stopTimeBounds(final_stops[0].end_taz_id_, path_spec.outbound_), scale);
+            return;
+        }
+        workspace.lower_bounds_ = stopTimeBounds(final_stops[0].end_taz_id_, path_spec.outbound_);
+        for (size_t final_num = 1; final_num < final_stops.size(); ++final_num) {
+            const std::vector<double>& bounds = stopTimeBounds(final_stops[final_num].end_taz_id_, path_spec.outbound_);
+            for (size_t stop_id = 0; stop_id < bounds.size(); ++stop_id) {
+                workspace.lower_bounds_[stop_id] = std::min(workspace.lower_bounds_[stop_id], bounds[stop_id]);
+            }
+        }
+        workspace.label_stop_queue_.setLowerBounds(&workspace.lower_bounds_, scale);
+    }
+
+    void PathFinder::labelEndTaz(
+        const PathSpecification& path_spec,
+        std::ofstream& trace_file,
+        PathFinderWorkspace& workspace) const
+    {
+        StopStates& stop_states = workspace.stop_states_;
+        if (workspace.end_taz_id_ >= 0) { stop_states.resetStop(workspace.end_taz_id_); }
+
+        FinalStops final_stops;
+        setReachableFinalStops(path_spec, trace_file, final_stops);
+        workspace.end_taz_id_ = final_stops.end_taz_id_;
+        if (final_stops.final_links_ == NULL) { return; }
+
+        // labelStops connects each final stop when its trip links are processed; these are done now
+        for (std::vector<int>::const_iterator stop_iter  = final_stops.final_links_->stops_.begin();
+                                              stop_iter != final_stops.final_links_->stops_.end(); ++stop_iter) {
+            const Hyperlink* stop_state = stop_states.find(*stop_iter);
+            if ((stop_state == NULL) || (stop_state->size(true) == 0)) { continue; }
+
+            LabelStop label_stop = { stop_state->hyperpathCost(true), *stop_iter, true, 0 };
+            if (path_spec.hyperpath_) {
+                updateStopStatesForFinalLinks<false, true >(path_spec, trace_file, final_stops, stop_states,
+                                                           workspace.label_stop_queue_, 0, label_stop);
+            } else {
+                updateStopStatesForFinalLinks<false, false>(path_spec, trace_file, final_stops, stop_states,
+                                                           workspace.label_stop_queue_, 0, label_stop);
+            }
+        }
+        // nothing more is labeled from the end TAZ
+        workspace.label_stop_queue_.clear();
     }
 
     void PathFinder::setBumpWait(int*       bw_index,
                                  double*    bw_data,
                                  int        num_bw)
     {
+        clearLabelCache();
+        // bump waits accumulate over iterations, so this updates them in place
+        if (bump_wait_.size() != trip_stop_times_.size()) {
+            bump_wait_.assign(trip_stop_times_.size(), NO_BUMP_WAIT);
+        }
         for (int i=0; i<num_bw; ++i) {
-            TripStop ts = { bw_index[3*i], bw_index[3*i+1], bw_index[3*i+2] };
-            bump_wait_[ts] = bw_data[i];
+            TripStopTimeRange trip_stops = getTripStopTimes(bw_index[3*i]);
+            int seq = bw_index[3*i+1];
+            if ((seq >= 1) && (seq <= trip_stops.second - trip_stops.first)) {
+                bump_wait_[trip_stop_time_offsets_[bw_index[3*i]] + seq-1] = bw_data[i];
+            }
             if (true && (process_num_ <= 1) && ((i<5) || (i>num_bw-5))) {
                 printf("bump_wait[%6d %6d %6d] = %f\n",
                        bw_index[3*i], bw_index[3*i+1], bw_index[3*i+2], bw_data[i] );
@@ -467,6 +927,102 @@ namespace fasttrips {
     PathFinder::~PathFinder()
     {
         // std::cout << "PathFinder destructor" << std::endl;
+        clearLabelCache();
+        for (size_t idx = 0; idx < free_workspaces_.size(); ++idx) {
+            delete free_workspaces_[idx];
+        }
+    }
+
+    PathFinderWorkspace* PathFinder::acquireWorkspace() const
+    {
+        ScopedLock lock(workspace_mutex_);
+        if (free_workspaces_.empty()) { return new PathFinderWorkspace(); }
+        PathFinderWorkspace* workspace = free_workspaces_.back();
+        free_workspaces_.pop_back();
+        return workspace;
+    }
+
+    void PathFinder::releaseWorkspace(PathFinderWorkspace* workspace) const
+    {
+        ScopedLock lock(workspace_mutex_);
+        free_workspaces_.push_back(workspace);
+    }
+
+    PathFinderWorkspace* PathFinder::findCachedLabeling(const PathSpecification& path_spec, PerformanceInfo& performance_info) const
+    {
+        ScopedLock lock(label_cache_mutex_);
+        LabelCache::iterator lci = label_cache_.find(path_spec);
+        // a request using the labeling has its own end TAZ connected to it
+        if ((lci == label_cache_.end()) || (lci->second.workspace_->cache_users_ > 0)) {
+            performance_info.label_cache_misses_ = 1;
+            return NULL;
+        }
+        performance_info.label_cache_hits_ = 1;
+
+        // it's the most recently used now
+        label_cache_order_.splice(label_cache_order_.begin(), label_cache_order_, lci->second.order_iter_);
+
+        PathFinderWorkspace* workspace = lci->second.workspace_;
+        workspace->cache_users_ += 1;
+        return workspace;
+    }
+
+    void PathFinder::releaseCachedLabeling(PathFinderWorkspace* workspace) const
+    {
+        ScopedLock lock(label_cache_mutex_);
+        workspace->cache_users_ -= 1;
+        // it was evicted while we were using it
+        if (!workspace->cached_ && (workspace->cache_users_ == 0)) {
+            releaseWorkspace(workspace);
+        }
+    }
+
+    void PathFinder::cacheLabeling(const PathSpecification& path_spec, PathFinderWorkspace* workspace, PerformanceInfo& performance_info) const
+    {
+        size_t bytes = workspace->stop_states_.memoryBytes() + workspace->trips_reached_.memoryBytes();
+        if (bytes > label_cache_max_bytes_) {
+            releaseWorkspace(workspace);
+            return;
+        }
+
+        ScopedLock lock(label_cache_mutex_);
+        // another thread labeled the same thing
+        if (label_cache_.count(path_spec) > 0) {
+            releaseWorkspace(workspace);
+            return;
+        }
+
+        // make room by evicting the least recently used
+        while (label_cache_bytes_ + bytes > label_cache_max_bytes_) {
+            LabelCache::iterator lci = label_cache_.find(label_cache_order_.back());
+            PathFinderWorkspace* evicted = lci->second.workspace_;
+            label_cache_bytes_ -= lci->second.bytes_;
+            label_cache_order_.pop_back();
+            label_cache_.erase(lci);
+            performance_info.label_cache_evictions_ += 1;
+
+            // if a request is still enumerating from it, it'll be released by releaseCachedLabeling()
+            evicted->cached_ = false;
+            if (evicted->cache_users_ == 0) { releaseWorkspace(evicted); }
+        }
+
+        label_cache_order_.push_front(path_spec);
+        LabelCacheEntry entry = { workspace, bytes, label_cache_order_.begin() };
+        label_cache_[path_spec] = entry;
+        label_cache_bytes_ += bytes;
+        workspace->cached_ = true;
+    }
+
+    void PathFinder::clearLabelCache()
+    {
+        ScopedLock lock(label_cache_mutex_);
+        for (LabelCache::iterator lci = label_cache_.begin(); lci != label_cache_.end(); ++lci) {
+            lci->second.workspace_->cached_ = false;
+            releaseWorkspace(lci->second.workspace_);
+        }
+        label_cache_.clear();
+        label_cache_order_.clear();
+        label_cache_bytes_ = 0;
     }
 
     void PathFinder::findPathSet(
@@ -482,6 +1038,12 @@ namespace fasttrips {
             exit(2);
         }
 
+        // weight lookups use the interned strings
+        setDemandStringNums(path_spec);
+
+        // tracing writes to the shared label and stop id files, so only one traced path at a time
+        ScopedLock trace_lock(trace_mutex, path_spec.trace_);
+
         std::ofstream trace_file;
         if (path_spec.trace_) {
             std::ostringstream ss;
@@ -515,81 +1077,76 @@ namespace fasttrips {
             stopids_file << "stop_id,stop_id_label_iter,is_trip,label_stop_cost" << std::endl;
         }
 
-        StopStates           stop_states;
-        LabelStopQueue       label_stop_queue;
-
-#ifdef _WIN32
-        // QueryPerformanceFrequency reference: https://msdn.microsoft.com/en-us/library/windows/desktop/dn553408(v=vs.85).aspx
-        LARGE_INTEGER        frequency;
-        LARGE_INTEGER        labeling_start_time, labeling_end_time, pathfind_end_time;
-        LARGE_INTEGER        label_elapsed, pathfind_elapsed;
-        QueryPerformanceFrequency(&frequency);
-        QueryPerformanceCounter(&labeling_start_time);
-#else
-        // using gettimeofday() since std::chrono is only c++11
-        struct timeval       labeling_start_time, labeling_end_time, pathfind_end_time;
-        gettimeofday(&labeling_start_time, NULL);
-#endif
-
-        // todo: handle failure
-        bool success = initializeStopStates(path_spec, trace_file, stop_states, label_stop_queue);
-
-        // These are the stops that are reachable from the final TAZ
-        std::map<int, int> reachable_final_stops;
-        success = setReachableFinalStops(path_spec, trace_file, reachable_final_stops);
-
-        performance_info.label_iterations_ = labelStops(path_spec, trace_file, reachable_final_stops,
-                                                        stop_states, label_stop_queue, performance_info.max_process_count_);
-        performance_info.num_labeled_stops_ = stop_states.size();
-
-#ifdef _WIN32
-        QueryPerformanceCounter(&labeling_end_time);
-#else
-        gettimeofday(&labeling_end_time, NULL);
-#endif
-
-        getPathSet(path_spec, trace_file, stop_states, pathset);
-
-#ifdef _WIN32
-        QueryPerformanceCounter(&pathfind_end_time);
-
-        label_elapsed.QuadPart                = labeling_end_time.QuadPart - labeling_start_time.QuadPart;
-        pathfind_elapsed.QuadPart             = pathfind_end_time.QuadPart - labeling_end_time.QuadPart;
-
-        // We now have the elapsed number of ticks, along with the
-        // number of ticks-per-second. We use these values
-        // to convert to the number of elapsed milliseconds.
-        // To guard against loss-of-precision, we convert
-        // to microseconds *before* dividing by ticks-per-second.
-        label_elapsed.QuadPart    *= 1000;
-        label_elapsed.QuadPart    /= frequency.QuadPart;
-        pathfind_elapsed.QuadPart *= 1000;
-        pathfind_elapsed.QuadPart /= frequency.QuadPart;
-
-        performance_info.milliseconds_labeling_    = (long)label_elapsed.QuadPart;
-        performance_info.milliseconds_enumerating_ = (long)pathfind_elapsed.QuadPart;
-
-        PROCESS_MEMORY_COUNTERS_EX pmc;
-        if ( GetProcessMemoryInfo(GetCurrentProcess(), (PROCESS_MEMORY_COUNTERS*)&pmc, sizeof(pmc)) )
-        {
-            performance_info.workingset_bytes_   = pmc.WorkingSetSize;
-            performance_info.privateusage_bytes_ = pmc.PrivateUsage;
+        // tracing logs the labeling, so traced requests always label.  A cached labeling connects to the end TAZ
+        // after it's labeled from the start TAZ, so they can't be the same.
+        bool use_label_cache = (label_cache_max_bytes_ > 0) && !path_spec.trace_ &&
+                               (path_spec.origin_taz_id_ != path_spec.destination_taz_id_);
+        PathFinderWorkspace* workspace = use_label_cache ? findCachedLabeling(path_spec, performance_info) : NULL;
+        bool label_cache_hit = (workspace != NULL);
+
+        TimeStamp labeling_start_time, labeling_end_time, pathfind_end_time;
+        getTimeStamp(labeling_start_time);
+        CpuTimeStamp cpu_start_time, cpu_end_time;
+        getCpuTimeStamp(cpu_start_time);
+
+        if (!label_cache_hit) {
+            workspace = acquireWorkspace();
+            StopStates&          stop_states = workspace->stop_states_;
+            stop_states.reset(max_stop_id_, path_spec.outbound_);
+            workspace->trips_reached_.reset(max_trip_id_);
+            LabelStopQueue&      label_stop_queue = workspace->label_stop_queue_;
+            label_stop_queue.clear();
+            label_stop_queue.resetCounts();
+            stop_states.resetCounts();
+
+            // todo: handle failure
+            bool success = initializeStopStates(path_spec, trace_file, stop_states, label_stop_queue);
+
+            // These are the stops that are reachable from the final TAZ
+            std::vector<FinalStops> final_stops(1);
+            success = setReachableFinalStops(path_spec, trace_file, final_stops[0]);
+            // a labeling for the cache is shared with other end TAZs, so it labels to completion without one
+            // and the end TAZ is connected afterwards
+            workspace->end_taz_id_ = -1;
+            if (use_label_cache) { final_stops.clear(); }
+            setLowerBounds(path_spec, final_stops, *workspace);
+
+            performance_info.label_iterations_ = labelStops(path_spec, trace_file, final_stops,
+                                                            stop_states, workspace->trips_reached_, label_stop_queue,
+                                                            performance_info.max_process_count_);
+            performance_info.link_allocations_      = stop_states.arena().allocations();
+            performance_info.link_heap_allocations_ = stop_states.arena().heapAllocations();
+            performance_info.label_queue_pushes_    = label_stop_queue.pushes();
+            performance_info.label_queue_pops_      = label_stop_queue.pops();
+            performance_info.trips_scanned_         = stop_states.tripsScanned();
+            performance_info.links_accepted_        = stop_states.linksAccepted();
+            performance_info.links_rejected_        = stop_states.linksRejected();
+        }
+        if (use_label_cache) {
+            labelEndTaz(path_spec, trace_file, *workspace);
+        }
+        performance_info.num_labeled_stops_ = workspace->stop_states_.size();
+
+        getTimeStamp(labeling_end_time);
+
+        getPathSet(path_spec, trace_file, workspace->stop_states_, pathset, performance_info.pathset_draws_);
+
+        getTimeStamp(pathfind_end_time);
+        getCpuTimeStamp(cpu_end_time);
+
+        performance_info.milliseconds_labeling_    = millisecondsElapsed(labeling_start_time, labeling_end_time);
+        performance_info.milliseconds_enumerating_ = millisecondsElapsed(labeling_end_time,   pathfind_end_time);
+        performance_info.milliseconds_cpu_         = cpuMillisecondsElapsed(cpu_start_time,   cpu_end_time);
+        setMemoryUsage(performance_info);
+
+        // the stop states are left for the next request to reset (or cached for the next one like it)
+        if (label_cache_hit) {
+            releaseCachedLabeling(workspace);
+        } else if (use_label_cache) {
+            cacheLabeling(path_spec, workspace, performance_info);
+        } else {
+            releaseWorkspace(workspace);
         }
-#else
-        gettimeofday(&pathfind_end_time, NULL);
-
-        // microseconds
-        long int diff = (labeling_end_time.tv_usec   + 1000000*labeling_end_time.tv_sec) -
-                        (labeling_start_time.tv_usec + 1000000*labeling_start_time.tv_sec);
-        performance_info.milliseconds_labeling_ = 0.001*diff;
-
-        diff = (pathfind_end_time.tv_usec   + 1000000*pathfind_end_time.tv_sec) -
-               (labeling_end_time.tv_usec   + 1000000*labeling_end_time.tv_sec);
-        performance_info.milliseconds_enumerating_ = 0.001*diff;
-#endif
-
-        // clear stop states since they have path pointers
-        stop_states.clear();
 
         if (path_spec.trace_) {
 
@@ -603,50 +1160,159 @@ namespace fasttrips {
         }
     }
 
+    void PathFinder::findPathSetGroup(
+        const std::vector<PathSpecification>&   path_specs,
+        const std::vector<size_t>&              group,
+        std::vector<PathSet>&                   pathsets,
+        std::vector<PerformanceInfo>&           performance_infos) const
+    {
+        // the labeling is the same for everyone in the group, so label for the first
+        PathSpecification label_spec = path_specs[group[0]];
+        setDemandStringNums(label_spec);
+
+        // never opened; tracing isn't supported here
+        std::ofstream trace_file;
+
+        PathFinderWorkspace* workspace = acquireWorkspace();
+        StopStates&          stop_states = workspace->stop_states_;
+        stop_states.reset(max_stop_id_, label_spec.outbound_);
+        workspace->trips_reached_.reset(max_trip_id_);
+        LabelStopQueue&      label_stop_queue = workspace->label_stop_queue_;
+        label_stop_queue.clear();
+        label_stop_queue.resetCounts();
+        stop_states.resetCounts();
+
+        TimeStamp labeling_start_time, labeling_end_time;
+        getTimeStamp(labeling_start_time);
+        CpuTimeStamp labeling_cpu_start_time, labeling_cpu_end_time;
+        getCpuTimeStamp(labeling_cpu_start_time);
+
+        initializeStopStates(label_spec, trace_file, stop_states, label_stop_queue);
+
+        // the stops reachable from each distinct end TAZ
+        std::vector<FinalStops> final_stops;
+        std::map<int, size_t>   end_taz_to_final_stops;
+        for (size_t member = 0; member < group.size(); ++member) {
+            const PathSpecification& path_spec = path_specs[group[member]];
+            int end_taz_id = path_spec.outbound_ ? path_spec.origin_taz_id_ : path_spec.destination_taz_id_;
+            if (end_taz_to_final_stops.count(end_taz_id) > 0) { continue; }
+
+            PathSpecification end_spec = label_spec;
+            end_spec.origin_taz_id_      = path_spec.origin_taz_id_;
+            end_spec.destination_taz_id_ = path_spec.destination_taz_id_;
+
+            end_taz_to_final_stops[end_taz_id] = final_stops.size();
+            final_stops.push_back(FinalStops());
+            setReachableFinalStops(end_spec, trace_file, final_stops.back());
+        }
+        setLowerBounds(label_spec, final_stops, *workspace);
+
+        int max_process_count = 0;
+        int label_iterations  = labelStops(label_spec, trace_file, final_stops, stop_states, workspace->trips_reached_,
+                                           label_stop_queue, max_process_count);
+
+        getTimeStamp(labeling_end_time);
+        getCpuTimeStamp(labeling_cpu_end_time);
+        long milliseconds_labeling     = millisecondsElapsed(labeling_start_time, labeling_end_time);
+        long milliseconds_labeling_cpu = cpuMillisecondsElapsed(labeling_cpu_start_time, labeling_cpu_end_time);
+
+        // enumerate each request's paths from the shared stop states
+        for (size_t member = 0; member < group.size(); ++member) {
+            size_t            request_num = group[member];
+            PathSpecification path_spec   = path_specs[request_num];
+            setDemandStringNums(path_spec);
+
+            TimeStamp enumerating_start_time, enumerating_end_time;
+            getTimeStamp(enumerating_start_time);
+            CpuTimeStamp enumerating_cpu_start_time, enumerating_cpu_end_time;
+            getCpuTimeStamp(enumerating_cpu_start_time);
+
+            PerformanceInfo& performance_info           = performance_infos[request_num];
+            getPathSet(path_spec, trace_file, stop_states, pathsets[request_num], performance_info.pathset_draws_);
+
+            getTimeStamp(enumerating_end_time);
+            getCpuTimeStamp(enumerating_cpu_end_time);
+
+            performance_info.label_iterations_          = label_iterations;
+            performance_info.num_labeled_stops_         = stop_states.size();
+            performance_info.max_process_count_         = max_process_count;
+            performance_info.milliseconds_labeling_     = (member == 0) ? milliseconds_labeling : 0;
+            performance_info.link_allocations_          = (member == 0) ? stop_states.arena().allocations()     : 0;
+            performance_info.link_heap_allocations_     = (member == 0) ? stop_states.arena().heapAllocations() : 0;
+            performance_info.label_queue_pushes_        = (member == 0) ? label_stop_queue.pushes()             : 0;
+            performance_info.label_queue_pops_          = (member == 0) ? label_stop_queue.pops()               : 0;
+            performance_info.trips_scanned_             = (member == 0) ? stop_states.tripsScanned()            : 0;
+            performance_info.links_accepted_            = (member == 0) ? stop_states.linksAccepted()           : 0;
+            performance_info.links_rejected_            = (member == 0) ? stop_states.linksRejected()           : 0;
+            performance_info.milliseconds_enumerating_  = millisecondsElapsed(enumerating_start_time, enumerating_end_time);
+            performance_info.milliseconds_cpu_          = cpuMillisecondsElapsed(enumerating_cpu_start_time, enumerating_cpu_end_time) +
+                                                          ((member == 0) ? milliseconds_labeling_cpu : 0);
+            setMemoryUsage(performance_info);
+        }
+
+        // the stop states are left for the next request to reset
+        releaseWorkspace(workspace);
+    }
+
+    template <bool TRACE>
     double PathFinder::tallyLinkCost(
         const int supply_mode_num,
         const PathSpecification& path_spec,
         std::ostream& trace_file,
-        const NamedWeights& weights,
+        const LinkWeights& weights,
         const Attributes& attributes,
         bool hush) const
     {
         // iterate through the weights
         double cost = 0;
-        if (true && path_spec.trace_ && !hush) {
+        if (true && TRACE && !hush) {
             trace_file << "Link cost for " << std::setw(15) << std::setfill(' ') << std::left << modeStringForNum(supply_mode_num);
             trace_file << std::setw(15) << std::setfill(' ') << std::right << "weight" << " x attribute" <<std::endl;
         }
 
-        NamedWeights::const_iterator iter_weights;
+        LinkWeights::const_iterator iter_weights;
         for (iter_weights  = weights.begin();
              iter_weights != weights.end(); ++iter_weights) {
 
             // look for the attribute
-            Attributes::const_iterator iter_attr = attributes.find(iter_weights->first);
-            if (iter_attr == attributes.end()) {
+            double attr_value = attributes[iter_weights->attribute_num_];
+            if (!isAttributeSet(attr_value)) {
                 // error out??
-                if (path_spec.trace_) {
-                    trace_file << " => NO ATTRIBUTE CALLED " << iter_weights->first << " for " << modeStringForNum(supply_mode_num) << std::endl;
+                const std::string& attr_name = attribute_names_[iter_weights->attribute_num_];
+                if (TRACE) {
+                    trace_file << " => NO ATTRIBUTE CALLED " << attr_name << " for " << modeStringForNum(supply_mode_num) << std::endl;
                 }
-                std::cerr << " => NO ATTRIBUTE CALLED " << iter_weights->first << " for " << modeStringForNum(supply_mode_num) << std::endl;
+                std::cerr << " => NO ATTRIBUTE CALLED " << attr_name << " for " << modeStringForNum(supply_mode_num) << std::endl;
                 continue;
             }
 
-            cost += iter_weights->second * iter_attr->second;
-            if (true && path_spec.trace_ && !hush) {
-                trace_file << std::setw(26) << std::setfill(' ') << std::right << iter_weights->first << ":  + ";
-                trace_file << std::setw(13) << std::setprecision(4) << std::fixed << iter_weights->second;
-                trace_file << " x " << iter_attr->second << std::endl;
+            cost += iter_weights->weight_ * attr_value;
+            if (true && TRACE && !hush) {
+                trace_file << std::setw(26) << std::setfill(' ') << std::right << attribute_names_[iter_weights->attribute_num_] << ":  + ";
+                trace_file << std::setw(13) << std::setprecision(4) << std::fixed << iter_weights->weight_;
+                trace_file << " x " << attr_value << std::endl;
             }
         }
-        if (true && path_spec.trace_ && !hush) {
+        if (true && TRACE && !hush) {
             trace_file << std::setw(26) << std::setfill(' ') << "final cost" << ":  = ";
             trace_file << std::setw(13) << std::setprecision(4) << std::fixed << cost << std::endl;
         }
         return cost;
     }
 
+    double PathFinder::tallyLinkCost(
+        const int supply_mode_num,
+        const PathSpecification& path_spec,
+        std::ostream& trace_file,
+        const LinkWeights& weights,
+        const Attributes& attributes,
+        bool hush) const
+    {
+        return path_spec.trace_ ? tallyLinkCost<true >(supply_mode_num, path_spec, trace_file, weights, attributes, hush)
+                                : tallyLinkCost<false>(supply_mode_num, path_spec, trace_file, weights, attributes, hush);
+    }
+
+    template <bool TRACE>
     void PathFinder::addStopState(
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
@@ -659,17 +1325,13 @@ namespace fasttrips {
         // do we even want to incorporate this link to our stop state?
         bool rejected = false;
 
-        // initialize the hyperlink if we need to
-        if (stop_states.find(stop_id) == stop_states.end()) {
-            Hyperlink h(stop_id, path_spec.outbound_);
-            stop_states[stop_id] = h;
-        }
-
+        // this initializes the hyperlink if we need to
         Hyperlink& hyperlink = stop_states[stop_id];
 
         // keep track if the state changed (label or time window)
         // if so, we'll want to trigger dealing with the effects by adding it to the queue
-        bool update_state = hyperlink.addLink(ss, prev_link, rejected, trace_file, path_spec, *this);
+        bool update_state = hyperlink.addLink<TRACE>(ss, prev_link, rejected, trace_file, path_spec, *this);
+        stop_states.countLink(rejected);
 
         if (update_state) {
             LabelStop ls = { hyperlink.hyperpathCost(isTrip(ss.deparr_mode_)), stop_id, isTrip(ss.deparr_mode_) };
@@ -679,15 +1341,12 @@ namespace fasttrips {
         }
 
         // the rest is for debugging
-        if (!path_spec.trace_) { return; }
+        if (!TRACE) { return; }
 
         if (rejected) { return; }
 
-        static int link_num = 1;        // unique ID for the link
-        static int last_iter = -1;   // last stop id that got numbered
-
         if (!label_file.is_open()) {
-            link_num = 1;  // reset
+            label_link_num = 1;  // reset
 
             std::ostringstream ss;
             ss << output_dir_ << kPathSeparator;
@@ -700,7 +1359,7 @@ namespace fasttrips {
         for (int o_d = 0; o_d < 2; ++o_d) {
             // print it into the labels file
             label_file << ss.iteration_ << ",";
-            label_file << link_num      << ",";
+            label_file << label_link_num << ",";
 
             if (o_d == 0) { label_file << stop_num_to_str_.find(stop_id)->second << ","; }
             else          { label_file << stop_num_to_str_.find(ss.stop_succpred_)->second << ","; }
@@ -725,7 +1384,20 @@ namespace fasttrips {
             else if (!path_spec.outbound_ && o_d == 1) { label_file << "A" << std::endl; }
             else                                       { label_file << "B" << std::endl; }
         }
-        ++link_num;
+        ++label_link_num;
+    }
+
+    void PathFinder::addStopState(
+        const PathSpecification& path_spec,
+        std::ofstream& trace_file,
+        const int stop_id,
+        const StopState& ss,
+        const Hyperlink* prev_link,
+        StopStates& stop_states,
+        LabelStopQueue& label_stop_queue) const
+    {
+        if (path_spec.trace_) { addStopState<true >(path_spec, trace_file, stop_id, ss, prev_link, stop_states, label_stop_queue); }
+        else                  { addStopState<false>(path_spec, trace_file, stop_id, ss, prev_link, stop_states, label_stop_queue); }
     }
 
     bool PathFinder::initializeStopStates(
@@ -745,10 +1417,10 @@ namespace fasttrips {
 
         // Are there any supply modes for this demand mode?
         UserClassPurposeMode ucpm = {
-            path_spec.user_class_,
-            path_spec.purpose_,
+            path_spec.user_class_num_,
+            path_spec.purpose_num_,
             path_spec.outbound_ ? MODE_EGRESS: MODE_ACCESS,
-            path_spec.outbound_ ? path_spec.egress_mode_ : path_spec.access_mode_
+            path_spec.outbound_ ? path_spec.egress_mode_num_ : path_spec.access_mode_num_
         };
         WeightLookup::const_iterator iter_weights = weight_lookup_.find(ucpm);
         if (iter_weights == weight_lookup_.end()) {
@@ -763,65 +1435,35 @@ namespace fasttrips {
             stopids_file << stop_num_to_str_.find(start_taz_id)->second << ",0,0,0" << std::endl;
         }
 
-        // Iterate through valid supply modes
-        SupplyModeToNamedWeights::const_iterator iter_s2w;
-        for (iter_s2w  = iter_weights->second.begin();
-             iter_s2w != iter_weights->second.end(); ++iter_s2w) {
-            int supply_mode_num = iter_s2w->first;
-
-            if (path_spec.trace_) {
-                trace_file << "Weights exist for supply mode " << supply_mode_num << " => ";
-                trace_file << mode_num_to_str_.find(supply_mode_num)->second << std::endl;
-            }
-
-            // Are there any egress/access links for the supply mode?
-            SupplyStopToAttr::const_iterator iter_ss2a = iter_tss2a->second.find(supply_mode_num);
-            if (iter_ss2a == iter_tss2a->second.end()) {
-                if (path_spec.trace_) {
-                    trace_file << "No links for this supply mode" << std::endl;
-                }
-                continue;
-            }
-
-            // Iterate through the links for the given supply mode
-            StopToAttr::const_iterator link_iter;
-            for (link_iter  = iter_ss2a->second.begin();
-                 link_iter != iter_ss2a->second.end(); ++link_iter)
-            {
-                int stop_id = link_iter->first;
-                Attributes link_attr = link_iter->second;
-                double attr_time = link_attr.find("time_min")->second;
-
-                // outbound: departure time = destination - access
-                // inbound:  arrival time   = origin      + access
-                double deparr_time = path_spec.preferred_time_ - (attr_time*dir_factor);
-                // we start out with no delay
-                link_attr["preferred_delay_min"] = 0.0;
-
-                double cost;
-                if (path_spec.hyperpath_) {
-                    cost = tallyLinkCost(supply_mode_num, path_spec, trace_file, iter_s2w->second, link_attr);
-                } else {
-                    cost = attr_time;
-                }
+        // traced requests go around the cache and tally each link, so the trace shows the link costs
+        TazLinks traced_links;
+        if (path_spec.trace_) { buildTazLinks<true>(path_spec, trace_file, start_taz_id, iter_weights->second, traced_links); }
+        const TazLinks& taz_links = path_spec.trace_ ? traced_links : tazLinks(path_spec, trace_file, start_taz_id, ucpm, iter_weights->second);
 
-                StopState ss(
-                    deparr_time,                                                                // departure/arrival time
-                    path_spec.outbound_ ? MODE_EGRESS : MODE_ACCESS,                            // departure/arrival mode
-                    supply_mode_num,                                                            // trip id
-                    start_taz_id,                                                               // successor/predecessor
-                    -1,                                                                         // sequence
-                    -1,                                                                         // sequence succ/pred
-                    attr_time,                                                                  // link time
-                    cost,                                                                       // link cost
-                    cost,                                                                       // cost
-                    0,                                                                          // iteration
-                    path_spec.preferred_time_                                                   // arrival/departure time
-                );
-                addStopState(path_spec, trace_file, stop_id, ss, NULL, stop_states, label_stop_queue);
+        // Iterate through the links for the valid supply modes
+        for (std::vector<TazLink>::const_iterator link_iter  = taz_links.links_.begin();
+             link_iter != taz_links.links_.end(); ++link_iter)
+        {
+            // outbound: departure time = destination - access
+            // inbound:  arrival time   = origin      + access
+            double deparr_time = path_spec.preferred_time_ - (link_iter->time_*dir_factor);
+            double cost        = path_spec.hyperpath_ ? link_iter->cost_ : link_iter->time_;
 
-            } // end iteration through links for the given supply mode
-        } // end iteration through valid supply modes
+            StopState ss(
+                deparr_time,                                                                // departure/arrival time
+                path_spec.outbound_ ? MODE_EGRESS : MODE_ACCESS,                            // departure/arrival mode
+                link_iter->supply_mode_num_,                                                // trip id
+                start_taz_id,                                                               // successor/predecessor
+                -1,                                                                         // sequence
+                -1,                                                                         // sequence succ/pred
+                link_iter->time_,                                                           // link time
+                cost,                                                                       // link cost
+                cost,                                                                       // cost
+                0,                                                                          // iteration
+                path_spec.preferred_time_                                                   // arrival/departure time
+            );
+            addStopState(path_spec, trace_file, link_iter->stop_id_, ss, NULL, stop_states, label_stop_queue);
+        }
 
         if (label_stop_queue.size() > 0)
             return true;
@@ -833,6 +1475,7 @@ namespace fasttrips {
      * *label_stop_queue*, this method will iterate through transfers to (for outbound) or
      * from (for inbound) the current stop and update the next stop given the current stop state.
      **/
+    template <bool TRACE, bool HYPERPATH>
     void PathFinder::updateStopStatesForTransfers(
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
@@ -851,18 +1494,18 @@ namespace fasttrips {
 
         // Lookup transfer weights
         // TODO: returning here is probably terrible and we shouldn't be silent... We should have zero weights if we don't want to penalize.
-        const NamedWeights* transfer_weights = getNamedWeights(path_spec.user_class_, path_spec.purpose_, MODE_TRANSFER, "transfer", transfer_supply_mode_);
+        const LinkWeights* transfer_weights = getLinkWeights(path_spec.user_class_num_, path_spec.purpose_num_, MODE_TRANSFER, transfer_demand_mode_num_, transfer_supply_mode_);
         if (transfer_weights == NULL) { return; }
 
         // add zero-walk transfer to this stop
         int               xfer_stop_id  = current_label_stop.stop_id_;
         const Attributes* zerowalk_xfer = getTransferAttributes(xfer_stop_id, xfer_stop_id);
-        double            transfer_time = zerowalk_xfer->find("walk_time_min")->second;  // todo: make this a different time?
+        double            transfer_time = (*zerowalk_xfer)[ATTR_WALK_TIME_MIN];  // todo: make this a different time?
         double            deparr_time   = current_deparr_time - (transfer_time*dir_factor);
         double            link_cost, cost;
-        if (path_spec.hyperpath_)
+        if (HYPERPATH)
         {
-            link_cost = tallyLinkCost(transfer_supply_mode_, path_spec, trace_file, *transfer_weights, *zerowalk_xfer);
+            link_cost = tallyLinkCost<TRACE>(transfer_supply_mode_, path_spec, trace_file, *transfer_weights, *zerowalk_xfer);
             cost      = nonwalk_label + link_cost;
         } else {
             link_cost = transfer_time;
@@ -882,7 +1525,7 @@ namespace fasttrips {
             label_iteration,                // label iteration
             current_deparr_time             // arrival/departure time
         );
-        addStopState(path_spec, trace_file, xfer_stop_id, ss, &current_stop_state, stop_states, label_stop_queue);
+        addStopState<TRACE>(path_spec, trace_file, xfer_stop_id, ss, &current_stop_state, stop_states, label_stop_queue);
 
         // are there other relevant transfers?
         // if outbound, going backwards, so transfer TO this current stop
@@ -897,17 +1540,17 @@ namespace fasttrips {
              transfer_it != transfer_map_it->second.end(); ++transfer_it)
         {
             xfer_stop_id    = transfer_it->first;
-            transfer_time   = transfer_it->second.find("time_min")->second;
+            transfer_time   = transfer_it->second[ATTR_TIME_MIN];
             // outbound: departure time = latest departure - transfer
             //  inbound: arrival time   = earliest arrival + transfer
             deparr_time     = current_deparr_time - (transfer_time*dir_factor);
 
             // stochastic/hyperpath: cost update
-            if (path_spec.hyperpath_)
+            if (HYPERPATH)
             {
                 Attributes link_attr            = transfer_it->second;
-                link_attr["transfer_penalty"]   = 1.0;
-                link_cost                       = tallyLinkCost(transfer_supply_mode_, path_spec, trace_file, *transfer_weights, link_attr);
+                link_attr[ATTR_TRANSFER_PENALTY]   = 1.0;
+                link_cost                       = tallyLinkCost<TRACE>(transfer_supply_mode_, path_spec, trace_file, *transfer_weights, link_attr);
                 cost                            = nonwalk_label + link_cost;
             }
             // deterministic: label = cost = total time, just additive
@@ -921,18 +1564,16 @@ namespace fasttrips {
                 // TODO: capacity stuff
                 if (path_spec.outbound_)
                 {
-                    int current_trip = current_stop_state.lowestCostStopState(true).trip_id_;
-                    TripStop ts = { current_trip, current_stop_state.lowestCostStopState(true).seq_, current_label_stop.stop_id_ };
-                    std::map<TripStop, double, struct TripStopCompare>::const_iterator bwi = bump_wait_.find(ts);
-                    if (bwi != bump_wait_.end())
+                    int current_trip = current_stop_state.label(true).trip_id_;
+                    // time a bumped passenger started waiting
+                    double latest_time;
+                    if (getBumpWait(current_trip, current_stop_state.label(true).seq_, latest_time))
                     {
-                        // time a bumped passenger started waiting
-                        double latest_time = bwi->second;
                         // we can't come in time
                         if (deparr_time - Hyperlink::TIME_WINDOW_ > latest_time) { continue; }
                         // leave earlier -- to get in line 5 minutes before bump wait time
                         // (confused... We don't resimulate previous bumping passenger so why does this make sense?)
-                        cost            = cost + (current_stop_state.lowestCostStopState(true).deparr_time_ - latest_time) + BUMP_BUFFER_;
+                        cost            = cost + (current_stop_state.label(true).deparr_time_ - latest_time) + BUMP_BUFFER_;
                         deparr_time     = latest_time - transfer_time - BUMP_BUFFER_;
                     }
                 }
@@ -952,7 +1593,7 @@ namespace fasttrips {
                 label_iteration,                // label iteration
                 current_deparr_time             // arrival/departure time
             );
-            addStopState(path_spec, trace_file, xfer_stop_id, ss, &current_stop_state, stop_states, label_stop_queue);
+            addStopState<TRACE>(path_spec, trace_file, xfer_stop_id, ss, &current_stop_state, stop_states, label_stop_queue);
         }
     }
 
@@ -961,18 +1602,20 @@ namespace fasttrips {
      * *label_stop_queue*, this method will iterate through access links to (for outbound) or
      * egress links from (for inbound) the current stop and update the next stop given the current stop state.
      */
+    template <bool TRACE, bool HYPERPATH>
     void PathFinder::updateStopStatesForFinalLinks(
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
-        const std::map<int, int>& reachable_final_stops,
+        FinalStops& final_stops,
         StopStates& stop_states,
         LabelStopQueue& label_stop_queue,
         int label_iteration,
-        const LabelStop& current_label_stop,
-        double& est_max_path_cost) const
+        const LabelStop& current_label_stop) const
     {
         // shortcut -- nothing to do if this isn't reachable to end taz
-        if (reachable_final_stops.count(current_label_stop.stop_id_) == 0) {
+        if (final_stops.final_links_ == NULL) { return; }
+        TazLinkRange final_links = final_stops.final_links_->stopLinks(current_label_stop.stop_id_);
+        if (final_links.first == final_links.second) {
             return;
         }
 
@@ -982,123 +1625,93 @@ namespace fasttrips {
         double current_deparr_time     = current_stop_state.latestDepartureEarliestArrival(true);
         double nonwalk_label           = current_stop_state.hyperpathCost(true);
 
-        int    end_taz_id = path_spec.outbound_ ? path_spec.origin_taz_id_ : path_spec.destination_taz_id_;
+        int    end_taz_id = final_stops.end_taz_id_;
         double dir_factor = path_spec.outbound_ ? 1.0 : -1.0;
 
         double earliest_dep_latest_arr = PathFinder::MAX_DATETIME;
-        if (path_spec.hyperpath_) {
+        if (HYPERPATH) {
             earliest_dep_latest_arr = current_stop_state.earliestDepartureLatestArrival(path_spec.outbound_, true);
         } else {
-            earliest_dep_latest_arr = current_stop_state.lowestCostStopState(true).deparr_time_;
+            earliest_dep_latest_arr = current_stop_state.label(true).deparr_time_;
 
         }
 
-        // are there any egress/access links?
-        TAZSupplyStopToAttr::const_iterator iter_tss2a = taz_access_links_.find(end_taz_id);
-        if (iter_tss2a == taz_access_links_.end()) {
-            // this shouldn't happen because of the shortcut
-            return;
-        }
+        // Iterate through the links between this stop and the end TAZ, by supply mode
+        for (const TazLink* link_iter = final_links.first; link_iter != final_links.second; ++link_iter) {
+            int     supply_mode_num         = link_iter->supply_mode_num_;
+            double  access_time             = link_iter->time_;
 
-        // Are there any supply modes for this demand mode?
-        UserClassPurposeMode ucpm = {
-            path_spec.user_class_,
-            path_spec.purpose_,
-            path_spec.outbound_ ? MODE_ACCESS: MODE_EGRESS,
-            path_spec.outbound_ ? path_spec.access_mode_ : path_spec.egress_mode_
-        };
-        WeightLookup::const_iterator iter_weights = weight_lookup_.find(ucpm);
-        if (iter_weights == weight_lookup_.end()) {
-            // this shouldn't happen because of the shortcut
-            std::cerr << "Couldn't find any weights configured for user class/purpose (2) [" << path_spec.user_class_ << "/" << path_spec.purpose_ << "], ";
-            std::cerr << (path_spec.outbound_ ? "access mode [" : "egress mode [");
-            std::cerr << (path_spec.outbound_ ? path_spec.access_mode_ : path_spec.egress_mode_) << "] for trip list id num " << path_spec.path_id_ << std::endl;
-            return;
-        }
+            double  deparr_time, link_cost, cost;
 
-        // Iterate through valid supply modes
-        SupplyModeToNamedWeights::const_iterator iter_s2w;
-        for (iter_s2w  = iter_weights->second.begin();
-             iter_s2w != iter_weights->second.end(); ++iter_s2w) {
-            int supply_mode_num = iter_s2w->first;
+            if (HYPERPATH)
+            {
+                deparr_time     = earliest_dep_latest_arr - (access_time*dir_factor);
+
+                link_cost       = link_iter->cost_;
+                // traced requests tally it again, so the trace shows the cost of each link as it's labeled
+                if (TRACE) {
+                    const LinkWeights* link_weights = getLinkWeights(path_spec.user_class_num_, path_spec.purpose_num_,
+                                                                     path_spec.outbound_ ? MODE_ACCESS : MODE_EGRESS,
+                                                                     path_spec.outbound_ ? path_spec.access_mode_num_ : path_spec.egress_mode_num_,
+                                                                     supply_mode_num);
+                    const Attributes*  link_attr    = getAccessAttributes(end_taz_id, supply_mode_num, current_label_stop.stop_id_);
+                    if ((link_weights != NULL) && (link_attr != NULL)) {
+                        Attributes final_attr = *link_attr;
+                        final_attr[ATTR_PREFERRED_DELAY_MIN] = 0.0;
+                        link_cost = tallyLinkCost<TRACE>(supply_mode_num, path_spec, trace_file, *link_weights, final_attr);
+                    }
+                }
+                cost            = nonwalk_label + link_cost;
 
-            // Are there any egress/access links for the supply mode?
-            SupplyStopToAttr::const_iterator iter_ss2a = iter_tss2a->second.find(supply_mode_num);
-            if (iter_ss2a == iter_tss2a->second.end()) {
-                continue;
             }
+            // deterministic
+            else
+            {
+                deparr_time = earliest_dep_latest_arr - (access_time*dir_factor);
+                link_cost   = access_time;
+                cost        = current_stop_state.label(true).cost_ + link_cost;
 
-            // If this supply mode reaches the given stop
-            StopToAttr::const_iterator link_iter = iter_ss2a->second.find(current_label_stop.stop_id_);
-            if (link_iter != iter_ss2a->second.end()) {
-
-                Attributes link_attr            = link_iter->second;
-                link_attr["preferred_delay_min"]= 0.0;
-
-                double  access_time             = link_attr.find("time_min")->second;
-
-                bool    use_new_state           = false;
-                double  deparr_time, link_cost, cost;
-
-
-                if (path_spec.hyperpath_)
-                {
-                    deparr_time     = earliest_dep_latest_arr - (access_time*dir_factor);
-
-                    link_cost       = tallyLinkCost(supply_mode_num, path_spec, trace_file, iter_s2w->second, link_attr);
-                    cost            = nonwalk_label + link_cost;
-
-                }
-                // deterministic
-                else
+                // capacity check
+                if (path_spec.outbound_)
                 {
-                    deparr_time = earliest_dep_latest_arr - (access_time*dir_factor);
-                    link_cost   = access_time;
-                    cost        = current_stop_state.lowestCostStopState(true).cost_ + link_cost;
-
-                    // capacity check
-                    if (path_spec.outbound_)
-                    {
-                        TripStop ts = { current_stop_state.lowestCostStopState(true).deparr_mode_, current_stop_state.lowestCostStopState(true).seq_, current_label_stop.stop_id_ };
-                        std::map<TripStop, double, struct TripStopCompare>::const_iterator bwi = bump_wait_.find(ts);
-                        if (bwi != bump_wait_.end()) {
-                            // time a bumped passenger started waiting
-                            double latest_time = bwi->second;
-                            // we can't come in time
-                            if (deparr_time - Hyperlink::TIME_WINDOW_ > latest_time) { continue; }
-                            // leave earlier -- to get in line 5 minutes before bump wait time
-                            cost   = cost + (current_stop_state.lowestCostStopState(true).deparr_time_ - latest_time) + BUMP_BUFFER_;
-                            deparr_time = latest_time - access_time - BUMP_BUFFER_;
-                        }
+                    // time a bumped passenger started waiting
+                    double latest_time;
+                    if (getBumpWait(current_stop_state.label(true).deparr_mode_, current_stop_state.label(true).seq_, latest_time)) {
+                        // we can't come in time
+                        if (deparr_time - Hyperlink::TIME_WINDOW_ > latest_time) { continue; }
+                        // leave earlier -- to get in line 5 minutes before bump wait time
+                        cost   = cost + (current_stop_state.label(true).deparr_time_ - latest_time) + BUMP_BUFFER_;
+                        deparr_time = latest_time - access_time - BUMP_BUFFER_;
                     }
-
                 }
 
-                StopState ts(
-                    deparr_time,                                                                // departure/arrival time
-                    path_spec.outbound_ ? MODE_ACCESS : MODE_EGRESS,                            // departure/arrival mode
-                    supply_mode_num,                                                            // trip id
-                    current_label_stop.stop_id_,                                                // successor/predecessor
-                    -1,                                                                         // sequence
-                    -1,                                                                         // sequence succ/pred
-                    access_time,                                                                // link time
-                    link_cost,                                                                  // link cost
-                    cost,                                                                       // cost
-                    label_iteration,                                                            // label iteration
-                    earliest_dep_latest_arr                                                     // arrival/departure time
-                );
-                addStopState(path_spec, trace_file, end_taz_id, ts, &current_stop_state, stop_states, label_stop_queue);
+            }
+
+            StopState ts(
+                deparr_time,                                                                // departure/arrival time
+                path_spec.outbound_ ? MODE_ACCESS : MODE_EGRESS,                            // departure/arrival mode
+                supply_mode_num,                                                            // trip id
+                current_label_stop.stop_id_,                                                // successor/predecessor
+                -1,                                                                         // sequence
+                -1,                                                                         // sequence succ/pred
+                access_time,                                                                // link time
+                link_cost,                                                                  // link cost
+                cost,                                                                       // cost
+                label_iteration,                                                            // label iteration
+                earliest_dep_latest_arr                                                     // arrival/departure time
+            );
+            addStopState<TRACE>(path_spec, trace_file, end_taz_id, ts, &current_stop_state, stop_states, label_stop_queue);
 
-                // set label_cutoff
-                double low_cost = stop_states[end_taz_id].hyperpathCost(false);
-                // estimate of the max path cost that would have probability > MIN_PATH_PROBABILITY
-                double max_cost = low_cost - (log(MIN_PATH_PROBABILITY_) - log(1.0-MIN_PATH_PROBABILITY_))/Hyperlink::STOCH_DISPERSION_;
-                est_max_path_cost = std::min(est_max_path_cost, max_cost);
+            // set label_cutoff
+            double low_cost = stop_states[end_taz_id].hyperpathCost(false);
+            // estimate of the max path cost that would have probability > MIN_PATH_PROBABILITY
+            double max_cost = low_cost - (log(MIN_PATH_PROBABILITY_) - log(1.0-MIN_PATH_PROBABILITY_))/Hyperlink::STOCH_DISPERSION_;
+            final_stops.est_max_path_cost_ = std::min(final_stops.est_max_path_cost_, max_cost);
 
-            } // end iteration through links for the given supply mode
-        } // end iteration through valid supply modes
+        } // end iteration through links to the end TAZ
      }
 
+    template <bool TRACE, bool HYPERPATH>
     void PathFinder::updateStopStatesForTrips(
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
@@ -1106,12 +1719,12 @@ namespace fasttrips {
         LabelStopQueue& label_stop_queue,
         int label_iteration,
         const LabelStop& current_label_stop,
-        std::tr1::unordered_set<int>& trips_done) const
+        VisitedMap& trips_reached) const
     {
         double dir_factor = path_spec.outbound_ ? 1.0 : -1.0;
 
         // for weight lookup
-        UserClassPurposeMode ucpm = { path_spec.user_class_, path_spec.purpose_, MODE_TRANSIT, path_spec.transit_mode_};
+        UserClassPurposeMode ucpm = { path_spec.user_class_num_, path_spec.purpose_num_, MODE_TRANSIT, path_spec.transit_mode_num_};
         WeightLookup::const_iterator iter_weights = weight_lookup_.find(ucpm);
         if (iter_weights == weight_lookup_.end()) {
             return;
@@ -1123,24 +1736,24 @@ namespace fasttrips {
         double     latest_dep_earliest_arr  = current_stop_state.latestDepartureEarliestArrival(false);
 
         // Update by trips
-        std::vector<TripStopTime> relevant_trips;
-        getTripsWithinTime(current_label_stop.stop_id_, path_spec.outbound_, latest_dep_earliest_arr, relevant_trips);
-        for (std::vector<TripStopTime>::const_iterator it=relevant_trips.begin(); it != relevant_trips.end(); ++it) {
+        TripStopTimeRange relevant_trips = getTripsWithinTime(current_label_stop.stop_id_, path_spec.outbound_, latest_dep_earliest_arr);
+        stop_states.countTripsScanned(relevant_trips.second - relevant_trips.first);
+        for (const TripStopTime* it = relevant_trips.first; it != relevant_trips.second; ++it) {
 
             // the trip info for this trip
-            const TripInfo& trip_info = trip_info_.find(it->trip_id_)->second;
+            const TripInfo& trip_info = trip_info_[it->trip_id_];
             // the trip stop time for this trip
             const TripStopTime& tst = getTripStopTime(it->trip_id_, it->seq_);
 
             // get the weights applicable for this trip
-            SupplyModeToNamedWeights::const_iterator iter_sm2nw = iter_weights->second.find(trip_info.supply_mode_num_);
+            SupplyModeToLinkWeights::const_iterator iter_sm2nw = iter_weights->second.find(trip_info.supply_mode_num_);
             if (iter_sm2nw == iter_weights->second.end()) {
                 // this supply mode isn't allowed for the userclass/demand mode
                 continue;
             }
-            const NamedWeights& named_weights = iter_sm2nw->second;
+            const LinkWeights& link_weights = iter_sm2nw->second;
 
-            if (true && path_spec.trace_) {
+            if (true && TRACE) {
                 trace_file << "valid trips: " << trip_num_to_str_.find(it->trip_id_)->second << " " << it->seq_ << " ";
                 printTime(trace_file, path_spec.outbound_ ? it->arrive_time_ : it->depart_time_);
                 trace_file << std::endl;
@@ -1148,40 +1761,38 @@ namespace fasttrips {
 
             // trip arrival time (outbound) / trip departure time (inbound)
             double arrdep_time                = path_spec.outbound_ ? it->arrive_time_ : it->depart_time_;
-            // this is our best guess link in the current_stop_state hyperlink that's relevant
-            const  StopState& best_guess_link = current_stop_state.bestGuessLink(path_spec.outbound_, arrdep_time);
+            // this is our best guess link in the current_stop_state hyperlink that's relevant (deterministic: the only one)
+            const  StopState& best_guess_link = HYPERPATH ? current_stop_state.bestGuessLink(path_spec.outbound_, arrdep_time)
+                                                                     : current_stop_state.label(false);
             double wait_time                  = (best_guess_link.deparr_time_ - arrdep_time)*dir_factor;
             if (wait_time < 0) {
                 std::cerr << "wait_time < 0 -- this shouldn't happen!" << std::endl;
-                if (path_spec.trace_) { trace_file << "wait_time < 0 -- this shouldn't happen!" << std::endl; }
+                if (TRACE) { trace_file << "wait_time < 0 -- this shouldn't happen!" << std::endl; }
             }
 
             // deterministic path-finding: check capacities
-            if (!path_spec.hyperpath_) {
-                TripStop check_for_bump_wait;
+            if (!HYPERPATH) {
+                int    bump_trip_id, bump_seq;
                 double arrive_time;
                 if (path_spec.outbound_) {
                     // if outbound, this trip loop is possible trips *before* the current trip
                     // checking that we get here in time for the current trip
-                    check_for_bump_wait.trip_id_ = current_stop_state.lowestCostStopState(false).trip_id_;
-                    check_for_bump_wait.seq_     = current_stop_state.lowestCostStopState(false).seq_;
-                    check_for_bump_wait.stop_id_ = current_label_stop.stop_id_;
+                    bump_trip_id = current_stop_state.label(false).trip_id_;
+                    bump_seq     = current_stop_state.label(false).seq_;
                     //  arrive from the loop trip
                     arrive_time = arrdep_time;
                 } else {
                     // if inbound, the trip is the next trip
                     // checking that we can get here in time for that trip
-                    check_for_bump_wait.trip_id_ = it->trip_id_;
-                    check_for_bump_wait.seq_     = it->seq_;
-                    check_for_bump_wait.stop_id_ = current_label_stop.stop_id_;
+                    bump_trip_id = it->trip_id_;
+                    bump_seq     = it->seq_;
                     // arrive for this trip
-                    arrive_time = current_stop_state.lowestCostStopState(false).deparr_time_;
+                    arrive_time = current_stop_state.label(false).deparr_time_;
                 }
-                std::map<TripStop, double, struct TripStopCompare>::const_iterator bwi = bump_wait_.find(check_for_bump_wait);
-                if (bwi != bump_wait_.end()) {
-                    // time a bumped passenger started waiting
-                    double latest_time = bwi->second;
-                    if (path_spec.trace_) {
+                // time a bumped passenger started waiting
+                double latest_time;
+                if (getBumpWait(bump_trip_id, bump_seq, latest_time)) {
+                    if (TRACE) {
                         trace_file << "checking latest_time ";
                         printTime(trace_file, latest_time);
                         trace_file << " vs arrive_time ";
@@ -1189,47 +1800,99 @@ namespace fasttrips {
                         trace_file << " for potential trip " << it->trip_id_ << std::endl;
                     }
                     if ((arrive_time + 0.01 >= latest_time) &&
-                        (current_stop_state.lowestCostStopState(false).trip_id_ != it->trip_id_)) {
-                        if (path_spec.trace_) { trace_file << "Continuing" << std::endl; }
+                        (current_stop_state.label(false).trip_id_ != it->trip_id_)) {
+                        if (TRACE) { trace_file << "Continuing" << std::endl; }
                         continue;
                     }
                 }
             }
 
             // get the TripStopTimes for this trip
-            std::map<int, std::vector<TripStopTime> >::const_iterator tstiter = trip_stop_times_.find(it->trip_id_);
-            assert(tstiter != trip_stop_times_.end());
-            const std::vector<TripStopTime>& possible_stops = tstiter->second;
+            TripStopTimeRange possible_stops = getTripStopTimes(it->trip_id_);
 
             // these are the relevant potential trips/stops; iterate through them
             unsigned int start_seq = path_spec.outbound_ ? 1 : it->seq_+1;
-            unsigned int end_seq   = path_spec.outbound_ ? it->seq_-1 : possible_stops.size();
+            unsigned int end_seq   = path_spec.outbound_ ? it->seq_-1 : (possible_stops.second - possible_stops.first);
+
+            // Deterministic labels are total time, anchored at the preferred time, so every stop this trip reaches gets the same
+            // label whichever stop it's boarded (inbound) or alighted (outbound) at -- only the stops it hasn't reached yet are new.
+            // So like the "reached index" of trip-based routing, scan only the part of the trip before the sequence
+            // already scanned (inbound), or after it (outbound).  Capacity iterations scan the whole trip, since bump waits
+            // add penalties to the transfer and access costs and the labels aren't just time any more.
+            // Hyperpath labeling always scans the whole trip: each boarding/alighting pair is a separate link with its own
+            // cost in the hyperlink, so a trip reached again from another stop adds new links at the stops it already reached,
+            // and skipping them would drop alternatives from the hyperpath.  It stays quadratic in the trip length.
+            if (!HYPERPATH && bump_wait_.empty()) {
+                int reached_seq;
+                if (trips_reached.find(it->trip_id_, reached_seq)) {
+                    if (path_spec.outbound_) { start_seq = std::max(start_seq, static_cast<unsigned int>(reached_seq)); }
+                    else                     { end_seq   = std::min(end_seq,   static_cast<unsigned int>(reached_seq)); }
+                    if (TRACE) { trace_file << "trip already reached at seq " << reached_seq << "; scanning seq " << start_seq << " to " << end_seq << std::endl; }
+                }
+                // anything left to scan extends the reached part of the trip to this stop
+                if (start_seq <= end_seq) { trips_reached.set(it->trip_id_, it->seq_); }
+            }
+
+            // the link attributes that don't depend on the board/alight stop
+            Attributes link_attr;
+            double     delay_cost = 0;
+            if (HYPERPATH && (start_seq <= end_seq)) {
+                // start with trip info attributes
+                link_attr = trip_info.trip_attr_;
+                link_attr[ATTR_WAIT_TIME_MIN      ] = wait_time;
+
+                // If outbound, and the current link is egress, then it's as late as possible and the wait time isn't accurate.
+                // It should be a preferred delay time instead
+                // ditto for inbound and access
+                if (( path_spec.outbound_ && best_guess_link.deparr_mode_ == MODE_EGRESS) ||
+                    (!path_spec.outbound_ && best_guess_link.deparr_mode_ == MODE_ACCESS)) {
+                    link_attr[ATTR_WAIT_TIME_MIN      ] = 0;
+
+                    Attributes delay_attr = newAttributes();
+                    delay_attr[ATTR_TIME_MIN           ] = 0;
+                    delay_attr[ATTR_DRIVE_TIME_MIN     ] = 0;
+                    delay_attr[ATTR_WALK_TIME_MIN      ] = 0;
+                    delay_attr[ATTR_ELEVATION_GAIN     ] = 0;
+                    delay_attr[ATTR_PREFERRED_DELAY_MIN] = wait_time;
+                    UserClassPurposeMode delay_ucpm = {
+                        path_spec.user_class_num_, path_spec.purpose_num_,
+                        path_spec.outbound_ ? MODE_EGRESS: MODE_ACCESS,
+                        path_spec.outbound_ ? path_spec.egress_mode_num_ : path_spec.access_mode_num_
+                    };
+                    WeightLookup::const_iterator delay_iter_weights = weight_lookup_.find(delay_ucpm);
+                    if (delay_iter_weights != weight_lookup_.end()) {
+                        SupplyModeToLinkWeights::const_iterator delay_iter_s2w = delay_iter_weights->second.find(best_guess_link.trip_id_);
+                        if (delay_iter_s2w != delay_iter_weights->second.end()) {
+                            delay_cost = tallyLinkCost<TRACE>(best_guess_link.trip_id_, path_spec, trace_file, delay_iter_s2w->second, delay_attr);
+                        }
+                    }
+                }
+
+                // This is for if we calculate the transfer penalty on the transit links.
+                // I think we can't do this as it's problematic
+                // TODO: devise test to demonstrate
+                if ((best_guess_link.deparr_mode_ == MODE_ACCESS) || (best_guess_link.deparr_mode_ == MODE_EGRESS)) {
+                    link_attr[ATTR_TRANSFER_PENALTY] = 0.0;
+                } else {
+                    link_attr[ATTR_TRANSFER_PENALTY] = 1.0;
+                }
+            }
+
             for (unsigned int seq_num = start_seq; seq_num <= end_seq; ++seq_num) {
                 // possible board for outbound / alight for inbound
-                const TripStopTime& possible_board_alight = possible_stops.at(seq_num-1);
+                const TripStopTime& possible_board_alight = possible_stops.first[seq_num-1];
 
                 // new label = length of trip so far if the passenger boards/alights at this stop
                 int board_alight_stop = possible_board_alight.stop_id_;
-                StopStates::const_iterator possible_stop_state_iter = stop_states.find(board_alight_stop);
-
-                // hyperpath: potential successor/predessor can't be access or egress
-                /*
-                if (path_spec.hyperpath_) {
-                    if (possible_stop_state_iter != stop_states.end() && possible_stop_state_iter->second.size()>0) {
-                        int possible_mode = possible_stop_state_iter->second.lowestCostStopState().deparr_mode_; // first mode; why 0 index?
-                        if ((possible_mode == MODE_ACCESS) || (possible_mode == MODE_EGRESS)) { continue; }
-                    }
-                }
-                */
 
                 double  deparr_time     = path_spec.outbound_ ? possible_board_alight.depart_time_ : possible_board_alight.arrive_time_;
                 // the schedule crossed midnight
                 if (path_spec.outbound_ && arrdep_time < deparr_time) {
                     deparr_time -= 24*60;
-                    if (path_spec.trace_) { trace_file << "trip crossed midnight; adjusting deparr_time" << std::endl; }
+                    if (TRACE) { trace_file << "trip crossed midnight; adjusting deparr_time" << std::endl; }
                 } else if (!path_spec.outbound_ && deparr_time < arrdep_time) {
                     deparr_time += 24*60;
-                    if (path_spec.trace_) { trace_file << "trip crossed midnight; adjusting deparr_time" << std::endl; }
+                    if (TRACE) { trace_file << "trip crossed midnight; adjusting deparr_time" << std::endl; }
                 }
                 double  in_vehicle_time = (arrdep_time - deparr_time)*dir_factor;
                 double  cost      = 0;
@@ -1237,17 +1900,17 @@ namespace fasttrips {
 
                 if (in_vehicle_time < 0) {
                     printf("in_vehicle_time < 0 -- this shouldn't happen\n");
-                    if (path_spec.trace_) { trace_file << "in_vehicle_time < 0 -- this shouldn't happen!" << std::endl; }
+                    if (TRACE) { trace_file << "in_vehicle_time < 0 -- this shouldn't happen!" << std::endl; }
                 }
 
                 // stochastic/hyperpath: cost update
-                if (path_spec.hyperpath_) {
+                if (HYPERPATH) {
 
                     double overcap     = path_spec.outbound_ ? possible_board_alight.overcap_ : tst.overcap_;
                     double at_capacity = (overcap >= 0 ? 1.0 : 0.0);  // binary, 0 means at capacity
                     if (overcap < 0) { overcap = 0; } // make it non-negative
 
-                    if (path_spec.trace_) {
+                    if (TRACE) {
                         if (path_spec.outbound_) {
                             trace_file << "trip " << tripStringForId(possible_board_alight.trip_id_)
                                        << ", stop " << stopStringForId(possible_board_alight.stop_id_)
@@ -1262,60 +1925,18 @@ namespace fasttrips {
                         }
                     }
 
-                    // start with trip info attributes
-                    Attributes link_attr = trip_info.trip_attr_;
-                    link_attr["in_vehicle_time_min"] = in_vehicle_time;
-                    link_attr["wait_time_min"      ] = wait_time;
-                    link_attr["overcap"            ] = overcap;
-                    link_attr["at_capacity"        ] = at_capacity;
-
-                    link_cost = 0;
-                    // If outbound, and the current link is egress, then it's as late as possible and the wait time isn't accurate.
-                    // It should be a preferred delay time instead
-                    // ditto for inbound and access
-                    if (( path_spec.outbound_ && best_guess_link.deparr_mode_ == MODE_EGRESS) ||
-                        (!path_spec.outbound_ && best_guess_link.deparr_mode_ == MODE_ACCESS)) {
-                        link_attr["wait_time_min"      ] = 0;
-
-
-                        // TODO: this is awkward... setting this all up again.  Plus we don't have all the attributes set.  Cache something?
-                        Attributes delay_attr;
-                        delay_attr["time_min"             ] = 0;
-                        delay_attr["drive_time_min"       ] = 0;
-                        delay_attr["walk_time_min"        ] = 0;
-                        delay_attr["elevation_gain"       ] = 0;
-                        delay_attr["preferred_delay_min"  ] = wait_time;
-                        UserClassPurposeMode delay_ucpm = {
-                            path_spec.user_class_, path_spec.purpose_,
-                            path_spec.outbound_ ? MODE_EGRESS: MODE_ACCESS,
-                            path_spec.outbound_ ? path_spec.egress_mode_ : path_spec.access_mode_
-                        };
-                        WeightLookup::const_iterator delay_iter_weights = weight_lookup_.find(delay_ucpm);
-                        if (delay_iter_weights != weight_lookup_.end()) {
-                            SupplyModeToNamedWeights::const_iterator delay_iter_s2w = delay_iter_weights->second.find(best_guess_link.trip_id_);
-                            if (delay_iter_s2w != delay_iter_weights->second.end()) {
-                                link_cost = tallyLinkCost(best_guess_link.trip_id_, path_spec, trace_file, delay_iter_s2w->second, delay_attr);
-                            }
-                        }
-                    }
-
-                    // This is for if we calculate the transfer penalty on the transit links.
-                    // I think we can't do this as it's problematic
-                    // TODO: devise test to demonstrate
-                    if ((best_guess_link.deparr_mode_ == MODE_ACCESS) || (best_guess_link.deparr_mode_ == MODE_EGRESS)) {
-                        link_attr["transfer_penalty"] = 0.0;
-                    } else {
-                        link_attr["transfer_penalty"] = 1.0;
-                    }
+                    link_attr[ATTR_IN_VEHICLE_TIME_MIN] = in_vehicle_time;
+                    link_attr[ATTR_OVERCAP            ] = overcap;
+                    link_attr[ATTR_AT_CAPACITY        ] = at_capacity;
 
-                    link_cost = link_cost + tallyLinkCost(trip_info.supply_mode_num_, path_spec, trace_file, named_weights, link_attr);
+                    link_cost = delay_cost + tallyLinkCost<TRACE>(trip_info.supply_mode_num_, path_spec, trace_file, link_weights, link_attr);
                     cost      = current_stop_state.hyperpathCost(false) + link_cost;
 
                 }
                 // deterministic: label = cost = total time, just additive
                 else {
                     link_cost   = in_vehicle_time + wait_time;
-                    cost        = current_stop_state.lowestCostStopState(false).cost_ + link_cost;
+                    cost        = current_stop_state.label(false).cost_ + link_cost;
                 }
 
                 StopState ss(
@@ -1331,24 +1952,23 @@ namespace fasttrips {
                     label_iteration,                // label iteration
                     arrdep_time                     // arrival/departure time
                 );
-                addStopState(path_spec, trace_file, board_alight_stop, ss, &current_stop_state, stop_states, label_stop_queue);
+                addStopState<TRACE>(path_spec, trace_file, board_alight_stop, ss, &current_stop_state, stop_states, label_stop_queue);
 
             }
-            trips_done.insert(it->trip_id_);
         }
     }
 
+    template <bool TRACE, bool HYPERPATH>
     int PathFinder::labelStops(
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
-        const std::map<int,int>& reachable_final_stops,
+        std::vector<FinalStops>& final_stops,
         StopStates& stop_states,
+        VisitedMap& trips_reached,
         LabelStopQueue& label_stop_queue,
         int& max_process_count) const
     {
         int label_iterations = 1;
-        std::tr1::unordered_set<int> stop_done;
-        std::tr1::unordered_set<int> trips_done;
         double dir_factor = path_spec.outbound_ ? 1.0 : -1.0;
         LabelStop last_label_stop;
 
@@ -1368,17 +1988,17 @@ namespace fasttrips {
             *                     from stop *predecessor*
             *                     and the total cost from the origin TAZ to the *stop_id* is *label*
             **************************************************************************************/
-            LabelStop current_label_stop = label_stop_queue.pop_top(stop_num_to_str_, path_spec.trace_, trace_file);
+            LabelStop current_label_stop = label_stop_queue.pop_top(stop_num_to_str_, TRACE, trace_file);
 
             // if we just processed this one, then skip since it'll be a no-op
             if ((current_label_stop.stop_id_ == last_label_stop.stop_id_) && (current_label_stop.is_trip_ == last_label_stop.is_trip_)) { continue; }
 
             // hyperpath only
-            if (path_spec.hyperpath_) {
+            if (HYPERPATH) {
                 // have we hit the configured limit?
                 if ((STOCH_MAX_STOP_PROCESS_COUNT_ > 0) &&
                     (stop_states[current_label_stop.stop_id_].processCount(current_label_stop.is_trip_) == STOCH_MAX_STOP_PROCESS_COUNT_)) {
-                    if (path_spec.trace_) {
+                    if (TRACE) {
                         trace_file << "Pulling from label_stop_queue but stop " << stop_num_to_str_.find(current_label_stop.stop_id_)->second;
                         trace_file << " is_trip " << current_label_stop.is_trip_;
                         trace_file << " has been processed the limit " << STOCH_MAX_STOP_PROCESS_COUNT_ << " times so skipping." << std::endl;
@@ -1393,11 +2013,11 @@ namespace fasttrips {
             // current_stop_state is a hyperlink
             Hyperlink& current_stop_state = stop_states[current_label_stop.stop_id_];
 
-            if (path_spec.trace_) {
+            if (TRACE) {
                 trace_file << "Pulling from label_stop_queue (iteration " << std::setw( 6) << std::setfill(' ') << label_iterations;
                 trace_file << ", stop " << stop_num_to_str_.find(current_label_stop.stop_id_)->second;
                 trace_file << ", is_trip " << current_label_stop.is_trip_;
-                if (path_spec.hyperpath_) {
+                if (HYPERPATH) {
                     trace_file << ", label ";
                     trace_file << std::setprecision(6) << current_label_stop.label_;
                 }
@@ -1414,32 +2034,38 @@ namespace fasttrips {
             // if the low cost is trip ids, process transfers
             if (current_label_stop.is_trip_)
             {
-                updateStopStatesForTransfers(path_spec,
-                                             trace_file,
-                                             stop_states,
-                                             label_stop_queue,
-                                             label_iterations,
-                                             current_label_stop);
-
-                updateStopStatesForFinalLinks(path_spec,
-                                              trace_file,
-                                              reachable_final_stops,
-                                              stop_states,
-                                              label_stop_queue,
-                                              label_iterations,
-                                              current_label_stop,
-                                              est_max_path_cost);
+                updateStopStatesForTransfers<TRACE, HYPERPATH>(path_spec,
+                                                        trace_file,
+                                                        stop_states,
+                                                        label_stop_queue,
+                                                        label_iterations,
+                                                        current_label_stop);
+
+                for (size_t final_num = 0; final_num < final_stops.size(); ++final_num) {
+                    updateStopStatesForFinalLinks<TRACE, HYPERPATH>(path_spec,
+                                                             trace_file,
+                                                             final_stops[final_num],
+                                                             stop_states,
+                                                             label_stop_queue,
+                                                             label_iterations,
+                                                             current_label_stop);
+                }
+                // we're only done when we're past useful paths for every end TAZ
+                est_max_path_cost = final_stops.empty() ? MAX_COST : final_stops[0].est_max_path_cost_;
+                for (size_t final_num = 1; final_num < final_stops.size(); ++final_num) {
+                    est_max_path_cost = std::max(est_max_path_cost, final_stops[final_num].est_max_path_cost_);
+                }
             }
             // else the low cost is walk links, so process trips
             else
             {
-                updateStopStatesForTrips(path_spec,
-                                         trace_file,
-                                         stop_states,
-                                         label_stop_queue,
-                                         label_iterations,
-                                         current_label_stop,
-                                         trips_done);
+                updateStopStatesForTrips<TRACE, HYPERPATH>(path_spec,
+                                                    trace_file,
+                                                    stop_states,
+                                                    label_stop_queue,
+                                                    label_iterations,
+                                                    current_label_stop,
+                                                    trips_reached);
             }
 
             //  Done with this label iteration!
@@ -1448,9 +2074,11 @@ namespace fasttrips {
             last_label_stop = current_label_stop;
 
             // Should we call it a day?
-            if (current_label_stop.label_ > 2*est_max_path_cost) {
-                if (path_spec.trace_) {
-                    trace_file << "ENDING LABELING LOOP.  label = " << current_label_stop.label_ << " > 2*est_max_path_cost = " << est_max_path_cost << std::endl;
+            // (the priority is the label plus the lower bound on the rest of the path, so this stop and everything
+            // after it is past useful paths)
+            if (current_label_stop.priority_ > 2*est_max_path_cost) {
+                if (TRACE) {
+                    trace_file << "ENDING LABELING LOOP.  label + lower bound = " << current_label_stop.priority_ << " > 2*est_max_path_cost = " << est_max_path_cost << std::endl;
                 }
                 break;
             }
@@ -1458,15 +2086,42 @@ namespace fasttrips {
         return label_iterations;
     }
 
+    int PathFinder::labelStops(
+        const PathSpecification& path_spec,
+        std::ofstream& trace_file,
+        std::vector<FinalStops>& final_stops,
+        StopStates& stop_states,
+        VisitedMap& trips_reached,
+        LabelStopQueue& label_stop_queue,
+        int& max_process_count) const
+    {
+        // the traced and untraced requests get their own copies of the labeling loop, so the untraced one has no tracing,
+        // and so do deterministic and stochastic, so the deterministic one only keeps labels
+        if (path_spec.trace_) {
+            if (path_spec.hyperpath_) {
+                return labelStops<true,  true >(path_spec, trace_file, final_stops, stop_states, trips_reached, label_stop_queue, max_process_count);
+            }
+            return labelStops<true,  false>(path_spec, trace_file, final_stops, stop_states, trips_reached, label_stop_queue, max_process_count);
+        }
+        if (path_spec.hyperpath_) {
+            return labelStops<false, true >(path_spec, trace_file, final_stops, stop_states, trips_reached, label_stop_queue, max_process_count);
+        }
+        return labelStops<false, false>(path_spec, trace_file, final_stops, stop_states, trips_reached, label_stop_queue, max_process_count);
+    }
+
     // Returns false if no stops are reachable
     bool PathFinder::setReachableFinalStops(
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
-        std::map<int, int>& reachable_final_stops) const
+        FinalStops& final_stops) const
     {
         int end_taz_id = path_spec.outbound_ ? path_spec.origin_taz_id_ : path_spec.destination_taz_id_;
         double dir_factor = path_spec.outbound_ ? 1.0 : -1.0;
 
+        final_stops.end_taz_id_         = end_taz_id;
+        final_stops.est_max_path_cost_  = MAX_COST;
+        final_stops.final_links_        = NULL;
+
         // are there any egress/access links?
         TAZSupplyStopToAttr::const_iterator iter_tss2a = taz_access_links_.find(end_taz_id);
         if (iter_tss2a == taz_access_links_.end()) {
@@ -1475,10 +2130,10 @@ namespace fasttrips {
 
         // Are there any supply modes for this demand mode?
         UserClassPurposeMode ucpm = {
-            path_spec.user_class_,
-            path_spec.purpose_,
+            path_spec.user_class_num_,
+            path_spec.purpose_num_,
             path_spec.outbound_ ? MODE_ACCESS: MODE_EGRESS,
-            path_spec.outbound_ ? path_spec.access_mode_ : path_spec.egress_mode_
+            path_spec.outbound_ ? path_spec.access_mode_num_ : path_spec.egress_mode_num_
         };
         WeightLookup::const_iterator iter_weights = weight_lookup_.find(ucpm);
         if (iter_weights == weight_lookup_.end()) {
@@ -1488,45 +2143,15 @@ namespace fasttrips {
             return false;
         }
 
-        // Iterate through valid supply modes
-        SupplyModeToNamedWeights::const_iterator iter_s2w;
-        for (iter_s2w  = iter_weights->second.begin();
-             iter_s2w != iter_weights->second.end(); ++iter_s2w) {
-            int supply_mode_num = iter_s2w->first;
-
-            if (path_spec.trace_) {
-                trace_file << "Weights exist for supply mode " << supply_mode_num << " => ";
-                trace_file << mode_num_to_str_.find(supply_mode_num)->second << std::endl;
-            }
-
-            // Are there any egress/access links for the supply mode?
-            SupplyStopToAttr::const_iterator iter_ss2a = iter_tss2a->second.find(supply_mode_num);
-            if (iter_ss2a == iter_tss2a->second.end()) {
-                if (path_spec.trace_) {
-                    trace_file << "No links for this supply mode" << std::endl;
-                }
-                continue;
-            }
-
-            // Iterate through the links for the given supply mode
-            StopToAttr::const_iterator link_iter;
-            for (link_iter  = iter_ss2a->second.begin();
-                 link_iter != iter_ss2a->second.end(); ++link_iter)
-            {
-                int     stop_id                 = link_iter->first;
-                if (reachable_final_stops.count(stop_id) == 0) {
-                    reachable_final_stops[stop_id] = 0;
-                } else {
-                    reachable_final_stops[stop_id] += 1;
-                }
-
-                if (path_spec.trace_) {
-                    trace_file << "Stop " << stop_id << " reachable by supply mode " << supply_mode_num << std::endl;
-                }
-            }
+        // traced requests go around the cache, like in initializeStopStates
+        if (path_spec.trace_) {
+            buildTazLinks<true>(path_spec, trace_file, end_taz_id, iter_weights->second, final_stops.traced_links_);
+            final_stops.final_links_ = &final_stops.traced_links_;
+        } else {
+            final_stops.final_links_ = &tazLinks(path_spec, trace_file, end_taz_id, ucpm, iter_weights->second);
         }
 
-        return (reachable_final_stops.size() > 0);
+        return (final_stops.final_links_->stops_.size() > 0);
     }
 
     // This is currently not being used because it has been replaced with updateStopStatesForFinalLinks() but
@@ -1549,10 +2174,10 @@ namespace fasttrips {
 
         // Are there any supply modes for this demand mode?
         UserClassPurposeMode ucpm = {
-            path_spec.user_class_,
-            path_spec.purpose_,
+            path_spec.user_class_num_,
+            path_spec.purpose_num_,
             path_spec.outbound_ ? MODE_ACCESS: MODE_EGRESS,
-            path_spec.outbound_ ? path_spec.access_mode_ : path_spec.egress_mode_
+            path_spec.outbound_ ? path_spec.access_mode_num_ : path_spec.egress_mode_num_
         };
         WeightLookup::const_iterator iter_weights = weight_lookup_.find(ucpm);
         if (iter_weights == weight_lookup_.end()) {
@@ -1568,7 +2193,7 @@ namespace fasttrips {
         }
 
         // Iterate through valid supply modes
-        SupplyModeToNamedWeights::const_iterator iter_s2w;
+        SupplyModeToLinkWeights::const_iterator iter_s2w;
         for (iter_s2w  = iter_weights->second.begin();
              iter_s2w != iter_weights->second.end(); ++iter_s2w) {
             int supply_mode_num = iter_s2w->first;
@@ -1594,19 +2219,19 @@ namespace fasttrips {
             {
                 int     stop_id                 = link_iter->first;
                 Attributes link_attr            = link_iter->second;
-                link_attr["preferred_delay_min"]= 0.0;
+                link_attr[ATTR_PREFERRED_DELAY_MIN]= 0.0;
 
-                double  access_time             = link_attr.find("time_min")->second;
+                double  access_time             = link_attr[ATTR_TIME_MIN];
 
                 double  earliest_dep_latest_arr = PathFinder::MAX_DATETIME;
 
                 bool    use_new_state           = false;
                 double  deparr_time, link_cost, cost;
 
-                StopStates::const_iterator stop_states_iter = stop_states.find(stop_id);
-                if (stop_states_iter == stop_states.end()) { continue; }
+                const Hyperlink* stop_state = stop_states.find(stop_id);
+                if (stop_state == NULL) { continue; }
 
-                const Hyperlink& current_stop_state = stop_states_iter->second;
+                const Hyperlink& current_stop_state = *stop_state;
                 // if there are no trip links, this isn't viable
                 if (current_stop_state.size(true) == 0) { continue; }
 
@@ -1641,11 +2266,9 @@ namespace fasttrips {
                     // capacity check
                     if (path_spec.outbound_)
                     {
-                        TripStop ts = { current_stop_state.lowestCostStopState(true).deparr_mode_, current_stop_state.lowestCostStopState(true).seq_, stop_id };
-                        std::map<TripStop, double, struct TripStopCompare>::const_iterator bwi = bump_wait_.find(ts);
-                        if (bwi != bump_wait_.end()) {
-                            // time a bumped passenger started waiting
-                            double latest_time = bwi->second;
+                        // time a bumped passenger started waiting
+                        double latest_time;
+                        if (getBumpWait(current_stop_state.lowestCostStopState(true).deparr_mode_, current_stop_state.lowestCostStopState(true).seq_, latest_time)) {
                             // we can't come in time
                             if (deparr_time - Hyperlink::TIME_WINDOW_ > latest_time) { continue; }
                             // leave earlier -- to get in line 5 minutes before bump wait time
@@ -1680,23 +2303,25 @@ namespace fasttrips {
         const PathSpecification& path_spec,
         std::ofstream& trace_file,
         const StopStates& stop_states,
+        RandomGenerator& random_generator,
+        ProbabilityCache& prob_cache,
         Path& path) const
     {
         int    start_state_id   = path_spec.outbound_ ? path_spec.origin_taz_id_ : path_spec.destination_taz_id_;
         double dir_factor       = path_spec.outbound_ ? 1 : -1;
 
-        const Hyperlink& taz_state = stop_states.find(start_state_id)->second;
+        const Hyperlink& taz_state = *stop_states.find(start_state_id);
         double taz_label        = taz_state.hyperpathCost(false);
 
         // setup access/egress probabilities
-        std::vector<ProbabilityStopState> access_cum_prob;
-        taz_state.setupProbabilities(path_spec, trace_file, *this, access_cum_prob);
-        if (access_cum_prob.size() == 0) { return false; }
+        const std::vector<ProbabilityStopState>& taz_cum_prob =
+            linkProbabilities(path_spec, trace_file, taz_state, start_state_id, NULL, -1, prob_cache);
+        if (taz_cum_prob.size() == 0) { return false; }
 
         // choose the state and store it
         if (path_spec.trace_) { trace_file << " -> Chose access/egress " << std::endl; }
         path.addLink(start_state_id,
-                     taz_state.chooseState(path_spec, trace_file, access_cum_prob),
+                     taz_state.chooseState(path_spec, trace_file, taz_cum_prob, random_generator),
                      trace_file, path_spec, *this);
 
         // trip_id shouldn't repeat
@@ -1708,8 +2333,8 @@ namespace fasttrips {
             const StopState& ss = path.back().second;
             int current_stop_id = ss.stop_succpred_;
 
-            StopStates::const_iterator ssi = stop_states.find(current_stop_id);
-            if (ssi == stop_states.end()) { return false; }
+            const Hyperlink* ssi = stop_states.find(current_stop_id);
+            if (ssi == NULL) { return false; }
 
             if (path_spec.trace_) {
                 trace_file << "current_stop=" << stop_num_to_str_.find(current_stop_id)->second;
@@ -1721,16 +2346,16 @@ namespace fasttrips {
             }
 
             // setup probabilities
-            std::vector<ProbabilityStopState> stop_cum_prob;
-            const Hyperlink& current_hyperlink = ssi->second;
-            current_hyperlink.setupProbabilities(path_spec, trace_file, *this, stop_cum_prob, &ss, last_trip_id);
+            const Hyperlink& current_hyperlink = *ssi;
+            const std::vector<ProbabilityStopState>& cum_prob =
+                linkProbabilities(path_spec, trace_file, current_hyperlink, current_stop_id, &ss, last_trip_id, prob_cache);
 
-            if (stop_cum_prob.size() == 0) { return false; }
+            if (cum_prob.size() == 0) { return false; }
 
             // choose next link and add it to the path
             if (path_spec.trace_) { trace_file << " -> Chose stop link " << std::endl; }
             path.addLink(current_stop_id,
-                         current_hyperlink.chooseState(path_spec, trace_file, stop_cum_prob, &ss),
+                         current_hyperlink.chooseState(path_spec, trace_file, cum_prob, random_generator, &ss),
                          trace_file, path_spec, *this);
 
             // are we done?
@@ -1747,12 +2372,41 @@ namespace fasttrips {
         return true;
     }
 
+    const std::vector<ProbabilityStopState>& PathFinder::linkProbabilities(
+        const PathSpecification& path_spec,
+        std::ofstream& trace_file,
+        const Hyperlink& hyperlink,
+        int stop_id,
+        const StopState* prev_link,
+        int last_trip_id,
+        ProbabilityCache& prob_cache) const
+    {
+        ProbabilityKey pk = { stop_id, false, false, 0.0, -1 };
+        if (prev_link) {
+            pk.has_prev_link_ = true;
+            pk.trip_links_    = !isTrip(prev_link->deparr_mode_);
+            pk.prev_time_     = prev_link->arrdep_time_;
+            pk.last_trip_id_  = last_trip_id;
+        }
+
+        ProbabilityCache::iterator pci = prob_cache.find(pk);
+        if (pci != prob_cache.end()) {
+            if (path_spec.trace_) { trace_file << "Using " << pci->second.size() << " cached link probabilities" << std::endl; }
+            return pci->second;
+        }
+
+        std::vector<ProbabilityStopState>& probabilities = prob_cache[pk];
+        hyperlink.setupProbabilities(path_spec, trace_file, *this, probabilities, prev_link, last_trip_id);
+        return probabilities;
+    }
+
     Path PathFinder::choosePath(const PathSpecification& path_spec,
         std::ofstream& trace_file,
         PathSet& paths,
-        int max_prob_i) const
+        int max_prob_i,
+        RandomGenerator& random_generator) const
     {
-        int random_num = rand();
+        int random_num = random_generator.next();
         if (path_spec.trace_) { trace_file << "random_num " << random_num << " -> "; }
 
         // mod it by max prob
@@ -1768,20 +2422,50 @@ namespace fasttrips {
         printf("PathFinder::choosePath() This should never happen!\n");
     }
 
+    bool PathFinder::stopDrawing(
+        const PathSpecification&    path_spec,
+        std::ofstream&              trace_file,
+        const PathCounter&          path_counter,
+        int                         paths_drawn,
+        int                         stall_draws) const
+    {
+        if ((STOCH_PATHSET_STALL_DRAWS_ > 0) && (stall_draws >= STOCH_PATHSET_STALL_DRAWS_)) {
+            if (path_spec.trace_) {
+                trace_file << "Stopping draws: " << stall_draws << " draws in a row found no new path" << std::endl;
+            }
+            return true;
+        }
+        // Good-Turing: the chance of drawing a path we haven't seen is about the share of paths drawn that were only drawn once.
+        // With fewer than 1/threshold paths drawn, that's mostly noise, so it waits until then.
+        if ((STOCH_PATHSET_UNSEEN_PROBABILITY_ > 0) && (paths_drawn*STOCH_PATHSET_UNSEEN_PROBABILITY_ >= 1.0)) {
+            double unseen_probability = static_cast<double>(path_counter.numSingletons())/paths_drawn;
+            if (unseen_probability < STOCH_PATHSET_UNSEEN_PROBABILITY_) {
+                if (path_spec.trace_) {
+                    trace_file << "Stopping draws: estimated probability of a new path " << unseen_probability;
+                    trace_file << " after " << paths_drawn << " paths drawn" << std::endl;
+                }
+                return true;
+            }
+        }
+        return false;
+    }
+
     // Return success
     bool PathFinder::getPathSet(
         const PathSpecification&    path_spec,
         std::ofstream&              trace_file,
         const StopStates&           stop_states,
-        PathSet&                    pathset) const
+        PathSet&                    pathset,
+        int&                        pathset_draws) const
     {
+        pathset_draws = 0;
         int end_taz_id = path_spec.outbound_ ? path_spec.origin_taz_id_ : path_spec.destination_taz_id_;
 
         // no taz states -> no path found
-        StopStates::const_iterator ssi_iter = stop_states.find(end_taz_id);
-        if (ssi_iter == stop_states.end()) { return false; }
+        const Hyperlink* ssi = stop_states.find(end_taz_id);
+        if (ssi == NULL) { return false; }
 
-        const Hyperlink& taz_state = ssi_iter->second;
+        const Hyperlink& taz_state = *ssi;
         if (taz_state.size() == 0) { return false; }
 
         // experimental-- look at the low cost path?
@@ -1798,13 +2482,23 @@ namespace fasttrips {
         if (path_spec.hyperpath_)
         {
             double logsum = 0;
-            // random seed
-            srand(path_spec.path_id_);
+            // each request gets its own draws, so the paths don't depend on what else is running
+            RandomGenerator random_generator(path_spec.path_id_, path_spec.iteration_);
+            // reused by each draw so it only allocates until it's big enough
+            Path             new_path(path_spec.outbound_, true);
+            // link probabilities only depend on the stop states, so the draws share them
+            ProbabilityCache prob_cache;
+            // distinct paths found; these go into the pathset, which orders them by cost, once we're done
+            PathCounter      path_counter;
+            // draws that found a path, and consecutive draws that didn't find a new one
+            int              paths_drawn = 0;
+            int              stall_draws = 0;
             // find a *set of Paths*
             for (int attempts = 1; attempts <= STOCH_PATHSET_SIZE_; ++attempts)
             {
-                Path new_path(path_spec.outbound_, true);
-                bool path_found = hyperpathGeneratePath(path_spec, trace_file, stop_states, new_path);
+                pathset_draws = attempts;
+                new_path.clear();
+                bool path_found = hyperpathGeneratePath(path_spec, trace_file, stop_states, random_generator, prob_cache, new_path);
 
                 if (path_found) {
                     // we have to calculate the cost in order to find it, since it's ordered by cost also
@@ -1817,22 +2511,26 @@ namespace fasttrips {
                         new_path.print(trace_file, path_spec, *this);
                         trace_file << std::endl;
                     }
-                    // do we already have this?  if so, increment
-                    PathSet::iterator paths_iter = pathset.find(new_path);
-                    if (paths_iter != pathset.end()) {
-                        paths_iter->second.count_ += 1;
-                    } else {
-                        PathInfo pi = { 1, 0, 0 };  // count is 1
-                        pathset[new_path] = pi;
-
+                    // do we already have this?  if not, it's new
+                    bool is_new = path_counter.add(new_path);
+                    if (is_new) {
                         logsum += exp(-1.0*Hyperlink::STOCH_DISPERSION_*new_path.cost());
                     }
-                    if (path_spec.trace_) { trace_file << "pathsset size = " << pathset.size() << " new? " << (paths_iter == pathset.end()) << std::endl; }
+                    paths_drawn += 1;
+                    stall_draws  = is_new ? 0 : stall_draws + 1;
+                    if (path_spec.trace_) { trace_file << "pathsset size = " << path_counter.size() << " new? " << is_new << std::endl; }
                 } else {
+                    stall_draws += 1;
                     if (path_spec.trace_) {
                         trace_file << "----> No path found" << std::endl;
                     }
                 }
+                if (stopDrawing(path_spec, trace_file, path_counter, paths_drawn, stall_draws)) { break; }
+            }
+
+            for (size_t path_num = 0; path_num < path_counter.size(); ++path_num) {
+                PathInfo pi = { path_counter.count(path_num), 0, 0 };
+                pathset[path_counter.path(path_num)] = pi;
             }
 
             if (logsum == 0) { return false; } // fail
@@ -1862,7 +2560,7 @@ namespace fasttrips {
                 }
 
                 // why?  :p
-                int prob_i = static_cast<int>(RAND_MAX*paths_iter->second.probability_);
+                int prob_i = static_cast<int>(RandomGenerator::MAX*paths_iter->second.probability_);
 
                 cum_prob += prob_i;
                 paths_iter->second.prob_i_ = cum_prob;
@@ -1924,15 +2622,15 @@ namespace fasttrips {
             int final_state_type = path_spec.outbound_ ? MODE_EGRESS : MODE_ACCESS;
 
             Path path(path_spec.outbound_, true);
-            path.addLink(end_taz_id, taz_state.lowestCostStopState(false), trace_file, path_spec, *this);
+            path.addLink(end_taz_id, taz_state.label(false), trace_file, path_spec, *this);
 
             while (path.back().second.deparr_mode_ != final_state_type)
             {
                 const StopState& last_link = path.back().second;
                 int stop_id = last_link.stop_succpred_;
-                StopStates::const_iterator ssi = stop_states.find(stop_id);
+                const Hyperlink* ssi = stop_states.find(stop_id);
                 path.addLink(stop_id,
-                             ssi->second.lowestCostStopState(!isTrip(last_link.deparr_mode_)),
+                             ssi->label(!isTrip(last_link.deparr_mode_)),
                              trace_file,
                              path_spec, *this);
 
@@ -1955,15 +2653,14 @@ namespace fasttrips {
      */
     double PathFinder::getScheduledDeparture(int trip_id, int stop_id, int sequence) const
     {
-        std::map<int, std::vector<TripStopTime> >::const_iterator tsti = trip_stop_times_.find(trip_id);
-        if (tsti == trip_stop_times_.end()) { return -1; }
+        TripStopTimeRange tstr = getTripStopTimes(trip_id);
 
-        for (size_t stt_index = 0; stt_index < tsti->second.size(); ++stt_index)
+        for (const TripStopTime* tst = tstr.first; tst != tstr.second; ++tst)
         {
-            if (tsti->second[stt_index].stop_id_ != stop_id) { continue; }
+            if (tst->stop_id_ != stop_id) { continue; }
             // trip id matches and stop id matches -- does sequence match or is it unspecified?
-            if ((sequence < 0) || (sequence == tsti->second[stt_index].seq_)) {
-                return tsti->second[stt_index].depart_time_;
+            if ((sequence < 0) || (sequence == tst->seq_)) {
+                return tst->depart_time_;
             }
         }
         return -1;
@@ -1973,21 +2670,23 @@ namespace fasttrips {
      * If outbound, then we're searching backwards, so this returns trips that arrive at the stop in time to depart at timepoint (timepoint-TIME_WINDOW_, timepoint]
      * If inbound,  then we're searching forwards,  so this returns trips that depart at the stop time after timepoint           [timepoint, timepoint+TIME_WINDOW_)
      */
-    void PathFinder::getTripsWithinTime(int stop_id, bool outbound, double timepoint, std::vector<TripStopTime>& return_trips) const
+    TripStopTimeRange PathFinder::getTripsWithinTime(int stop_id, bool outbound, double timepoint) const
     {
         // are there any trips for this stop?
-        std::map<int, std::vector<TripStopTime> >::const_iterator mapiter = stop_trip_times_.find(stop_id);
-        if (mapiter == stop_trip_times_.end()) {
-            return;
+        if ((stop_id < 0) || (stop_id+1 >= static_cast<int>(stop_trip_time_offsets_.size())) ||
+            (stop_trip_time_offsets_[stop_id] == stop_trip_time_offsets_[stop_id+1])) {
+            return TripStopTimeRange(NULL, NULL);
         }
-        for (std::vector<TripStopTime>::const_iterator it  = mapiter->second.begin();
-                                                       it != mapiter->second.end();   ++it) {
-            if (outbound && (it->arrive_time_ <= timepoint) && (it->arrive_time_ > timepoint-Hyperlink::TIME_WINDOW_)) {
-                return_trips.push_back(*it);
-            } else if (!outbound && (it->depart_time_ >= timepoint) && (it->depart_time_ < timepoint+Hyperlink::TIME_WINDOW_)) {
-                return_trips.push_back(*it);
-            }
+        const TripStopTime* base  = outbound ? &stop_trip_arrivals_[0] : &stop_trip_departures_[0];
+        const TripStopTime* begin = base + stop_trip_time_offsets_[stop_id];
+        const TripStopTime* end   = base + stop_trip_time_offsets_[stop_id+1];
+
+        if (outbound) {
+            return TripStopTimeRange(std::upper_bound(begin, end, timepoint-Hyperlink::TIME_WINDOW_, TripStopTimeArrivalCompare()),
+                                     std::upper_bound(begin, end, timepoint,                         TripStopTimeArrivalCompare()));
         }
+        return TripStopTimeRange(std::lower_bound(begin, end, timepoint,                         TripStopTimeDepartureCompare()),
+                                 std::lower_bound(begin, end, timepoint+Hyperlink::TIME_WINDOW_, TripStopTimeDepartureCompare()));
     }
 
     /*
@@ -2037,7 +2736,7 @@ namespace fasttrips {
             ostr << std::setw(10) << std::setfill(' ') << "Transfer";
         } else if (mode == MODE_TRANSIT) {
             // show the supply mode
-            int supply_mode_num = trip_info_.find(trip_id)->second.supply_mode_num_;
+            int supply_mode_num = trip_info_[trip_id].supply_mode_num_;
             ostr << std::setw(10) << std::setfill(' ') << mode_num_to_str_.find(supply_mode_num)->second;
         } else {
             // trip
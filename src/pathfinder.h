@@ -5,6 +5,8 @@
  */
 
 #include <ctime>
+#include <limits>
+#include <list>
 #include <map>
 #include <vector>
 #include <queue>
@@ -14,15 +16,9 @@
 #include "pathspec.h"
 #include "LabelStopQueue.h"
 #include "hyperlink.h"
+#include "mutex.h"
 #include "path.h"
-
-#if __APPLE__
-#include <tr1/unordered_set>
-#elif __linux__
-#include <tr1/unordered_set>
-#else
-#include <unordered_set>
-#endif
+#include "visitedset.h"
 
 #if _WIN32
 // suppress warning C4503: decorated name length exceeded, name was truncated
@@ -31,12 +27,12 @@
 
 namespace fasttrips {
 
-    /// Weight lookup
+    /// Weight lookup.  The strings are interned; see PathFinder::demandStringNum()
     typedef struct {
-        std::string     user_class_;
-        std::string     purpose_;
+        int             user_class_;
+        int             purpose_;
         DemandModeType  demand_mode_type_;
-        std::string     demand_mode_;
+        int             demand_mode_;
     } UserClassPurposeMode;
 
     /// Comparator to enable the fasttrips::WeightLookup to use UserClassMode as a lookup
@@ -55,13 +51,84 @@ namespace fasttrips {
         }
     };
 
+    /**
+     * Comparator for path specifications that can share one labeling; see PathFinder::findPathSetGroup
+     * and the PathFinder label cache.  Specifications are equivalent if they differ only in their end TAZ
+     * (origin for outbound, destination for inbound), their passenger and path ids and their iteration.
+     */
+    struct SharedLabelingCompare {
+        // less than
+        bool operator()(const PathSpecification &ps1, const PathSpecification &ps2) const {
+            int start_taz1 = ps1.outbound_ ? ps1.destination_taz_id_ : ps1.origin_taz_id_;
+            int start_taz2 = ps2.outbound_ ? ps2.destination_taz_id_ : ps2.origin_taz_id_;
+            if (ps1.hyperpath_      < ps2.hyperpath_     ) { return true;  }
+            if (ps1.hyperpath_      > ps2.hyperpath_     ) { return false; }
+            if (ps1.outbound_       < ps2.outbound_      ) { return true;  }
+            if (ps1.outbound_       > ps2.outbound_      ) { return false; }
+            if (start_taz1          < start_taz2         ) { return true;  }
+            if (start_taz1          > start_taz2         ) { return false; }
+            if (ps1.preferred_time_ < ps2.preferred_time_) { return true;  }
+            if (ps1.preferred_time_ > ps2.preferred_time_) { return false; }
+            if (ps1.user_class_     < ps2.user_class_    ) { return true;  }
+            if (ps1.user_class_     > ps2.user_class_    ) { return false; }
+            if (ps1.purpose_        < ps2.purpose_       ) { return true;  }
+            if (ps1.purpose_        > ps2.purpose_       ) { return false; }
+            if (ps1.access_mode_    < ps2.access_mode_   ) { return true;  }
+            if (ps1.access_mode_    > ps2.access_mode_   ) { return false; }
+            if (ps1.transit_mode_   < ps2.transit_mode_  ) { return true;  }
+            if (ps1.transit_mode_   > ps2.transit_mode_  ) { return false; }
+            if (ps1.egress_mode_    < ps2.egress_mode_   ) { return true;  }
+            if (ps1.egress_mode_    > ps2.egress_mode_   ) { return false; }
+            return false;
+        }
+    };
+
+    /**
+     * Attribute numbers for the link attributes that the path finding sets or reads itself.
+     * Other attributes are numbered after these, as they're found in the weights.
+     */
+    enum AttributeNum {
+        ATTR_TIME_MIN = 0,
+        ATTR_WALK_TIME_MIN,
+        ATTR_DRIVE_TIME_MIN,
+        ATTR_ELEVATION_GAIN,
+        ATTR_PREFERRED_DELAY_MIN,
+        ATTR_IN_VEHICLE_TIME_MIN,
+        ATTR_WAIT_TIME_MIN,
+        ATTR_OVERCAP,
+        ATTR_AT_CAPACITY,
+        ATTR_TRANSFER_PENALTY,
+        NUM_FIXED_ATTRIBUTES
+    };
+
+    /// A weight applied to one attribute, see fasttrips::Attributes
+    typedef struct {
+        int     attribute_num_;         ///< Index into fasttrips::Attributes
+        double  weight_;                ///< Weight value
+    } AttributeWeight;
+
     // This is a lot of naming but it does make iterator construction easier
-    typedef std::map<std::string, double> NamedWeights;
-    typedef std::map<int, NamedWeights> SupplyModeToNamedWeights;
-    typedef std::map< UserClassPurposeMode, SupplyModeToNamedWeights, struct fasttrips::UCPMCompare > WeightLookup;
+    /// The weights for a link, in weight name order
+    typedef std::vector<AttributeWeight> LinkWeights;
+    typedef std::map<int, LinkWeights> SupplyModeToLinkWeights;
+    typedef std::map< UserClassPurposeMode, SupplyModeToLinkWeights, struct fasttrips::UCPMCompare > WeightLookup;
+
+    /// Link attribute values indexed by attribute number.  Every instance has PathFinder::numAttributes() values;
+    /// attributes that weren't given are fasttrips::ATTRIBUTE_UNSET.
+    typedef std::vector<double> Attributes;
+    /// Value for attributes that weren't given
+    const double ATTRIBUTE_UNSET = std::numeric_limits<double>::quiet_NaN();
+    /// Returns false if the attribute value is fasttrips::ATTRIBUTE_UNSET
+    inline bool isAttributeSet(double value) { return value == value; }
+    /// Returns true if any of the given attribute values are set
+    inline bool anyAttributeSet(const double* values, int num_values) {
+        for (int value_num = 0; value_num < num_values; ++value_num) {
+            if (isAttributeSet(values[value_num])) { return true; }
+        }
+        return false;
+    }
 
-    /// Access/Egress information: taz id -> supply_mode -> stop id -> attribute map
-    typedef std::map<std::string, double> Attributes;
+    /// Access/Egress information: taz id -> supply_mode -> stop id -> attributes
     typedef std::map<int, Attributes> StopToAttr;
     typedef std::map<int, StopToAttr> SupplyStopToAttr;
     typedef std::map<int, SupplyStopToAttr> TAZSupplyStopToAttr;
@@ -69,6 +136,35 @@ namespace fasttrips {
     // Transfer information: stop id -> stop id -> attribute map
     typedef std::map<int, StopToAttr> StopStopToAttr;
 
+    /// An access or egress link between a TAZ and a stop, for fasttrips::TazLinks
+    typedef struct {
+        int     stop_id_;
+        int     supply_mode_num_;
+        double  time_;          ///< Link time (fasttrips::ATTR_TIME_MIN), in minutes
+        double  cost_;          ///< Link cost for the user class, purpose and demand mode, with no preferred delay
+    } TazLink;
+
+    /// A contiguous range of fasttrips::TazLink instances, [first, second)
+    typedef std::pair<const TazLink*, const TazLink*> TazLinkRange;
+
+    /**
+     * The access or egress links between a TAZ and the stops that a user class, purpose and demand mode can use,
+     * in flat arrays.  These only depend on the network and the weights, so PathFinder::tazLinks builds them once
+     * and the requests for the TAZ look them up rather than walking PathFinder::taz_access_links_ and tallying costs.
+     */
+    struct TazLinks {
+        std::vector<TazLink>    links_;             ///< By supply mode, then by stop
+        std::vector<TazLink>    stop_links_;        ///< The same links, by stop, then by supply mode
+        std::vector<int>        stops_;             ///< The stops the links reach, in order
+        std::vector<int>        stop_link_offsets_; ///< The links for stops_[i] are stop_links_[stop_link_offsets_[i]] up to stop_link_offsets_[i+1]
+
+        /// Returns the links between the TAZ and the given stop, by supply mode.  The range is empty if there are none.
+        TazLinkRange stopLinks(int stop_id) const;
+    };
+
+    /// UserClassPurposeMode -> TAZ links
+    typedef std::map<UserClassPurposeMode, TazLinks, struct fasttrips::UCPMCompare> UCPMToTazLinks;
+
 
     /// Supply data: access/egress time and cost between TAZ and stops
     typedef struct {
@@ -100,21 +196,46 @@ namespace fasttrips {
         double  overcap_;       // number of passengers overcap
     } TripStopTime;
 
-    /// For capacity lookups: TripStop definition
-    typedef struct {
-        int     trip_id_;
-        int     seq_;
-        int     stop_id_;
-    } TripStop;
+    /// A contiguous range of fasttrips::TripStopTime instances, [first, second)
+    typedef std::pair<const TripStopTime*, const TripStopTime*> TripStopTimeRange;
 
-    /// Comparator for the PathFinder::bump_wait_ std::map
-    struct TripStopCompare {
-        bool operator()(const TripStop &ts1, const TripStop &ts2) const {
-            return ((ts1.trip_id_ < ts2.trip_id_) ||
-                    ((ts1.trip_id_ == ts2.trip_id_) && (ts1.seq_ < ts2.seq_)));
-        }
+    /// Comparator for searching fasttrips::TripStopTime vectors sorted by arrival time
+    struct TripStopTimeArrivalCompare {
+        bool operator()(const TripStopTime &tst1, const TripStopTime &tst2) const { return tst1.arrive_time_ < tst2.arrive_time_; }
+        bool operator()(const TripStopTime &tst,  double time              ) const { return tst.arrive_time_  < time;              }
+        bool operator()(double time,              const TripStopTime &tst  ) const { return time              < tst.arrive_time_;  }
+    };
+
+    /// Comparator for searching fasttrips::TripStopTime vectors sorted by departure time
+    struct TripStopTimeDepartureCompare {
+        bool operator()(const TripStopTime &tst1, const TripStopTime &tst2) const { return tst1.depart_time_ < tst2.depart_time_; }
+        bool operator()(const TripStopTime &tst,  double time              ) const { return tst.depart_time_  < time;              }
+        bool operator()(double time,              const TripStopTime &tst  ) const { return time              < tst.depart_time_;  }
     };
 
+    /// A link to or from a stop with the shortest time it takes in the supply, for the labeling lower bounds
+    typedef struct {
+        int     stop_id_;       ///< The stop at the other end of the link
+        double  time_min_;      ///< in minutes
+    } MinTimeLink;
+
+    /**
+     * Supply data: a table passed to PathFinder::initializeNetwork.  Row i has the ints
+     * index_[i*num_index_cols_, (i+1)*num_index_cols_) and the doubles values_[i*num_value_cols_, (i+1)*num_value_cols_).
+     * What the columns and strings_ mean depends on the table; see PathFinder::initializeNetwork.
+     */
+    typedef struct {
+        int                         num_rows_;
+        int                         num_index_cols_;
+        const int*                  index_;
+        int                         num_value_cols_;
+        const double*               values_;
+        std::vector<std::string>    strings_;
+    } SupplyTable;
+
+    /// PathFinder::bump_wait_ value for the trip stops no passenger was bumped from
+    const double NO_BUMP_WAIT = std::numeric_limits<double>::quiet_NaN();
+
     /** Performance information to return. */
     typedef struct {
         int     label_iterations_;              ///< Number of label iterations performed
@@ -124,8 +245,64 @@ namespace fasttrips {
         long    milliseconds_enumerating_;      ///< Number of seconds spent in enumerating
         long    workingset_bytes_;              ///< Working set size, in bytes
         long    privateusage_bytes_;            ///< Private memory usage, in bytes
+        int     label_cache_hits_;              ///< 1 if the labeling came from the label cache
+        int     label_cache_misses_;            ///< 1 if the label cache was checked and didn't have the labeling
+        int     label_cache_evictions_;         ///< Number of labelings evicted from the label cache to make room for this one
+        long    link_allocations_;              ///< Number of hyperlink link arrays allocated from the workspace arena while labeling
+        long    link_heap_allocations_;         ///< Number of chunks the workspace arena allocated from the heap while labeling
+        long    peak_workingset_bytes_;         ///< Peak working set size, in bytes
+        long    milliseconds_cpu_;              ///< CPU time spent labeling and enumerating on the path finding thread, in milliseconds
+        long    label_queue_pushes_;            ///< Number of pushes onto the label stop queue while labeling
+        long    label_queue_pops_;              ///< Number of pops from the label stop queue while labeling
+        long    trips_scanned_;                 ///< Number of trip stop times scanned by PathFinder::updateStopStatesForTrips
+        long    links_accepted_;                ///< Number of links Hyperlink::addLink accepted while labeling
+        long    links_rejected_;                ///< Number of links Hyperlink::addLink rejected while labeling
+        int     pathset_draws_;                 ///< Number of hyperpath draws PathFinder::getPathSet made for the pathset
     } PerformanceInfo;
 
+    /**
+     * An end TAZ (origin for outbound, destination for inbound) that labeling connects to, for PathFinder::labelStops.
+     */
+    typedef struct {
+        int                 end_taz_id_;                ///< The end TAZ
+        const TazLinks*     final_links_;               ///< The links between the end TAZ and the final stops.  NULL if there are none.
+        double              est_max_path_cost_;         ///< Estimate of the max path cost with a usable probability
+        TazLinks            traced_links_;              ///< Traced requests don't use the PathFinder::tazLinks cache; final_links_ points here instead
+    } FinalStops;
+
+    /**
+     * Working storage for a single PathFinder::findPathSet call.  These are kept by the PathFinder
+     * and reused by later calls (one per concurrent call), so the per-stop and per-trip arrays are
+     * allocated once rather than for every request.
+     */
+    struct PathFinderWorkspace {
+        StopStates      stop_states_;       ///< Hyperlink for each stop, indexed by stop id
+        VisitedMap      trips_reached_;     ///< Deterministic labeling without bump waits: the sequence range of each trip already scanned, indexed by trip id.  Hyperpath labeling doesn't use it.
+        LabelStopQueue  label_stop_queue_;  ///< Stops waiting to be processed while labeling
+        std::vector<double> lower_bounds_;  ///< Labeling lower bounds combined across several end TAZs, indexed by stop id
+
+        /// The end TAZ connected to a cached labeling by PathFinder::labelEndTaz, or -1
+        int             end_taz_id_;
+
+        // These are guarded by PathFinder::label_cache_mutex_
+        bool            cached_;            ///< Is this workspace's labeling in the label cache?
+        int             cache_users_;       ///< Number of requests enumerating paths from this workspace's cached labeling (0 or 1)
+
+        PathFinderWorkspace() : end_taz_id_(-1), cached_(false), cache_users_(0) {}
+    };
+
+    /// Keys of the label cache, most recently used first
+    typedef std::list<PathSpecification> LabelCacheOrder;
+
+    /// A labeling in the PathFinder label cache
+    typedef struct {
+        PathFinderWorkspace*        workspace_;     ///< The workspace with the labeled stop states
+        size_t                      bytes_;         ///< Estimated memory used by the workspace
+        LabelCacheOrder::iterator   order_iter_;    ///< Position in the fasttrips::LabelCacheOrder
+    } LabelCacheEntry;
+
+    typedef std::map<PathSpecification, LabelCacheEntry, struct fasttrips::SharedLabelingCompare> LabelCache;
+
     /**
     * This is the class that does all the work.  Setup the network supply first.
     */
@@ -141,6 +318,12 @@ namespace fasttrips {
         /// See <a href="_generated/fasttrips.Assignment.html#fasttrips.Assignment.STOCH_PATHSET_SIZE">fasttrips.Assignment.STOCH_PATHSET_SIZE</a>
         int STOCH_PATHSET_SIZE_; // er....
 
+        /// See <a href="_generated/fasttrips.Assignment.html#fasttrips.Assignment.STOCH_PATHSET_STALL_DRAWS">fasttrips.Assignment.STOCH_PATHSET_STALL_DRAWS</a>
+        int STOCH_PATHSET_STALL_DRAWS_;
+
+        /// See <a href="_generated/fasttrips.Assignment.html#fasttrips.Assignment.STOCH_PATHSET_UNSEEN_PROBABILITY">fasttrips.Assignment.STOCH_PATHSET_UNSEEN_PROBABILITY</a>
+        double STOCH_PATHSET_UNSEEN_PROBABILITY_;
+
         /// See <a href="_generated/fasttrips.Assignment.html#fasttrips.Assignment.STOCH_MAX_STOP_PROCESS_COUNT">fasttrips.Assignment.STOCH_MAX_STOP_PROCESS_COUNT</a>
         int STOCH_MAX_STOP_PROCESS_COUNT_;
 
@@ -152,7 +335,7 @@ namespace fasttrips {
         ///@}
 
         /// Access this through getTransferAttributes()
-        static Attributes* ZERO_WALK_TRANSFER_ATTRIBUTES_;
+        Attributes zero_walk_transfer_attributes_;
 
         /// directory in which to write trace files
         std::string output_dir_;
@@ -163,6 +346,16 @@ namespace fasttrips {
         /// (User class, demand_mode_type, demand_mode) -> supply_mode -> weight_map
         WeightLookup weight_lookup_;
 
+        /// Attribute name -> attribute number (index into fasttrips::Attributes)
+        std::map<std::string, int> attribute_num_;
+        /// Attribute number -> attribute name
+        std::vector<std::string> attribute_names_;
+
+        /// User class, purpose and demand mode strings -> interned numbers, for weight lookups
+        std::map<std::string, int> demand_str_to_num_;
+        /// The interned number for the "transfer" demand mode, or -1
+        int transfer_demand_mode_num_;
+
         // ================ Network supply ================
         /// Access/Egress information: taz id -> supply_mode -> stop id -> attribute map
         TAZSupplyStopToAttr taz_access_links_;
@@ -170,12 +363,27 @@ namespace fasttrips {
         /// Transfer information: stop id -> stop id -> attributes
         StopStopToAttr transfer_links_o_d_;
         StopStopToAttr transfer_links_d_o_;
-        /// Trip information: trip id -> Trip Info
-        std::map<int, TripInfo> trip_info_;
-        /// Trip information: trip id -> vector of [trip id, sequence, stop id, arrival time, departure time, overcap]
-        std::map<int, std::vector<TripStopTime> > trip_stop_times_;
-        /// Stop information: stop id -> vector of [trip id, sequence, stop id, arrival time, departure time, overcap]
-        std::map<int, std::vector<TripStopTime> > stop_trip_times_;
+        /// Trip information: indexed by trip id.  Trips without info have a supply_mode_num_ of -1.
+        std::vector<TripInfo> trip_info_;
+
+        // ================ Timetable ================
+        // The stop times are stored in compressed sparse row form: contiguous TripStopTime records,
+        // plus offset arrays indexed by the (dense) trip id or stop id.
+        // The records for id x are [offsets[x], offsets[x+1]).
+
+        /// [trip id, sequence, stop id, arrival time, departure time, overcap], grouped by trip id and ordered by sequence
+        std::vector<TripStopTime> trip_stop_times_;
+        /// Offsets into PathFinder::trip_stop_times_, indexed by trip id.  Size is max trip id + 2.
+        std::vector<int> trip_stop_time_offsets_;
+        /// [trip id, sequence, stop id, arrival time, departure time, overcap], grouped by stop id
+        /// and sorted by arrival time.  Searched by PathFinder::getTripsWithinTime() for outbound paths.
+        std::vector<TripStopTime> stop_trip_arrivals_;
+        /// [trip id, sequence, stop id, arrival time, departure time, overcap], grouped by stop id
+        /// and sorted by departure time.  Searched by PathFinder::getTripsWithinTime() for inbound paths.
+        std::vector<TripStopTime> stop_trip_departures_;
+        /// Offsets into PathFinder::stop_trip_arrivals_ and PathFinder::stop_trip_departures_, indexed by stop id.
+        /// Size is max stop id + 2.
+        std::vector<int> stop_trip_time_offsets_;
 
         // ================ ID numbers to ID strings ===============
         std::map<int, std::string> trip_num_to_str_;
@@ -189,25 +397,179 @@ namespace fasttrips {
          * board a vehicle, this is the time the bumped passengers arrive at a stop and wait for a
          * vehicle they cannot board.
          *
-         * This structure maps the fasttrips::TripStop to the arrival time of the first waiting
-         * would-be passenger.
+         * This is the arrival time of the first waiting would-be passenger for each trip stop, indexed
+         * like PathFinder::trip_stop_times_, or fasttrips::NO_BUMP_WAIT.  Empty if there are no bump waits.
+         */
+        std::vector<double> bump_wait_;
+
+        /// Largest stop id (including TAZs) and trip id in the supply; these size the PathFinderWorkspace arrays.
+        int max_stop_id_;
+        int max_trip_id_;
+
+        /// Workspaces not currently in use by a PathFinder::findPathSet call.  Guarded by workspace_mutex_.
+        mutable std::vector<PathFinderWorkspace*> free_workspaces_;
+        mutable Mutex workspace_mutex_;
+
+        /// Returns an unused workspace, creating one if needed.  Return it with PathFinder::releaseWorkspace().
+        PathFinderWorkspace* acquireWorkspace() const;
+        /// Puts the workspace back for the next PathFinder::findPathSet call.
+        void releaseWorkspace(PathFinderWorkspace* workspace) const;
+
+        /** @name Label cache
+         * Recent labelings, kept in their workspaces so PathFinder::findPathSet can skip labeling for a request
+         * that can share the labeling (see fasttrips::SharedLabelingCompare).  Cached labelings don't depend on
+         * the end TAZ: they're labeled to completion and each request connects its own end TAZ with
+         * PathFinder::labelEndTaz.  A cached labeling is used by one request at a time.  Least recently used
+         * labelings are evicted to stay within label_cache_max_bytes_.  The cache is emptied whenever the
+         * network, supply, parameters or bump wait change.
          */
-        std::map<TripStop, double, struct TripStopCompare> bump_wait_;
+        ///@{
+        /// Memory budget, in bytes.  Zero disables the cache.
+        size_t label_cache_max_bytes_;
+        /// Estimated memory used by the cached labelings, in bytes
+        mutable size_t label_cache_bytes_;
+        mutable LabelCache label_cache_;
+        mutable LabelCacheOrder label_cache_order_;
+        /// Guards the members above and the cache members of each fasttrips::PathFinderWorkspace
+        mutable Mutex label_cache_mutex_;
 
         /**
-         * Read the intermediate files mapping integer IDs to strings
-         * for modes, stops, trips, and routes.
-         **/
-        void readIntermediateFiles();
-        void readTripIds();
-        void readStopIds();
-        void readRouteIds();
-        void readModeIds();
-        void readAccessLinks();
-        void readTransferLinks();
-        void readTripInfo();
-        void readWeights();
+         * Returns the workspace with the cached labeling for the given request, or NULL if there isn't one
+         * or another request is using it.  Sets the label cache hits or misses in performance_info.  Return a workspace from here
+         * with PathFinder::releaseCachedLabeling().
+         */
+        PathFinderWorkspace* findCachedLabeling(const PathSpecification& path_spec, PerformanceInfo& performance_info) const;
+        /// Done enumerating from a workspace returned by PathFinder::findCachedLabeling.
+        void releaseCachedLabeling(PathFinderWorkspace* workspace) const;
+        /**
+         * Adds the labeling in the given workspace to the cache, evicting least recently used labelings to make room
+         * and setting the label cache evictions in performance_info.  If it won't fit or is already cached,
+         * the workspace is released instead.
+         */
+        void cacheLabeling(const PathSpecification& path_spec, PathFinderWorkspace* workspace, PerformanceInfo& performance_info) const;
+        /// Empties the label cache.  This should only happen while no paths are being found.
+        void clearLabelCache();
+        ///@}
+
+        /** @name Labeling lower bounds
+         * An admissible lower bound on the time between each stop and an end TAZ (origin for outbound,
+         * destination for inbound), from shortest paths over the smallest ride time between consecutive stops
+         * on any trip, the transfer times and the access/egress times, ignoring waits.  The stops are
+         * labeled in order of label plus the bound times label_lower_bound_weight_ (in label units), so
+         * labeling heads towards the end TAZ and stops once no stop can get there within the cutoff.
+         * Only hyperpath labeling uses them; deterministic labeling keeps its label order.
+         */
+        ///@{
+        /// See <a href="_generated/fasttrips.Assignment.html#fasttrips.Assignment.LABEL_LOWER_BOUND_WEIGHT">fasttrips.Assignment.LABEL_LOWER_BOUND_WEIGHT</a>.
+        /// Zero disables the lower bounds.
+        double label_lower_bound_weight_;
+        /// Minimum time links out of each stop, in compressed sparse row form like the timetable; see setupMinTimeLinks()
+        std::vector<MinTimeLink> min_time_links_out_;
+        std::vector<int>         min_time_link_out_offsets_;
+        /// Minimum time links into each stop
+        std::vector<MinTimeLink> min_time_links_in_;
+        std::vector<int>         min_time_link_in_offsets_;
+        /// Time lower bounds, indexed by stop id, for each end TAZ and direction (key is 2*end TAZ + outbound).
+        /// Filled in as needed by stopTimeBounds() and guarded by stop_time_bounds_mutex_.
+        mutable std::map<int, std::vector<double> > stop_time_bounds_;
+        mutable Mutex stop_time_bounds_mutex_;
+
+        /// Access and egress links by TAZ and UserClassPurposeMode, in the order they are used by requests.
+        /// Filled in as needed by tazLinks() and guarded by taz_links_mutex_.
+        mutable std::map<int, UCPMToTazLinks> taz_links_;
+        mutable Mutex taz_links_mutex_;
+
+        /**
+         * Returns the access or egress links for the given TAZ that are usable with the given weights,
+         * which are the weights for ucpm.  Builds them the first time they're asked for; the path_spec
+         * is only used for tallying the link costs, which don't depend on anything in it but ucpm.
+         */
+        const TazLinks& tazLinks(const PathSpecification& path_spec,
+                                 std::ofstream& trace_file,
+                                 int taz_id,
+                                 const UserClassPurposeMode& ucpm,
+                                 const SupplyModeToLinkWeights& weights) const;
+
+        /**
+         * Builds the access or egress links for the given TAZ that are usable with the given weights into taz_links.
+         * PathFinder::tazLinks uses this for its cache.  Traced requests build their own with TRACE, which logs
+         * each supply mode's links and the cost breakdown of each link.
+         */
+        template <bool TRACE>
+        void buildTazLinks(const PathSpecification& path_spec,
+                           std::ofstream& trace_file,
+                           int taz_id,
+                           const SupplyModeToLinkWeights& weights,
+                           TazLinks& taz_links) const;
+
+        /// Builds the minimum time links from the timetable and transfer links and forgets the old time bounds.
+        void setupMinTimeLinks();
+        /// Returns the time lower bounds for the given end TAZ, computing them if needed.
+        const std::vector<double>& stopTimeBounds(int end_taz_id, bool outbound) const;
+        /**
+         * Returns the smallest weight per minute of travel time for the links the given request might use,
+         * or zero if some link's time isn't weighted.  This converts time bounds into stochastic labels.
+         */
+        double minTimeWeight(const PathSpecification& path_spec) const;
+        /**
+         * Sets the lower bounds that the workspace's label stop queue is ordered by, for a labeling that
+         * connects to the given end TAZs.  With more than one end TAZ, each stop gets the smallest of their bounds.
+         */
+        void setLowerBounds(const PathSpecification& path_spec,
+                            const std::vector<FinalStops>& final_stops,
+                            PathFinderWorkspace& workspace) const;
+        /**
+         * Connects the request's end TAZ to the workspace's labeling, which was labeled to completion without
+         * an end TAZ for the label cache, as PathFinder::labelStops would have for each labeled final stop.
+         * The end TAZ connected for the previous request using the labeling is removed first.
+         */
+        void labelEndTaz(const PathSpecification& path_spec,
+                         std::ofstream& trace_file,
+                         PathFinderWorkspace& workspace) const;
+        ///@}
+
+        /** @name Network setup; see PathFinder::initializeNetwork for the tables */
+        ///@{
+        void setIdStrings(const SupplyTable& ids, std::map<int, std::string>& num_to_str, const char* description);
+        void setAccessLinks(const SupplyTable& access_links);
+        void setTransferLinks(const SupplyTable& transfer_links);
+        void setTripInfo(const SupplyTable& trip_info);
+        void setWeights(const SupplyTable& weights);
+        ///@}
+
+        /// Returns the attribute number for the given name, adding it if it's new.
+        int addAttribute(const std::string& attr_name);
+        /// Returns a new fasttrips::Attributes with all values unset.
+        Attributes newAttributes() const { return Attributes(attribute_names_.size(), ATTRIBUTE_UNSET); }
+        /// Sets the given attribute if any weights use it, sizing attributes if it's empty.
+        void setAttribute(Attributes& attributes, const std::string& attr_name, double attr_value) const;
+        /// Returns the interned number for the given user class, purpose or demand mode, adding it if it's new.
+        int internDemandString(const std::string& demand_str);
+        /// Returns the interned number for the given user class, purpose or demand mode, or -1 if it's not in any weights.
+        int demandStringNum(const std::string& demand_str) const;
+        /// Sets the interned user class, purpose and demand mode numbers in the given path specification.
+        void setDemandStringNums(PathSpecification& path_spec) const;
+
+        /**
+         * Populates PathFinder::trip_stop_times_ and the time-sorted per-stop views,
+         * PathFinder::stop_trip_arrivals_ and PathFinder::stop_trip_departures_, along with their offsets.
+         * Any previous stop times are cleared.  See PathFinder::initializeSupply for parameters.
+         */
+        void setupStopTimes(int*        stoptime_index,
+                            double*     stoptime_times,
+                            int         num_stoptimes);
 
+        /// Offer the link to the stop's hyperlink, queueing the stop if its state changed.
+        /// Calls the instantiation below matching path_spec.trace_.
+        void addStopState(const PathSpecification& path_spec,
+                          std::ofstream& trace_file,
+                          const int stop_id,
+                          const StopState& ss,
+                          const Hyperlink* prev_link,
+                          StopStates& stop_states,
+                          LabelStopQueue& label_stop_queue) const;
+        /// See PathFinder::labelStops about TRACE
+        template <bool TRACE>
         void addStopState(const PathSpecification& path_spec,
                           std::ofstream& trace_file,
                           const int stop_id,
@@ -231,7 +593,9 @@ namespace fasttrips {
          * Iterate through all the stops that transfer to(outbound)/from(inbound) the
          * *current_label_stop* and update the *stop_states* with information about how
          * accessible those stops are as a transfer to/from the *current_label_stop*.
+         * See PathFinder::labelStops about TRACE and HYPERPATH.
          */
+        template <bool TRACE, bool HYPERPATH>
         void updateStopStatesForTransfers(const PathSpecification& path_spec,
                                   std::ofstream& trace_file,
                                   StopStates& stop_states,
@@ -243,15 +607,16 @@ namespace fasttrips {
          * Part of the labeling loop. Assuming the *current_label_stop* was just pulled off the
          * *label_stop_queue*, this method will iterate through access links to (for outbound) or
          * egress links from (for inbound) the current stop and update the next stop given the current stop state.
+         * See PathFinder::labelStops about TRACE and HYPERPATH.
          */
+        template <bool TRACE, bool HYPERPATH>
         void updateStopStatesForFinalLinks(const PathSpecification& path_spec,
                                   std::ofstream& trace_file,
-                                  const std::map<int, int>& reachable_final_stops,
+                                  FinalStops& final_stops,
                                   StopStates& stop_states,
                                   LabelStopQueue& label_stop_queue,
                                   int label_iteration,
-                                  const LabelStop& current_label_stop,
-                                  double& est_max_path_cost) const;
+                                  const LabelStop& current_label_stop) const;
 
 
         /**
@@ -259,14 +624,19 @@ namespace fasttrips {
          * to(outbound)/from(inbound) the *current_label_stop* and update the *stop_states*
          * with information about how accessible those stops are as a transit trip to/from
          * the *current_label_stop*.
+         * For deterministic path-finding without bump waits, *trips_reached* keeps the part of each trip
+         * already scanned so only the rest of it is scanned.  Hyperpath labeling scans the whole trip every time,
+         * since each boarding/alighting pair is its own link in the hyperpath.
+         * See PathFinder::labelStops about TRACE and HYPERPATH.
          */
+        template <bool TRACE, bool HYPERPATH>
         void updateStopStatesForTrips(const PathSpecification& path_spec,
                                   std::ofstream& trace_file,
                                   StopStates& stop_states,
                                   LabelStopQueue& label_stop_queue,
                                   int label_iteration,
                                   const LabelStop& current_label_stop,
-                                  std::tr1::unordered_set<int>& trips_done) const;
+                                  VisitedMap& trips_reached) const;
 
         /**
          * Label stops by:
@@ -276,24 +646,40 @@ namespace fasttrips {
          *     * adding the stops accessible by transit trip (PathFinder::updateStopStatesForTrips)
          *
          * Assume we're done if we've reached the final TAZ already and the current cost is some percent bigger than
-         * threshhold based on the lowest cost and the minimum probability.
+         * threshhold based on the lowest cost and the minimum probability.  With more than one final TAZ,
+         * that has to be true for all of them.
+         *
+         * This calls the instantiation matching path_spec.trace_.  The labeling loop is instantiated
+         * with TRACE true for traced requests and false for the rest, and TRACE replaces the checks of
+         * path_spec.trace_, so the untraced loop has no trace checks or output at all.
+         * Likewise HYPERPATH replaces the checks of path_spec.hyperpath_, so the deterministic loop
+         * just keeps one label per stop (see Hyperlink::setLabel) with no hyperpath bookkeeping.
          */
         int labelStops(const PathSpecification& path_spec,
                        std::ofstream& trace_file,
-                       const std::map<int,int>& reachable_final_stops,
+                       std::vector<FinalStops>& final_stops,
+                       StopStates& stop_states,
+                       VisitedMap& trips_reached,
+                       LabelStopQueue& label_stop_queue,
+                       int& max_process_count) const;
+        template <bool TRACE, bool HYPERPATH>
+        int labelStops(const PathSpecification& path_spec,
+                       std::ofstream& trace_file,
+                       std::vector<FinalStops>& final_stops,
                        StopStates& stop_states,
+                       VisitedMap& trips_reached,
                        LabelStopQueue& label_stop_queue,
                        int& max_process_count) const;
 
         /**
-         * This fills the reachable_final_stops map with stop_id -> number of supply links between
-         * the final stop and the final TAZ.
+         * This sets up the final_stops for the path_spec's end TAZ, pointing it at the links between the
+         * end TAZ and the final stops; see PathFinder::tazLinks.
          *
          * @return True if some final stops are reachable, False if there are none
          */
         bool setReachableFinalStops(const PathSpecification& path_spec,
                                     std::ofstream& trace_file,
-                                    std::map<int, int>& reachable_final_stops) const;
+                                    FinalStops& final_stops) const;
 
         /**
          * This is like the reverse of PathFinder::initializeStopStates.
@@ -311,15 +697,34 @@ namespace fasttrips {
         /**
          * Given all the labeled stops and taz, traces back and generates a
          * specific path.  We do this by setting up probabilities for each
-         * option and then choosing via PathFinder::chooseState.
+         * option and then choosing via Hyperlink::chooseState, drawing from
+         * the request's random generator.
+         *
+         * The path should start out empty.  The probabilities are set up via PathFinder::linkProbabilities,
+         * so passing the same prob_cache for each of a request's draws means each set is only set up once.
          *
          * @return success
          */
         bool hyperpathGeneratePath(const PathSpecification& path_spec,
                                   std::ofstream& trace_file,
                                   const StopStates& stop_states,
+                                  RandomGenerator& random_generator,
+                                  ProbabilityCache& prob_cache,
                                   Path& path) const;
 
+        /**
+         * Returns the cumulative probabilities for choosing a link out of the given hyperlink
+         * (see Hyperlink::setupProbabilities), looking them up in prob_cache first and adding them if they're not there.
+         * The stop states mustn't change while prob_cache is in use.
+         */
+        const std::vector<ProbabilityStopState>& linkProbabilities(const PathSpecification& path_spec,
+                                                                   std::ofstream& trace_file,
+                                                                   const Hyperlink& hyperlink,
+                                                                   int stop_id,
+                                                                   const StopState* prev_link,
+                                                                   int last_trip_id,
+                                                                   ProbabilityCache& prob_cache) const;
+
         /**
          * Given a set of paths, randomly selects one based on the cumulative
          * probability (fasttrips::PathInfo.prob_i_)
@@ -329,18 +734,43 @@ namespace fasttrips {
         Path choosePath(const PathSpecification& path_spec,
                         std::ofstream& trace_file,
                         PathSet& paths,
-                        int max_prob_i) const;
+                        int max_prob_i,
+                        RandomGenerator& random_generator) const;
 
+        /**
+         * Finds the pathset from the labeled stop states.  For stochastic path finding, that's up to
+         * STOCH_PATHSET_SIZE_ hyperpath draws; see PathFinder::stopDrawing for when it stops sooner.
+         * Sets *pathset_draws* to the number of draws made (0 for deterministic).
+         *
+         * @return success.
+         */
         bool getPathSet(const PathSpecification&      path_spec,
                         std::ofstream&                trace_file,
                         const StopStates&             stop_states,
-                        PathSet&                      pathset) const;
+                        PathSet&                      pathset,
+                        int&                          pathset_draws) const;
+
+        /**
+         * Should PathFinder::getPathSet stop drawing paths before STOCH_PATHSET_SIZE_ draws?
+         * Yes once the last STOCH_PATHSET_STALL_DRAWS_ draws found no new path, or once the Good-Turing
+         * estimate of the chance the next draw finds a new path (the share of the paths drawn that
+         * were only drawn once) is below STOCH_PATHSET_UNSEEN_PROBABILITY_, after at least 1/STOCH_PATHSET_UNSEEN_PROBABILITY_
+         * paths drawn.  Either is skipped if it's 0.
+         */
+        bool stopDrawing(const PathSpecification&      path_spec,
+                         std::ofstream&                trace_file,
+                         const PathCounter&            path_counter,
+                         int                           paths_drawn,
+                         int                           stall_draws) const;
 
         /**
          * If outbound, then we're searching backwards, so this returns trips that arrive at the given stop in time to depart at timepoint.
          * If inbound,  then we're searching forwards,  so this returns trips that depart at the given stop time after timepoint
+         *
+         * The trips are returned as a range into the time-sorted stop view (no copies are made), found by binary search,
+         * so the cost is in the size of the window rather than the number of trips serving the stop.
          */
-        void getTripsWithinTime(int stop_id, bool outbound, double timepoint, std::vector<TripStopTime>& return_trips) const;
+        TripStopTimeRange getTripsWithinTime(int stop_id, bool outbound, double timepoint) const;
 
     public:
         const static int MAX_DATETIME   = 48*60; // 48 hours in minutes
@@ -349,8 +779,15 @@ namespace fasttrips {
         PathFinder();
 
         int processNumber() const { return process_num_; }
+        /**
+         * Sets the process number without touching the supply.  This is for worker processes
+         * forked after the supply was initialized in the parent, which share that supply copy-on-write.
+         */
+        void setProcessNumber(int process_num) { process_num_ = process_num; }
         /// This is the transfer supply mode number
         int transferSupplyMode() const { return transfer_supply_mode_; }
+        /// This is the interned transfer demand mode number, for PathFinder::getLinkWeights()
+        int transferDemandModeNum() const { return transfer_demand_mode_num_; }
         /// Accessor for access link attributes
         const Attributes* getAccessAttributes(int taz_id, int supply_mode_num, int stop_id) const;
         /// Accessor for transfer link attributes
@@ -359,6 +796,12 @@ namespace fasttrips {
         const TripInfo* getTripInfo(int trip_id_num) const;
         /// Accessor for TripStopTime for given trip id, stop sequence
         const TripStopTime& getTripStopTime(int trip_id, int stop_seq) const;
+        /// If a passenger was bumped from the given trip at the given stop sequence, sets latest_time to the
+        /// time the first of them started waiting and returns true.
+        bool getBumpWait(int trip_id, int stop_seq, double& latest_time) const;
+        /// Accessor for all the TripStopTime instances for the given trip id, ordered by sequence.
+        /// Returns an empty range for an unknown trip.
+        TripStopTimeRange getTripStopTimes(int trip_id) const;
         /**
          * Tally the link cost, which is the sum of the weighted attributes.
          * @return the cost.
@@ -366,32 +809,74 @@ namespace fasttrips {
         double tallyLinkCost(const int supply_mode_num,
                              const PathSpecification& path_spec,
                              std::ostream& trace_file,
-                             const NamedWeights& weights,
+                             const LinkWeights& weights,
+                             const Attributes& attributes,
+                             bool  hush = false) const;
+        /// The same, with TRACE in place of path_spec.trace_; for the labeling loop (see PathFinder::labelStops)
+        template <bool TRACE>
+        double tallyLinkCost(const int supply_mode_num,
+                             const PathSpecification& path_spec,
+                             std::ostream& trace_file,
+                             const LinkWeights& weights,
                              const Attributes& attributes,
                              bool  hush = false) const;
 
         /**
-         * Access the named weights given user/link information.
+         * Access the link weights given user/link information.  The user class, purpose and demand mode
+         * are the interned numbers in the fasttrips::PathSpecification.
          * Returns NULL if not found.
          **/
-        const NamedWeights* getNamedWeights(const std::string& user_class,
-                                            const std::string& purpose,
-                                            DemandModeType     demand_mode_type,
-                                            const std::string& demand_mode,
-                                            int                suppy_mode_num) const;
+        const LinkWeights* getLinkWeights(int                user_class_num,
+                                          int                purpose_num,
+                                          DemandModeType     demand_mode_type,
+                                          int                demand_mode_num,
+                                          int                suppy_mode_num) const;
         /**
          * Setup the path finding parameters.
          */
         void initializeParameters(double     time_window,
                                   double     bump_buffer,
                                   int        stoch_pathset_size,
+                                  int        stoch_pathset_stall_draws,
+                                  double     stoch_pathset_unseen_probability,
                                   double     stoch_dispersion,
                                   int        stoch_max_stop_process_count,
                                   int        max_num_paths,
-                                  double     min_path_probability);
+                                  double     min_path_probability,
+                                  double     label_cache_megabytes,
+                                  double     label_lower_bound_weight);
 
         /**
-         * Setup the network supply.  This should happen once, before any pathfinding.
+         * Setup the network: the ID strings, path weights and link attributes.  This replaces any previous
+         * network and should happen before PathFinder::initializeSupply.
+         *
+         * Each table is a fasttrips::SupplyTable:
+         *
+         * @param process_num       The process number for this instance
+         * @param trip_ids          Index: trip ID num.  Strings: the trip ID for each row.
+         * @param stop_ids          Index: stop ID num (TAZs included).  Strings: the stop ID for each row.
+         * @param route_ids         Index: route ID num.  Strings: the route ID for each row.
+         * @param mode_ids          Index: supply mode num.  Strings: the supply mode for each row.
+         * @param weights           Index: user class, purpose, demand mode type, demand mode, supply mode num, weight name.
+         *                          Values: weight value.  Strings: what the non-numeric index columns refer to.
+         * @param access_links      Index: TAZ num, supply mode num, stop ID num.  Values: attributes named by strings.
+         * @param transfer_links    Index: from stop ID num, to stop ID num.  Values: attributes named by strings.
+         * @param trip_info         Index: trip ID num, supply mode num, route ID num.  Values: attributes named by strings.
+         *
+         * Attribute values that are NaN aren't set, and rows with no attributes set are skipped.
+         */
+        void initializeNetwork(int                process_num,
+                               const SupplyTable& trip_ids,
+                               const SupplyTable& stop_ids,
+                               const SupplyTable& route_ids,
+                               const SupplyTable& mode_ids,
+                               const SupplyTable& weights,
+                               const SupplyTable& access_links,
+                               const SupplyTable& transfer_links,
+                               const SupplyTable& trip_info);
+
+        /**
+         * Setup the network supply.  This should happen after PathFinder::initializeNetwork, before any pathfinding.
          *
          * @param output_dir        The directory in which to output trace files (if any)
          * @param process_num       The process number for this instance
@@ -411,7 +896,7 @@ namespace fasttrips {
          * Setup the information for bumped passengers.
          *
          * @param bw_index          For populating PathFinder::bump_wait_, this array contains the
-         *                          fasttrips::TripStop fields.
+         *                          trip id, stop sequence and stop id of each trip stop.
          * @param bw_data           For populating the PathFinder::bum_wait_, this contains the
          *                          arrival time of the first would-be waiting passenger
          * @param num_bw            The number of trip stops with bump waits described in the
@@ -430,6 +915,8 @@ namespace fasttrips {
          * See PathFinder::initializeStopStates, PathFinder::labelStops,
          * PathFinder::finalTazState, and PathFinder::getFoundPath
          *
+         * If the label cache is enabled, untraced requests reuse a cached labeling when there is one.
+         *
          * @param path_spec     The specifications of that path to find
          * @param path          This is really a return fasttrips::Path
          * @param path_info     Also for returng information (e.g. about the Path cost)
@@ -439,6 +926,26 @@ namespace fasttrips {
             PathSet           &pathset,
             PerformanceInfo   &performance_info) const;
 
+        /**
+         * Find the path sets for a group of requests that can share one labeling (see fasttrips::SharedLabelingCompare).
+         * The stops are labeled once from the shared start TAZ, connecting to every end TAZ in the group, and then
+         * each request's path set is enumerated from those stop states as PathFinder::findPathSet would.
+         * Tracing isn't supported; traced requests should use PathFinder::findPathSet.  The label cache isn't used.
+         *
+         * Each request's performance information has the shared labeling's iterations and stop counts;
+         * the labeling time is only included in the first request's.
+         *
+         * @param path_specs        The specifications of all the paths
+         * @param group             The indices into path_specs of the requests in this group
+         * @param pathsets          Indexed like path_specs; the found path sets for the group are set
+         * @param performance_infos Indexed like path_specs; the performance information for the group is set
+         */
+        void findPathSetGroup(
+            const std::vector<PathSpecification>&   path_specs,
+            const std::vector<size_t>&              group,
+            std::vector<PathSet>&                   pathsets,
+            std::vector<PerformanceInfo>&           performance_infos) const;
+
         double getScheduledDeparture(int trip_id, int stop_id, int sequence) const;
 
         void printTimeDuration(std::ostream& ostr, const double& timedur) const;
@@ -27,6 +27,11 @@ namespace fasttrips {
         std::string access_mode_;       ///< Access demand mode
         std::string transit_mode_;      ///< Transit demand mode
         std::string egress_mode_;       ///< Egress demand mode
+        int     user_class_num_;        ///< Interned user class, set by PathFinder::findPathSet
+        int     purpose_num_;           ///< Interned purpose, set by PathFinder::findPathSet
+        int     access_mode_num_;       ///< Interned access demand mode, set by PathFinder::findPathSet
+        int     transit_mode_num_;      ///< Interned transit demand mode, set by PathFinder::findPathSet
+        int     egress_mode_num_;       ///< Interned egress demand mode, set by PathFinder::findPathSet
     } PathSpecification;
 
     /**
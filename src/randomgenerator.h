@@ -0,0 +1,50 @@
+/**
+ * \file randomgenerator.h
+ *
+ * Defines the RandomGenerator class, a small seedable pseudo-random number generator.
+ */
+
+#ifndef RANDOMGENERATOR_H
+#define RANDOMGENERATOR_H
+
+namespace fasttrips {
+
+    /**
+     * A pseudo-random number generator (xorshift64*) with its own state, so that each path finding
+     * request can draw its own reproducible sequence regardless of what else is running.
+     * Unlike rand(), the sequence and range are the same on every platform.
+     */
+    class RandomGenerator {
+    public:
+        /// The largest number returned by RandomGenerator::next(); used in place of RAND_MAX
+        static const int MAX = 0x7fffffff;
+
+        /// Seeds the generator from the path id and iteration, so the draws for a path differ by iteration.
+        RandomGenerator(int path_id, int iteration)
+        {
+            // mix the seed (splitmix64 finalizer) so nearby ids give unrelated sequences
+            unsigned long long z = (static_cast<unsigned long long>(static_cast<unsigned int>(path_id)) << 32) |
+                                    static_cast<unsigned int>(iteration);
+            z += 0x9E3779B97F4A7C15ULL;
+            z  = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+            z  = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+            z  =  z ^ (z >> 31);
+            // state must be nonzero
+            state_ = (z == 0 ? 0x9E3779B97F4A7C15ULL : z);
+        }
+
+        /// Returns the next number in [0, RandomGenerator::MAX]
+        int next()
+        {
+            state_ ^= state_ >> 12;
+            state_ ^= state_ << 25;
+            state_ ^= state_ >> 27;
+            return static_cast<int>((state_ * 0x2545F4914F6CDD1DULL) >> 33);
+        }
+
+    private:
+        unsigned long long state_;
+    };
+}
+
+#endif
@@ -0,0 +1,83 @@
+/**
+ * \file threads.h
+ *
+ * Defines a minimal portable way to run a function on a number of threads, since std::thread is only c++11.
+ */
+
+#ifndef THREADS_H
+#define THREADS_H
+
+#include <vector>
+
+#ifdef _WIN32
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#include <windows.h>
+#include <process.h>
+#else
+#include <pthread.h>
+#endif
+
+namespace fasttrips {
+
+    /// The function run by each thread in fasttrips::runThreads()
+    typedef void (*ThreadFunction)(void* arg);
+
+    /// Function and argument passed to the thread entry point
+    typedef struct {
+        ThreadFunction  function_;
+        void*           arg_;
+    } ThreadStart;
+
+#ifdef _WIN32
+    inline unsigned __stdcall threadEntry(void* thread_start) {
+        ThreadStart* ts = static_cast<ThreadStart*>(thread_start);
+        ts->function_(ts->arg_);
+        return 0;
+    }
+#else
+    inline void* threadEntry(void* thread_start) {
+        ThreadStart* ts = static_cast<ThreadStart*>(thread_start);
+        ts->function_(ts->arg_);
+        return NULL;
+    }
+#endif
+
+    /**
+     * Runs function(arg) on num_threads threads and waits for them all to finish.
+     * The calling thread runs one of them.  If num_threads is 1 or less, just calls function(arg).
+     *
+     * The function is responsible for splitting up the work, e.g. by taking work items from arg under a fasttrips::Mutex.
+     */
+    inline void runThreads(int num_threads, ThreadFunction function, void* arg)
+    {
+        ThreadStart ts = { function, arg };
+#ifdef _WIN32
+        std::vector<HANDLE>    threads;
+        for (int thread_num = 1; thread_num < num_threads; ++thread_num) {
+            HANDLE handle = (HANDLE)_beginthreadex(NULL, 0, threadEntry, &ts, 0, NULL);
+            if (handle != 0) { threads.push_back(handle); }
+        }
+#else
+        std::vector<pthread_t> threads;
+        for (int thread_num = 1; thread_num < num_threads; ++thread_num) {
+            pthread_t thread;
+            if (pthread_create(&thread, NULL, threadEntry, &ts) == 0) { threads.push_back(thread); }
+        }
+#endif
+        // do our share
+        function(arg);
+
+        for (size_t thread_num = 0; thread_num < threads.size(); ++thread_num) {
+#ifdef _WIN32
+            WaitForSingleObject(threads[thread_num], INFINITE);
+            CloseHandle(threads[thread_num]);
+#else
+            pthread_join(threads[thread_num], NULL);
+#endif
+        }
+    }
+}
+
+#endif
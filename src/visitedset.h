@@ -0,0 +1,106 @@
+/**
+ * \file visitedset.h
+ *
+ * Defines the VisitedSet class, a set of small dense integer ids that can be emptied in constant time,
+ * and the VisitedMap class, which keeps an int value for each id in the set.
+ */
+
+#ifndef VISITEDSET_H
+#define VISITEDSET_H
+
+#include <algorithm>
+#include <vector>
+
+namespace fasttrips {
+
+    /**
+     * A set of ids in [0, max_id], stored as a generation stamp per id.
+     *
+     * VisitedSet::reset() empties the set by bumping the current generation rather than by
+     * touching every id, so one instance can be reused across path finding requests without
+     * per-request allocation or clearing.
+     */
+    class VisitedSet {
+    public:
+        VisitedSet() : generation_(0) {}
+
+        /// Empties the set and makes sure ids up to max_id can be stored.
+        void reset(int max_id)
+        {
+            if (max_id >= static_cast<int>(generations_.size())) {
+                generations_.resize(max_id+1, 0);
+            }
+            ++generation_;
+            // wrapped around -- old stamps could look current so clear them for real
+            if (generation_ == 0) {
+                std::fill(generations_.begin(), generations_.end(), 0);
+                generation_ = 1;
+            }
+        }
+
+        /// Is the given id in the set?
+        bool contains(int id) const
+        {
+            return (id >= 0) && (id < static_cast<int>(generations_.size())) && (generations_[id] == generation_);
+        }
+
+        /// Approximate memory used, in bytes
+        size_t memoryBytes() const { return generations_.capacity()*sizeof(unsigned int); }
+
+        /// Adds the given id, which must be in [0, max_id].  Returns true iff it wasn't already in the set.
+        bool insert(int id)
+        {
+            if (generations_[id] == generation_) { return false; }
+            generations_[id] = generation_;
+            return true;
+        }
+
+    private:
+        /// Generation in which each id was last inserted
+        std::vector<unsigned int>   generations_;
+        /// The current generation; ids stamped with anything else aren't in the set
+        unsigned int                generation_;
+    };
+
+    /**
+     * A map from ids in [0, max_id] to ints, stored as a fasttrips::VisitedSet plus a value per id,
+     * so VisitedMap::reset() empties it in constant time the same way.
+     */
+    class VisitedMap {
+    public:
+        /// Empties the map and makes sure ids up to max_id can be stored.
+        void reset(int max_id)
+        {
+            visited_.reset(max_id);
+            if (max_id >= static_cast<int>(values_.size())) {
+                values_.resize(max_id+1, 0);
+            }
+        }
+
+        /// If the given id is in the map, sets value to its value and returns true.
+        bool find(int id, int& value) const
+        {
+            if (!visited_.contains(id)) { return false; }
+            value = values_[id];
+            return true;
+        }
+
+        /// Sets the value for the given id, which must be in [0, max_id].
+        void set(int id, int value)
+        {
+            visited_.insert(id);
+            values_[id] = value;
+        }
+
+        /// Approximate memory used, in bytes
+        size_t memoryBytes() const { return visited_.memoryBytes() + values_.capacity()*sizeof(int); }
+
+    private:
+        /// Which ids are in the map
+        VisitedSet                  visited_;
+        /// Value for each id in the map
+        std::vector<int>            values_;
+    };
+}
+
+#endif